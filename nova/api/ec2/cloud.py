@@ -999,9 +999,11 @@ class CloudController(object):
         filters = kwargs.get('filter', None)
         instances = self._enforce_valid_instance_ids(context, instance_id)
         return self._format_describe_instances(context,
-                                               instance_id=instance_id,
-                                               instance_cache=instances,
-                                               filter=filters)
+                                        instance_id=instance_id,
+                                        instances_cache=instances,
+                                        filter=filters,
+                                        max_results=kwargs.get('max_results'),
+                                        next_token=kwargs.get('next_token'))
 
     def describe_instances_v6(self, context, **kwargs):
         # Optional DescribeInstancesV6 argument
@@ -1009,13 +1011,41 @@ class CloudController(object):
         filters = kwargs.get('filter', None)
         instances = self._enforce_valid_instance_ids(context, instance_id)
         return self._format_describe_instances(context,
-                                               instance_id=instance_id,
-                                               instance_cache=instances,
-                                               filter=filters,
-                                               use_v6=True)
+                                        instance_id=instance_id,
+                                        instances_cache=instances,
+                                        filter=filters,
+                                        max_results=kwargs.get('max_results'),
+                                        next_token=kwargs.get('next_token'),
+                                        use_v6=True)
+
+    def _format_describe_instances(self, context, max_results=None,
+                                   next_token=None, **kwargs):
+        # As with Amazon's implementation, MaxResults pages through the
+        # instances matching the filters only and is ignored when instance
+        # ids are given.
+        if max_results is None or kwargs.get('instance_id'):
+            return {'reservationSet': self._format_instances(context,
+                                                             **kwargs)}
 
-    def _format_describe_instances(self, context, **kwargs):
-        return {'reservationSet': self._format_instances(context, **kwargs)}
+        try:
+            limit = int(max_results)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            msg = _('MaxResults must be a positive integer')
+            raise exception.InvalidParameterValue(err=msg)
+        marker = None
+        if next_token:
+            marker = ec2utils.ec2_inst_id_to_uuid(context, next_token)
+
+        instances = self._get_instances(context, limit=limit, marker=marker,
+                                        **kwargs)
+        result = {'reservationSet': self._format_instance_list(context,
+                                                               instances)}
+        if len(instances) == limit:
+            result['nextToken'] = ec2utils.id_to_ec2_inst_id(
+                instances[-1]['uuid'])
+        return result
 
     def _format_run_instances(self, context, reservation_id):
         i = self._format_instances(context, reservation_id=reservation_id)
@@ -1042,13 +1072,14 @@ class CloudController(object):
         return {'instancesSet': instances_set}
 
     def _format_instance_bdm(self, context, instance_uuid, root_device_name,
-                             result):
+                             result, bdms=None):
         """Format InstanceBlockDeviceMappingResponseItemType."""
         root_device_type = 'instance-store'
         mapping = []
-        for bdm in block_device.legacy_mapping(
-            db.block_device_mapping_get_all_by_instance(context,
-                                                        instance_uuid)):
+        if bdms is None:
+            bdms = db.block_device_mapping_get_all_by_instance(context,
+                                                               instance_uuid)
+        for bdm in block_device.legacy_mapping(bdms):
             volume_id = bdm['volume_id']
             if (volume_id is None or bdm['no_device']):
                 continue
@@ -1098,8 +1129,13 @@ class CloudController(object):
         #               that it will be making a variety of database calls
         #               rather than simply formatting a bunch of instances that
         #               were handed to it
-        reservations = {}
+        instances = self._get_instances(context, instance_id=instance_id,
+                                        instances_cache=instances_cache,
+                                        **search_opts)
+        return self._format_instance_list(context, instances)
 
+    def _get_instances(self, context, instance_id=None, use_v6=False,
+            instances_cache=None, limit=None, marker=None, **search_opts):
         if not instances_cache:
             instances_cache = {}
 
@@ -1123,22 +1159,48 @@ class CloudController(object):
                 search_opts['deleted'] = False
                 instances = self.compute_api.get_all(context,
                                                      search_opts=search_opts,
-                                                     sort_dir='asc')
+                                                     sort_dir='asc',
+                                                     limit=limit,
+                                                     marker=marker)
             except exception.NotFound:
                 instances = []
+        return instances
+
+    def _format_instance_list(self, context, instances):
+        """Format a list of instances into reservations.
+
+        The ec2 ids, block device mappings and availability zones of all the
+        instances are looked up together before formatting them.
+        """
+        reservations = {}
+
+        if not context.is_admin:
+            instances = [instance for instance in instances
+                         if not pipelib.is_vpn_image(instance['image_ref'])]
+        instance_uuids = [instance['uuid'] for instance in instances]
+        ec2_ids = ec2utils.ids_to_ec2_inst_ids(instance_uuids)
+        image_uuids = [instance['image_ref'] for instance in instances]
+        image_uuids.extend(instance[key] for instance in instances
+                           for key in ('kernel_id', 'ramdisk_id')
+                           if instance[key])
+        image_ids = ec2utils.glance_ids_to_ids(context, image_uuids)
+        bdms = db.block_device_mapping_get_all_by_instance_uuids(
+            context, instance_uuids)
+        zones = ec2utils.get_availability_zones_by_hosts(
+            set(instance['host'] for instance in instances))
 
         for instance in instances:
-            if not context.is_admin:
-                if pipelib.is_vpn_image(instance['image_ref']):
-                    continue
             i = {}
             instance_uuid = instance['uuid']
-            ec2_id = ec2utils.id_to_ec2_inst_id(instance_uuid)
-            i['instanceId'] = ec2_id
-            image_uuid = instance['image_ref']
-            i['imageId'] = ec2utils.glance_id_to_ec2_id(context, image_uuid)
-            self._format_kernel_id(context, instance, i, 'kernelId')
-            self._format_ramdisk_id(context, instance, i, 'ramdiskId')
+            i['instanceId'] = ec2_ids[instance_uuid]
+            i['imageId'] = ec2utils.image_ec2_id(
+                image_ids[instance['image_ref']])
+            if instance['kernel_id']:
+                i['kernelId'] = ec2utils.image_ec2_id(
+                    image_ids[instance['kernel_id']], 'aki')
+            if instance['ramdisk_id']:
+                i['ramdiskId'] = ec2utils.image_ec2_id(
+                    image_ids[instance['ramdisk_id']], 'ari')
             i['instanceState'] = _state_description(
                 instance['vm_state'], instance['shutdown_terminate'])
 
@@ -1175,11 +1237,10 @@ class CloudController(object):
             i['launchTime'] = instance['created_at']
             i['amiLaunchIndex'] = instance['launch_index']
             self._format_instance_root_device_name(instance, i)
-            self._format_instance_bdm(context, instance['uuid'],
-                                      i['rootDeviceName'], i)
-            host = instance['host']
-            zone = ec2utils.get_availability_zone_by_host(host)
-            i['placement'] = {'availabilityZone': zone}
+            self._format_instance_bdm(context, instance_uuid,
+                                      i['rootDeviceName'], i,
+                                      bdms=bdms[instance_uuid])
+            i['placement'] = {'availabilityZone': zones[instance['host']]}
             if instance['reservation_id'] not in reservations:
                 r = {}
                 r['reservationId'] = instance['reservation_id']
@@ -20,6 +20,7 @@ import functools
 import re
 
 from nova import availability_zones
+from nova import cache_utils
 from nova import context
 from nova import db
 from nova import exception
@@ -27,7 +28,6 @@ from nova.network import model as network_model
 from nova.objects import instance as instance_obj
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
-from nova.openstack.common import memorycache
 from nova.openstack.common import timeutils
 from nova.openstack.common import uuidutils
 
@@ -37,22 +37,60 @@ _CACHE_TIME = 7 * 24 * 60 * 60
 _CACHE = None
 
 
+def _get_cache():
+    global _CACHE
+    if not _CACHE:
+        _CACHE = cache_utils.get_client()
+    return _CACHE
+
+
+def _memoize_key(func, reqid):
+    return str("%s:%s" % (func.__name__, reqid))
+
+
 def memoize(func):
     @functools.wraps(func)
     def memoizer(context, reqid):
-        global _CACHE
-        if not _CACHE:
-            _CACHE = memorycache.get_client()
-        key = "%s:%s" % (func.__name__, reqid)
-        key = str(key)
-        value = _CACHE.get(key)
+        cache = _get_cache()
+        key = _memoize_key(func, reqid)
+        value = cache.get(key)
         if value is None:
             value = func(context, reqid)
-            _CACHE.set(key, value, time=_CACHE_TIME)
+            cache.set(key, value, time=_CACHE_TIME)
         return value
     return memoizer
 
 
+def memoize_many(func, context, reqids, lookup):
+    """Resolve many reqids of the memoized func at once.
+
+    Values already memoized for func are taken from the cache and the
+    others are fetched with a single call to lookup, which takes the
+    context and the list of missing reqids and returns a dict of the values
+    it found. The reqids lookup does not find are left to func. Returns a
+    dict of the values by reqid.
+    """
+    cache = _get_cache()
+    values = {}
+    missing = []
+    for reqid in set(reqids):
+        value = cache.get(_memoize_key(func, reqid))
+        if value is None:
+            missing.append(reqid)
+        else:
+            values[reqid] = value
+    if missing:
+        found = lookup(context, missing)
+        for reqid in missing:
+            if reqid in found:
+                values[reqid] = found[reqid]
+                cache.set(_memoize_key(func, reqid), found[reqid],
+                          time=_CACHE_TIME)
+            else:
+                values[reqid] = func(context, reqid)
+    return values
+
+
 def reset_cache():
     global _CACHE
     _CACHE = None
@@ -122,6 +160,17 @@ def ec2_id_to_glance_id(context, ec2_id):
     return id_to_glance_id(context, image_id)
 
 
+def _s3_image_ids_by_uuids(context, glance_ids):
+    return dict((image['uuid'], image['id']) for image in
+                db.s3_image_get_by_uuids(context, glance_ids))
+
+
+def glance_ids_to_ids(context, glance_ids):
+    """Convert glance ids to internal (db) ids, returned in a dict."""
+    return memoize_many(glance_id_to_id, context, glance_ids,
+                        _s3_image_ids_by_uuids)
+
+
 def glance_id_to_ec2_id(context, glance_id, image_type='ami'):
     image_id = glance_id_to_id(context, glance_id)
     return image_ec2_id(image_id, image_type=image_type)
@@ -175,6 +224,12 @@ def get_availability_zone_by_host(host, conductor_api=None):
         context.get_admin_context(), host, conductor_api)
 
 
+def get_availability_zones_by_hosts(hosts):
+    """Return a dict of the availability zones of the given hosts."""
+    return availability_zones.get_host_availability_zones(
+        context.get_admin_context(), hosts)
+
+
 def id_to_ec2_id(instance_id, template='i-%08x'):
     """Convert an instance ID (int) to an ec2 ID (i-[base 16 number])."""
     return template % int(instance_id)
@@ -192,6 +247,15 @@ def id_to_ec2_inst_id(instance_id):
         return id_to_ec2_id(instance_id)
 
 
+def ids_to_ec2_inst_ids(instance_uuids):
+    """Get or create the ec2 instance IDs of instance uuids, in a dict."""
+    ctxt = context.get_admin_context()
+    int_ids = memoize_many(get_int_id_from_instance_uuid, ctxt,
+                           instance_uuids, db.get_ec2_instance_ids_by_uuids)
+    return dict((instance_uuid, id_to_ec2_id(int_id))
+                for instance_uuid, int_id in int_ids.iteritems())
+
+
 def ec2_inst_id_to_uuid(context, ec2_id):
     """"Convert an instance id to uuid."""
     int_id = ec2_id_to_id(ec2_id)
@@ -19,18 +19,22 @@
 """Instance Metadata information."""
 
 import base64
+import copy
 import json
 import os
 import posixpath
 
+from eventlet import semaphore
 from oslo.config import cfg
 
 from nova.api.ec2 import ec2utils
 from nova.api.metadata import password
 from nova import block_device
 from nova.compute import flavors
+from nova.compute import utils as compute_utils
 from nova import conductor
 from nova import context
+from nova import exception
 from nova import network
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
@@ -49,10 +53,18 @@ metadata_opts = [
     cfg.StrOpt('vendordata_driver',
                default='nova.api.metadata.vendordata_json.JsonFileVendorData',
                help='Driver to use for vendor data'),
+    cfg.IntOpt('metadata_fixed_ip_index_interval',
+               default=0,
+               help='Interval in seconds between refreshes of the map of '
+                    'fixed IPs to instances the metadata API resolves '
+                    'requesters with. 0 disables the map and looks every '
+                    'uncached requester up with the network API.'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(metadata_opts)
+
+CACHE_EXPIRATION = 15  # in seconds
 CONF.import_opt('dhcp_domain', 'nova.network.manager')
 
 
@@ -447,23 +459,138 @@ class VendorDataDriver(object):
         return self._data
 
 
-def get_metadata_by_address(conductor_api, address):
+class FixedIpIndex(object):
+    """Map of fixed IP addresses to the uuids of their instances.
+
+    The whole map is fetched with a single network API call and refreshed
+    every metadata_fixed_ip_index_interval seconds, requests arriving
+    during a refresh wait for it rather than starting their own. An
+    address missing from the map triggers an early refresh, at most every
+    MISS_REFRESH_INTERVAL seconds, so that a burst of newly booted
+    instances is resolved with one call too.
+    """
+
+    MISS_REFRESH_INTERVAL = 5
+
+    def __init__(self, network_api=None):
+        self.network_api = network_api or network.API()
+        self._uuids = {}
+        self._refreshed_at = None
+        self._lock = semaphore.Semaphore()
+
+    def _is_older_than(self, seconds):
+        return (self._refreshed_at is None or
+                timeutils.is_older_than(self._refreshed_at, seconds))
+
+    def _refresh(self, ctxt, max_age):
+        with self._lock:
+            if not self._is_older_than(max_age):
+                # Refreshed by another request while this one waited
+                return
+            self._uuids = self.network_api.get_fixed_ip_instance_uuids(ctxt)
+            self._refreshed_at = timeutils.utcnow()
+
+    def get_instance_uuid(self, ctxt, address):
+        """Return the uuid of the instance using address, or None."""
+        interval = CONF.metadata_fixed_ip_index_interval
+        if self._is_older_than(interval):
+            self._refresh(ctxt, interval)
+        if (address not in self._uuids and
+                self._is_older_than(self.MISS_REFRESH_INTERVAL)):
+            self._refresh(ctxt, self.MISS_REFRESH_INTERVAL)
+        return self._uuids.get(address)
+
+    def discard(self, address):
+        self._uuids.pop(address, None)
+
+
+def _get_instance_with_address(conductor_api, ctxt, instance_uuid,
+                               address):
+    try:
+        instance = conductor_api.instance_get_by_uuid(ctxt, instance_uuid)
+    except exception.InstanceNotFound:
+        return None
+    # The map may be stale, so only trust it if the instance still has
+    # the address.
+    nw_info = compute_utils.get_nw_info_for_instance(instance)
+    if address in [ip['address'] for ip in nw_info.fixed_ips()]:
+        return instance
+    return None
+
+
+def _get_prerendered_metadata(cache, instance_uuid, address):
+    """Return the cached metadata of an instance if it has address."""
+    if cache is None:
+        return None
+    md = cache.get(cache_key(instance_uuid))
+    if md is None:
+        return None
+    ip_info = md.ip_info
+    if address not in ip_info['fixed_ips'] + ip_info['fixed_ip6s']:
+        return None
+    md = copy.copy(md)
+    md.address = address
+    return md
+
+
+def get_metadata_by_address(conductor_api, address, fixed_ip_index=None,
+                            cache=None):
     ctxt = context.get_admin_context()
+    if fixed_ip_index is not None:
+        instance_uuid = fixed_ip_index.get_instance_uuid(ctxt, address)
+        if instance_uuid is not None:
+            md = _get_prerendered_metadata(cache, instance_uuid, address)
+            if md is not None:
+                return md
+            instance = _get_instance_with_address(conductor_api, ctxt,
+                                                  instance_uuid, address)
+            if instance is not None:
+                return InstanceMetadata(instance, address)
+            fixed_ip_index.discard(address)
+
     fixed_ip = network.API().get_fixed_ip_by_address(ctxt, address)
 
     return get_metadata_by_instance_id(conductor_api,
                                        fixed_ip['instance_uuid'],
                                        address,
-                                       ctxt)
+                                       ctxt,
+                                       cache)
 
 
 def get_metadata_by_instance_id(conductor_api, instance_id, address,
-                                ctxt=None):
+                                ctxt=None, cache=None):
+    md = _get_prerendered_metadata(cache, instance_id, address)
+    if md is not None:
+        return md
     ctxt = ctxt or context.get_admin_context()
     instance = conductor_api.instance_get_by_uuid(ctxt, instance_id)
     return InstanceMetadata(instance, address)
 
 
+def cache_key(key):
+    """Return the cache key of the metadata for an address or uuid."""
+    return compute_utils.metadata_cache_key(key)
+
+
+def cache_instance_metadata(cache, instance, network_info,
+                            conductor_api=None):
+    """Build the metadata of instance and store it in cache.
+
+    The metadata is stored under the uuid of the instance for as long as
+    the metadata handler caches what it renders. Requests are still
+    resolved to the instance first, so that an address that has moved on
+    to another instance is never answered with this metadata.
+    """
+    fixed_ips = network_info.fixed_ips()
+    v4_addresses = [ip['address'] for ip in fixed_ips if ip['version'] == 4]
+    md = InstanceMetadata(instance,
+                          address=v4_addresses and v4_addresses[0] or None,
+                          conductor_api=conductor_api,
+                          network_info=network_info)
+    cache.set(cache_key(instance['uuid']), md, CACHE_EXPIRATION)
+    return md
+
+
 def _format_instance_mapping(conductor_api, ctxt, instance):
     bdms = conductor_api.block_device_mapping_get_all_by_instance(
                ctxt, instance)
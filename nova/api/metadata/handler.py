@@ -26,14 +26,13 @@ import webob.dec
 import webob.exc
 
 from nova.api.metadata import base
+from nova import cache_utils
 from nova import conductor
 from nova import exception
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
-from nova.openstack.common import memorycache
 from nova import wsgi
 
-CACHE_EXPIRATION = 15  # in seconds
 
 CONF = cfg.CONF
 CONF.import_opt('use_forwarded_for', 'nova.api.auth')
@@ -61,29 +60,34 @@ class MetadataRequestHandler(wsgi.Application):
     """Serve metadata."""
 
     def __init__(self):
-        self._cache = memorycache.get_client()
+        self._cache = cache_utils.get_client()
         self.conductor_api = conductor.API()
+        self._fixed_ip_index = None
+        if CONF.metadata_fixed_ip_index_interval > 0:
+            self._fixed_ip_index = base.FixedIpIndex()
 
     def get_metadata_by_remote_address(self, address):
         if not address:
             raise exception.FixedIpNotFoundForAddress(address=address)
 
-        cache_key = 'metadata-%s' % address
+        cache_key = base.cache_key(address)
         data = self._cache.get(cache_key)
         if data:
             return data
 
         try:
-            data = base.get_metadata_by_address(self.conductor_api, address)
+            data = base.get_metadata_by_address(self.conductor_api, address,
+                                                self._fixed_ip_index,
+                                                self._cache)
         except exception.NotFound:
             return None
 
-        self._cache.set(cache_key, data, CACHE_EXPIRATION)
+        self._cache.set(cache_key, data, base.CACHE_EXPIRATION)
 
         return data
 
     def get_metadata_by_instance_id(self, instance_id, address):
-        cache_key = 'metadata-%s' % instance_id
+        cache_key = base.cache_key(instance_id)
         data = self._cache.get(cache_key)
         if data:
             return data
@@ -94,7 +98,7 @@ class MetadataRequestHandler(wsgi.Application):
         except exception.NotFound:
             return None
 
-        self._cache.set(cache_key, data, CACHE_EXPIRATION)
+        self._cache.set(cache_key, data, base.CACHE_EXPIRATION)
 
         return data
 
@@ -22,6 +22,7 @@ from webob import exc
 from nova.api.openstack import extensions
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
+from nova.compute import flavors
 from nova import db
 from nova import exception
 from nova.openstack.common.gettextutils import _
@@ -75,6 +76,7 @@ class FlavorExtraSpecsController(object):
                                                               specs)
         except exception.MetadataLimitExceeded as error:
             raise exc.HTTPBadRequest(explanation=error.format_message())
+        flavors.invalidate_cache()
         return body
 
     @wsgi.serializers(xml=ExtraSpecTemplate)
@@ -94,6 +96,7 @@ class FlavorExtraSpecsController(object):
                                                                body)
         except exception.MetadataLimitExceeded as error:
             raise exc.HTTPBadRequest(explanation=error.format_message())
+        flavors.invalidate_cache()
         return body
 
     @wsgi.serializers(xml=ExtraSpecTemplate)
@@ -116,6 +119,7 @@ class FlavorExtraSpecsController(object):
             db.flavor_extra_specs_delete(context, flavor_id, id)
         except exception.InstanceTypeExtraSpecsNotFound as e:
             raise exc.HTTPNotFound(explanation=e.format_message())
+        flavors.invalidate_cache()
 
 
 class Flavorextraspecs(extensions.ExtensionDescriptor):
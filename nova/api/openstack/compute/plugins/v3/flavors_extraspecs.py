@@ -20,6 +20,7 @@ import webob
 from nova.api.openstack import extensions
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
+from nova.compute import flavors
 from nova import db
 from nova import exception
 from nova.openstack.common.db import exception as db_exc
@@ -79,6 +80,7 @@ class FlavorExtraSpecsController(object):
                                                           specs)
         except db_exc.DBDuplicateEntry as error:
             raise webob.exc.HTTPBadRequest(explanation=error.format_message())
+        flavors.invalidate_cache()
         return body
 
     @wsgi.serializers(xml=ExtraSpecTemplate)
@@ -97,6 +99,7 @@ class FlavorExtraSpecsController(object):
                                                           body)
         except db_exc.DBDuplicateEntry as error:
             raise webob.exc.HTTPBadRequest(explanation=error.format_message())
+        flavors.invalidate_cache()
         return body
 
     @wsgi.serializers(xml=ExtraSpecTemplate)
@@ -121,6 +124,7 @@ class FlavorExtraSpecsController(object):
             db.instance_type_extra_specs_delete(context, flavor_id, id)
         except exception.InstanceTypeExtraSpecsNotFound as e:
             raise webob.exc.HTTPNotFound(explanation=e.format_message())
+        flavors.invalidate_cache()
 
 
 class FlavorsExtraSpecs(extensions.V3APIExtensionBase):
@@ -535,6 +535,15 @@ class Controller(wsgi.Controller):
                 raise exc.HTTPBadRequest(explanation=msg)
             search_opts['changes-since'] = parsed
 
+        for filter_name in ('launched-since', 'launched-before'):
+            if filter_name in search_opts:
+                try:
+                    parsed = timeutils.parse_isotime(search_opts[filter_name])
+                except ValueError:
+                    msg = _('Invalid %s value') % filter_name
+                    raise exc.HTTPBadRequest(explanation=msg)
+                search_opts[filter_name] = parsed
+
         # By default, compute's get_all() will return deleted instances.
         # If an admin hasn't specified a 'deleted' search option, we need
         # to filter out deleted instances by setting the filter ourselves.
@@ -560,12 +569,12 @@ class Controller(wsgi.Controller):
                 search_opts['user_id'] = context.user_id
 
         limit, marker = common.get_limit_and_marker(req)
+        # The index view only renders the ids and names of the servers
+        expected_attrs = None if is_detail else []
         try:
-            instance_list = self.compute_api.get_all(context,
-                                                     search_opts=search_opts,
-                                                     limit=limit,
-                                                     marker=marker,
-                                                     want_objects=True)
+            instance_list = self.compute_api.get_all(
+                context, search_opts=search_opts, limit=limit, marker=marker,
+                want_objects=True, expected_attrs=expected_attrs)
         except exception.MarkerNotFound:
             msg = _('marker [%s] not found') % marker
             raise exc.HTTPBadRequest(explanation=msg)
@@ -575,7 +584,7 @@ class Controller(wsgi.Controller):
             instance_list = []
 
         if is_detail:
-            instance_list.fill_faults()
+            instance_list.fill(['fault'])
             response = self._view_builder.detail(req, instance_list)
         else:
             response = self._view_builder.index(req, instance_list)
@@ -17,8 +17,8 @@
 
 from oslo.config import cfg
 
+from nova import cache_utils
 from nova import db
-from nova.openstack.common import memorycache
 
 # NOTE(vish): azs don't change that often, so cache them for an hour to
 #             avoid hitting the db multiple times on every request.
@@ -42,7 +42,7 @@ def _get_cache():
     global MC
 
     if MC is None:
-        MC = memorycache.get_client()
+        MC = cache_utils.get_client()
 
     return MC
 
@@ -96,6 +96,23 @@ def get_host_availability_zone(context, host, conductor_api=None):
     return az
 
 
+def get_host_availability_zones(context, hosts):
+    """Return a dict of the availability zones of the given hosts.
+
+    Looks the zones of all the hosts up at once rather than one query per
+    host as get_host_availability_zone does.
+    """
+    metadata = db.aggregate_host_get_by_metadata_key(context,
+            key='availability_zone')
+    zones = {}
+    for host in hosts:
+        if metadata.get(host):
+            zones[host] = list(metadata[host])[0]
+        else:
+            zones[host] = CONF.default_availability_zone
+    return zones
+
+
 def get_availability_zones(context, get_only_available=False):
     """Return available and unavailable zones on demands.
 
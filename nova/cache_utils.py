@@ -0,0 +1,174 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Cache clients with a bounded in-process fallback."""
+
+from oslo.config import cfg
+
+from nova.openstack.common import memorycache
+from nova.openstack.common import timeutils
+
+cache_opts = [
+    cfg.IntOpt('memorycache_max_entries',
+               default=100000,
+               help='Maximum number of keys kept by the in process cache, '
+                    'least recently used ones are evicted first. 0 means '
+                    'unbounded.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(cache_opts)
+
+# Seconds between two purges of all the expired keys of a Client
+SWEEP_INTERVAL = 60
+
+
+def get_client(memcached_servers=None):
+    """Return a memcached client, or a Client if memcached is not used."""
+    client = memorycache.get_client(memcached_servers)
+    if isinstance(client, memorycache.Client):
+        return Client()
+    return client
+
+
+class Client(memorycache.Client):
+    """In process cache holding at most memorycache_max_entries keys.
+
+    Keys are kept in least recently used order so that both lookups and
+    evictions are O(1). Expired keys are dropped when looked up, when they
+    reach the least recently used end of the cache, and by a purge of the
+    whole cache done by get at most every SWEEP_INTERVAL seconds.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Ignores the passed in args."""
+        self.max_entries = CONF.memorycache_max_entries
+        # key -> [prev link, next link, key, timeout, value]
+        self.cache = {}
+        # Circular doubly linked list, most recently used key last
+        self._root = []
+        self._root[:] = [self._root, self._root, None, 0, None]
+        self._swept_at = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _unlink(self, link):
+        link_prev, link_next = link[0], link[1]
+        link_prev[1] = link_next
+        link_next[0] = link_prev
+
+    def _append(self, link):
+        root = self._root
+        last = root[0]
+        link[0] = last
+        link[1] = root
+        last[1] = root[0] = link
+
+    def _lookup(self, key, now):
+        link = self.cache.get(key)
+        if link is None:
+            return None
+        timeout = link[3]
+        if timeout and now >= timeout:
+            self._unlink(link)
+            del self.cache[key]
+            return None
+        return link
+
+    def _sweep(self, now):
+        """Drop all the expired keys if the last purge is old enough."""
+        if now < self._swept_at + SWEEP_INTERVAL:
+            return
+        self._swept_at = now
+        for key, link in self.cache.items():
+            timeout = link[3]
+            if timeout and now >= timeout:
+                self._unlink(link)
+                del self.cache[key]
+
+    def _evict(self):
+        """Drop the least recently used keys until the cache fits."""
+        if not self.max_entries:
+            return
+        root = self._root
+        while len(self.cache) > self.max_entries:
+            oldest = root[1]
+            self._unlink(oldest)
+            del self.cache[oldest[2]]
+            timeout = oldest[3]
+            if not timeout or timeutils.utcnow_ts() < timeout:
+                self.evictions += 1
+
+    def get(self, key):
+        """Retrieves the value for a key or None."""
+        now = timeutils.utcnow_ts()
+        self._sweep(now)
+        link = self._lookup(key, now)
+        if link is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._unlink(link)
+        self._append(link)
+        return link[4]
+
+    def set(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key."""
+        timeout = 0
+        if time != 0:
+            timeout = timeutils.utcnow_ts() + time
+        link = self.cache.get(key)
+        if link is not None:
+            self._unlink(link)
+            link[3] = timeout
+            link[4] = value
+        else:
+            link = [None, None, key, timeout, value]
+            self.cache[key] = link
+        self._append(link)
+        self._evict()
+        return True
+
+    def add(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key if it doesn't exist."""
+        if self._lookup(key, timeutils.utcnow_ts()) is not None:
+            return False
+        return self.set(key, value, time, min_compress_len)
+
+    def incr(self, key, delta=1):
+        """Increments the value for a key."""
+        link = self._lookup(key, timeutils.utcnow_ts())
+        if link is None:
+            return None
+        new_value = int(link[4]) + delta
+        link[4] = str(new_value)
+        return new_value
+
+    def delete(self, key, time=0):
+        """Deletes the value associated with a key."""
+        link = self.cache.pop(key, None)
+        if link is not None:
+            self._unlink(link)
+
+    def get_stats(self):
+        """Returns the cache statistics, shaped like memcached's."""
+        return [('memorycache', {'get_hits': self.hits,
+                                 'get_misses': self.misses,
+                                 'evictions': self.evictions,
+                                 'curr_items': len(self.cache),
+                                 'limit_maxitems': self.max_entries})]
@@ -635,7 +635,8 @@ class _BaseMessageMethods(base.Base):
                                              period_beginning,
                                              period_ending,
                                              host=host,
-                                             state=state)
+                                             state=state,
+                                             use_slave=True)
         return jsonutils.to_primitive(task_logs)
 
 
@@ -1089,7 +1090,8 @@ class _BroadcastMessageMethods(_BaseMessageMethods):
             nodes = self.db.compute_node_search_by_hypervisor(message.ctxt,
                     hypervisor_match)
         else:
-            nodes = self.db.compute_node_get_all(message.ctxt)
+            nodes = self.db.compute_node_get_all(message.ctxt,
+                                                 use_slave=True)
         return jsonutils.to_primitive(nodes)
 
     def compute_node_stats(self, message):
@@ -23,6 +23,7 @@ import functools
 from oslo.config import cfg
 
 from nova.cells import rpc_driver
+from nova.compute import flavors
 from nova import context
 from nova.db import base
 from nova import exception
@@ -293,7 +294,7 @@ class CellStateManager(base.Base):
             ram_mb_free_units[str(memory_mb)] += ram_free_units
             disk_mb_free_units[str(disk_mb)] += disk_free_units
 
-        instance_types = self.db.flavor_get_all(ctxt)
+        instance_types = flavors.get_all_flavors(ctxt).values()
 
         for compute_values in compute_hosts.values():
             total_ram_mb_free += compute_values['free_ram_mb']
@@ -650,11 +650,11 @@ class VmCommands(object):
                                              _('zone'),
                                              _('index'))))
 
-        if host is None:
-            instances = db.instance_get_all(context.get_admin_context())
-        else:
-            instances = db.instance_get_all_by_host(
-                           context.get_admin_context(), host)
+        filters = {'deleted': False, 'soft_deleted': True}
+        if host is not None:
+            filters['host'] = host
+        instances = db.instance_get_all_by_filters_iter(
+            context.get_admin_context(), filters)
 
         for instance in instances:
             instance_type = flavors.extract_flavor(instance)
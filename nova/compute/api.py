@@ -1460,6 +1460,7 @@ class API(base.Base):
                       "database") % instance['host'], instance=instance)
         instance_uuid = instance['uuid']
         instance.info_cache.delete()
+        compute_utils.uncache_instance_metadata(instance_uuid)
         compute_utils.notify_about_instance_usage(
             self.notifier, context, instance, "%s.start" % delete_type)
 
@@ -1627,7 +1628,8 @@ class API(base.Base):
     def get_active_by_window(self, context, begin, end=None, project_id=None):
         """Get instances that were continuously active over a window."""
         return self.db.instance_get_active_by_window_joined(context, begin,
-                                                     end, project_id)
+                                                     end, project_id,
+                                                     use_slave=True)
 
     #NOTE(bcwaldon): this doesn't really belong in this class
     def get_instance_type(self, context, instance_type_id):
@@ -1658,7 +1660,8 @@ class API(base.Base):
         return instance
 
     def get_all(self, context, search_opts=None, sort_key='created_at',
-                sort_dir='desc', limit=None, marker=None, want_objects=False):
+                sort_dir='desc', limit=None, marker=None, want_objects=False,
+                expected_attrs=None):
         """Get all instances filtered by one of the given parameters.
 
         If there is no filter and the context is an admin, it will retrieve
@@ -1670,6 +1673,10 @@ class API(base.Base):
         The results will be returned sorted in the order specified by the
         'sort_dir' parameter using the key specified in the 'sort_key'
         parameter.
+
+        The optional instance attributes loaded with the instances can be
+        limited to what the caller needs with 'expected_attrs', by default
+        metadata, system_metadata, info_cache and security_groups are.
         """
 
         #TODO(bcwaldon): determine the best argument for target here
@@ -1734,10 +1741,9 @@ class API(base.Base):
                     except ValueError:
                         return []
 
-        inst_models = self._get_instances_by_filters(context, filters,
-                                                     sort_key, sort_dir,
-                                                     limit=limit,
-                                                     marker=marker)
+        inst_models = self._get_instances_by_filters(
+            context, filters, sort_key, sort_dir, limit=limit, marker=marker,
+            expected_attrs=expected_attrs)
         if want_objects:
             return inst_models
 
@@ -1751,7 +1757,8 @@ class API(base.Base):
     def _get_instances_by_filters(self, context, filters,
                                   sort_key, sort_dir,
                                   limit=None,
-                                  marker=None):
+                                  marker=None,
+                                  expected_attrs=None):
         if 'ip6' in filters or 'ip' in filters:
             res = self.network_api.get_instance_uuids_by_ip_filter(context,
                                                                    filters)
@@ -1760,8 +1767,10 @@ class API(base.Base):
             uuids = set([r['instance_uuid'] for r in res])
             filters['uuid'] = uuids
 
-        fields = ['metadata', 'system_metadata', 'info_cache',
-                  'security_groups']
+        fields = expected_attrs
+        if fields is None:
+            fields = ['metadata', 'system_metadata', 'info_cache',
+                      'security_groups']
         return instance_obj.InstanceList.get_by_filters(
             context, filters=filters, sort_key=sort_key, sort_dir=sort_dir,
             limit=limit, marker=marker, expected_attrs=fields)
@@ -3047,14 +3056,15 @@ class HostAPI(base.Base):
                                         period_beginning,
                                         period_ending,
                                         host=host,
-                                        state=state)
+                                        state=state,
+                                        use_slave=True)
 
     def compute_node_get(self, context, compute_id):
         """Return compute node entry for particular integer ID."""
         return self.db.compute_node_get(context, int(compute_id))
 
     def compute_node_get_all(self, context):
-        return self.db.compute_node_get_all(context)
+        return self.db.compute_node_get_all(context, use_slave=True)
 
     def compute_node_search_by_hypervisor(self, context, hypervisor_match):
         return self.db.compute_node_search_by_hypervisor(context,
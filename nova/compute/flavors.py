@@ -20,11 +20,13 @@
 
 """Built-in instance properties."""
 
+import copy
 import re
 import uuid
 
 from oslo.config import cfg
 
+from nova import cache_utils
 from nova import context
 from nova import db
 from nova import exception
@@ -32,6 +34,7 @@ from nova.openstack.common.db import exception as db_exc
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.openstack.common import strutils
+from nova.openstack.common import timeutils
 from nova.pci import pci_request
 from nova import utils
 
@@ -42,6 +45,14 @@ flavor_opts = [
                default='m1.small',
                help='default flavor to use for the EC2 API only. The Nova API '
                'does not support a default flavor.'),
+    cfg.IntOpt('flavor_cache_seconds',
+               default=0,
+               help='Number of seconds flavors are kept in the in process '
+                    'flavor cache. 0 disables the cache. Flavor changes '
+                    'invalidate the caches of all processes sharing the '
+                    'memcached_servers right away. Without '
+                    'memcached_servers, changes made by other processes are '
+                    'only seen once the cached entries expire.'),
 ]
 
 CONF = cfg.CONF
@@ -51,6 +62,16 @@ LOG = logging.getLogger(__name__)
 
 VALID_NAME_OR_ID_REGEX = re.compile("^[\w\.\- ]*$")
 
+# Flavors hardly ever change, so lookups may be cached in process.
+# Entries are tagged with the generation of the flavors read before their
+# lookup, which is kept in memcache so that it is shared between processes.
+# invalidate_cache starts a new generation, so that all processes stop
+# using their entries, including those read while the flavors changed.
+_CACHE = {}
+_CACHE_MAX_ENTRIES = 1000
+_GENERATION_KEY = 'flavor-cache-generation'
+MC = None
+
 
 def _int_or_none(val):
     if val is not None:
@@ -71,6 +92,61 @@ system_metadata_flavor_props = {
     }
 
 
+def _get_cache():
+    global MC
+
+    if MC is None:
+        MC = cache_utils.get_client()
+
+    return MC
+
+
+def _get_generation():
+    """Return the current generation of the flavors."""
+    cache = _get_cache()
+    generation = cache.get(_GENERATION_KEY)
+    if generation is None:
+        # Generations are never reused, so that entries of a generation
+        # evicted from memcache are not used again.
+        generation = str(uuid.uuid4())
+        if not cache.add(_GENERATION_KEY, generation):
+            generation = cache.get(_GENERATION_KEY)
+    return generation
+
+
+def invalidate_cache():
+    """Invalidate the flavor caches of all processes.
+
+    Must be called whenever flavors, their extra specs or access lists
+    change.
+    """
+    _CACHE.clear()
+    _get_cache().set(_GENERATION_KEY, str(uuid.uuid4()))
+
+
+def _cached(ctxt, key, lookup):
+    """Return a copy of the result of lookup, cached under key."""
+    if CONF.flavor_cache_seconds <= 0:
+        return lookup()
+
+    # Non admin contexts only see the flavors their project has access to.
+    project_id = None if ctxt.is_admin else ctxt.project_id
+    key += (ctxt.read_deleted, project_id)
+    generation = _get_generation()
+    if generation is None:
+        # memcache can't be reached, so changes may go unnoticed
+        return lookup()
+    now = timeutils.utcnow_ts()
+    entry = _CACHE.get(key)
+    if entry is None or entry[0] != generation or entry[1] <= now:
+        value = lookup()
+        if len(_CACHE) >= _CACHE_MAX_ENTRIES:
+            _CACHE.clear()
+        entry = (generation, now + CONF.flavor_cache_seconds, value)
+        _CACHE[key] = entry
+    return copy.deepcopy(entry[2])
+
+
 def create(name, memory, vcpus, root_gb, ephemeral_gb=0, flavorid=None,
            swap=0, rxtx_factor=1.0, is_public=True):
     """Creates flavors."""
@@ -154,10 +230,12 @@ def create(name, memory, vcpus, root_gb, ephemeral_gb=0, flavorid=None,
         raise exception.InvalidInput(reason=_("is_public must be a boolean"))
 
     try:
-        return db.flavor_create(context.get_admin_context(), kwargs)
+        flavor = db.flavor_create(context.get_admin_context(), kwargs)
     except db_exc.DBError as e:
         LOG.exception(_('DB error: %s') % e)
         raise exception.InstanceTypeCreateFailed()
+    invalidate_cache()
+    return flavor
 
 
 def destroy(name):
@@ -169,6 +247,7 @@ def destroy(name):
     except (ValueError, exception.NotFound):
         LOG.exception(_('Instance type %s not found for deletion') % name)
         raise exception.InstanceTypeNotFoundByName(instance_type_name=name)
+    invalidate_cache()
 
 
 def get_all_flavors(ctxt=None, inactive=False, filters=None):
@@ -179,8 +258,13 @@ def get_all_flavors(ctxt=None, inactive=False, filters=None):
     if ctxt is None:
         ctxt = context.get_admin_context()
 
-    inst_types = db.flavor_get_all(
-            ctxt, inactive=inactive, filters=filters)
+    if filters is None:
+        inst_types = _cached(ctxt, ('all', inactive),
+                             lambda: db.flavor_get_all(ctxt,
+                                                       inactive=inactive))
+    else:
+        inst_types = db.flavor_get_all(
+                ctxt, inactive=inactive, filters=filters)
 
     inst_type_dict = {}
     for inst_type in inst_types:
@@ -219,7 +303,8 @@ def get_flavor(instance_type_id, ctxt=None, inactive=False):
     if inactive:
         ctxt = ctxt.elevated(read_deleted="yes")
 
-    return db.flavor_get(ctxt, instance_type_id)
+    return _cached(ctxt, ('id', instance_type_id),
+                   lambda: db.flavor_get(ctxt, instance_type_id))
 
 
 def get_flavor_by_name(name, ctxt=None):
@@ -230,7 +315,8 @@ def get_flavor_by_name(name, ctxt=None):
     if ctxt is None:
         ctxt = context.get_admin_context()
 
-    return db.flavor_get_by_name(ctxt, name)
+    return _cached(ctxt, ('name', name),
+                   lambda: db.flavor_get_by_name(ctxt, name))
 
 
 # TODO(termie): flavor-specific code should probably be in the API that uses
@@ -243,7 +329,9 @@ def get_flavor_by_flavor_id(flavorid, ctxt=None, read_deleted="yes"):
     if ctxt is None:
         ctxt = context.get_admin_context(read_deleted=read_deleted)
 
-    return db.flavor_get_by_flavor_id(ctxt, flavorid, read_deleted)
+    return _cached(ctxt, ('flavorid', flavorid, read_deleted),
+                   lambda: db.flavor_get_by_flavor_id(ctxt, flavorid,
+                                                      read_deleted))
 
 
 def get_flavor_access_by_flavor_id(flavorid, ctxt=None):
@@ -251,6 +339,8 @@ def get_flavor_access_by_flavor_id(flavorid, ctxt=None):
     if ctxt is None:
         ctxt = context.get_admin_context()
 
+    # Access lists are not cached, so that revoked access is never seen as
+    # granted.
     return db.flavor_access_get_by_flavor_id(ctxt, flavorid)
 
 
@@ -259,7 +349,9 @@ def add_flavor_access(flavorid, projectid, ctxt=None):
     if ctxt is None:
         ctxt = context.get_admin_context()
 
-    return db.flavor_access_add(ctxt, flavorid, projectid)
+    access_ref = db.flavor_access_add(ctxt, flavorid, projectid)
+    invalidate_cache()
+    return access_ref
 
 
 def remove_flavor_access(flavorid, projectid, ctxt=None):
@@ -267,7 +359,9 @@ def remove_flavor_access(flavorid, projectid, ctxt=None):
     if ctxt is None:
         ctxt = context.get_admin_context()
 
-    return db.flavor_access_remove(ctxt, flavorid, projectid)
+    access_ref = db.flavor_access_remove(ctxt, flavorid, projectid)
+    invalidate_cache()
+    return access_ref
 
 
 def extract_flavor(instance, prefix=''):
@@ -36,10 +36,12 @@ import time
 import traceback
 import uuid
 
+from eventlet import greenpool
 from eventlet import greenthread
 from oslo.config import cfg
 
 from nova import block_device
+from nova import cache_utils
 from nova.cells import rpcapi as cells_rpcapi
 from nova.cloudpipe import pipelib
 from nova import compute
@@ -67,6 +69,7 @@ from nova.objects import migration as migration_obj
 from nova.objects import quotas as quotas_obj
 from nova.openstack.common import excutils
 from nova.openstack.common.gettextutils import _
+from nova.openstack.common import importutils
 from nova.openstack.common import jsonutils
 from nova.openstack.common import log as logging
 from nova.openstack.common import periodic_task
@@ -113,6 +116,23 @@ compute_opts = [
     cfg.IntOpt('network_allocate_retries',
                default=0,
                help="Number of times to retry network allocation on failures"),
+    cfg.IntOpt('sync_power_state_pool_size',
+               default=20,
+               help='Maximum number of instances whose power state is '
+                    'synced between the database and the hypervisor at '
+                    'the same time'),
+    cfg.IntOpt("heal_instance_info_cache_batch_size",
+               default=1,
+               help="Number of instances whose info_cache is healed on "
+                    "each info_cache self healing update"),
+    cfg.BoolOpt('metadata_prerender',
+                default=False,
+                help='Whether compute hosts build the metadata of their '
+                     'instances when they are booted or their metadata or '
+                     'network changes, and store it in the cache shared '
+                     'with the metadata API through memcached_servers so '
+                     'that it is served without rendering it again. '
+                     'Requires memcached_servers'),
     ]
 
 interval_opts = [
@@ -440,6 +460,8 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.consoleauth_rpcapi = consoleauth.rpcapi.ConsoleAuthAPI()
         self.cells_rpcapi = cells_rpcapi.CellsAPI()
         self._resource_tracker_dict = {}
+        self._metadata_cache = cache_utils.get_client()
+        self._metadata_prerender_warned = False
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
@@ -465,6 +487,40 @@ class ComputeManager(manager.SchedulerDependentManager):
             self._resource_tracker_dict[nodename] = rt
         return rt
 
+    def _metadata_prerender_enabled(self):
+        """Whether metadata is pre-rendered for the metadata API.
+
+        The metadata API can only read it from memcached, so nothing is
+        pre-rendered into the in-process cache used without
+        memcached_servers.
+        """
+        if not CONF.metadata_prerender:
+            return False
+        if not CONF.memcached_servers:
+            if not self._metadata_prerender_warned:
+                LOG.warn(_('metadata_prerender is set but memcached_servers '
+                           'is not, so metadata is not pre-rendered'))
+                self._metadata_prerender_warned = True
+            return False
+        return True
+
+    def _prerender_metadata(self, context, instance, network_info=None):
+        """Store the metadata of instance in the metadata cache."""
+        if not self._metadata_prerender_enabled():
+            return
+        try:
+            if network_info is None:
+                network_info = self._get_instance_nw_info(context, instance)
+            # The metadata API is only loaded on hosts pre-rendering
+            instance_metadata = importutils.import_module(
+                'nova.api.metadata.base')
+            instance_metadata.cache_instance_metadata(
+                self._metadata_cache, obj_base.obj_to_primitive(instance),
+                network_info, conductor_api=self.conductor_api)
+        except Exception:
+            LOG.exception(_('Failed to pre-render instance metadata'),
+                          instance=instance)
+
     def _instance_update(self, context, instance_uuid, **kwargs):
         """Update an instance in the database using kwargs as value."""
 
@@ -944,6 +1000,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                     request_spec, filter_properties, requested_networks,
                     injected_files, admin_password, is_first_time, node,
                     instance, image_meta, legacy_bdm_in_spec)
+            self._prerender_metadata(context, instance, network_info)
             notify("end", msg=_("Success"), network_info=network_info)
 
         except exception.RescheduledException as e:
@@ -1639,6 +1696,7 @@ class ComputeManager(manager.SchedulerDependentManager):
             network_info = self._get_instance_nw_info(context, instance)
         except (exception.NetworkNotFound, exception.NoMoreFixedIps):
             network_info = network_model.NetworkInfo()
+        compute_utils.uncache_instance_metadata(instance['uuid'])
 
         # NOTE(vish) get bdms before destroying the instance
         vol_bdms = self._get_volume_bdms(bdms)
@@ -2073,6 +2131,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                                  progress=0)
                 self.stop_instance(context, instance=instance)
 
+            self._prerender_metadata(context, instance, network_info)
             self._notify_about_instance_usage(
                     context, instance, "rebuild.end",
                     network_info=network_info,
@@ -2590,6 +2649,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         LOG.debug(_("Changing instance metadata according to %r"),
                   diff, instance=instance)
         self.driver.change_instance_metadata(context, instance, diff)
+        self._prerender_metadata(context, instance)
 
     def _cleanup_stored_instance_types(self, migration, instance,
                                        restore_old=False):
@@ -3172,6 +3232,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                 context, instance_obj.Instance(), instance)
         network_info = self._inject_network_info(context, inst_obj)
         self.reset_network(context, inst_obj)
+        self._prerender_metadata(context, instance, network_info)
 
         # NOTE(russellb) We just want to bump updated_at.  See bug 1143466.
         self._instance_update(context, instance['uuid'],
@@ -3198,6 +3259,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                 context, instance_obj.Instance(), instance)
         network_info = self._inject_network_info(context, inst_obj)
         self.reset_network(context, inst_obj)
+        self._prerender_metadata(context, instance, network_info)
 
         # NOTE(russellb) We just want to bump updated_at.  See bug 1143466.
         self._instance_update(context, instance['uuid'],
@@ -3878,6 +3940,7 @@ class ComputeManager(manager.SchedulerDependentManager):
             context, image_service, image_ref, instance)
 
         self.driver.attach_interface(instance, image_meta, network_info[0])
+        self._prerender_metadata(context, instance)
         return network_info[0]
 
     def detach_interface(self, context, instance, port_id):
@@ -3897,6 +3960,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.network_api.deallocate_port_for_instance(context, instance,
             port_id, conductor_api=self.conductor_api)
         self.driver.detach_interface(instance, [condemned])
+        self._prerender_metadata(context, instance)
 
     def _get_compute_info(self, context, host):
         compute_node_ref = self.conductor_api.service_get_by_compute_host(
@@ -4308,6 +4372,11 @@ class ComputeManager(manager.SchedulerDependentManager):
             return
         self._last_info_cache_heal = curr_time
 
+        batch_size = CONF.heal_instance_info_cache_batch_size
+        if batch_size > 1:
+            self._heal_instance_info_cache_batch(context, batch_size)
+            return
+
         instance_uuids = getattr(self, '_instance_uuids_to_heal', None)
         instance = None
 
@@ -4342,13 +4411,48 @@ class ComputeManager(manager.SchedulerDependentManager):
             # We don't care about any failures
             pass
 
+    def _heal_instance_info_cache_batch(self, context, batch_size):
+        """Update the info_cache of the next batch_size instances of this
+        host with one DB query and one call to the network API.
+
+        The uuids still to heal are kept between calls, so consecutive
+        calls rotate through all instances of the host before it is
+        queried again.
+        """
+        instance_uuids = getattr(self, '_instance_uuids_to_heal', None)
+        if not instance_uuids:
+            db_instances = instance_obj.InstanceList.get_by_host(
+                context, self.host, expected_attrs=[])
+            instance_uuids = [inst['uuid'] for inst in db_instances]
+            if not instance_uuids:
+                return
+        self._instance_uuids_to_heal = instance_uuids[batch_size:]
+
+        # Instances which are gone or have moved to another host are
+        # simply not returned.
+        filters = {'uuid': instance_uuids[:batch_size],
+                   'host': self.host,
+                   'deleted': False}
+        instances = instance_obj.InstanceList.get_by_filters(
+            context, filters, expected_attrs=['system_metadata', 'info_cache'],
+            use_slave=True)
+        if not instances:
+            return
+        try:
+            self.network_api.get_instances_nw_info(context, instances)
+            LOG.debug(_('Updated the info_cache for %d instances'),
+                      len(instances))
+        except Exception:
+            # We don't care about any failures
+            pass
+
     @periodic_task.periodic_task
     def _poll_rebooting_instances(self, context):
         if CONF.reboot_timeout > 0:
             filters = {'task_state': task_states.REBOOTING,
                        'host': self.host}
             rebooting = instance_obj.InstanceList.get_by_filters(
-                context, filters, expected_attrs=[])
+                context, filters, expected_attrs=[], use_slave=True)
 
             to_poll = []
             for instance in rebooting:
@@ -4652,12 +4756,15 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         To sync power state data we make a DB call to get the number of
         virtual machines known by the hypervisor and if the number matches the
-        number of virtual machines known by the database, we proceed in a lazy
-        loop, one database record at a time, checking if the hypervisor has the
-        same power state as is in the database.
+        number of virtual machines known by the database, we ask the driver
+        for the power state of all of them at once and check, with at most
+        sync_power_state_pool_size instances in flight, if the hypervisor has
+        the same power state as is in the database.
         """
+        start_time = time.time()
         db_instances = instance_obj.InstanceList.get_by_host(context,
-                                                             self.host)
+                                                             self.host,
+                                                             use_slave=True)
 
         num_vm_instances = self.driver.get_num_instances()
         num_db_instances = len(db_instances)
@@ -4668,43 +4775,94 @@ class ComputeManager(manager.SchedulerDependentManager):
                      {'num_db_instances': num_db_instances,
                       'num_vm_instances': num_vm_instances})
 
+        instances = []
         for db_instance in db_instances:
             if db_instance['task_state'] is not None:
                 LOG.info(_("During sync_power_state the instance has a "
                            "pending task. Skip."), instance=db_instance)
                 continue
-            # No pending tasks. Now try to figure out the real vm_power_state.
-            try:
-                try:
-                    vm_instance = self.driver.get_info(db_instance)
-                    vm_power_state = vm_instance['state']
-                except exception.InstanceNotFound:
-                    vm_power_state = power_state.NOSTATE
-                # Note(maoy): the above get_info call might take a long time,
-                # for example, because of a broken libvirt driver.
-                try:
-                    self._sync_instance_power_state(context,
-                                                    db_instance,
-                                                    vm_power_state)
-                except exception.InstanceNotFound:
-                    # NOTE(hanlind): If the instance gets deleted during sync,
-                    # silently ignore and move on to next instance.
-                    continue
-            except Exception:
-                LOG.exception(_("Periodic sync_power_state task had an error "
-                                "while processing an instance."),
-                                instance=db_instance)
+            instances.append(db_instance)
+
+        # Note(maoy): the get_power_states call might take a long time,
+        # for example, because of a broken libvirt driver.
+        try:
+            vm_power_states = self.driver.get_power_states(instances)
+        except Exception:
+            LOG.exception(_("Periodic sync_power_state task had an error "
+                            "while getting the power states from the "
+                            "hypervisor."))
+            return
+        driver_time = time.time()
 
-    def _sync_instance_power_state(self, context, db_instance, vm_power_state):
+        # We re-query the DB to get the latest instance info to minimize
+        # (not eliminate) race condition, and update the power states
+        # from the hypervisor, with one conductor call for all instances.
+        db_instances.objects = [db_instance for db_instance in instances
+                                if db_instance['uuid'] in vm_power_states]
+        failures = db_instances.refresh_all()
+        for db_instance in db_instances:
+            vm_power_state = vm_power_states[db_instance['uuid']]
+            if (db_instance['uuid'] not in failures and
+                    db_instance.host == self.host and
+                    db_instance.task_state is None and
+                    db_instance.power_state != vm_power_state):
+                db_instance.power_state = vm_power_state
+        failures.update(db_instances.save_all())
+
+        pool = greenpool.GreenPool(CONF.sync_power_state_pool_size)
+        for db_instance in instances:
+            if db_instance['uuid'] not in vm_power_states:
+                # The driver could not tell the state of this instance.
+                continue
+            error = failures.get(db_instance['uuid'])
+            if isinstance(error, exception.InstanceNotFound):
+                # NOTE(hanlind): If the instance gets deleted during sync,
+                # silently ignore and move on to next instance.
+                continue
+            elif error is not None:
+                LOG.error(_("Periodic sync_power_state task had an error "
+                            "while processing an instance: %s"),
+                          unicode(error), instance=db_instance)
+                continue
+            pool.spawn_n(self._query_and_sync_power_state, context,
+                         db_instance, vm_power_states[db_instance['uuid']])
+        pool.waitall()
+
+        LOG.debug(_("Synchronized the power state of %(num_instances)d "
+                    "instances in %(total).2f seconds (%(driver).2f seconds "
+                    "in the driver)."),
+                  {'num_instances': len(instances),
+                   'total': time.time() - start_time,
+                   'driver': driver_time - start_time})
+
+    def _query_and_sync_power_state(self, context, db_instance,
+                                    vm_power_state):
+        try:
+            self._sync_instance_power_state(context, db_instance,
+                                            vm_power_state, refresh=False)
+        except exception.InstanceNotFound:
+            # NOTE(hanlind): If the instance gets deleted during sync,
+            # silently ignore and move on to next instance.
+            pass
+        except Exception:
+            LOG.exception(_("Periodic sync_power_state task had an error "
+                            "while processing an instance."),
+                            instance=db_instance)
+
+    def _sync_instance_power_state(self, context, db_instance, vm_power_state,
+                                   refresh=True):
         """Align instance power state between the database and hypervisor.
 
         If the instance is not found on the hypervisor, but is in the database,
         then a stop() API will be called on the instance.
+
+        refresh can be False if db_instance was just refreshed.
         """
 
-        # We re-query the DB to get the latest instance info to minimize
-        # (not eliminate) race condition.
-        db_instance.refresh()
+        if refresh:
+            # We re-query the DB to get the latest instance info to minimize
+            # (not eliminate) race condition.
+            db_instance.refresh()
         db_power_state = db_instance.power_state
         vm_state = db_instance.vm_state
 
@@ -4829,23 +4987,25 @@ class ComputeManager(manager.SchedulerDependentManager):
                    'task_state': None,
                    'host': self.host}
         instances = instance_obj.InstanceList.get_by_filters(
-            context, filters,
-            expected_attrs=instance_obj.INSTANCE_DEFAULT_FIELDS)
+            context, filters, expected_attrs=[])
+        instances.objects = [instance for instance in instances
+                             if self._deleted_old_enough(instance, interval)]
+        # Only load what deleting needs for the instances to reclaim
+        instances.fill(instance_obj.INSTANCE_DEFAULT_FIELDS)
         for instance in instances:
-            if self._deleted_old_enough(instance, interval):
-                capi = self.conductor_api
-                bdms = capi.block_device_mapping_get_all_by_instance(
-                    context, instance)
-                LOG.info(_('Reclaiming deleted instance'), instance=instance)
-                # NOTE(comstud): Quotas were already accounted for when
-                # the instance was soft deleted, so there's no need to
-                # pass reservations here.
-                try:
-                    self._delete_instance(context, instance, bdms)
-                except Exception as e:
-                    LOG.warning(_("Periodic reclaim failed to delete "
-                                  "instance: %s"),
-                                unicode(e), instance=instance)
+            capi = self.conductor_api
+            bdms = capi.block_device_mapping_get_all_by_instance(
+                context, instance)
+            LOG.info(_('Reclaiming deleted instance'), instance=instance)
+            # NOTE(comstud): Quotas were already accounted for when
+            # the instance was soft deleted, so there's no need to
+            # pass reservations here.
+            try:
+                self._delete_instance(context, instance, bdms)
+            except Exception as e:
+                LOG.warning(_("Periodic reclaim failed to delete "
+                              "instance: %s"),
+                            unicode(e), instance=instance)
 
     @periodic_task.periodic_task
     def update_available_resource(self, context):
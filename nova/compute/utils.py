@@ -24,6 +24,7 @@ import traceback
 from oslo.config import cfg
 
 from nova import block_device
+from nova import cache_utils
 from nova.compute import flavors
 from nova import exception
 from nova.network import model as network_model
@@ -40,6 +41,9 @@ CONF = cfg.CONF
 CONF.import_opt('host', 'nova.netconf')
 LOG = log.getLogger(__name__)
 
+# Cache shared with the metadata API, see uncache_instance_metadata()
+MC = None
+
 
 def add_instance_fault_from_exc(context, conductor,
                                 instance, fault, exc_info=None):
@@ -355,6 +359,26 @@ def get_nw_info_for_instance(instance):
     return nw_info
 
 
+def metadata_cache_key(key):
+    """Return the cache key of the metadata for an address or uuid."""
+    return 'metadata-%s' % key
+
+
+def uncache_instance_metadata(instance_uuid):
+    """Drop the metadata of an instance cached for the metadata API.
+
+    The metadata API and compute hosts pre-rendering metadata store it under
+    the instance uuid, so it has to be dropped when the instance is deleted
+    or its network changes.
+    """
+    global MC
+
+    if MC is None:
+        MC = cache_utils.get_client()
+
+    MC.delete(metadata_cache_key(instance_uuid))
+
+
 def has_audit_been_run(context, conductor, host, timestamp=None):
     begin, end = utils.last_completed_audit_period(before=timestamp)
     task_log = conductor.task_log_get(context, "instance_usage_audit",
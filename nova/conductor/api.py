@@ -35,7 +35,13 @@ conductor_opts = [
                default='nova.conductor.manager.ConductorManager',
                help='full class name for the Manager for conductor'),
     cfg.IntOpt('workers',
-               help='Number of workers for OpenStack Conductor service')
+               help='Number of workers for OpenStack Conductor service'),
+    cfg.BoolOpt('compact_objects',
+                default=False,
+                help='Send objects to and from conductor services in the '
+                     'compact wire format. Only enable this once all '
+                     'conductor services support it; it is not used while '
+                     'upgrade_levels caps conductor messages below 1.59'),
 ]
 conductor_group = cfg.OptGroup(name='conductor',
                                title='Conductor Options')
@@ -15,11 +15,13 @@
 """Handles database requests from other nova services."""
 
 import copy
+import sys
 
 from nova.api.ec2 import ec2utils
 from nova import block_device
 from nova.cells import rpcapi as cells_rpcapi
 from nova.compute import api as compute_api
+from nova.compute import flavors
 from nova.compute import rpcapi as compute_rpcapi
 from nova.compute import task_states
 from nova.compute import utils as compute_utils
@@ -76,7 +78,7 @@ class ConductorManager(manager.Manager):
     namespace.  See the ComputeTaskManager class for details.
     """
 
-    RPC_API_VERSION = '1.58'
+    RPC_API_VERSION = '1.60'
 
     def __init__(self, *args, **kwargs):
         super(ConductorManager, self).__init__(service_name='conductor',
@@ -360,8 +362,10 @@ class ConductorManager(manager.Manager):
 
     def instance_get_active_by_window_joined(self, context, begin, end=None,
                                              project_id=None, host=None):
+        # NOTE: This is only used by the instance usage audit of compute
+        # hosts, which can do with a slightly out of date view.
         result = self.db.instance_get_active_by_window_joined(
-            context, begin, end, project_id, host)
+            context, begin, end, project_id, host, use_slave=True)
         return jsonutils.to_primitive(result)
 
     def instance_destroy(self, context, instance):
@@ -375,7 +379,7 @@ class ConductorManager(manager.Manager):
                                            values)
 
     def instance_type_get(self, context, instance_type_id):
-        result = self.db.flavor_get(context, instance_type_id)
+        result = flavors.get_flavor(instance_type_id, ctxt=context)
         return jsonutils.to_primitive(result)
 
     def instance_fault_create(self, context, values):
@@ -555,17 +559,21 @@ class ConductorManager(manager.Manager):
         self.compute_api.unrescue(context, instance)
 
     def object_class_action(self, context, objname, objmethod,
-                            objver, args, kwargs):
+                            objver, args, kwargs, compact=False):
         """Perform a classmethod action on an object."""
         objclass = nova_object.NovaObject.obj_class_from_name(objname,
                                                               objver)
-        return getattr(objclass, objmethod)(context, *args, **kwargs)
+        result = getattr(objclass, objmethod)(context, *args, **kwargs)
+        if compact and isinstance(result, nova_object.NovaObject):
+            result = result.obj_to_compact_primitive()
+        return result
 
-    def object_action(self, context, objinst, objmethod, args, kwargs):
+    def object_action(self, context, objinst, objmethod, args, kwargs,
+                      compact=False):
         """Perform an action on an object."""
         oldobj = copy.copy(objinst)
         result = getattr(objinst, objmethod)(context, *args, **kwargs)
-        updates = dict()
+        changed = []
         # NOTE(danms): Diff the object with the one passed to us and
         # generate a list of changes to forward back
         for field in objinst.fields:
@@ -574,12 +582,40 @@ class ConductorManager(manager.Manager):
                 continue
             if (not oldobj.obj_attr_is_set(field) or
                     oldobj[field] != objinst[field]):
-                updates[field] = objinst._attr_to_primitive(field)
+                changed.append(field)
+        if compact:
+            if isinstance(result, nova_object.NovaObject):
+                result = result.obj_to_compact_primitive()
+            return objinst.obj_to_compact_primitive(fields=changed), result
+        updates = dict()
+        for field in changed:
+            updates[field] = objinst._attr_to_primitive(field)
         # This is safe since a field named this would conflict with the
         # method anyway
         updates['obj_what_changed'] = objinst.obj_what_changed()
         return updates, result
 
+    def object_action_batch(self, context, objinsts, objmethod, args, kwargs,
+                            compact=False):
+        """Perform the same action on several objects.
+
+        The failure of the action on one object is returned along with it
+        instead of being raised, so that the other objects are handled.
+        """
+        replies = []
+        for objinst in objinsts:
+            try:
+                updates, result = self.object_action(
+                    context, objinst, objmethod, args, kwargs,
+                    compact=compact)
+            except Exception:
+                replies.append((None, None,
+                                rpc_common.serialize_remote_exception(
+                                    sys.exc_info(), log_failure=False)))
+            else:
+                replies.append((updates, result, None))
+        return replies
+
     # NOTE(danms): This method is now deprecated and can be removed in
     # v2.0 of the RPC API
     def compute_reboot(self, context, instance, reboot_type):
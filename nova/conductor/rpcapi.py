@@ -14,6 +14,8 @@
 
 """Client side of the conductor RPC API."""
 
+import sys
+
 from oslo.config import cfg
 
 from nova.objects import base as objects_base
@@ -110,6 +112,9 @@ class ConductorAPI(rpcclient.RpcProxy):
                   migration_get_unconfirmed_by_dest_compute
     1.57 - Remove migration_create()
     1.58 - Remove migration_get()
+    1.59 - Added compact argument to object_class_action() and
+           object_action(), and accept objects in the compact format
+    1.60 - Added object_action_batch()
     """
 
     BASE_RPC_API_VERSION = '1.0'
@@ -121,10 +126,15 @@ class ConductorAPI(rpcclient.RpcProxy):
     def __init__(self):
         version_cap = self.VERSION_ALIASES.get(CONF.upgrade_levels.conductor,
                                                CONF.upgrade_levels.conductor)
+        self.compact_objects = (CONF.conductor.compact_objects and
+                                (not version_cap or
+                                 rpc_common.version_is_compatible(
+                                     version_cap, '1.59')))
         super(ConductorAPI, self).__init__(
             topic=CONF.conductor.topic,
             default_version=self.BASE_RPC_API_VERSION,
-            serializer=objects_base.NovaObjectSerializer(),
+            serializer=objects_base.NovaObjectSerializer(
+                compact=self.compact_objects),
             version_cap=version_cap)
         self.client = self.get_client()
 
@@ -486,15 +496,48 @@ class ConductorAPI(rpcclient.RpcProxy):
 
     def object_class_action(self, context, objname, objmethod, objver,
                             args, kwargs):
-        cctxt = self.client.prepare(version='1.50')
+        if self.compact_objects:
+            version = '1.59'
+            extra = {'compact': True}
+        else:
+            version = '1.50'
+            extra = {}
+        cctxt = self.client.prepare(version=version)
         return cctxt.call(context, 'object_class_action',
                           objname=objname, objmethod=objmethod,
-                          objver=objver, args=args, kwargs=kwargs)
+                          objver=objver, args=args, kwargs=kwargs, **extra)
 
     def object_action(self, context, objinst, objmethod, args, kwargs):
-        cctxt = self.client.prepare(version='1.50')
+        if self.compact_objects:
+            version = '1.59'
+            extra = {'compact': True}
+        else:
+            version = '1.50'
+            extra = {}
+        cctxt = self.client.prepare(version=version)
         return cctxt.call(context, 'object_action', objinst=objinst,
-                          objmethod=objmethod, args=args, kwargs=kwargs)
+                          objmethod=objmethod, args=args, kwargs=kwargs,
+                          **extra)
+
+    def object_action_batch(self, context, objinsts, objmethod, args, kwargs):
+        if not self.client.can_send_version('1.60'):
+            replies = []
+            for objinst in objinsts:
+                try:
+                    updates, result = self.object_action(
+                        context, objinst, objmethod, args, kwargs)
+                except Exception:
+                    replies.append((None, None,
+                                    rpc_common.serialize_remote_exception(
+                                        sys.exc_info(), log_failure=False)))
+                else:
+                    replies.append((updates, result, None))
+            return replies
+        extra = {'compact': True} if self.compact_objects else {}
+        cctxt = self.client.prepare(version='1.60')
+        return cctxt.call(context, 'object_action_batch', objinsts=objinsts,
+                          objmethod=objmethod, args=args, kwargs=kwargs,
+                          **extra)
 
 
 class ComputeTaskAPI(rpcclient.RpcProxy):
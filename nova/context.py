@@ -95,6 +95,8 @@ class RequestContext(object):
         self.quota_class = quota_class
         self.user_name = user_name
         self.project_name = project_name
+        # Policy decisions memoized by nova.policy for this request
+        self.policy_decisions = {}
         self.is_admin = is_admin
         if self.is_admin is None:
             self.is_admin = policy.check_is_admin(self)
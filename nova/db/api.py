@@ -183,7 +183,8 @@ def compute_node_get_by_service_id(context, service_id):
     return IMPL.compute_node_get_by_service_id(context, service_id)
 
 
-def compute_node_get_all(context, no_date_fields=False):
+def compute_node_get_all(context, no_date_fields=False, changed_since=None,
+                         use_slave=False):
     """Get all computeNodes.
 
     :param context: The security context
@@ -191,11 +192,19 @@ def compute_node_get_all(context, no_date_fields=False):
                            'deteled_at' and 'deleted' fields from the output,
                            thus significantly reducing its size.
                            Set to False by default
+    :param changed_since: If set, only returns the computeNodes created,
+                          updated or deleted at or after this time. Deleted
+                          ones are returned with a non-zero 'deleted' field
+                          and without stats.
+    :param use_slave: If set to True, the computeNodes may be read from the
+                      slave database, and so be slightly out of date.
 
     :returns: List of dictionaries each containing compute node properties,
               including corresponding service and stats
     """
-    return IMPL.compute_node_get_all(context, no_date_fields)
+    return IMPL.compute_node_get_all(context, no_date_fields,
+                                     changed_since=changed_since,
+                                     use_slave=use_slave)
 
 
 def compute_node_search_by_hypervisor(context, hypervisor_match):
@@ -493,6 +502,11 @@ def fixed_ip_get_all(context):
     return IMPL.fixed_ip_get_all(context)
 
 
+def fixed_ip_get_all_instance_uuids(context):
+    """Get (address, instance_uuid) of all fixed ips used by instances."""
+    return IMPL.fixed_ip_get_all_instance_uuids(context)
+
+
 def fixed_ip_get_by_address(context, address):
     """Get a fixed ip by address or raise if it does not exist."""
     return IMPL.fixed_ip_get_by_address(context, address)
@@ -617,28 +631,51 @@ def instance_get_all(context, columns_to_join=None):
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
                                 sort_dir='desc', limit=None, marker=None,
-                                columns_to_join=None):
-    """Get all instances that match all filters."""
+                                columns_to_join=None, use_slave=False):
+    """Get all instances that match all filters.
+
+    With use_slave, the instances may be read from the slave database.
+    """
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
                                             sort_dir, limit=limit,
                                             marker=marker,
-                                            columns_to_join=columns_to_join)
+                                            columns_to_join=columns_to_join,
+                                            use_slave=use_slave)
+
+
+def instance_get_all_by_filters_iter(context, filters, sort_key='created_at',
+                                     sort_dir='desc', chunk_size=1000,
+                                     columns_to_join=None):
+    """Iterate over the instances that match all filters, fetching them
+    chunk_size at a time.
+    """
+    return IMPL.instance_get_all_by_filters_iter(
+        context, filters, sort_key, sort_dir, chunk_size,
+        columns_to_join=columns_to_join)
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None, host=None):
+                                         project_id=None, host=None,
+                                         use_slave=False):
     """Get instances and joins active during a certain time window.
 
     Specifying a project_id will filter for a certain project.
     Specifying a host will filter for instances on a given compute host.
+    With use_slave, the instances may be read from the slave database.
     """
     return IMPL.instance_get_active_by_window_joined(context, begin, end,
-                                              project_id, host)
+                                              project_id, host,
+                                              use_slave=use_slave)
 
 
-def instance_get_all_by_host(context, host, columns_to_join=None):
-    """Get all instances belonging to a host."""
-    return IMPL.instance_get_all_by_host(context, host, columns_to_join)
+def instance_get_all_by_host(context, host, columns_to_join=None,
+                             use_slave=False):
+    """Get all instances belonging to a host.
+
+    With use_slave, the instances may be read from the slave database.
+    """
+    return IMPL.instance_get_all_by_host(context, host, columns_to_join,
+                                         use_slave=use_slave)
 
 
 def instance_get_all_by_host_and_node(context, host, node):
@@ -823,6 +860,16 @@ def instance_info_cache_get(context, instance_uuid):
     return IMPL.instance_info_cache_get(context, instance_uuid)
 
 
+def instance_info_cache_get_by_instance_uuids(context, instance_uuids):
+    """Get the info caches of the provided instance_uuids.
+
+    Returns a dict of instance uuid to info cache, or None for instances
+    without one.
+    """
+    return IMPL.instance_info_cache_get_by_instance_uuids(context,
+                                                          instance_uuids)
+
+
 def instance_info_cache_update(context, instance_uuid, values):
     """Update an instance info cache record in the table.
 
@@ -1166,6 +1213,15 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                                                          instance_uuid)
 
 
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids):
+    """Get all block device mapping belonging to the provided instance_uuids.
+
+    Returns a dict of the lists of block device mappings by instance uuid.
+    """
+    return IMPL.block_device_mapping_get_all_by_instance_uuids(
+        context, instance_uuids)
+
+
 def block_device_mapping_get_by_volume_id(context, volume_id,
         columns_to_join=None):
     """Get block device mapping for a given volume."""
@@ -1221,6 +1277,13 @@ def security_group_get_by_instance(context, instance_uuid):
     return IMPL.security_group_get_by_instance(context, instance_uuid)
 
 
+def security_group_get_by_instance_uuids(context, instance_uuids):
+    """Get a dict of instance uuid to the security groups of the instance
+    for the provided instance_uuids.
+    """
+    return IMPL.security_group_get_by_instance_uuids(context, instance_uuids)
+
+
 def security_group_in_use(context, group_id):
     """Indicates if a security group is currently in use."""
     return IMPL.security_group_in_use(context, group_id)
@@ -1518,6 +1581,13 @@ def pci_device_get_all_by_instance_uuid(context, instance_uuid):
     return IMPL.pci_device_get_all_by_instance_uuid(context, instance_uuid)
 
 
+def pci_device_get_by_instance_uuids(context, instance_uuids):
+    """Get a dict of instance uuid to the PCI devices allocated to the
+    instance for the provided instance_uuids.
+    """
+    return IMPL.pci_device_get_by_instance_uuids(context, instance_uuids)
+
+
 def pci_device_destroy(context, node_id, address):
     """Delete a PCI device record."""
     return IMPL.pci_device_destroy(context, node_id, address)
@@ -1563,6 +1633,14 @@ def instance_metadata_get(context, instance_uuid):
     return IMPL.instance_metadata_get(context, instance_uuid)
 
 
+def instance_metadata_get_by_instance_uuids(context, instance_uuids):
+    """Get a dict of instance uuid to the metadata of the instance for the
+    provided instance_uuids.
+    """
+    return IMPL.instance_metadata_get_by_instance_uuids(context,
+                                                        instance_uuids)
+
+
 def instance_metadata_delete(context, instance_uuid, key):
     """Delete the given metadata item."""
     IMPL.instance_metadata_delete(context, instance_uuid, key)
@@ -1582,6 +1660,14 @@ def instance_system_metadata_get(context, instance_uuid):
     return IMPL.instance_system_metadata_get(context, instance_uuid)
 
 
+def instance_system_metadata_get_by_instance_uuids(context, instance_uuids):
+    """Get a dict of instance uuid to the system metadata of the instance
+    for the provided instance_uuids.
+    """
+    return IMPL.instance_system_metadata_get_by_instance_uuids(
+        context, instance_uuids)
+
+
 def instance_system_metadata_update(context, instance_uuid, metadata, delete):
     """Update metadata if it exists, otherwise create it."""
     IMPL.instance_system_metadata_update(
@@ -1625,9 +1711,13 @@ def bw_usage_get(context, uuid, start_period, mac):
     return IMPL.bw_usage_get(context, uuid, start_period, mac)
 
 
-def bw_usage_get_by_uuids(context, uuids, start_period):
-    """Return bw usages for instance(s) in a given audit period."""
-    return IMPL.bw_usage_get_by_uuids(context, uuids, start_period)
+def bw_usage_get_by_uuids(context, uuids, start_period, use_slave=False):
+    """Return bw usages for instance(s) in a given audit period.
+
+    With use_slave, the usages may be read from the slave database.
+    """
+    return IMPL.bw_usage_get_by_uuids(context, uuids, start_period,
+                                      use_slave=use_slave)
 
 
 def bw_usage_update(context, uuid, mac, start_period, bw_in, bw_out,
@@ -1682,6 +1772,11 @@ def s3_image_get_by_uuid(context, image_uuid):
     return IMPL.s3_image_get_by_uuid(context, image_uuid)
 
 
+def s3_image_get_by_uuids(context, image_uuids):
+    """Find the local s3 images represented by the provided uuids."""
+    return IMPL.s3_image_get_by_uuids(context, image_uuids)
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid."""
     return IMPL.s3_image_create(context, image_uuid)
@@ -1715,6 +1810,16 @@ def aggregate_metadata_get_by_host(context, host, key=None):
     return IMPL.aggregate_metadata_get_by_host(context, host, key)
 
 
+def aggregate_metadata_get_all_by_host(context, key=None):
+    """Get aggregate metadata for every host that belongs to an aggregate.
+
+    Returns a dictionary keyed by hostname where each value is a dictionary
+    in the format returned by aggregate_metadata_get_by_host.
+    Optional key filter
+    """
+    return IMPL.aggregate_metadata_get_all_by_host(context, key)
+
+
 def aggregate_metadata_get_by_metadata_key(context, aggregate_id, key):
     """Get metadata for an aggregate by metadata key."""
     return IMPL.aggregate_metadata_get_by_metadata_key(context, aggregate_id,
@@ -1848,6 +1953,14 @@ def get_ec2_instance_id_by_uuid(context, instance_id):
     return IMPL.get_ec2_instance_id_by_uuid(context, instance_id)
 
 
+def get_ec2_instance_ids_by_uuids(context, instance_uuids):
+    """Get a dict of ec2 ids by uuid from instance_id_mappings table.
+
+    Uuids without a mapping are left out of the dict.
+    """
+    return IMPL.get_ec2_instance_ids_by_uuids(context, instance_uuids)
+
+
 def get_instance_uuid_by_ec2_id(context, ec2_id):
     """Get uuid through ec2 id from instance_id_mappings table."""
     return IMPL.get_instance_uuid_by_ec2_id(context, ec2_id)
@@ -1892,9 +2005,9 @@ def task_log_begin_task(context, task_name,
 
 
 def task_log_get_all(context, task_name, period_beginning,
-                 period_ending, host=None, state=None):
+                 period_ending, host=None, state=None, use_slave=False):
     return IMPL.task_log_get_all(context, task_name, period_beginning,
-                 period_ending, host, state)
+                 period_ending, host, state, use_slave=use_slave)
 
 
 def task_log_get(context, task_name, period_beginning,
@@ -29,11 +29,13 @@ import time
 import uuid
 
 from oslo.config import cfg
+import sqlalchemy
 from sqlalchemy import and_
 from sqlalchemy import Boolean
 from sqlalchemy.exc import DataError
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.exc import NoSuchTableError
+from sqlalchemy.exc import OperationalError
 from sqlalchemy import Integer
 from sqlalchemy import MetaData
 from sqlalchemy import or_
@@ -41,6 +43,7 @@ from sqlalchemy.orm import contains_eager
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.orm import noload
+from sqlalchemy.pool import NullPool
 from sqlalchemy.schema import Table
 from sqlalchemy.sql.expression import asc
 from sqlalchemy.sql.expression import desc
@@ -70,6 +73,15 @@ db_opts = [
                help='When set, compute API will consider duplicate hostnames '
                     'invalid within the specified scope, regardless of case. '
                     'Should be empty, "project" or "global".'),
+    cfg.IntOpt('archive_deleted_rows_batch_size',
+               default=1000,
+               help='Number of deleted rows moved to a shadow table per '
+                    'transaction when archiving deleted rows'),
+    cfg.IntOpt('slave_connection_retry_interval',
+               default=60,
+               help='Seconds during which reads meant for the slave '
+                    'database are sent to the master database after the '
+                    'slave database could not be reached'),
 ]
 
 CONF = cfg.CONF
@@ -95,6 +107,70 @@ def get_backend():
     return sys.modules[__name__]
 
 
+# Whether the slave database was reached since its engine was last
+# created, and when reaching it last failed.
+_SLAVE_CONNECTED = False
+_SLAVE_FAILED_AT = None
+
+
+def _slave_failed():
+    """Send reads to the master database for a while."""
+    global _SLAVE_CONNECTED, _SLAVE_FAILED_AT
+    _SLAVE_CONNECTED = False
+    _SLAVE_FAILED_AT = time.time()
+
+
+def _use_slave(use_slave):
+    """Return whether a read should go to the slave database.
+
+    That is when use_slave is set, a slave database is configured and it
+    has not failed within slave_connection_retry_interval seconds.
+    """
+    global _SLAVE_CONNECTED
+    if not (use_slave and CONF.database.slave_connection):
+        return False
+    if (_SLAVE_FAILED_AT is not None and
+            time.time() - _SLAVE_FAILED_AT <
+            CONF.slave_connection_retry_interval):
+        return False
+    if not _SLAVE_CONNECTED:
+        # get_engine() retries connecting to an unreachable database
+        # max_retries times, retry_interval seconds apart, which would
+        # stall the read. Reads can go to the master instead, so try the
+        # slave only once.
+        engine = sqlalchemy.create_engine(CONF.database.slave_connection,
+                                          poolclass=NullPool)
+        try:
+            engine.connect().close()
+        except OperationalError as e:
+            _slave_failed()
+            LOG.warn(_('Could not connect to the slave database, reading '
+                       'from the master instead: %s'), e)
+            return False
+        finally:
+            engine.dispose()
+        _SLAVE_CONNECTED = True
+    return True
+
+
+def _get_session(use_slave=False):
+    """Return a session on the slave database if use_slave is set and one
+    is usable, and on the master database otherwise.
+    """
+    if _use_slave(use_slave):
+        return get_session(slave_session=True)
+    return get_session()
+
+
+def _get_engine(use_slave=False):
+    """Return the engine of the slave database if use_slave is set and one
+    is usable, and of the master database otherwise.
+    """
+    if _use_slave(use_slave):
+        return get_engine(slave_engine=True)
+    return get_engine()
+
+
 def require_admin_context(f):
     """Decorator to require admin request context.
 
@@ -127,6 +203,32 @@ def require_context(f):
     return wrapper
 
 
+def _slave_fallback(f):
+    """Decorator to retry a read from the slave database on the master.
+
+    Reads are retried when the slave can't be reached, in which case the
+    slave is not used for slave_connection_retry_interval seconds, and
+    when it has not caught up yet with a marker the caller got from the
+    master. Replication lag is not measured otherwise, so use_slave is
+    only for reads which can be as stale as the slave. Errors of reads
+    from the master are raised as they are.
+    """
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        if _use_slave(kwargs.get('use_slave')):
+            try:
+                return f(*args, **kwargs)
+            except (OperationalError, exception.MarkerNotFound) as e:
+                if isinstance(e, OperationalError):
+                    _slave_failed()
+                LOG.warn(_('Reading from the slave database failed, '
+                           'reading from the master instead: %s'), e)
+        kwargs['use_slave'] = False
+        return f(*args, **kwargs)
+    return wrapper
+
+
 def require_instance_exists_using_uuid(f):
     """Decorator to require the specified instance to exist.
 
@@ -178,6 +280,8 @@ def model_query(context, model, *args, **kwargs):
 
     :param context: context to query under
     :param session: if present, the session to use
+    :param use_slave: if present and no session is given, read from the
+            slave database if one is configured.
     :param read_deleted: if present, overrides context's read_deleted field.
     :param project_only: if present and context is user-type, then restrict
             query to match the context's project_id. If set to 'allow_none',
@@ -187,7 +291,8 @@ def model_query(context, model, *args, **kwargs):
             parameter that is a subclass of NovaBase and corresponds to the
             model parameter.
     """
-    session = kwargs.get('session') or get_session()
+    session = kwargs.get('session') or _get_session(
+        kwargs.get('use_slave', False))
     read_deleted = kwargs.get('read_deleted') or context.read_deleted
     project_only = kwargs.get('project_only', False)
 
@@ -517,13 +622,15 @@ def compute_node_get_by_service_id(context, service_id):
 
 
 @require_admin_context
-def compute_node_get_all(context, no_date_fields):
+@_slave_fallback
+def compute_node_get_all(context, no_date_fields, changed_since=None,
+                         use_slave=False):
 
     # NOTE(msdubov): Using lower-level 'select' queries and joining the tables
     #                manually here allows to gain 3x speed-up and to have 5x
     #                less network load / memory usage compared to the sqla ORM.
 
-    engine = get_engine()
+    engine = _get_engine(use_slave)
 
     # Retrieve ComputeNode, Service, Stat.
     compute_node = models.ComputeNode.__table__
@@ -533,12 +640,24 @@ def compute_node_get_all(context, no_date_fields):
     with engine.begin() as conn:
         redundant_columns = set(['deleted_at', 'created_at', 'updated_at',
                                  'deleted']) if no_date_fields else set([])
+        if changed_since is not None:
+            # Callers need it to tell deleted compute nodes apart
+            redundant_columns.discard('deleted')
 
         def filter_columns(table):
             return [c for c in table.c if c.name not in redundant_columns]
 
-        compute_node_query = select(filter_columns(compute_node)).\
-                                where(compute_node.c.deleted == 0).\
+        compute_node_query = select(filter_columns(compute_node))
+        if changed_since is None:
+            compute_node_query = compute_node_query.where(
+                    compute_node.c.deleted == 0)
+        else:
+            # NOTE: deleted_at is the only timestamp soft_delete() bumps.
+            compute_node_query = compute_node_query.where(or_(
+                    compute_node.c.created_at >= changed_since,
+                    compute_node.c.updated_at >= changed_since,
+                    compute_node.c.deleted_at >= changed_since))
+        compute_node_query = compute_node_query.\
                                 order_by(compute_node.c.service_id)
         compute_node_rows = conn.execute(compute_node_query).fetchall()
 
@@ -549,8 +668,13 @@ def compute_node_get_all(context, no_date_fields):
         service_rows = conn.execute(service_query).fetchall()
 
         stat_query = select(filter_columns(stat)).\
-                        where(stat.c.deleted == 0).\
-                        order_by(stat.c.compute_node_id)
+                        where(stat.c.deleted == 0)
+        if changed_since is not None:
+            changed_ids = [proxy['id'] for proxy in compute_node_rows
+                           if not proxy['deleted']]
+            stat_query = stat_query.where(
+                    stat.c.compute_node_id.in_(changed_ids or [-1]))
+        stat_query = stat_query.order_by(stat.c.compute_node_id)
         stat_rows = conn.execute(stat_query).fetchall()
 
     # NOTE(msdubov): Transferring sqla.RowProxy objects to dicts.
@@ -1260,6 +1384,15 @@ def fixed_ip_get_all(context):
     return result
 
 
+@require_admin_context
+def fixed_ip_get_all_instance_uuids(context):
+    return model_query(context, models.FixedIp.address,
+                       models.FixedIp.instance_uuid,
+                       base_model=models.FixedIp, read_deleted="no").\
+                       filter(models.FixedIp.instance_uuid != None).\
+                       all()
+
+
 @require_context
 def fixed_ip_get_by_address(context, address):
     return _fixed_ip_get_by_address(context, address)
@@ -1727,7 +1860,8 @@ def _build_instance_get(context, session=None, columns_to_join=None):
     return query
 
 
-def _instances_fill_metadata(context, instances, manual_joins=None):
+def _instances_fill_metadata(context, instances, manual_joins=None,
+                             use_slave=False):
     """Selectively fill instances with manually-joined metadata. Note that
     instance will be converted to a dict.
 
@@ -1736,25 +1870,30 @@ def _instances_fill_metadata(context, instances, manual_joins=None):
     :param manual_joins: list of tables to manually join (can be any
                          combination of 'metadata' and 'system_metadata' or
                          None to take the default of both)
+    :param use_slave: read the metadata from the slave database
     """
     uuids = [inst['uuid'] for inst in instances]
+    session = _get_session(use_slave) if use_slave else None
 
     if manual_joins is None:
         manual_joins = ['metadata', 'system_metadata']
 
     meta = collections.defaultdict(list)
     if 'metadata' in manual_joins:
-        for row in _instance_metadata_get_multi(context, uuids):
+        for row in _instance_metadata_get_multi(context, uuids,
+                                                session=session):
             meta[row['instance_uuid']].append(row)
 
     sys_meta = collections.defaultdict(list)
     if 'system_metadata' in manual_joins:
-        for row in _instance_system_metadata_get_multi(context, uuids):
+        for row in _instance_system_metadata_get_multi(context, uuids,
+                                                       session=session):
             sys_meta[row['instance_uuid']].append(row)
 
     pcidevs = collections.defaultdict(list)
     if 'pci_devices' in manual_joins:
-        for row in _instance_pcidevs_get_multi(context, uuids):
+        for row in _instance_pcidevs_get_multi(context, uuids,
+                                               session=session):
             pcidevs[row['instance_uuid']].append(row)
 
     filled_instances = []
@@ -1799,8 +1938,10 @@ def instance_get_all(context, columns_to_join=None):
 
 
 @require_context
+@_slave_fallback
 def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
-                                limit=None, marker=None, columns_to_join=None):
+                                limit=None, marker=None, columns_to_join=None,
+                                use_slave=False):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
     otherwise.
@@ -1813,6 +1954,9 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
          'vm_state', 'instance_type_id', 'uuid',
          'metadata', 'host', 'system_metadata']
 
+    Regular expressions anchored at the start of the value, like
+    '^web' or '^web01$', are also matched on the index of their column,
+    if there is one.
 
     A third type of filter (also using exact matching), filters
     based on instance metadata tags when supplied under a special
@@ -1829,15 +1973,78 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
     Special keys are used to tweek the query further:
 
         'changes-since' - only return instances updated after
+        'launched-since' - only return instances launched at or after
+        'launched-before' - only return instances launched before
         'deleted' - only return (or exclude) deleted instances
         'soft_deleted' - modify behavior of 'deleted' to either
                          include or exclude instances whose
                          vm_state is SOFT_DELETED.
     """
 
-    sort_fn = {'desc': desc, 'asc': asc}
+    session = _get_session(use_slave)
+    if marker is not None:
+        marker = _instance_get_marker(context, marker, sort_key,
+                                      session=session)
+    query, manual_joins = _instance_get_all_by_filters_query(
+        context, filters, sort_key, sort_dir, limit, marker,
+        columns_to_join, session)
+    return _instances_fill_metadata(context, query.all(), manual_joins,
+                                    use_slave=use_slave)
 
-    session = get_session()
+
+@require_context
+def instance_get_all_by_filters_iter(context, filters, sort_key, sort_dir,
+                                     chunk_size, columns_to_join=None):
+    """Iterate over the instances that match all filters.
+
+    The instances are fetched chunk_size at a time, each chunk starting
+    after the last instance of the previous one, so that they are never
+    all loaded at once.
+    """
+    marker = None
+    while True:
+        # The columns are removed from the list given to the query as they
+        # are joined, so each chunk needs its own copy
+        if columns_to_join is None:
+            chunk_columns_to_join = None
+        else:
+            chunk_columns_to_join = list(columns_to_join)
+        query, manual_joins = _instance_get_all_by_filters_query(
+            context, filters, sort_key, sort_dir, chunk_size, marker,
+            chunk_columns_to_join, get_session())
+        instances = query.all()
+        for instance in _instances_fill_metadata(context, instances,
+                                                 manual_joins):
+            yield instance
+        if len(instances) < chunk_size:
+            return
+        marker = instances[-1]
+
+
+def _instance_sort_keys(sort_key):
+    return [sort_key] + [key for key in ('created_at', 'id')
+                         if key != sort_key]
+
+
+def _instance_get_marker(context, instance_uuid, sort_key, session=None):
+    """Get the values of the columns instances are paginated on for
+    instance_uuid, without loading the rest of the instance.
+    """
+    columns = [getattr(models.Instance, key)
+               for key in _instance_sort_keys(sort_key)]
+    result = model_query(context, *columns, base_model=models.Instance,
+                         session=session, project_only=True).\
+                filter_by(uuid=instance_uuid).\
+                first()
+    if not result:
+        raise exception.MarkerNotFound(instance_uuid)
+    return result
+
+
+def _instance_get_all_by_filters_query(context, filters, sort_key, sort_dir,
+                                       limit, marker, columns_to_join,
+                                       session):
+    sort_fn = {'desc': desc, 'asc': asc}
 
     if columns_to_join is None:
         columns_to_join = ['info_cache', 'security_groups']
@@ -1861,6 +2068,17 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
         query_prefix = query_prefix.\
                             filter(models.Instance.updated_at > changes_since)
 
+    if 'launched-since' in filters:
+        launched_since = timeutils.normalize_time(filters['launched-since'])
+        query_prefix = query_prefix.\
+                filter(models.Instance.launched_at >= launched_since)
+
+    if 'launched-before' in filters:
+        launched_before = timeutils.normalize_time(
+                filters['launched-before'])
+        query_prefix = query_prefix.\
+                filter(models.Instance.launched_at < launched_before)
+
     if 'deleted' in filters:
         # Instances can be soft or hard deleted and the query needs to
         # include or exclude both
@@ -1913,18 +2131,13 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
                               filters)
 
     # paginate query
-    if marker is not None:
-        try:
-            marker = _instance_get_by_uuid(context, marker, session=session)
-        except exception.InstanceNotFound:
-            raise exception.MarkerNotFound(marker)
     query_prefix = sqlalchemyutils.paginate_query(query_prefix,
                            models.Instance, limit,
-                           [sort_key, 'created_at', 'id'],
+                           _instance_sort_keys(sort_key),
                            marker=marker,
                            sort_dir=sort_dir)
 
-    return _instances_fill_metadata(context, query_prefix.all(), manual_joins)
+    return query_prefix, manual_joins
 
 
 def tag_filter(context, query, model, model_metadata,
@@ -1985,11 +2198,59 @@ def tag_filter(context, query, model, model_metadata,
     return query
 
 
+def _regex_prefix(regex):
+    """Return the literal prefix of a regex anchored at the start of the
+    value, like 'web' for '^web[0-9]+', or None if it has none.
+    """
+    if not regex.startswith('^') or '|' in regex or '(?' in regex:
+        return None
+    prefix = []
+    pos = 1
+    while pos < len(regex):
+        char = regex[pos]
+        if char == '\\':
+            escaped = regex[pos + 1:pos + 2]
+            if not escaped or escaped.isalnum():
+                break
+            char = escaped
+            pos += 1
+        elif char in '.^$*+?{}[]()':
+            if char in '*?{' and prefix:
+                # The last character is optional or repeated
+                prefix.pop()
+            break
+        prefix.append(char)
+        pos += 1
+    return ''.join(prefix) or None
+
+
+def _prefix_filter(column_attr, prefix, db_string):
+    """Return a criterion matching the values starting with prefix which
+    can be answered from an index on the column.
+    """
+    if db_string != 'sqlite':
+        prefix = prefix.replace('\\', '\\\\').replace(
+            '%', '\\%').replace('_', '\\_')
+        return column_attr.like(prefix + '%', escape='\\')
+    # NOTE: SQLite only uses indexes for LIKE when it is case sensitive,
+    # but its default collation compares strings by code point, so the
+    # values starting with prefix are the range up to the next prefix.
+    last = ord(prefix[-1])
+    if last >= sys.maxunicode:
+        return column_attr >= prefix
+    return and_(column_attr >= prefix,
+                column_attr < prefix[:-1] + unichr(last + 1))
+
+
 def regex_filter(query, model, filters):
     """Applies regular expression filtering to a query.
 
     Returns the updated query.
 
+    Regexes anchored at the start of the value are also filtered on their
+    literal prefix, which lets the database narrow the rows to match down
+    with an index on the column.
+
     :param query: query to apply filters to
     :param model: model object the query applies to
     :param filters: dictionary of filters with regex values
@@ -2010,16 +2271,22 @@ def regex_filter(query, model, filters):
             continue
         if 'property' == type(column_attr).__name__:
             continue
-        query = query.filter(column_attr.op(db_regexp_op)(
-                                    str(filters[filter_name])))
+        regex = str(filters[filter_name])
+        prefix = _regex_prefix(regex)
+        if prefix:
+            query = query.filter(_prefix_filter(column_attr, prefix,
+                                                db_string))
+        query = query.filter(column_attr.op(db_regexp_op)(regex))
     return query
 
 
 @require_context
+@_slave_fallback
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None, host=None):
+                                         project_id=None, host=None,
+                                         use_slave=False):
     """Return instances and joins that were active during window."""
-    session = get_session()
+    session = _get_session(use_slave)
     query = session.query(models.Instance)
 
     query = query.options(joinedload('info_cache')).\
@@ -2033,24 +2300,30 @@ def instance_get_active_by_window_joined(context, begin, end=None,
     if host:
         query = query.filter_by(host=host)
 
-    return _instances_fill_metadata(context, query.all())
+    return _instances_fill_metadata(context, query.all(),
+                                    use_slave=use_slave)
 
 
-def _instance_get_all_query(context, project_only=False, joins=None):
+def _instance_get_all_query(context, project_only=False, joins=None,
+                            use_slave=False):
     if joins is None:
         joins = ['info_cache', 'security_groups']
 
-    query = model_query(context, models.Instance, project_only=project_only)
+    query = model_query(context, models.Instance, project_only=project_only,
+                        use_slave=use_slave)
     for join in joins:
         query = query.options(joinedload(join))
     return query
 
 
 @require_admin_context
-def instance_get_all_by_host(context, host, columns_to_join=None):
+@_slave_fallback
+def instance_get_all_by_host(context, host, columns_to_join=None,
+                             use_slave=False):
     return _instances_fill_metadata(context,
-        _instance_get_all_query(context).filter_by(host=host).all(),
-                                manual_joins=columns_to_join)
+        _instance_get_all_query(context, use_slave=use_slave).filter_by(
+            host=host).all(),
+        manual_joins=columns_to_join, use_slave=use_slave)
 
 
 def _instance_get_all_uuids_by_host(context, host, session=None):
@@ -2292,6 +2565,20 @@ def instance_info_cache_get(context, instance_uuid):
                          first()
 
 
+@require_context
+def instance_info_cache_get_by_instance_uuids(context, instance_uuids):
+    output = dict((instance_uuid, None) for instance_uuid in instance_uuids)
+    if not instance_uuids:
+        return output
+    rows = model_query(context, models.InstanceInfoCache).\
+                       filter(models.InstanceInfoCache.instance_uuid.in_(
+                           instance_uuids)).\
+                       all()
+    for row in rows:
+        output[row['instance_uuid']] = row
+    return output
+
+
 @require_context
 def instance_info_cache_update(context, instance_uuid, values):
     """Update an instance info cache record in the table.
@@ -3503,6 +3790,20 @@ def block_device_mapping_get_all_by_instance(context, instance_uuid):
                  all()
 
 
+@require_context
+def block_device_mapping_get_all_by_instance_uuids(context, instance_uuids):
+    output = dict((instance_uuid, []) for instance_uuid in instance_uuids)
+    if not instance_uuids:
+        return output
+    rows = _block_device_mapping_get_query(context).\
+                 filter(models.BlockDeviceMapping.instance_uuid.in_(
+                     instance_uuids)).\
+                 all()
+    for row in rows:
+        output[row['instance_uuid']].append(row)
+    return output
+
+
 @require_context
 def block_device_mapping_get_by_volume_id(context, volume_id,
         columns_to_join=None):
@@ -3644,6 +3945,25 @@ def security_group_get_by_instance(context, instance_uuid):
                    all()
 
 
+@require_context
+def security_group_get_by_instance_uuids(context, instance_uuids):
+    output = dict((instance_uuid, []) for instance_uuid in instance_uuids)
+    if not instance_uuids:
+        return output
+    assoc = models.SecurityGroupInstanceAssociation
+    rows = _security_group_get_query(context, read_deleted="no",
+                                     join_rules=False).\
+                   add_column(assoc.instance_uuid).\
+                   join(assoc,
+                        models.SecurityGroup.id == assoc.security_group_id).\
+                   filter(assoc.deleted == 0).\
+                   filter(assoc.instance_uuid.in_(instance_uuids)).\
+                   all()
+    for secgroup, instance_uuid in rows:
+        output[instance_uuid].append(secgroup)
+    return output
+
+
 @require_context
 def security_group_in_use(context, group_id):
     session = get_session()
@@ -4513,6 +4833,14 @@ def instance_metadata_get(context, instance_uuid):
     return dict((row['key'], row['value']) for row in rows)
 
 
+@require_context
+def instance_metadata_get_by_instance_uuids(context, instance_uuids):
+    output = dict((instance_uuid, {}) for instance_uuid in instance_uuids)
+    for row in _instance_metadata_get_multi(context, instance_uuids):
+        output[row['instance_uuid']][row['key']] = row['value']
+    return output
+
+
 @require_context
 @_retry_on_deadlock
 def instance_metadata_delete(context, instance_uuid, key):
@@ -4577,6 +4905,14 @@ def instance_system_metadata_get(context, instance_uuid):
     return dict((row['key'], row['value']) for row in rows)
 
 
+@require_context
+def instance_system_metadata_get_by_instance_uuids(context, instance_uuids):
+    output = dict((instance_uuid, {}) for instance_uuid in instance_uuids)
+    for row in _instance_system_metadata_get_multi(context, instance_uuids):
+        output[row['instance_uuid']][row['key']] = row['value']
+    return output
+
+
 @require_context
 def instance_system_metadata_update(context, instance_uuid, metadata, delete):
     all_keys = metadata.keys()
@@ -4672,8 +5008,10 @@ def bw_usage_get(context, uuid, start_period, mac):
 
 
 @require_context
-def bw_usage_get_by_uuids(context, uuids, start_period):
-    return model_query(context, models.BandwidthUsage, read_deleted="yes").\
+@_slave_fallback
+def bw_usage_get_by_uuids(context, uuids, start_period, use_slave=False):
+    return model_query(context, models.BandwidthUsage, read_deleted="yes",
+                       use_slave=use_slave).\
                    filter(models.BandwidthUsage.uuid.in_(uuids)).\
                    filter_by(start_period=start_period).\
                    all()
@@ -4872,6 +5210,15 @@ def s3_image_get_by_uuid(context, image_uuid):
     return result
 
 
+def s3_image_get_by_uuids(context, image_uuids):
+    """Find local s3 images represented by the provided uuids."""
+    if not image_uuids:
+        return []
+    return model_query(context, models.S3Image, read_deleted="yes").\
+                 filter(models.S3Image.uuid.in_(image_uuids)).\
+                 all()
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid."""
     try:
@@ -4980,6 +5327,27 @@ def aggregate_metadata_get_by_host(context, host, key=None):
     return dict(metadata)
 
 
+@require_admin_context
+def aggregate_metadata_get_all_by_host(context, key=None):
+    query = model_query(context, models.Aggregate)
+    query = query.join("_metadata")
+    query = query.options(contains_eager("_metadata"))
+    query = query.options(joinedload("_hosts"))
+
+    if key:
+        query = query.filter(models.AggregateMetadata.key == key)
+    rows = query.all()
+
+    metadata = collections.defaultdict(
+            lambda: collections.defaultdict(set))
+    for agg in rows:
+        for agghost in agg._hosts:
+            for kv in agg._metadata:
+                metadata[agghost.host][kv['key']].add(kv['value'])
+    return dict((host, dict(host_metadata))
+                for host, host_metadata in metadata.iteritems())
+
+
 @require_admin_context
 def aggregate_metadata_get_by_metadata_key(context, aggregate_id, key):
     query = model_query(context, models.Aggregate)
@@ -5371,6 +5739,16 @@ def get_ec2_instance_id_by_uuid(context, instance_id):
     return result['id']
 
 
+@require_context
+def get_ec2_instance_ids_by_uuids(context, instance_uuids):
+    if not instance_uuids:
+        return {}
+    rows = _ec2_instance_get_query(context).\
+                    filter(models.InstanceIdMapping.uuid.in_(instance_uuids)).\
+                    all()
+    return dict((row['uuid'], row['id']) for row in rows)
+
+
 @require_context
 def get_instance_uuid_by_ec2_id(context, ec2_id):
     result = _ec2_instance_get_query(context).\
@@ -5391,8 +5769,10 @@ def _ec2_instance_get_query(context, session=None):
 
 
 def _task_log_get_query(context, task_name, period_beginning,
-                        period_ending, host=None, state=None, session=None):
-    query = model_query(context, models.TaskLog, session=session).\
+                        period_ending, host=None, state=None, session=None,
+                        use_slave=False):
+    query = model_query(context, models.TaskLog, session=session,
+                        use_slave=use_slave).\
                      filter_by(task_name=task_name).\
                      filter_by(period_beginning=period_beginning).\
                      filter_by(period_ending=period_ending)
@@ -5411,10 +5791,12 @@ def task_log_get(context, task_name, period_beginning, period_ending, host,
 
 
 @require_admin_context
+@_slave_fallback
 def task_log_get_all(context, task_name, period_beginning, period_ending,
-                     host=None, state=None):
+                     host=None, state=None, use_slave=False):
     return _task_log_get_query(context, task_name, period_beginning,
-                               period_ending, host, state).all()
+                               period_ending, host, state,
+                               use_slave=use_slave).all()
 
 
 @require_admin_context
@@ -5473,11 +5855,50 @@ def _get_default_deleted_value(table):
         return None
 
 
+def _archive_deleted_rows_batch(conn, table, shadow_table, column,
+                                default_deleted_value, batch_size,
+                                watermark=None):
+    """Move one batch of deleted rows from table to shadow_table.
+
+    The batch is the batch_size lowest values of column among the deleted
+    rows above watermark.  Its rows are locked, then copied and deleted by
+    their keys, so exactly the rows copied are deleted.
+
+    :returns: a (rows archived, new watermark) tuple; the new watermark is
+              None when there was nothing left to archive.
+    """
+    # nova.db.sqlalchemy.utils imports this module, so it can not be
+    # imported at the top of it.
+    from nova.db.sqlalchemy import utils as db_utils
+
+    deleted = table.c.deleted != default_deleted_value
+    if watermark is not None:
+        deleted = and_(deleted, column > watermark)
+    # The columns are selected in the order of the shadow table, which
+    # InsertFromSelect does not name.
+    columns = [table.c[c.name] for c in shadow_table.c]
+    with conn.begin():
+        keys = [row[0] for row in conn.execute(
+                select([column], deleted, for_update=True).
+                order_by(column).limit(batch_size))]
+        if not keys:
+            return 0, None
+        in_batch = column.in_(keys)
+        conn.execute(db_utils.InsertFromSelect(
+                shadow_table, select(columns).where(in_batch)))
+        result = conn.execute(table.delete().where(in_batch))
+    return result.rowcount, keys[-1]
+
+
 @require_admin_context
-def archive_deleted_rows_for_table(context, tablename, max_rows):
+def archive_deleted_rows_for_table(context, tablename, max_rows=None):
     """Move up to max_rows rows from one tables to the corresponding
     shadow table.
 
+    Rows are moved in batches of CONF.archive_deleted_rows_batch_size, each
+    in its own transaction, so an interrupted run keeps the batches already
+    archived and the next run resumes from there.
+
     :returns: number of rows archived
     """
     # The context argument is only used for the decorator.
@@ -5494,58 +5915,61 @@ def archive_deleted_rows_for_table(context, tablename, max_rows):
     except NoSuchTableError:
         # No corresponding shadow table; skip it.
         return rows_archived
-    # Group the insert and delete in a transaction.
-    with conn.begin():
-        # TODO(dripton): It would be more efficient to insert(select) and then
-        # delete(same select) without ever returning the selected rows back to
-        # Python.  sqlalchemy does not support that directly, but we have
-        # nova.db.sqlalchemy.utils.InsertFromSelect for the insert side.  We
-        # need a corresponding function for the delete side.
+    try:
+        column = table.c.id
+    except AttributeError:
+        # We have one table (dns_domains) where the key is called
+        # "domain" rather than "id"
+        column = table.c.domain
+    batch_size = max(CONF.archive_deleted_rows_batch_size, 1)
+    watermark = None
+    while max_rows is None or rows_archived < max_rows:
+        if max_rows is not None:
+            batch_size = min(batch_size, max_rows - rows_archived)
         try:
-            column = table.c.id
-            column_name = "id"
-        except AttributeError:
-            # We have one table (dns_domains) where the key is called
-            # "domain" rather than "id"
-            column = table.c.domain
-            column_name = "domain"
-        query = select([table],
-                       table.c.deleted != default_deleted_value).\
-                       order_by(column).limit(max_rows)
-        rows = conn.execute(query).fetchall()
-        if rows:
-            keys = [getattr(row, column_name) for row in rows]
-            delete_statement = table.delete(column.in_(keys))
-            try:
-                result = conn.execute(delete_statement)
-            except IntegrityError:
-                # A foreign key constraint keeps us from deleting some of
-                # these rows until we clean up a dependent table.  Just
-                # skip this table for now; we'll come back to it later.
-                return rows_archived
-            insert_statement = shadow_table.insert()
-            conn.execute(insert_statement, rows)
-            rows_archived = result.rowcount
+            archived, watermark = _archive_deleted_rows_batch(
+                    conn, table, shadow_table, column, default_deleted_value,
+                    batch_size, watermark)
+        except IntegrityError:
+            # A foreign key constraint keeps us from deleting some of
+            # these rows until we clean up a dependent table.  Just
+            # skip the rest of this table for now; we'll come back to it
+            # later.
+            break
+        if watermark is None:
+            break
+        rows_archived += archived
     return rows_archived
 
 
+def _archive_tablenames():
+    """Table names ordered so that referencing tables come before the
+    tables they reference.
+    """
+    return [table.name
+            for table in reversed(models.BASE.metadata.sorted_tables)]
+
+
 @require_admin_context
 def archive_deleted_rows(context, max_rows=None):
     """Move up to max_rows rows from production tables to the corresponding
     shadow tables.
 
+    Tables are archived children first, so the foreign keys of rows being
+    archived never point at rows which have already been moved.
+
     :returns: Number of rows archived.
     """
     # The context argument is only used for the decorator.
-    tablenames = []
-    for model_class in models.__dict__.itervalues():
-        if hasattr(model_class, "__tablename__"):
-            tablenames.append(model_class.__tablename__)
     rows_archived = 0
-    for tablename in tablenames:
+    for tablename in _archive_tablenames():
+        if max_rows is None:
+            remaining = None
+        else:
+            remaining = max_rows - rows_archived
         rows_archived += archive_deleted_rows_for_table(context, tablename,
-                                         max_rows=max_rows - rows_archived)
-        if rows_archived >= max_rows:
+                                                        max_rows=remaining)
+        if max_rows is not None and rows_archived >= max_rows:
             break
     return rows_archived
 
@@ -5946,6 +6370,16 @@ def pci_device_get_all_by_instance_uuid(context, instance_uuid):
                        all()
 
 
+@require_context
+def pci_device_get_by_instance_uuids(context, instance_uuids):
+    output = dict((instance_uuid, []) for instance_uuid in instance_uuids)
+    if not instance_uuids:
+        return output
+    for row in _instance_pcidevs_get_multi(context, instance_uuids):
+        output[row['instance_uuid']].append(row)
+    return output
+
+
 def _instance_pcidevs_get_multi(context, instance_uuids, session=None):
     return model_query(context, models.PciDevice, session=session).\
         filter_by(status='allocated').\
@@ -0,0 +1,44 @@
+# Copyright 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+
+# Based on the filters of instance_get_all_by_filters
+# from: nova/db/sqlalchemy/api.py
+INDEXES = [
+    ('instances_display_name_deleted_idx', ('display_name', 'deleted')),
+    ('instances_hostname_deleted_idx', ('hostname', 'deleted')),
+    ('instances_node_deleted_idx', ('node', 'deleted')),
+    ('instances_launched_at_deleted_idx', ('launched_at', 'deleted')),
+]
+
+
+def _indexes(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    instances = Table('instances', meta, autoload=True)
+    return [Index(name, *[instances.c[column] for column in columns])
+            for name, columns in INDEXES]
+
+
+def upgrade(migrate_engine):
+    for index in _indexes(migrate_engine):
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    for index in _indexes(migrate_engine):
+        index.drop(migrate_engine)
@@ -178,6 +178,14 @@ class Instance(BASE, NovaBase):
               'host', 'node', 'deleted'),
         Index('instances_host_deleted_cleaned_idx',
               'host', 'deleted', 'cleaned'),
+        Index('instances_display_name_deleted_idx',
+              'display_name', 'deleted'),
+        Index('instances_hostname_deleted_idx',
+              'hostname', 'deleted'),
+        Index('instances_node_deleted_idx',
+              'node', 'deleted'),
+        Index('instances_launched_at_deleted_idx',
+              'launched_at', 'deleted'),
     )
     injected_files = []
 
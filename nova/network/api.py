@@ -22,6 +22,7 @@ import functools
 import inspect
 
 from nova.compute import flavors
+from nova.compute import utils as compute_utils
 from nova.db import base
 from nova import exception
 from nova.network import floating_ips
@@ -81,6 +82,7 @@ def update_instance_cache_with_nw_info(api, context, instance, nw_info=None,
         ic.save(update_cells=update_cells)
     except Exception:
         LOG.exception(_('Failed storing info cache'), instance=instance)
+    compute_utils.uncache_instance_metadata(instance['uuid'])
 
 
 def wrap_check_policy(func):
@@ -158,6 +160,24 @@ class API(base.Base):
     def get_fixed_ip_by_address(self, context, address):
         return self.db.fixed_ip_get_by_address(context, address)
 
+    @wrap_check_policy
+    def get_fixed_ip_instance_uuids(self, context):
+        """Returns a dict mapping every fixed ip address allocated to an
+        instance to the uuid of that instance.
+
+        Addresses allocated to more than one instance are left out, since
+        the address alone does not tell which instance is meant.
+        """
+        uuids = {}
+        shared = set()
+        for address, instance_uuid in \
+                self.db.fixed_ip_get_all_instance_uuids(context):
+            if uuids.setdefault(address, instance_uuid) != instance_uuid:
+                shared.add(address)
+        for address in shared:
+            del uuids[address]
+        return uuids
+
     @wrap_check_policy
     def get_floating_ip(self, context, id):
         return self.db.floating_ip_get(context, id)
@@ -398,6 +418,13 @@ class API(base.Base):
                                            result, update_cells=False)
         return result
 
+    def get_instances_nw_info(self, context, instances):
+        """Returns the network info of several instances, updating their
+        info_caches.
+        """
+        return [self.get_instance_nw_info(context, instance)
+                for instance in instances]
+
     def _get_instance_nw_info(self, context, instance):
         """Returns all network info related to an instance."""
         instance_type = flavors.extract_flavor(instance)
@@ -122,6 +122,16 @@ linux_net_opts = [
                default='DROP',
                help=('The table that iptables to jump to when a packet is '
                      'to be dropped.')),
+    cfg.BoolOpt('iptables_incremental_apply',
+                default=False,
+                help='Only send the chains which changed since the last '
+                     'apply to iptables-restore instead of rewriting all '
+                     'the rules of nova'),
+    cfg.IntOpt('iptables_full_resync_interval',
+               default=600,
+               help='Interval in seconds between full rewrites of the '
+                    'rules of nova when iptables_incremental_apply is '
+                    'set. 0 means only after a failed incremental apply.'),
     ]
 
 CONF = cfg.CONF
@@ -165,6 +175,9 @@ class IptablesRule(object):
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return hash((self.chain, self.rule, self.top, self.wrap))
+
     def __str__(self):
         if self.wrap:
             chain = '%s-%s' % (binary_name, self.chain)
@@ -178,13 +191,37 @@ class IptablesTable(object):
     """An iptables table."""
 
     def __init__(self):
-        self.rules = []
+        # Rules are kept in insertion order, with None in place of removed
+        # ones, and indexed by rule so that adding and removing a rule does
+        # not have to scan all of them.
+        self._rules = []
+        self._rule_index = {}
         self.remove_rules = []
         self.chains = set()
         self.unwrapped_chains = set()
         self.remove_chains = set()
         self.dirty = True
 
+    @property
+    def rules(self):
+        return [rule for rule in self._rules if rule is not None]
+
+    def _discard_rule(self, rule):
+        """Remove rule, raising KeyError if it is not in the table."""
+        self._rules[self._rule_index.pop(rule)] = None
+        if len(self._rule_index) * 2 < len(self._rules):
+            # Drop the holes once they are most of the list
+            self._rules = self.rules
+            self._rule_index = dict((rule, i)
+                                    for i, rule in enumerate(self._rules))
+
+    def _remove_rules_if(self, predicate):
+        """Remove the rules matching predicate and return them."""
+        removed = [rule for rule in self.rules if predicate(rule)]
+        for rule in removed:
+            self._discard_rule(rule)
+        return removed
+
     def add_chain(self, name, wrap=True):
         """Adds a named chain to the table.
 
@@ -228,19 +265,18 @@ class IptablesTable(object):
         if not wrap:
             self.remove_chains.add(name)
         chain_set.remove(name)
+        removed = self._remove_rules_if(lambda r: r.chain == name)
         if not wrap:
-            self.remove_rules += filter(lambda r: r.chain == name, self.rules)
-        self.rules = filter(lambda r: r.chain != name, self.rules)
+            self.remove_rules += removed
 
         if wrap:
             jump_snippet = '-j %s-%s' % (binary_name, name)
         else:
             jump_snippet = '-j %s' % (name,)
 
+        removed = self._remove_rules_if(lambda r: jump_snippet in r.rule)
         if not wrap:
-            self.remove_rules += filter(lambda r: jump_snippet in r.rule,
-                                        self.rules)
-        self.rules = filter(lambda r: jump_snippet not in r.rule, self.rules)
+            self.remove_rules += removed
 
     def add_rule(self, chain, rule, wrap=True, top=False):
         """Add a rule to the table.
@@ -260,10 +296,11 @@ class IptablesTable(object):
             rule = ' '.join(map(self._wrap_target_chain, rule.split(' ')))
 
         rule_obj = IptablesRule(chain, rule, wrap, top)
-        if rule_obj in self.rules:
+        if rule_obj in self._rule_index:
             LOG.debug(_("Skipping duplicate iptables rule addition"))
         else:
-            self.rules.append(IptablesRule(chain, rule, wrap, top))
+            self._rule_index[rule_obj] = len(self._rules)
+            self._rules.append(rule_obj)
             self.dirty = True
 
     def _wrap_target_chain(self, s):
@@ -280,11 +317,11 @@ class IptablesTable(object):
 
         """
         try:
-            self.rules.remove(IptablesRule(chain, rule, wrap, top))
+            self._discard_rule(IptablesRule(chain, rule, wrap, top))
             if not wrap:
                 self.remove_rules.append(IptablesRule(chain, rule, wrap, top))
             self.dirty = True
-        except ValueError:
+        except KeyError:
             LOG.warn(_('Tried to remove rule that was not there:'
                        ' %(chain)r %(rule)r %(wrap)r %(top)r'),
                      {'chain': chain, 'rule': rule,
@@ -294,21 +331,16 @@ class IptablesTable(object):
         """Remove all rules matching regex."""
         if isinstance(regex, basestring):
             regex = re.compile(regex)
-        num_rules = len(self.rules)
-        self.rules = filter(lambda r: not regex.match(str(r)), self.rules)
-        removed = num_rules - len(self.rules)
+        removed = len(self._remove_rules_if(lambda r: regex.match(str(r))))
         if removed > 0:
             self.dirty = True
         return removed
 
     def empty_chain(self, chain, wrap=True):
         """Remove all rules from a chain."""
-        chained_rules = [rule for rule in self.rules
-                              if rule.chain == chain and rule.wrap == wrap]
-        if chained_rules:
+        if self._remove_rules_if(lambda r: r.chain == chain and
+                                           r.wrap == wrap):
             self.dirty = True
-        for rule in chained_rules:
-            self.rules.remove(rule)
 
 
 class IptablesManager(object):
@@ -347,6 +379,10 @@ class IptablesManager(object):
 
         self.iptables_apply_deferred = False
 
+        # Snapshot of what the last apply wrote, per command, used to
+        # compute the chains an incremental apply has to rewrite.
+        self._applied = {}
+
         # Add a nova-filter-top chain. It's intended to be shared
         # among the various nova components. It sits at the very top
         # of FORWARD and OUTPUT.
@@ -436,20 +472,120 @@ class IptablesManager(object):
             s += [('ip6tables', self.ipv6)]
 
         for cmd, tables in s:
-            all_tables, _err = self.execute('%s-save' % (cmd,), '-c',
-                                                run_as_root=True,
-                                                attempts=5)
-            all_lines = all_tables.split('\n')
-            for table_name, table in tables.iteritems():
-                start, end = self._find_table(all_lines, table_name)
-                all_lines[start:end] = self._modify_rules(
-                        all_lines[start:end], table, table_name)
-                table.dirty = False
-            self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
-                         process_input='\n'.join(all_lines),
-                         attempts=5)
+            if not (CONF.iptables_incremental_apply and
+                    self._apply_diff(cmd, tables)):
+                self._apply_full(cmd, tables)
         LOG.debug(_("IPTablesManager.apply completed with success"))
 
+    def _apply_full(self, cmd, tables):
+        all_tables, _err = self.execute('%s-save' % (cmd,), '-c',
+                                            run_as_root=True,
+                                            attempts=5)
+        all_lines = all_tables.split('\n')
+        for table_name, table in tables.iteritems():
+            start, end = self._find_table(all_lines, table_name)
+            all_lines[start:end] = self._modify_rules(
+                    all_lines[start:end], table, table_name)
+            table.dirty = False
+        self.execute('%s-restore' % (cmd,), '-c', run_as_root=True,
+                     process_input='\n'.join(all_lines),
+                     attempts=5)
+        if CONF.iptables_incremental_apply:
+            self._applied[cmd] = (timeutils.utcnow(),
+                                  dict((table_name, self._snapshot(table))
+                                       for table_name, table
+                                       in tables.iteritems()))
+        else:
+            self._applied.pop(cmd, None)
+
+    @staticmethod
+    def _snapshot(table):
+        """Return the unwrapped part and the wrapped chains of a table.
+
+        The unwrapped part is shared with other nova binaries, so it can
+        only be rewritten by a full apply.
+
+        """
+        unwrapped = []
+        chains = dict((name, ([], [])) for name in table.chains)
+        for rule in table.rules:
+            if rule.wrap:
+                top, bottom = chains.setdefault(rule.chain, ([], []))
+                (top if rule.top else bottom).append(str(rule))
+            else:
+                unwrapped.append((str(rule), rule.top))
+        return ((frozenset(table.unwrapped_chains), tuple(unwrapped)),
+                dict((name, tuple(top + bottom))
+                     for name, (top, bottom) in chains.iteritems()))
+
+    def _apply_diff(self, cmd, tables):
+        """Rewrite only the wrapped chains changed since the last apply.
+
+        Every changed chain is flushed and refilled, or only appended to
+        if its old rules are a prefix of the new ones, with a single
+        iptables-restore --noflush call, which leaves the rest of the
+        tables alone. Returns False if a full apply is needed instead.
+
+        """
+        synced_at, applied = self._applied.get(cmd, (None, {}))
+        if synced_at is None:
+            return False
+        if (CONF.iptables_full_resync_interval > 0 and
+                timeutils.is_older_than(synced_at,
+                                        CONF.iptables_full_resync_interval)):
+            return False
+
+        snapshots = {}
+        lines = []
+        for table_name, table in tables.iteritems():
+            if (table_name not in applied or table.remove_rules or
+                    table.remove_chains):
+                return False
+            old_unwrapped, old_chains = applied[table_name]
+            snapshots[table_name] = new_unwrapped, new_chains = (
+                    self._snapshot(table))
+            if new_unwrapped != old_unwrapped:
+                return False
+
+            # iptables-restore only accepts a jump to a chain declared
+            # before the rule, so all declarations come first.
+            declarations = []
+            table_rules = []
+            for name, rules in sorted(new_chains.iteritems()):
+                old_rules = old_chains.get(name)
+                if old_rules == rules:
+                    continue
+                if (old_rules is not None and
+                        rules[:len(old_rules)] == old_rules):
+                    table_rules += rules[len(old_rules):]
+                    continue
+                declarations.append(':%s-%s - [0:0]' % (binary_name, name))
+                table_rules += rules
+            removed = sorted(set(old_chains) - set(new_chains))
+            declarations += [':%s-%s - [0:0]' % (binary_name, name)
+                             for name in removed]
+            table_lines = (declarations + table_rules +
+                           ['-X %s-%s' % (binary_name, name)
+                            for name in removed])
+            if table_lines:
+                lines += ['*%s' % table_name] + table_lines + ['COMMIT']
+
+        if lines:
+            try:
+                self.execute('%s-restore' % (cmd,), '-c', '-n',
+                             run_as_root=True,
+                             process_input='\n'.join(lines + ['']))
+            except processutils.ProcessExecutionError as exc:
+                LOG.warn(_('Incremental %(cmd)s-restore failed, falling '
+                           'back to a full apply: %(exc)s'),
+                         {'cmd': cmd, 'exc': exc})
+                return False
+
+        for table_name, table in tables.iteritems():
+            table.dirty = False
+        applied.update(snapshots)
+        return True
+
     def _find_table(self, lines, table_name):
         if len(lines) < 3:
             # length only <2 when fake iptables
@@ -485,17 +621,17 @@ class IptablesManager(object):
         if CONF.iptables_top_regex:
             regex = re.compile(CONF.iptables_top_regex)
             temp_filter = filter(lambda line: regex.search(line), new_filter)
-            for rule_str in temp_filter:
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                                    new_filter)
+            matched = set(rule_str.strip() for rule_str in temp_filter)
+            new_filter = filter(lambda s: s.strip() not in matched,
+                                new_filter)
             top_rules = temp_filter
 
         if CONF.iptables_bottom_regex:
             regex = re.compile(CONF.iptables_bottom_regex)
             temp_filter = filter(lambda line: regex.search(line), new_filter)
-            for rule_str in temp_filter:
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                    new_filter)
+            matched = set(rule_str.strip() for rule_str in temp_filter)
+            new_filter = filter(lambda s: s.strip() not in matched,
+                                new_filter)
             bottom_rules = temp_filter
 
         seen_chains = False
@@ -572,6 +708,10 @@ class IptablesManager(object):
                 seen_lines.add(line)
                 return True
 
+        # ignore [packet:byte] counts at beginning of rules
+        remove_rule_strs = set(str(rule).split(' ', 1)[1].strip()
+                               for rule in remove_rules)
+
         def _weed_out_removes(line):
             # We need to find exact matches here
             if line.startswith(':'):
@@ -580,23 +720,17 @@ class IptablesManager(object):
                 line = line.split(':')[1]
                 line = line.split('- [')[0]
                 line = line.strip()
-                for chain in remove_chains:
-                    if chain == line:
-                        remove_chains.remove(chain)
-                        return False
+                if line in remove_chains:
+                    remove_chains.remove(line)
+                    return False
             elif line.startswith('['):
                 # it's a rule
                 # ignore [packet:byte] counts at beginning of lines
                 line = line.split(']', 1)[1]
                 line = line.strip()
-                for rule in remove_rules:
-                    # ignore [packet:byte] counts at beginning of rules
-                    rule_str = str(rule)
-                    rule_str = rule_str.split(' ', 1)[1]
-                    rule_str = rule_str.strip()
-                    if rule_str == line:
-                        remove_rules.remove(rule)
-                        return False
+                if line in remove_rule_strs:
+                    remove_rule_strs.remove(line)
+                    return False
 
             # Leave it alone
             return True
@@ -611,12 +745,107 @@ class IptablesManager(object):
 
         # flush lists, just in case we didn't find something
         remove_chains.clear()
-        for rule in remove_rules:
-            remove_rules.remove(rule)
+        del remove_rules[:]
 
         return new_filter
 
 
+class IpsetManager(object):
+    """Wrapper for ipset.
+
+    Remembers the members of every set it manages, so that bringing a set
+    up to date only adds and removes the addresses which changed, all in
+    a single ipset restore call.
+    """
+
+    def __init__(self, execute=None):
+        if not execute:
+            self.execute = _execute
+        else:
+            self.execute = execute
+        self.sets = {}
+        # Sets found on the host which were left over by a previous run,
+        # None until the host has been listed
+        self.leftover_sets = None
+
+    @utils.synchronized('ipset', external=True)
+    def set_members(self, name, family, members):
+        """Make members the content of the hash:ip set name.
+
+        The first time a set is seen it is filled under a temporary name
+        and swapped in, so that a set left over from a previous run keeps
+        matching its old members until then.
+
+        :param family: 'inet' or 'inet6'
+        """
+        members = set(members)
+        current = self.sets.get(name)
+        if current is None:
+            temp_name = '%s-new' % name
+            commands = ['create %s hash:ip family %s' % (name, family),
+                        'create %s hash:ip family %s' % (temp_name, family),
+                        'flush %s' % temp_name]
+            commands += ['add %s %s' % (temp_name, member)
+                         for member in sorted(members)]
+            commands += ['swap %s %s' % (temp_name, name),
+                         'destroy %s' % temp_name]
+        else:
+            commands = ['del %s %s' % (name, member)
+                        for member in sorted(current - members)]
+            commands += ['add %s %s' % (name, member)
+                         for member in sorted(members - current)]
+        if commands:
+            self.execute('ipset', 'restore', '-exist',
+                         process_input='\n'.join(commands) + '\n',
+                         run_as_root=True)
+        self.sets[name] = members
+        if self.leftover_sets:
+            self.leftover_sets.discard(name)
+
+    def _destroy_set(self, name):
+        try:
+            self.execute('ipset', 'destroy', name, run_as_root=True)
+        except processutils.ProcessExecutionError:
+            return False
+        self.sets.pop(name, None)
+        if self.leftover_sets:
+            self.leftover_sets.discard(name)
+        return True
+
+    @utils.synchronized('ipset', external=True)
+    def destroy_set(self, name):
+        """Destroy the set name.
+
+        :returns: False if the set is still referenced by a rule and could
+                  not be destroyed yet.
+        """
+        return self._destroy_set(name)
+
+    def _list_sets(self):
+        try:
+            out, _err = self.execute('ipset', 'list', '-name',
+                                     run_as_root=True)
+        except processutils.ProcessExecutionError:
+            return []
+        return out.split()
+
+    @utils.synchronized('ipset', external=True)
+    def destroy_unused_sets(self, prefix, used):
+        """Destroy the sets named with prefix which are not in used,
+        including the ones left over on the host by a previous run.
+
+        Sets which are still referenced by a rule are retried on the next
+        call.
+        """
+        if self.leftover_sets is None:
+            self.leftover_sets = set(name for name in self._list_sets()
+                                     if name.startswith(prefix) and
+                                     name not in self.sets)
+        for name in sorted(set(self.sets) | self.leftover_sets):
+            if name.startswith(prefix) and name not in used:
+                self._destroy_set(name)
+
+
 # NOTE(jkoelker) This is just a nice little stub point since mocking
 #                builtins with mox is a nightmare
 def write_to_file(file, data, mode='w'):
@@ -1811,3 +2040,4 @@ class NeutronLinuxBridgeInterfaceDriver(LinuxNetInterfaceDriver):
 QuantumLinuxBridgeInterfaceDriver = NeutronLinuxBridgeInterfaceDriver
 
 iptables_manager = IptablesManager()
+ipset_manager = IpsetManager()
@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from eventlet import corolocal
 from neutronclient import client
 from neutronclient.common import exceptions
 from neutronclient.v2_0 import client as clientv20
@@ -23,12 +24,69 @@ from oslo.config import cfg
 from nova.openstack.common import excutils
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
+from nova.openstack.common import timeutils
 
 CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
 
+# Seconds before its expiry at which the cached admin token is renewed
+TOKEN_EXPIRY_WINDOW = 120
+
+# Clients kept per greenthread before the oldest ones are dropped
+MAX_CACHED_CLIENTS = 8
+
+# The admin token shared by the whole process and when it expires
+_ADMIN_AUTH = {'token': None, 'expires': None}
+
+# Clients are not safe to share between greenthreads, as their HTTP
+# connections would be, so each greenthread keeps its own.
+_CLIENTS = corolocal.local()
+
+
+def _token_expiry(httpclient):
+    try:
+        return timeutils.parse_isotime(
+                httpclient.service_catalog.get_token()['expires'])
+    except (AttributeError, KeyError, ValueError):
+        return None
+
+
+def _remember_admin_token(httpclient):
+    _ADMIN_AUTH['token'] = httpclient.auth_token
+    _ADMIN_AUTH['expires'] = _token_expiry(httpclient)
+
+
+def _is_newer_token(httpclient):
+    """Whether the token of a client expires after the shared one."""
+    if not _ADMIN_AUTH['token']:
+        return True
+    expires = _token_expiry(httpclient)
+    if expires is None:
+        return False
+    return not _ADMIN_AUTH['expires'] or expires >= _ADMIN_AUTH['expires']
+
+
+def _cached_auth_token():
+    token = _ADMIN_AUTH['token']
+    expires = _ADMIN_AUTH['expires']
+    if not token or not expires:
+        return None
+    if timeutils.is_soon(expires, TOKEN_EXPIRY_WINDOW):
+        return None
+    return token
+
+
+def reset_clients():
+    """Forget the cached admin token and clients."""
+    _ADMIN_AUTH['token'] = None
+    _ADMIN_AUTH['expires'] = None
+    _CLIENTS.clients = {}
+
 
 def _get_auth_token():
+    token = _cached_auth_token()
+    if token:
+        return token
     try:
         httpclient = client.HTTPClient(
             username=CONF.neutron_admin_username,
@@ -41,6 +99,7 @@ def _get_auth_token():
             ca_cert=CONF.neutron_ca_certificates_file,
             insecure=CONF.neutron_api_insecure)
         httpclient.authenticate()
+        _remember_admin_token(httpclient)
         return httpclient.auth_token
     except exceptions.NeutronClientException as e:
         with excutils.save_and_reraise_exception():
@@ -48,7 +107,8 @@ def _get_auth_token():
 
 
 def _get_client(token=None):
-    if not token and CONF.neutron_auth_strategy:
+    admin = not token and CONF.neutron_auth_strategy
+    if admin:
         token = _get_auth_token()
     params = {
         'endpoint_url': CONF.neutron_url,
@@ -60,12 +120,51 @@ def _get_client(token=None):
         params['token'] = token
     else:
         params['auth_strategy'] = None
+    if admin:
+        # Let the client authenticate again by itself if Neutron turns
+        # the cached token down.
+        params.update(username=CONF.neutron_admin_username,
+                      tenant_name=CONF.neutron_admin_tenant_name,
+                      region_name=CONF.neutron_region_name,
+                      password=CONF.neutron_admin_password,
+                      auth_url=CONF.neutron_admin_auth_url,
+                      auth_strategy=CONF.neutron_auth_strategy)
     return clientv20.Client(**params)
 
 
+def _get_cached_client(token=None):
+    """Return a client of the current greenthread, so that the HTTP
+    connection it holds to Neutron is reused across calls.
+    """
+    admin = not token and CONF.neutron_auth_strategy
+    key = 'admin' if admin else token
+    if not hasattr(_CLIENTS, 'clients'):
+        _CLIENTS.clients = {}
+    clients = _CLIENTS.clients
+    neutron = clients.get(key)
+    if neutron is not None and admin:
+        httpclient = neutron.httpclient
+        if httpclient.auth_token != _ADMIN_AUTH['token']:
+            if _is_newer_token(httpclient):
+                # It authenticated again after being turned down
+                _remember_admin_token(httpclient)
+            else:
+                # Another greenthread has renewed the shared token since
+                # this client was built, so use that one instead.
+                neutron = None
+        if neutron is not None and not _cached_auth_token():
+            neutron = None
+    if neutron is None:
+        if len(clients) >= MAX_CACHED_CLIENTS:
+            clients.clear()
+        neutron = _get_client(token=token)
+        clients[key] = neutron
+    return neutron
+
+
 def get_client(context, admin=False):
     if admin:
         token = None
     else:
         token = context.auth_token
-    return _get_client(token=token)
+    return _get_cached_client(token=token)
@@ -100,6 +100,9 @@ LOG = logging.getLogger(__name__)
 refresh_cache = network_api.refresh_cache
 update_instance_info_cache = network_api.update_instance_cache_with_nw_info
 
+# Most ids passed in a single filtered list request, to keep the URI short
+MAX_IDS_PER_REQUEST = 100
+
 
 class API(base.Base):
     """API for interacting with the neutron 2.x API."""
@@ -463,6 +466,22 @@ class API(base.Base):
         nw_info = self._build_network_info_model(context, instance, networks)
         return network_model.NetworkInfo.hydrate(nw_info)
 
+    def get_instances_nw_info(self, context, instances):
+        """Return network information for several instances and update
+           their caches.
+
+        The number of Neutron requests does not depend on the number of
+        instances or ports.
+        """
+        nw_infos = self._build_network_info_models(context, instances)
+        result = []
+        for instance, nw_info in zip(instances, nw_infos):
+            nw_info = network_model.NetworkInfo.hydrate(nw_info)
+            update_instance_info_cache(self, context, instance, nw_info,
+                                       update_cells=False)
+            result.append(nw_info)
+        return result
+
     @refresh_cache
     def add_fixed_ip_to_instance(self, context, instance, network_id,
                                  conductor_api=None):
@@ -691,6 +710,31 @@ class API(base.Base):
             raise exception.FixedIpAssociatedWithMultipleInstances(
                 address=address)
 
+    def get_fixed_ip_instance_uuids(self, context):
+        """Return a dict mapping the fixed ip addresses of all instance
+        ports to the uuids of their instances.
+
+        Addresses used by ports of more than one instance, as happens with
+        overlapping subnets, are left out since the address alone does not
+        tell which instance is meant.
+        """
+        data = neutronv2.get_client(context).list_ports(
+            fields=['device_id', 'device_owner', 'fixed_ips'])
+        uuids = {}
+        shared = set()
+        for port in data.get('ports', []):
+            if not (port['device_id'] and
+                    port['device_owner'].startswith('compute:')):
+                continue
+            for fixed_ip in port['fixed_ips']:
+                address = fixed_ip['ip_address']
+                if uuids.setdefault(address, port['device_id']) != \
+                        port['device_id']:
+                    shared.add(address)
+        for address in shared:
+            del uuids[address]
+        return uuids
+
     def _setup_net_dict(self, client, network_id):
         if not network_id:
             return {}
@@ -836,18 +880,17 @@ class API(base.Base):
             raise exception.FloatingIpMultipleFoundForAddress(address=address)
         return fips[0]
 
-    def _get_floating_ips_by_fixed_and_port(self, client, fixed_ip, port):
-        """Get floatingips from fixed ip and port."""
+    def _get_floating_ips_by_ports(self, client, port_ids):
+        """Get the floatingips associated to any of the given ports."""
         try:
-            data = client.list_floatingips(fixed_ip_address=fixed_ip,
-                                           port_id=port)
+            return _list_by_ids(client.list_floatingips, 'floatingips',
+                                'port_id', port_ids)
         # If a neutron plugin does not implement the L3 API a 404 from
         # list_floatingips will be raised.
         except neutronv2.exceptions.NeutronClientException as e:
             if e.status_code == 404:
                 return []
             raise
-        return data['floatingips']
 
     def release_floating_ip(self, context, address,
                             affect_auto_assigned=False):
@@ -910,21 +953,24 @@ class API(base.Base):
         """Force add a network to the project."""
         raise NotImplementedError()
 
-    def _nw_info_get_ips(self, client, port):
+    def _nw_info_get_ips(self, port, floating_ips):
+        """Return the fixed IPs of a port.
+
+        :param floating_ips: dict of the floating IP addresses keyed by
+                             (port id, fixed IP address)
+        """
         network_IPs = []
         for fixed_ip in port['fixed_ips']:
             fixed = network_model.FixedIP(address=fixed_ip['ip_address'])
-            floats = self._get_floating_ips_by_fixed_and_port(
-                client, fixed_ip['ip_address'], port['id'])
-            for ip in floats:
-                fip = network_model.IP(address=ip['floating_ip_address'],
-                                       type='floating')
+            floats = floating_ips.get((port['id'], fixed_ip['ip_address']),
+                                      [])
+            for address in floats:
+                fip = network_model.IP(address=address, type='floating')
                 fixed.add_floating_ip(fip)
             network_IPs.append(fixed)
         return network_IPs
 
-    def _nw_info_get_subnets(self, context, port, network_IPs):
-        subnets = self._get_subnets_from_port(context, port)
+    def _nw_info_get_subnets(self, subnets, network_IPs):
         for subnet in subnets:
             subnet['ips'] = [fixed_ip for fixed_ip in network_IPs
                              if fixed_ip.is_in_subnet(subnet)]
@@ -973,6 +1019,33 @@ class API(base.Base):
             network['should_create_bridge'] = should_create_bridge
         return network, ovs_interfaceid
 
+    def _nw_info_cached_net_ids(self, context, instance):
+        # retrieve networks from info_cache to get correct nic order
+        network_cache = self.conductor_api.instance_get_by_uuid(
+            context, instance['uuid'])['info_cache']['network_info']
+        network_cache = jsonutils.loads(network_cache)
+        return [iface['network']['id'] for iface in network_cache]
+
+    def _nw_info_loaded_net_ids(self, context, instance):
+        """Return the networks from the info_cache loaded with the instance,
+        if it was, instead of looking the instance up again.
+        """
+        if 'info_cache' not in instance:
+            return self._nw_info_cached_net_ids(context, instance)
+        info_cache = instance['info_cache']
+        network_cache = info_cache and info_cache['network_info']
+        if isinstance(network_cache, basestring):
+            network_cache = jsonutils.loads(network_cache)
+        return [iface['network']['id'] for iface in network_cache or []]
+
+    def _nw_info_select_ports(self, ports, net_ids):
+        # ensure ports are in preferred network order, and filter out
+        # those not attached to one of the provided list of networks
+        ports = [port for port in ports if port['network_id'] in net_ids]
+        _ensure_requested_network_ordering(lambda x: x['network_id'],
+                                           ports, net_ids)
+        return ports
+
     def _build_network_info_model(self, context, instance, networks=None):
         search_opts = {'tenant_id': instance['project_id'],
                        'device_id': instance['uuid'], }
@@ -980,85 +1053,149 @@ class API(base.Base):
         data = client.list_ports(**search_opts)
         ports = data.get('ports', [])
         if networks is None:
-            # retrieve networks from info_cache to get correct nic order
-            network_cache = self.conductor_api.instance_get_by_uuid(
-                context, instance['uuid'])['info_cache']['network_info']
-            network_cache = jsonutils.loads(network_cache)
-            net_ids = [iface['network']['id'] for iface in network_cache]
+            net_ids = self._nw_info_cached_net_ids(context, instance)
             networks = self._get_available_networks(context,
                                                     instance['project_id'])
-
-        # ensure ports are in preferred network order, and filter out
-        # those not attached to one of the provided list of networks
         else:
             net_ids = [n['id'] for n in networks]
-        ports = [port for port in ports if port['network_id'] in net_ids]
-        _ensure_requested_network_ordering(lambda x: x['network_id'],
-                                           ports, net_ids)
-
-        nw_info = network_model.NetworkInfo()
-        for port in ports:
-            network_IPs = self._nw_info_get_ips(client, port)
-            subnets = self._nw_info_get_subnets(context, port, network_IPs)
-
-            devname = "tap" + port['id']
-            devname = devname[:network_model.NIC_NAME_LEN]
+        ports = self._nw_info_select_ports(ports, net_ids)
+        return self._nw_info_build_models(context, client,
+                                          [(ports, networks)])[0]
 
-            network, ovs_interfaceid = self._nw_info_build_network(port,
-                                                                   networks,
-                                                                   subnets)
-
-            nw_info.append(network_model.VIF(
-                id=port['id'],
-                address=port['mac_address'],
-                network=network,
-                type=port.get('binding:vif_type'),
-                ovs_interfaceid=ovs_interfaceid,
-                devname=devname))
-        return nw_info
+    def _build_network_info_models(self, context, instances):
+        """Build the network info models of several instances at once."""
+        client = neutronv2.get_client(context, admin=True)
+        ports_by_device = {}
+        for port in _list_by_ids(client.list_ports, 'ports', 'device_id',
+                                 [instance['uuid'] for instance in instances]):
+            ports_by_device.setdefault(port['device_id'], []).append(port)
+
+        networks_by_project = {}
+        instance_ports = []
+        for instance in instances:
+            project_id = instance['project_id']
+            if project_id not in networks_by_project:
+                networks_by_project[project_id] = (
+                    self._get_available_networks(context, project_id))
+            ports = [port for port in ports_by_device.get(instance['uuid'],
+                                                          [])
+                     if port['tenant_id'] == project_id]
+            net_ids = self._nw_info_loaded_net_ids(context, instance)
+            instance_ports.append((self._nw_info_select_ports(ports, net_ids),
+                                   networks_by_project[project_id]))
+        return self._nw_info_build_models(context, client, instance_ports)
+
+    def _nw_info_build_models(self, context, client, instance_ports):
+        """Build network info models from (ports, networks) pairs, looking
+        up the floating IPs, subnets and DHCP servers of all the ports in
+        bulk.
+        """
+        all_ports = [port for ports, networks in instance_ports
+                     for port in ports]
+        floating_ips = {}
+        # Floating IPs are associated to fixed IPs, ports without don't
+        # have any.
+        port_ids = [port['id'] for port in all_ports if port['fixed_ips']]
+        if port_ids:
+            fips = self._get_floating_ips_by_ports(client, port_ids)
+            for fip in fips:
+                key = (fip['port_id'], fip['fixed_ip_address'])
+                floating_ips.setdefault(key, []).append(
+                        fip['floating_ip_address'])
+        port_subnets = self._get_subnets_from_ports(context, all_ports)
+
+        nw_infos = []
+        for ports, networks in instance_ports:
+            nw_info = network_model.NetworkInfo()
+            for port in ports:
+                network_IPs = self._nw_info_get_ips(port, floating_ips)
+                subnets = self._nw_info_get_subnets(port_subnets[port['id']],
+                                                    network_IPs)
+
+                devname = "tap" + port['id']
+                devname = devname[:network_model.NIC_NAME_LEN]
+
+                network, ovs_interfaceid = self._nw_info_build_network(
+                        port, networks, subnets)
+
+                nw_info.append(network_model.VIF(
+                    id=port['id'],
+                    address=port['mac_address'],
+                    network=network,
+                    type=port.get('binding:vif_type'),
+                    ovs_interfaceid=ovs_interfaceid,
+                    devname=devname))
+            nw_infos.append(nw_info)
+        return nw_infos
 
     def _get_subnets_from_port(self, context, port):
         """Return the subnets for a given port."""
+        return self._get_subnets_from_ports(context, [port])[port['id']]
 
-        fixed_ips = port['fixed_ips']
+    def _get_subnets_from_ports(self, context, ports):
+        """Return the subnets of each port, keyed by port id.
+
+        The subnets and their DHCP ports are looked up with one request
+        each for all the ports.
+        """
+        subnet_ids = []
+        for port in ports:
+            for ip in port['fixed_ips']:
+                if ip['subnet_id'] not in subnet_ids:
+                    subnet_ids.append(ip['subnet_id'])
         # No fixed_ips for the port means there is no subnet associated
         # with the network the port is created on.
         # Since list_subnets(id=[]) returns all subnets visible for the
         # current tenant, returned subnets may contain subnets which is not
-        # related to the port. To avoid this, the method returns here.
-        if not fixed_ips:
-            return []
-        search_opts = {'id': [ip['subnet_id'] for ip in fixed_ips]}
-        data = neutronv2.get_client(context).list_subnets(**search_opts)
-        ipam_subnets = data.get('subnets', [])
-        subnets = []
-
-        for subnet in ipam_subnets:
-            subnet_dict = {'cidr': subnet['cidr'],
-                           'gateway': network_model.IP(
-                                address=subnet['gateway_ip'],
-                                type='gateway'),
-            }
+        # related to the port. To avoid this, nothing is looked up then.
+        ipam_subnets = {}
+        dhcp_servers = {}
+        if subnet_ids:
+            client = neutronv2.get_client(context)
+            for subnet in _list_by_ids(client.list_subnets, 'subnets', 'id',
+                                       subnet_ids):
+                ipam_subnets[subnet['id']] = subnet
 
             # attempt to populate DHCP server field
-            search_opts = {'network_id': subnet['network_id'],
-                           'device_owner': 'network:dhcp'}
-            data = neutronv2.get_client(context).list_ports(**search_opts)
-            dhcp_ports = data.get('ports', [])
+            network_ids = []
+            for subnet_id in subnet_ids:
+                subnet = ipam_subnets.get(subnet_id)
+                if subnet and subnet['network_id'] not in network_ids:
+                    network_ids.append(subnet['network_id'])
+            dhcp_ports = _list_by_ids(client.list_ports, 'ports',
+                                      'network_id', network_ids,
+                                      device_owner='network:dhcp')
             for p in dhcp_ports:
                 for ip_pair in p['fixed_ips']:
-                    if ip_pair['subnet_id'] == subnet['id']:
-                        subnet_dict['dhcp_server'] = ip_pair['ip_address']
-                        break
-
-            subnet_object = network_model.Subnet(**subnet_dict)
-            for dns in subnet.get('dns_nameservers', []):
-                subnet_object.add_dns(
-                    network_model.IP(address=dns, type='dns'))
+                    dhcp_servers.setdefault(ip_pair['subnet_id'],
+                                            ip_pair['ip_address'])
 
-            # TODO(gongysh) get the routes for this subnet
-            subnets.append(subnet_object)
-        return subnets
+        result = {}
+        for port in ports:
+            subnets = []
+            seen = set()
+            for ip in port['fixed_ips']:
+                subnet = ipam_subnets.get(ip['subnet_id'])
+                if subnet is None or subnet['id'] in seen:
+                    continue
+                seen.add(subnet['id'])
+                subnet_dict = {'cidr': subnet['cidr'],
+                               'gateway': network_model.IP(
+                                    address=subnet['gateway_ip'],
+                                    type='gateway'),
+                }
+                if subnet['id'] in dhcp_servers:
+                    subnet_dict['dhcp_server'] = dhcp_servers[subnet['id']]
+
+                subnet_object = network_model.Subnet(**subnet_dict)
+                for dns in subnet.get('dns_nameservers', []):
+                    subnet_object.add_dns(
+                        network_model.IP(address=dns, type='dns'))
+
+                # TODO(gongysh) get the routes for this subnet
+                subnets.append(subnet_object)
+            result[port['id']] = subnets
+        return result
 
     def get_dns_domains(self, context):
         """Return a list of available dns domains.
@@ -1100,6 +1237,18 @@ class API(base.Base):
         raise NotImplementedError()
 
 
+def _list_by_ids(list_method, resource, key, ids, **search_opts):
+    """Return the resources whose key is any of ids.
+
+    Ids are sent MAX_IDS_PER_REQUEST at a time.
+    """
+    resources = []
+    for start in xrange(0, len(ids), MAX_IDS_PER_REQUEST):
+        search_opts[key] = ids[start:start + MAX_IDS_PER_REQUEST]
+        resources.extend(list_method(**search_opts).get(resource, []))
+    return resources
+
+
 def _ensure_requested_network_ordering(accessor, unordered, preferred):
     """Sort a list with respect to the preferred network ordering."""
     if preferred:
@@ -14,10 +14,14 @@
 
 """Nova common internal object model"""
 
+import calendar
 import collections
 import copy
+import datetime
 import functools
 
+from oslo.config import cfg
+
 from nova import context
 from nova import exception
 from nova.objects import utils as obj_utils
@@ -26,7 +30,7 @@ from nova.openstack.common import log as logging
 from nova.openstack.common.rpc import common as rpc_common
 import nova.openstack.common.rpc.serializer
 
-
+CONF = cfg.CONF
 LOG = logging.getLogger('object')
 
 
@@ -34,6 +38,15 @@ class NotSpecifiedSentinel:
     pass
 
 
+# Field kinds of the compact wire format, see NovaObject.obj_compact_layout()
+COMPACT_PLAIN = 0
+COMPACT_DATETIME = 1
+COMPACT_HANDLER = 2
+
+_DATETIME_TYPEFNS = (obj_utils.datetime_or_none,
+                     obj_utils.datetime_or_str_or_none)
+
+
 def get_attrname(name):
     """Return the mangled name of the attribute's underlying storage."""
     return '_%s' % name
@@ -137,16 +150,66 @@ def remotable(fn):
         if NovaObject.indirection_api:
             updates, result = NovaObject.indirection_api.object_action(
                 ctxt, self, fn.__name__, args, kwargs)
-            for key, value in updates.iteritems():
-                if key in self.fields:
-                    self[key] = self._attr_from_primitive(key, value)
-            self._changed_fields = set(updates.get('obj_what_changed', []))
+            _apply_remote_updates(self, updates)
             return result
         else:
             return fn(self, ctxt, *args, **kwargs)
     return wrapper
 
 
+def _apply_remote_updates(obj, updates):
+    """Apply the updates returned by a remote object action to obj."""
+    if isinstance(updates, NovaObject):
+        # NOTE: Compact replies carry the updated fields as a
+        # partial object rather than as a dict of primitives
+        for key in updates.fields:
+            if updates.obj_attr_is_set(key):
+                obj[key] = updates[key]
+        obj._changed_fields = set(updates.obj_what_changed())
+        return
+    for key, value in updates.iteritems():
+        if key in obj.fields:
+            obj[key] = obj._attr_from_primitive(key, value)
+    obj._changed_fields = set(updates.get('obj_what_changed', []))
+
+
+def obj_batch_action(context, objs, objmethod, *args, **kwargs):
+    """Call the remotable method objmethod on each of objs.
+
+    When object methods are remoted, this is done with a single call to
+    the indirection service rather than with one call per object.
+
+    A failing object does not keep the method from being called on the
+    others, so the exception it raised is returned in place of its result.
+
+    :returns: A list with the result of the call or the exception raised
+              by it for each of objs, in order.
+    """
+    if not objs:
+        return []
+    if NovaObject.indirection_api:
+        replies = NovaObject.indirection_api.object_action_batch(
+            context, objs, objmethod, args, kwargs)
+        results = []
+        for obj, (updates, result, failure) in zip(objs, replies):
+            obj._context = context
+            if failure is not None:
+                result = rpc_common.deserialize_remote_exception(CONF,
+                                                                 failure)
+            else:
+                _apply_remote_updates(obj, updates)
+            results.append(result)
+        return results
+
+    results = []
+    for obj in objs:
+        try:
+            results.append(getattr(obj, objmethod)(context, *args, **kwargs))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
 # Object versioning rules
 #
 # Each service has its set of objects, each with a version attached. When
@@ -301,6 +364,94 @@ class NovaObject(object):
             obj['nova_object.changes'] = list(self.obj_what_changed())
         return obj
 
+    @classmethod
+    def obj_compact_layout(cls):
+        """Return the field kinds used by the compact wire format.
+
+        This is a dict of field name to field kind, which tells how the
+        value of the field is encoded. It is computed once per class.
+        """
+        layout = cls.__dict__.get('_obj_compact_layout')
+        if layout is None:
+            layout = {}
+            for name, typefn in cls.fields.iteritems():
+                if typefn in _DATETIME_TYPEFNS:
+                    layout[name] = COMPACT_DATETIME
+                elif hasattr(cls, '_attr_%s_to_primitive' % name):
+                    layout[name] = COMPACT_HANDLER
+                else:
+                    layout[name] = COMPACT_PLAIN
+            cls._obj_compact_layout = layout
+        return layout
+
+    def obj_to_compact_primitive(self, fields=None):
+        """Dehydrate into the compact wire format.
+
+        Set fields are sent as a flat list of (field name, value) pairs,
+        datetimes as integer seconds since the epoch and nested objects in
+        the compact format as well. If fields is given, only those fields
+        are sent. Fields are identified by name, so that, as with the
+        regular format, the receiving side may have a newer minor version
+        of the object.
+        """
+        layout = self.obj_compact_layout()
+        data = []
+        for name, kind in layout.iteritems():
+            if fields is not None and name not in fields:
+                continue
+            attrname = get_attrname(name)
+            if not hasattr(self, attrname):
+                continue
+            value = getattr(self, attrname)
+            if value is None:
+                pass
+            elif kind == COMPACT_DATETIME:
+                value = calendar.timegm(value.utctimetuple())
+            elif kind == COMPACT_HANDLER:
+                if isinstance(value, NovaObject):
+                    value = value.obj_to_compact_primitive()
+                elif (isinstance(value, list) and value and
+                        all(isinstance(x, NovaObject) for x in value)):
+                    value = [x.obj_to_compact_primitive() for x in value]
+                else:
+                    value = self._attr_to_primitive(name)
+            data.extend((name, value))
+        return {'nova_object.compact': [self.obj_name(), self.version,
+                                        data,
+                                        list(self.obj_what_changed())]}
+
+    @classmethod
+    def obj_from_compact_primitive(cls, primitive, context=None):
+        """Hydrate from the compact wire format."""
+        objname, objver, data, changes = primitive['nova_object.compact']
+        objclass = cls.obj_class_from_name(objname, objver)
+        layout = objclass.obj_compact_layout()
+        self = objclass()
+        self._context = context
+        for i in xrange(0, len(data), 2):
+            name = data[i]
+            kind = layout.get(name)
+            if kind is None:
+                # Not a field of this version of the object
+                continue
+            value = data[i + 1]
+            if value is None:
+                pass
+            elif kind == COMPACT_DATETIME:
+                value = datetime.datetime.utcfromtimestamp(value)
+            elif kind == COMPACT_HANDLER:
+                if is_compact_primitive(value):
+                    value = cls.obj_from_compact_primitive(value, context)
+                elif (isinstance(value, list) and value and
+                        all(is_compact_primitive(x) for x in value)):
+                    value = [cls.obj_from_compact_primitive(x, context)
+                             for x in value]
+                else:
+                    value = self._attr_from_primitive(name, value)
+            setattr(self, name, value)
+        self._changed_fields = set([x for x in changes if x in layout])
+        return self
+
     def obj_load_attr(self, attrname):
         """Load an additional attribute from the real object.
 
@@ -498,7 +649,15 @@ class NovaObjectSerializer(nova.openstack.common.rpc.serializer.Serializer):
     ability to serialize and deserialize NovaObject entities. Any service
     that needs to accept or return NovaObjects as arguments or result values
     should pass this to its RpcProxy and RpcDispatcher objects.
+
+    Both the regular and the compact object format are deserialized, but
+    objects are only serialized in the compact format if compact is True,
+    which callers must only do once they know the receiving side
+    understands it.
     """
+    def __init__(self, compact=False):
+        self.compact = compact
+
     def _process_iterable(self, context, action_fn, values):
         """Process an iterable, taking an action on each value.
         :param:context: Request context
@@ -519,6 +678,8 @@ class NovaObjectSerializer(nova.openstack.common.rpc.serializer.Serializer):
         if isinstance(entity, (tuple, list, set)):
             entity = self._process_iterable(context, self.serialize_entity,
                                             entity)
+        elif self.compact and isinstance(entity, NovaObject):
+            entity = entity.obj_to_compact_primitive()
         elif (hasattr(entity, 'obj_to_primitive') and
               callable(entity.obj_to_primitive)):
             entity = entity.obj_to_primitive()
@@ -527,12 +688,20 @@ class NovaObjectSerializer(nova.openstack.common.rpc.serializer.Serializer):
     def deserialize_entity(self, context, entity):
         if isinstance(entity, dict) and 'nova_object.name' in entity:
             entity = NovaObject.obj_from_primitive(entity, context=context)
+        elif is_compact_primitive(entity):
+            entity = NovaObject.obj_from_compact_primitive(entity,
+                                                           context=context)
         elif isinstance(entity, (tuple, list, set)):
             entity = self._process_iterable(context, self.deserialize_entity,
                                             entity)
         return entity
 
 
+def is_compact_primitive(entity):
+    """Return True if entity is an object in the compact wire format."""
+    return isinstance(entity, dict) and 'nova_object.compact' in entity
+
+
 def obj_to_primitive(obj):
     """Recursively turn an object into a python primitive.
 
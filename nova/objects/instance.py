@@ -479,10 +479,15 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
                    'name': self.obj_name(),
                    'uuid': self.uuid,
                    })
-        # FIXME(comstud): This should be optimized to only load the attr.
-        instance = self.__class__.get_by_uuid(self._context,
-                                              uuid=self.uuid,
-                                              expected_attrs=[attrname])
+        instance = InstanceList.get_attrs_by_uuids(self._context,
+                                                   [self.uuid],
+                                                   [attrname])[0]
+        if instance.obj_attr_is_set(attrname) and not instance[attrname]:
+            # Nothing was found for the attribute, which is also the case
+            # when the instance does not exist (anymore). Load it along
+            # with the instance then, which raises InstanceNotFound.
+            instance = Instance.get_by_uuid(self._context, self.uuid,
+                                            expected_attrs=[attrname])
 
         # NOTE(danms): Never allow us to recursively-load
         if instance.obj_attr_is_set(attrname):
@@ -493,6 +498,54 @@ class Instance(base.NovaPersistentObject, base.NovaObject):
                 reason='loading %s requires recursion' % attrname)
 
 
+def _get_optional_attr(context, attrname, instance_uuids):
+    """Return a dict of instance uuid to the value of the optional
+    attribute attrname of the instance, loaded for all instance_uuids at
+    once.
+    """
+    if attrname == 'metadata':
+        return db.instance_metadata_get_by_instance_uuids(context,
+                                                          instance_uuids)
+    elif attrname == 'system_metadata':
+        return db.instance_system_metadata_get_by_instance_uuids(
+            context, instance_uuids)
+    elif attrname == 'fault':
+        values = dict((uuid, None) for uuid in instance_uuids)
+        faults = instance_fault.InstanceFaultList.get_by_instance_uuids(
+            context, instance_uuids)
+        for fault in faults:
+            # The latest fault of an instance comes first
+            if values.get(fault.instance_uuid) is None:
+                values[fault.instance_uuid] = fault
+        return values
+
+    values = {}
+    if attrname == 'info_cache':
+        db_info_caches = db.instance_info_cache_get_by_instance_uuids(
+            context, instance_uuids)
+        for uuid, db_info_cache in db_info_caches.iteritems():
+            info_cache = None
+            if db_info_cache is not None:
+                info_cache = instance_info_cache.InstanceInfoCache()
+                instance_info_cache.InstanceInfoCache._from_db_object(
+                    context, info_cache, db_info_cache)
+            values[uuid] = info_cache
+    elif attrname == 'security_groups':
+        db_secgroups = db.security_group_get_by_instance_uuids(
+            context, instance_uuids)
+        for uuid, db_secgroup_list in db_secgroups.iteritems():
+            values[uuid] = security_group._make_secgroup_list(
+                context, security_group.SecurityGroupList(),
+                db_secgroup_list)
+    elif attrname == 'pci_devices':
+        db_pci_devices = db.pci_device_get_by_instance_uuids(
+            context, instance_uuids)
+        for uuid, db_pci_list in db_pci_devices.iteritems():
+            values[uuid] = pci_device._make_pci_list(
+                context, pci_device.PciDeviceList(), db_pci_list)
+    return values
+
+
 def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
     get_fault = expected_attrs and 'fault' in expected_attrs
     inst_faults = {}
@@ -518,20 +571,29 @@ def _make_instance_list(context, inst_list, db_inst_list, expected_attrs):
 
 
 class InstanceList(base.ObjectListBase, base.NovaObject):
+    # Version 1.0: Initial version
+    # Version 1.1: Added get_attrs_by_uuids()
+    # Version 1.2: Added use_slave to get_by_filters() and get_by_host()
+    VERSION = '1.2'
+
     @base.remotable_classmethod
     def get_by_filters(cls, context, filters,
                        sort_key='created_at', sort_dir='desc', limit=None,
-                       marker=None, expected_attrs=None):
+                       marker=None, expected_attrs=None, use_slave=False):
+        kwargs = {'use_slave': True} if use_slave else {}
         db_inst_list = db.instance_get_all_by_filters(
             context, filters, sort_key, sort_dir, limit=limit, marker=marker,
-            columns_to_join=_expected_cols(expected_attrs))
+            columns_to_join=_expected_cols(expected_attrs), **kwargs)
         return _make_instance_list(context, cls(), db_inst_list,
                                    expected_attrs)
 
     @base.remotable_classmethod
-    def get_by_host(cls, context, host, expected_attrs=None):
+    def get_by_host(cls, context, host, expected_attrs=None,
+                    use_slave=False):
+        kwargs = {'use_slave': True} if use_slave else {}
         db_inst_list = db.instance_get_all_by_host(
-            context, host, columns_to_join=_expected_cols(expected_attrs))
+            context, host, columns_to_join=_expected_cols(expected_attrs),
+            **kwargs)
         return _make_instance_list(context, cls(), db_inst_list,
                                    expected_attrs)
 
@@ -558,6 +620,88 @@ class InstanceList(base.ObjectListBase, base.NovaObject):
         return _make_instance_list(context, cls(), db_inst_list,
                                    expected_attrs)
 
+    @base.remotable_classmethod
+    def get_attrs_by_uuids(cls, context, instance_uuids, attrs):
+        """Load optional attributes of instances without their other fields.
+
+        Each attribute is loaded for all instances with a single query.
+
+        :returns: A list of instances, in the order of instance_uuids,
+                  which only have their uuid and attrs set.
+        """
+        values = dict((attr, _get_optional_attr(context, attr,
+                                                instance_uuids))
+                      for attr in attrs)
+        inst_list = cls()
+        inst_list.objects = []
+        for uuid in instance_uuids:
+            instance = Instance()
+            instance.uuid = uuid
+            for attr in attrs:
+                instance[attr] = values[attr][uuid]
+            instance._context = context
+            instance.obj_reset_changes()
+            inst_list.objects.append(instance)
+        inst_list._context = context
+        inst_list.obj_reset_changes()
+        return inst_list
+
+    def fill(self, attrs):
+        """Load the optional attributes attrs of all instances lacking them.
+
+        This does one query per attribute for the whole list instead of
+        one per instance and attribute when they are lazy-loaded.
+        """
+        for attr in attrs:
+            if attr not in INSTANCE_OPTIONAL_ATTRS:
+                raise exception.ObjectActionError(
+                    action='fill',
+                    reason='attribute %s not lazy-loadable' % attr)
+        missing = [attr for attr in attrs
+                   if not all(inst.obj_attr_is_set(attr) for inst in self)]
+        uuids = [inst.uuid for inst in self
+                 if not all(inst.obj_attr_is_set(attr) for attr in missing)]
+        if not uuids:
+            return
+        loaded = self.get_attrs_by_uuids(self._context, uuids, missing)
+        loaded = dict((instance.uuid, instance) for instance in loaded)
+        for instance in self:
+            if instance.uuid not in loaded:
+                continue
+            for attr in missing:
+                if not instance.obj_attr_is_set(attr):
+                    instance[attr] = loaded[instance.uuid][attr]
+                    instance.obj_reset_changes([attr])
+
+    def _call_all(self, instances, method, *args, **kwargs):
+        results = base.obj_batch_action(self._context, instances, method,
+                                        *args, **kwargs)
+        return dict((instance.uuid, result)
+                    for instance, result in zip(instances, results)
+                    if isinstance(result, Exception))
+
+    def refresh_all(self):
+        """Refresh all instances of the list with a single remote call.
+
+        :returns: A dict of instance uuid to the exception raised while
+                  refreshing it for the instances which could not be
+                  refreshed, for example because they were deleted.
+        """
+        return self._call_all(list(self), 'refresh')
+
+    def save_all(self, expected_vm_state=None, expected_task_state=None):
+        """Save the changes of all instances of the list with a single
+        remote call.
+
+        :returns: A dict of instance uuid to the exception raised while
+                  saving it for the instances which could not be saved.
+        """
+        changed = [instance for instance in self
+                   if instance.obj_what_changed()]
+        return self._call_all(changed, 'save',
+                              expected_vm_state=expected_vm_state,
+                              expected_task_state=expected_task_state)
+
     def fill_faults(self):
         """Batch query the database for our instances' faults.
 
@@ -17,13 +17,16 @@
 
 """Policy Engine For Nova."""
 
+import datetime
 import os.path
+import re
 
 from oslo.config import cfg
 
 from nova import exception
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import policy
+from nova.openstack.common import timeutils
 from nova import utils
 
 
@@ -34,6 +37,11 @@ policy_opts = [
     cfg.StrOpt('policy_default_rule',
                default='default',
                help=_('Rule checked when requested rule is not found')),
+    cfg.IntOpt('policy_file_check_interval',
+               default=10,
+               help=_('Number of seconds between checks of the policy file '
+                      'for modifications. Set to 0 to check on every '
+                      'policy check')),
     ]
 
 CONF = cfg.CONF
@@ -42,6 +50,18 @@ CONF.register_opts(policy_opts)
 _POLICY_PATH = None
 _POLICY_CACHE = {}
 
+# Rules compiled from the parsed policy, keyed by rule name. The cache is
+# dropped whenever the rules in openstack.common.policy are replaced.
+_COMPILED = {}
+_COMPILED_RULES = None
+_COMPILED_GENERATION = 0
+
+# Upper bound for the decisions memoized on a single request context.
+_MAX_DECISIONS = 1000
+
+_TARGET_KEY_RE = re.compile(r'%\((\w+)\)s')
+_MISSING = object()
+
 
 def reset():
     global _POLICY_PATH
@@ -60,8 +80,14 @@ def init():
             _POLICY_PATH = CONF.find_file(_POLICY_PATH)
         if not _POLICY_PATH:
             raise exception.ConfigNotFound(path=CONF.policy_file)
+    now = timeutils.utcnow()
+    next_check = _POLICY_CACHE.get('next_check')
+    if next_check is not None and now < next_check:
+        return
     utils.read_cached_file(_POLICY_PATH, _POLICY_CACHE,
                            reload_func=_set_rules)
+    _POLICY_CACHE['next_check'] = now + datetime.timedelta(
+        seconds=CONF.policy_file_check_interval)
 
 
 def _set_rules(data):
@@ -69,6 +95,279 @@ def _set_rules(data):
     policy.set_rules(policy.Rules.load_json(data, default_rule))
 
 
+class _CompiledRule(object):
+    """A policy rule compiled into a flat function.
+
+    The tree of checks parsed from the policy file is folded into closures:
+    rule references are inlined, branches which can not change the outcome
+    are dropped and role names are lowered once. The credential and target
+    keys the rule reads are recorded so that decisions can be memoized.
+    """
+
+    def __init__(self, name, rules):
+        self.cred_keys = set()
+        self.target_keys = set()
+        self.memoizable = True
+        self._compiling = set([name])
+        try:
+            self.func = self._compile(rules[name], rules) if rules else False
+        except KeyError:
+            # If the rule doesn't exist, fail closed
+            self.func = False
+        self.uses_roles = 'roles' in self.cred_keys
+        self.cred_keys = tuple(sorted(self.cred_keys))
+        self.target_keys = tuple(sorted(self.target_keys))
+
+    def _compile(self, check, rules):
+        """Compile a check into a function of (target, creds, roles).
+
+        Checks which do not depend on the target or the credentials are
+        compiled to True or False.
+        """
+        if isinstance(check, policy.TrueCheck):
+            return True
+        if isinstance(check, policy.FalseCheck):
+            return False
+        if isinstance(check, policy.NotCheck):
+            return self._compile_not(check, rules)
+        if isinstance(check, policy.AndCheck):
+            return self._compile_and(check, rules)
+        if isinstance(check, policy.OrCheck):
+            return self._compile_or(check, rules)
+        if type(check) is policy.RuleCheck:
+            return self._compile_rule(check, rules)
+        if type(check) is policy.RoleCheck:
+            return self._compile_role(check)
+        if type(check) is policy.GenericCheck:
+            return self._compile_generic(check)
+        if isinstance(check, IsAdminCheck):
+            return self._compile_is_admin(check)
+
+        # Http checks and checks registered elsewhere may depend on anything
+        # in the target and the credentials
+        self.memoizable = False
+
+        def other_check(target, creds, roles):
+            return check(target, creds)
+        return other_check
+
+    def _compile_not(self, check, rules):
+        func = self._compile(check.rule, rules)
+        if func is True or func is False:
+            return not func
+
+        def not_check(target, creds, roles):
+            return not func(target, creds, roles)
+        return not_check
+
+    def _flatten(self, checks, rules, cls, stop):
+        """Compile the operands of nested and/or checks into one list.
+
+        Operands which never decide the outcome are dropped and operands
+        after one which always does are never evaluated, so the list is cut
+        there. Returns stop if the outcome does not depend on any operand.
+        """
+        funcs = []
+        for check in checks:
+            if type(check) is cls:
+                func = self._flatten(check.rules, rules, cls, stop)
+                if func is not stop:
+                    funcs.extend(func)
+                    continue
+            else:
+                func = self._compile(check, rules)
+            if func is stop:
+                if not funcs:
+                    return stop
+                # The operands before this one may still raise KeyError
+                funcs.append(lambda target, creds, roles: stop)
+                return funcs
+            if func is not (not stop):
+                funcs.append(func)
+        return funcs
+
+    def _compile_and(self, check, rules):
+        funcs = self._flatten(check.rules, rules, policy.AndCheck,
+                              False)
+        if funcs is False:
+            return False
+        if not funcs:
+            return True
+
+        def and_check(target, creds, roles):
+            for func in funcs:
+                if not func(target, creds, roles):
+                    return False
+            return True
+        return and_check
+
+    def _compile_or(self, check, rules):
+        funcs = self._flatten(check.rules, rules, policy.OrCheck, True)
+        if funcs is True:
+            return True
+        if not funcs:
+            return False
+
+        def or_check(target, creds, roles):
+            for func in funcs:
+                if func(target, creds, roles):
+                    return True
+            return False
+        return or_check
+
+    def _compile_rule(self, check, rules):
+        name = check.match
+        if name in self._compiling:
+            # A rule referring back to itself is left to the policy module
+            self.memoizable = False
+
+            def recursive_check(target, creds, roles):
+                return check(target, creds)
+            return recursive_check
+        try:
+            rule = rules[name]
+        except KeyError:
+            # We don't have any matching rule; fail closed
+            return False
+
+        self._compiling.add(name)
+        try:
+            func = self._compile(rule, rules)
+        finally:
+            self._compiling.discard(name)
+        if func is True or func is False:
+            return func
+
+        def rule_check(target, creds, roles):
+            try:
+                return func(target, creds, roles)
+            except KeyError:
+                return False
+        return rule_check
+
+    def _compile_role(self, check):
+        role = check.match.lower()
+        self.cred_keys.add('roles')
+
+        def role_check(target, creds, roles):
+            if roles is None:
+                raise KeyError('roles')
+            return role in roles
+        return role_check
+
+    def _compile_generic(self, check):
+        kind = check.kind
+        match = check.match
+        self.cred_keys.add(kind)
+        self.target_keys.update(_TARGET_KEY_RE.findall(match))
+        if '%' in _TARGET_KEY_RE.sub('', match).replace('%%', ''):
+            # The match is formatted with more than single target values
+            self.memoizable = False
+
+        if '%' not in match:
+            def constant_check(target, creds, roles):
+                if kind in creds:
+                    return match == unicode(creds[kind])
+                return False
+            return constant_check
+
+        def generic_check(target, creds, roles):
+            value = match % target
+            if kind in creds:
+                return value == unicode(creds[kind])
+            return False
+        return generic_check
+
+    def _compile_is_admin(self, check):
+        expected = check.expected
+        self.cred_keys.add('is_admin')
+
+        def is_admin_check(target, creds, roles):
+            return creds['is_admin'] == expected
+        return is_admin_check
+
+    def fingerprint(self, context, target):
+        """Return the values the decision depends on as a hashable key.
+
+        Returns None if the decision can not be memoized.
+        """
+        if not self.memoizable:
+            return None
+        creds = []
+        for key in self.cred_keys:
+            value = getattr(context, key, _MISSING)
+            if key == 'roles' and value is not _MISSING:
+                value = tuple(value)
+            creds.append(value)
+        values = []
+        for key in self.target_keys:
+            try:
+                values.append(target[key])
+            except KeyError:
+                values.append(_MISSING)
+            except TypeError:
+                return None
+        fingerprint = (tuple(creds), tuple(values))
+        try:
+            hash(fingerprint)
+        except TypeError:
+            return None
+        return fingerprint
+
+    def __call__(self, target, creds):
+        if self.func is True or self.func is False:
+            return self.func
+        roles = None
+        if self.uses_roles and 'roles' in creds:
+            roles = frozenset(role.lower() for role in creds['roles'])
+        try:
+            return self.func(target, creds, roles)
+        except KeyError:
+            return False
+
+
+def _get_compiled(action):
+    """Return the compiled rule for an action."""
+    global _COMPILED
+    global _COMPILED_RULES
+    global _COMPILED_GENERATION
+    rules = policy._rules
+    if rules is not _COMPILED_RULES:
+        _COMPILED = {}
+        _COMPILED_RULES = rules
+        _COMPILED_GENERATION += 1
+    compiled = _COMPILED.get(action)
+    if compiled is None:
+        compiled = _COMPILED[action] = _CompiledRule(action, rules)
+    return compiled
+
+
+def _check(context, action, target):
+    compiled = _get_compiled(action)
+    if compiled.func is True or compiled.func is False:
+        return compiled.func
+
+    # Decisions are memoized on the request context, so they last as long
+    # as the request does
+    decisions = getattr(context, 'policy_decisions', None)
+    key = None
+    if decisions is not None:
+        fingerprint = compiled.fingerprint(context, target)
+        if fingerprint is not None:
+            key = (_COMPILED_GENERATION, action) + fingerprint
+            try:
+                return decisions[key]
+            except KeyError:
+                pass
+
+    result = compiled(target, context.to_dict())
+    if key is not None:
+        if len(decisions) >= _MAX_DECISIONS:
+            decisions.clear()
+        decisions[key] = result
+    return result
+
+
 def enforce(context, action, target, do_raise=True):
     """Verifies that the action is valid on the target in this context.
 
@@ -93,14 +392,12 @@ def enforce(context, action, target, do_raise=True):
     """
     init()
 
-    credentials = context.to_dict()
+    result = _check(context, action, target)
 
-    # Add the exception arguments if asked to do a raise
-    extra = {}
-    if do_raise:
-        extra.update(exc=exception.PolicyNotAuthorized, action=action)
+    if do_raise and result is False:
+        raise exception.PolicyNotAuthorized(action=action)
 
-    return policy.check(action, target, credentials, **extra)
+    return result
 
 
 def check_is_admin(context):
@@ -113,7 +410,7 @@ def check_is_admin(context):
     credentials = context.to_dict()
     target = credentials
 
-    return policy.check('context_is_admin', target, credentials)
+    return _get_compiled('context_is_admin')(target, credentials)
 
 
 @policy.register('is_admin')
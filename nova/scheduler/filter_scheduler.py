@@ -92,6 +92,9 @@ class FilterScheduler(driver.Scheduler):
         # NOTE(comstud): Make sure we do not pass this through.  It
         # contains an instance of RpcContext that cannot be serialized.
         filter_properties.pop('context', None)
+        # Nor the instance hosts the affinity filters looked up, they are
+        # only valid for this request.
+        filter_properties.pop('affinity_instance_hosts', None)
 
         for num, instance_uuid in enumerate(instance_uuids):
             request_spec['instance_properties']['launch_index'] = num
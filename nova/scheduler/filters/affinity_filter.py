@@ -30,47 +30,80 @@ class AffinityFilter(filters.BaseHostFilter):
         self.compute_api = compute.API()
 
 
-class DifferentHostFilter(AffinityFilter):
-    '''Schedule the instance on a different host from a set of instances.'''
+class _InstanceHostAffinityFilter(AffinityFilter):
+    """Base class for filters placing instances relative to the hosts of
+    the instances listed in a scheduler hint.
+
+    The hinted instances are resolved to their hosts with one query, which
+    is kept in filter_properties so every filter and host in the request
+    shares it, leaving a set lookup per host.
+    """
 
     # The hosts the instances are running on doesn't change within a request
     run_filter_once_per_request = True
 
-    def host_passes(self, host_state, filter_properties):
-        context = filter_properties['context']
-        scheduler_hints = filter_properties.get('scheduler_hints') or {}
+    # Name of the scheduler hint holding the instance uuids
+    hint_name = None
 
-        affinity_uuids = scheduler_hints.get('different_host', [])
+    def _affinity_uuids(self, filter_properties):
+        scheduler_hints = filter_properties.get('scheduler_hints') or {}
+        affinity_uuids = scheduler_hints.get(self.hint_name, [])
         if isinstance(affinity_uuids, basestring):
             affinity_uuids = [affinity_uuids]
+        return affinity_uuids
+
+    def _affinity_hosts(self, affinity_uuids, filter_properties):
+        """Return the set of hosts the given instances are running on."""
+        instance_hosts = filter_properties.setdefault(
+                'affinity_instance_hosts', {})
+        missing_uuids = [uuid for uuid in affinity_uuids
+                         if uuid not in instance_hosts]
+        if missing_uuids:
+            context = filter_properties['context']
+            instances = self.compute_api.get_all(context,
+                                                 {'uuid': missing_uuids,
+                                                  'deleted': False})
+            for instance in instances:
+                instance_hosts[instance['uuid']] = instance['host']
+            for uuid in missing_uuids:
+                instance_hosts.setdefault(uuid, None)
+        return set(instance_hosts[uuid] for uuid in affinity_uuids
+                   if instance_hosts[uuid])
+
+    def filter_all(self, filter_obj_list, filter_properties):
+        # Without the hint every host passes, so don't even look at them
+        if not self._affinity_uuids(filter_properties):
+            return filter_obj_list
+        return super(_InstanceHostAffinityFilter, self).filter_all(
+                filter_obj_list, filter_properties)
+
+
+class DifferentHostFilter(_InstanceHostAffinityFilter):
+    '''Schedule the instance on a different host from a set of instances.'''
+
+    hint_name = 'different_host'
+
+    def host_passes(self, host_state, filter_properties):
+        affinity_uuids = self._affinity_uuids(filter_properties)
         if affinity_uuids:
-            return not self.compute_api.get_all(context,
-                                                {'host': host_state.host,
-                                                 'uuid': affinity_uuids,
-                                                 'deleted': False})
+            return host_state.host not in self._affinity_hosts(
+                    affinity_uuids, filter_properties)
         # With no different_host key
         return True
 
 
-class SameHostFilter(AffinityFilter):
+class SameHostFilter(_InstanceHostAffinityFilter):
     '''Schedule the instance on the same host as another instance in a set of
     of instances.
     '''
 
-    # The hosts the instances are running on doesn't change within a request
-    run_filter_once_per_request = True
+    hint_name = 'same_host'
 
     def host_passes(self, host_state, filter_properties):
-        context = filter_properties['context']
-        scheduler_hints = filter_properties.get('scheduler_hints') or {}
-
-        affinity_uuids = scheduler_hints.get('same_host', [])
-        if isinstance(affinity_uuids, basestring):
-            affinity_uuids = [affinity_uuids]
+        affinity_uuids = self._affinity_uuids(filter_properties)
         if affinity_uuids:
-            return self.compute_api.get_all(context, {'host': host_state.host,
-                                                      'uuid': affinity_uuids,
-                                                      'deleted': False})
+            return host_state.host in self._affinity_hosts(
+                    affinity_uuids, filter_properties)
         # With no same_host key
         return True
 
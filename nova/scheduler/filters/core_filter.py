@@ -17,10 +17,10 @@
 
 from oslo.config import cfg
 
-from nova import db
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.scheduler import filters
+from nova.scheduler.filters import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -46,14 +46,18 @@ class BaseCoreFilter(filters.BaseHostFilter):
         if not instance_type:
             return True
 
+        cpu_allocation_ratio = self._get_cpu_allocation_ratio(host_state,
+                                                          filter_properties)
+        return self._has_enough_vcpus(host_state, instance_type['vcpus'],
+                                      cpu_allocation_ratio)
+
+    def _has_enough_vcpus(self, host_state, instance_vcpus,
+                          cpu_allocation_ratio):
         if not host_state.vcpus_total:
             # Fail safe
             LOG.warning(_("VCPUs not set; assuming CPU collection broken"))
             return True
 
-        instance_vcpus = instance_type['vcpus']
-        cpu_allocation_ratio = self._get_cpu_allocation_ratio(host_state,
-                                                          filter_properties)
         vcpus_total = host_state.vcpus_total * cpu_allocation_ratio
 
         # Only provide a VCPU limit to compute if the virt driver is reporting
@@ -70,6 +74,22 @@ class CoreFilter(BaseCoreFilter):
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
         return CONF.cpu_allocation_ratio
 
+    def filter_all(self, filter_obj_list, filter_properties):
+        # The ratio and the request are the same for every host, so look
+        # them up once rather than per host.
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return filter_obj_list
+        return self._filter_all(filter_obj_list, instance_type['vcpus'],
+                                CONF.cpu_allocation_ratio)
+
+    def _filter_all(self, filter_obj_list, instance_vcpus,
+                    cpu_allocation_ratio):
+        for host_state in filter_obj_list:
+            if self._has_enough_vcpus(host_state, instance_vcpus,
+                                      cpu_allocation_ratio):
+                yield host_state
+
 
 class AggregateCoreFilter(BaseCoreFilter):
     """AggregateCoreFilter with per-aggregate CPU subscription flag.
@@ -78,12 +98,8 @@ class AggregateCoreFilter(BaseCoreFilter):
     """
 
     def _get_cpu_allocation_ratio(self, host_state, filter_properties):
-        context = filter_properties['context'].elevated()
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        metadata = db.aggregate_metadata_get_by_host(
-                     context, host_state.host, key='cpu_allocation_ratio')
+        metadata = utils.aggregate_metadata_get_by_host(
+                     host_state, filter_properties, key='cpu_allocation_ratio')
         aggregate_vals = metadata.get('cpu_allocation_ratio', set())
         num_values = len(aggregate_vals)
 
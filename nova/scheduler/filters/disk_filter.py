@@ -33,14 +33,31 @@ class DiskFilter(filters.BaseHostFilter):
 
     def host_passes(self, host_state, filter_properties):
         """Filter based on disk usage."""
+        return self._has_usable_disk(host_state,
+                                     self._requested_disk(filter_properties),
+                                     CONF.disk_allocation_ratio)
+
+    def filter_all(self, filter_obj_list, filter_properties):
+        # The ratio and the request are the same for every host, so look
+        # them up once rather than per host.
+        requested_disk = self._requested_disk(filter_properties)
+        disk_allocation_ratio = CONF.disk_allocation_ratio
+        for host_state in filter_obj_list:
+            if self._has_usable_disk(host_state, requested_disk,
+                                     disk_allocation_ratio):
+                yield host_state
+
+    def _requested_disk(self, filter_properties):
         instance_type = filter_properties.get('instance_type')
-        requested_disk = 1024 * (instance_type['root_gb'] +
-                                 instance_type['ephemeral_gb'])
+        return 1024 * (instance_type['root_gb'] +
+                       instance_type['ephemeral_gb'])
 
+    def _has_usable_disk(self, host_state, requested_disk,
+                         disk_allocation_ratio):
         free_disk_mb = host_state.free_disk_mb
         total_usable_disk_mb = host_state.total_usable_disk_gb * 1024
 
-        disk_mb_limit = total_usable_disk_mb * CONF.disk_allocation_ratio
+        disk_mb_limit = total_usable_disk_mb * disk_allocation_ratio
         used_disk_mb = total_usable_disk_mb - free_disk_mb
         usable_disk_mb = disk_mb_limit - used_disk_mb
 
@@ -33,8 +33,17 @@ class NumInstancesFilter(filters.BaseHostFilter):
     """Filter out hosts with too many instances."""
 
     def host_passes(self, host_state, filter_properties):
-        num_instances = host_state.num_instances
+        return self._has_room(host_state, CONF.max_instances_per_host)
+
+    def filter_all(self, filter_obj_list, filter_properties):
+        # Look the limit up once rather than per host
         max_instances = CONF.max_instances_per_host
+        for host_state in filter_obj_list:
+            if self._has_room(host_state, max_instances):
+                yield host_state
+
+    def _has_room(self, host_state, max_instances):
+        num_instances = host_state.num_instances
         passes = num_instances < max_instances
         if not passes:
             LOG.debug(_("%(host_state)s fails num_instances check: Max "
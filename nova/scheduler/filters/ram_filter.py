@@ -16,10 +16,10 @@
 
 from oslo.config import cfg
 
-from nova import db
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
 from nova.scheduler import filters
+from nova.scheduler.filters import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -42,12 +42,15 @@ class BaseRamFilter(filters.BaseHostFilter):
     def host_passes(self, host_state, filter_properties):
         """Only return hosts with sufficient available RAM."""
         instance_type = filter_properties.get('instance_type')
-        requested_ram = instance_type['memory_mb']
-        free_ram_mb = host_state.free_ram_mb
-        total_usable_ram_mb = host_state.total_usable_ram_mb
-
         ram_allocation_ratio = self._get_ram_allocation_ratio(host_state,
                                                           filter_properties)
+        return self._has_usable_ram(host_state, instance_type['memory_mb'],
+                                    ram_allocation_ratio)
+
+    def _has_usable_ram(self, host_state, requested_ram,
+                        ram_allocation_ratio):
+        free_ram_mb = host_state.free_ram_mb
+        total_usable_ram_mb = host_state.total_usable_ram_mb
 
         memory_mb_limit = total_usable_ram_mb * ram_allocation_ratio
         used_ram_mb = total_usable_ram_mb - free_ram_mb
@@ -71,6 +74,16 @@ class RamFilter(BaseRamFilter):
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
         return CONF.ram_allocation_ratio
 
+    def filter_all(self, filter_obj_list, filter_properties):
+        # The ratio and the request are the same for every host, so look
+        # them up once rather than per host.
+        requested_ram = filter_properties.get('instance_type')['memory_mb']
+        ram_allocation_ratio = CONF.ram_allocation_ratio
+        for host_state in filter_obj_list:
+            if self._has_usable_ram(host_state, requested_ram,
+                                    ram_allocation_ratio):
+                yield host_state
+
 
 class AggregateRamFilter(BaseRamFilter):
     """AggregateRamFilter with per-aggregate ram subscription flag.
@@ -79,12 +92,8 @@ class AggregateRamFilter(BaseRamFilter):
     """
 
     def _get_ram_allocation_ratio(self, host_state, filter_properties):
-        context = filter_properties['context'].elevated()
-        # TODO(uni): DB query in filter is a performance hit, especially for
-        # system with lots of hosts. Will need a general solution here to fix
-        # all filters with aggregate DB call things.
-        metadata = db.aggregate_metadata_get_by_host(
-                     context, host_state.host, key='ram_allocation_ratio')
+        metadata = utils.aggregate_metadata_get_by_host(
+                     host_state, filter_properties, key='ram_allocation_ratio')
         aggregate_vals = metadata.get('ram_allocation_ratio', set())
         num_values = len(aggregate_vals)
 
@@ -0,0 +1,33 @@
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Bits shared by the scheduler filters."""
+
+from nova import db
+
+
+def aggregate_metadata_get_by_host(host_state, filter_properties, key=None):
+    """Return the aggregate metadata of the host behind host_state.
+
+    HostStates built by the HostManager share a per-request index of the
+    metadata of every aggregate, so the lookup costs no DB round-trip.
+    Hosts without an index fall back to querying the DB for this host only.
+    """
+    index = getattr(host_state, 'aggregate_metadata_index', None)
+    if index is not None:
+        return index.get(host_state.host, key=key)
+    context = filter_properties['context'].elevated()
+    return db.aggregate_metadata_get_by_host(context, host_state.host,
+                                             key=key)
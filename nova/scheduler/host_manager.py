@@ -55,6 +55,15 @@ host_manager_opts = [
     cfg.ListOpt('scheduler_weight_classes',
                 default=['nova.scheduler.weights.all_weighers'],
                 help='Which weight class names to use for weighing hosts'),
+    cfg.BoolOpt('scheduler_incremental_host_refresh',
+                default=False,
+                help='Only fetch the compute nodes that changed since the '
+                     'previous scheduling request instead of all of them'),
+    cfg.IntOpt('scheduler_full_host_refresh_interval',
+               default=600,
+               help='Seconds between full refreshes of the host states when '
+                    'scheduler_incremental_host_refresh is enabled, to '
+                    'pick up changes missed due to clock skew'),
     ]
 
 CONF = cfg.CONF
@@ -95,6 +104,32 @@ class ReadOnlyDict(UserDict.IterableUserDict):
             raise TypeError()
 
 
+class AggregateMetadataIndex(object):
+    """Host to aggregate metadata mapping shared by a set of HostStates.
+
+    The index is loaded with a single query the first time a filter asks
+    for it, rather than with one query per host and filter.
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self._metadata_by_host = None
+
+    def get(self, host, key=None):
+        """Return the aggregate metadata for host, like
+        db.aggregate_metadata_get_by_host() does.
+        """
+        if self._metadata_by_host is None:
+            self._metadata_by_host = db.aggregate_metadata_get_all_by_host(
+                    self.context)
+        metadata = self._metadata_by_host.get(host, {})
+        if key is None:
+            return dict(metadata)
+        if key in metadata:
+            return {key: metadata[key]}
+        return {}
+
+
 class HostState(object):
     """Mutable and immutable information tracked for a host.
     This is an attempt to remove the ad-hoc data structures
@@ -134,6 +169,9 @@ class HostState(object):
         # Resource oversubscription values for the compute host:
         self.limits = {}
 
+        # Aggregate metadata shared with the other hosts of a request
+        self.aggregate_metadata_index = None
+
         self.updated = None
 
     def update_capabilities(self, capabilities=None, service=None):
@@ -289,6 +327,12 @@ class HostManager(object):
         # { (host, hypervisor_hostname) : { <service> : { cap k : v }}}
         self.service_states = {}
         self.host_state_map = {}
+        # Used by the incremental host refresh: newest compute node timestamp
+        # seen so far, when the last full refresh happened and which
+        # host_state_map key belongs to which compute node id.
+        self._changed_since = None
+        self._last_full_refresh = None
+        self._compute_node_keys = {}
         self.filter_handler = filters.HostFilterHandler()
         self.filter_classes = self.filter_handler.get_matching_classes(
                 CONF.scheduler_available_filters)
@@ -419,42 +463,141 @@ class HostManager(object):
         capab_copy["timestamp"] = timeutils.utcnow()  # Reported time
         self.service_states[state_key] = capab_copy
 
+    def _update_host_state(self, compute, aggregate_metadata_index):
+        """Create or update the HostState of a compute node.
+
+        Returns the host_state_map key, or None if the compute node has no
+        service.
+        """
+        service = compute['service']
+        if not service:
+            LOG.warn(_("No service for compute ID %s") % compute['id'])
+            return None
+        host = service['host']
+        node = compute.get('hypervisor_hostname')
+        state_key = (host, node)
+        capabilities = self.service_states.get(state_key, None)
+        host_state = self.host_state_map.get(state_key)
+        if host_state:
+            host_state.update_capabilities(capabilities,
+                                           dict(service.iteritems()))
+        else:
+            host_state = self.host_state_cls(host, node,
+                    capabilities=capabilities,
+                    service=dict(service.iteritems()))
+            self.host_state_map[state_key] = host_state
+        host_state.update_from_compute_node(compute)
+        host_state.aggregate_metadata_index = aggregate_metadata_index
+        return state_key
+
+    def _remove_dead_nodes(self, dead_nodes):
+        for state_key in dead_nodes:
+            host, node = state_key
+            LOG.info(_("Removing dead compute node %(host)s:%(node)s "
+                       "from scheduler") % {'host': host, 'node': node})
+            del self.host_state_map[state_key]
+
+    def _track_changes(self, compute_nodes):
+        """Remember the newest compute node timestamp seen.
+
+        The next incremental refresh asks for the nodes stamped at or after
+        that timestamp, so nodes stamped in the same second are read again.
+        The timestamps come from the clocks of the hosts that wrote the
+        rows, though, so an update stamped by a host whose clock lags
+        behind can fall before it and be missed. Such updates are only
+        picked up by the next full refresh, which bounds the window to
+        scheduler_full_host_refresh_interval.
+        """
+        for compute in compute_nodes:
+            for field in ('created_at', 'updated_at', 'deleted_at'):
+                timestamp = compute.get(field)
+                if timestamp and (self._changed_since is None or
+                                  timestamp > self._changed_since):
+                    self._changed_since = timestamp
+
+    def _want_full_refresh(self):
+        if not CONF.scheduler_incremental_host_refresh:
+            return True
+        if self._changed_since is None or self._last_full_refresh is None:
+            return True
+        return timeutils.is_older_than(
+                self._last_full_refresh,
+                CONF.scheduler_full_host_refresh_interval)
+
     def get_all_host_states(self, context):
         """Returns a list of HostStates that represents all the hosts
         the HostManager knows about. Also, each of the consumable resources
         in HostState are pre-populated and adjusted based on data in the db.
         """
+        if not self._want_full_refresh():
+            return self._refresh_changed_host_states(context)
 
         # Get resource usage across the available compute nodes:
         compute_nodes = db.compute_node_get_all(context)
         seen_nodes = set()
+        aggregate_metadata_index = AggregateMetadataIndex(context)
+        self._compute_node_keys = {}
         for compute in compute_nodes:
-            service = compute['service']
-            if not service:
-                LOG.warn(_("No service for compute ID %s") % compute['id'])
-                continue
-            host = service['host']
-            node = compute.get('hypervisor_hostname')
-            state_key = (host, node)
-            capabilities = self.service_states.get(state_key, None)
-            host_state = self.host_state_map.get(state_key)
-            if host_state:
-                host_state.update_capabilities(capabilities,
-                                               dict(service.iteritems()))
-            else:
-                host_state = self.host_state_cls(host, node,
-                        capabilities=capabilities,
-                        service=dict(service.iteritems()))
-                self.host_state_map[state_key] = host_state
-            host_state.update_from_compute_node(compute)
-            seen_nodes.add(state_key)
+            state_key = self._update_host_state(compute,
+                                                aggregate_metadata_index)
+            if state_key:
+                self._compute_node_keys[compute['id']] = state_key
+                seen_nodes.add(state_key)
 
         # remove compute nodes from host_state_map if they are not active
         dead_nodes = set(self.host_state_map.keys()) - seen_nodes
-        for state_key in dead_nodes:
-            host, node = state_key
-            LOG.info(_("Removing dead compute node %(host)s:%(node)s "
-                       "from scheduler") % {'host': host, 'node': node})
-            del self.host_state_map[state_key]
+        self._remove_dead_nodes(dead_nodes)
+
+        if CONF.scheduler_incremental_host_refresh:
+            self._track_changes(compute_nodes)
+            self._last_full_refresh = timeutils.utcnow()
+
+        return self.host_state_map.itervalues()
+
+    def _refresh_changed_host_states(self, context):
+        """Update the host states from the compute nodes that changed since
+        the previous refresh and keep the others as they are.
+
+        Compute nodes deleted since then come back with their 'deleted'
+        field set; nodes whose service went away are caught by comparing
+        against the current service list.
+        """
+        compute_nodes = db.compute_node_get_all(
+                context, changed_since=self._changed_since)
+        aggregate_metadata_index = AggregateMetadataIndex(context)
+        dead_nodes = set()
+        for compute in compute_nodes:
+            if compute['deleted']:
+                state_key = self._compute_node_keys.pop(compute['id'], None)
+                if state_key:
+                    dead_nodes.add(state_key)
+                continue
+            state_key = self._update_host_state(compute,
+                                                aggregate_metadata_index)
+            if state_key:
+                self._compute_node_keys[compute['id']] = state_key
+
+        # Service heartbeats don't touch the compute nodes, so refresh the
+        # service of every host state from the compute services instead.
+        services = dict((service['id'], service)
+                        for service in db.service_get_all(context)
+                        if service['binary'] == 'nova-compute')
+        for compute_id, state_key in self._compute_node_keys.items():
+            host_state = self.host_state_map.get(state_key)
+            if host_state is None:
+                del self._compute_node_keys[compute_id]
+                continue
+            service = services.get(host_state.service.get('id'))
+            if service is None:
+                del self._compute_node_keys[compute_id]
+                dead_nodes.add(state_key)
+                continue
+            host_state.update_capabilities(
+                    self.service_states.get(state_key, None),
+                    dict(service.iteritems()))
+            host_state.aggregate_metadata_index = aggregate_metadata_index
+
+        self._remove_dead_nodes(dead_nodes & set(self.host_state_map.keys()))
+        self._track_changes(compute_nodes)
 
         return self.host_state_map.itervalues()
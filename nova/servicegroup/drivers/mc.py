@@ -19,11 +19,11 @@
 
 from oslo.config import cfg
 
+from nova import cache_utils
 from nova import conductor
 from nova import context
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import log as logging
-from nova.openstack.common import memorycache
 from nova.openstack.common import timeutils
 from nova.servicegroup import api
 
@@ -42,7 +42,7 @@ class MemcachedDriver(api.ServiceGroupDriver):
         test = kwargs.get('test')
         if not CONF.memcached_servers and not test:
             raise RuntimeError(_('memcached_servers not defined'))
-        self.mc = memorycache.get_client()
+        self.mc = cache_utils.get_client()
         self.db_allowed = kwargs.get('db_allowed', True)
         self.conductor_api = conductor.API(use_local=self.db_allowed)
 
@@ -40,6 +40,7 @@ from nova.api.ec2 import apirequest
 from nova.api.ec2 import ec2utils
 from nova import block_device
 from nova import context
+from nova import db
 from nova import exception
 from nova.openstack.common import timeutils
 from nova import test
@@ -146,6 +147,31 @@ class Ec2utilsTestCase(test.TestCase):
         self.assertEqual(ec2utils.id_to_ec2_snap_id(28), 'snap-0000001c')
         self.assertEqual(ec2utils.id_to_ec2_vol_id(27), 'vol-0000001b')
 
+    def test_ids_to_ec2_inst_ids(self):
+        ctxt = context.get_admin_context()
+        ec2utils.reset_cache()
+        cached_id = ec2utils.get_int_id_from_instance_uuid(ctxt, 'cached')
+        stored_id = db.ec2_instance_create(ctxt, 'stored')['id']
+        lookups = []
+
+        def fake_get_ec2_instance_ids_by_uuids(context, instance_uuids):
+            lookups.append(sorted(instance_uuids))
+            return {'stored': stored_id}
+
+        self.stubs.Set(db, 'get_ec2_instance_ids_by_uuids',
+                       fake_get_ec2_instance_ids_by_uuids)
+        ec2_ids = ec2utils.ids_to_ec2_inst_ids(['cached', 'stored', 'new'])
+        new_id = db.get_ec2_instance_id_by_uuid(ctxt, 'new')
+        self.assertEqual({'cached': ec2utils.id_to_ec2_id(cached_id),
+                          'stored': ec2utils.id_to_ec2_id(stored_id),
+                          'new': ec2utils.id_to_ec2_id(new_id)}, ec2_ids)
+        self.assertEqual([['new', 'stored']], lookups)
+
+        # All of them are memoized now.
+        self.assertEqual(ec2_ids, ec2utils.ids_to_ec2_inst_ids(
+            ['cached', 'stored', 'new']))
+        self.assertEqual(1, len(lookups))
+
     def test_dict_from_dotted_str(self):
         in_str = [('BlockDeviceMapping.1.DeviceName', '/dev/sda1'),
                   ('BlockDeviceMapping.1.Ebs.SnapshotId', 'snap-0000001c'),
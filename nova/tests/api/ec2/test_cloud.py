@@ -1139,6 +1139,92 @@ class CloudTestCase(test.TestCase):
         db.service_destroy(self.context, comp1['id'])
         db.service_destroy(self.context, comp2['id'])
 
+    def test_describe_instances_max_results(self):
+        # Makes sure describe_instances pages through the instances.
+        self._stub_instance_get_with_fixed_ips('get_all')
+
+        image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
+        sys_meta = flavors.save_flavor_info(
+            {}, flavors.get_flavor(1))
+        utc = iso8601.iso8601.Utc()
+        instances = []
+        for i in xrange(5):
+            instances.append(db.instance_create(self.context, {
+                'reservation_id': 'a',
+                'image_ref': image_uuid,
+                'instance_type_id': 1,
+                'host': 'host1',
+                'hostname': 'server-%d' % i,
+                'vm_state': 'active',
+                'created_at': datetime.datetime(2012, 1, i + 1,
+                                                tzinfo=utc),
+                'system_metadata': sys_meta}))
+
+        ec2_ids = []
+        next_token = None
+        for expected in (2, 2, 1):
+            result = self.cloud.describe_instances(self.context,
+                                                   max_results=2,
+                                                   next_token=next_token)
+            instances_set = result['reservationSet'][0]['instancesSet']
+            self.assertEqual(expected, len(instances_set))
+            ec2_ids.extend(i['instanceId'] for i in instances_set)
+            next_token = result.get('nextToken')
+            if expected == 2:
+                self.assertEqual(ec2_ids[-1], next_token)
+        self.assertEqual(None, next_token)
+        self.assertEqual([ec2utils.id_to_ec2_inst_id(instance['uuid'])
+                          for instance in instances], ec2_ids)
+
+        self.assertRaises(exception.InvalidParameterValue,
+                          self.cloud.describe_instances, self.context,
+                          max_results='0')
+
+        for instance in instances:
+            db.instance_destroy(self.context, instance['uuid'])
+
+    def test_describe_instances_batches_lookups(self):
+        # Makes sure describe_instances looks the block device mappings and
+        # availability zones up for all instances at once.
+        self._stub_instance_get_with_fixed_ips('get_all')
+
+        def fake_lookup(*args, **kwargs):
+            self.fail('unexpected lookup for a single instance')
+
+        self.stubs.Set(db, 'block_device_mapping_get_all_by_instance',
+                       fake_lookup)
+        self.stubs.Set(db, 'aggregate_metadata_get_by_host', fake_lookup)
+
+        image_uuid = 'cedef40a-ed67-4d10-800e-17455edce175'
+        sys_meta = flavors.save_flavor_info(
+            {}, flavors.get_flavor(1))
+        instances = [db.instance_create(self.context, {
+            'reservation_id': 'a',
+            'image_ref': image_uuid,
+            'kernel_id': 'cedef40a-ed67-4d10-800e-17455edce175',
+            'ramdisk_id': '76fa36fc-c930-4bf3-8c8a-ea2a2420deb6',
+            'instance_type_id': 1,
+            'host': host,
+            'vm_state': 'active',
+            'system_metadata': sys_meta}) for host in ('host1', 'host2')]
+        agg = db.aggregate_create(self.context,
+                {'name': 'agg1'}, {'availability_zone': 'zone1'})
+        db.aggregate_host_add(self.context, agg['id'], 'host1')
+
+        result = self.cloud.describe_instances(self.context)
+        instances_set = result['reservationSet'][0]['instancesSet']
+        self.assertEqual(['zone1', CONF.default_availability_zone],
+                         [i['placement']['availabilityZone']
+                          for i in instances_set])
+        for i in instances_set:
+            self.assertEqual('ami-00000001', i['imageId'])
+            self.assertEqual('aki-00000001', i['kernelId'])
+            self.assertEqual('ari-00000002', i['ramdiskId'])
+            self.assertEqual('instance-store', i['rootDeviceType'])
+
+        for instance in instances:
+            db.instance_destroy(self.context, instance['uuid'])
+
     def test_describe_instance_state(self):
         # Makes sure describe_instances for instanceState works.
 
@@ -81,7 +81,7 @@ TEST_SERVERS = [dict(name="inst1", uuid="uuid1", host="compute1"),
 
 
 @db_api.require_admin_context
-def fake_compute_node_get_all(context):
+def fake_compute_node_get_all(context, use_slave=False):
     return TEST_HYPERS
 
 
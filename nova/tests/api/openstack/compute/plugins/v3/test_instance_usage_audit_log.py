@@ -86,7 +86,7 @@ TEST_LOGS3 = [
 
 
 def fake_task_log_get_all(context, task_name, begin, end,
-                          host=None, state=None):
+                          host=None, state=None, use_slave=False):
     assert task_name == "instance_usage_audit"
 
     if begin == begin1 and end == end1:
@@ -954,8 +954,8 @@ class CellsTargetedMethodsTestCase(test.TestCase):
 
         self.mox.StubOutWithMock(self.tgt_db_inst, 'task_log_get_all')
         self.tgt_db_inst.task_log_get_all(self.ctxt, task_name,
-                begin, end, host=host,
-                state=state).AndReturn(['fake_result'])
+                begin, end, host=host, state=state,
+                use_slave=True).AndReturn(['fake_result'])
 
         self.mox.ReplayAll()
 
@@ -1705,11 +1705,14 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
         self.mox.StubOutWithMock(self.tgt_db_inst, 'task_log_get_all')
 
         self.src_db_inst.task_log_get_all(ctxt, task_name,
-                begin, end, host=host, state=state).AndReturn([1, 2])
+                begin, end, host=host, state=state,
+                use_slave=True).AndReturn([1, 2])
         self.mid_db_inst.task_log_get_all(ctxt, task_name,
-                begin, end, host=host, state=state).AndReturn([3])
+                begin, end, host=host, state=state,
+                use_slave=True).AndReturn([3])
         self.tgt_db_inst.task_log_get_all(ctxt, task_name,
-                begin, end, host=host, state=state).AndReturn([4, 5])
+                begin, end, host=host, state=state,
+                use_slave=True).AndReturn([4, 5])
 
         self.mox.ReplayAll()
 
@@ -1732,9 +1735,12 @@ class CellsBroadcastMethodsTestCase(test.TestCase):
         self.mox.StubOutWithMock(self.mid_db_inst, 'compute_node_get_all')
         self.mox.StubOutWithMock(self.tgt_db_inst, 'compute_node_get_all')
 
-        self.src_db_inst.compute_node_get_all(ctxt).AndReturn([1, 2])
-        self.mid_db_inst.compute_node_get_all(ctxt).AndReturn([3])
-        self.tgt_db_inst.compute_node_get_all(ctxt).AndReturn([4, 5])
+        self.src_db_inst.compute_node_get_all(ctxt,
+                use_slave=True).AndReturn([1, 2])
+        self.mid_db_inst.compute_node_get_all(ctxt,
+                use_slave=True).AndReturn([3])
+        self.tgt_db_inst.compute_node_get_all(ctxt,
+                use_slave=True).AndReturn([4, 5])
 
         self.mox.ReplayAll()
 
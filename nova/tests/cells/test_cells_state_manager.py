@@ -48,13 +48,14 @@ def _fake_compute_node_get_all(context):
     return [_node(*fake) for fake in FAKE_COMPUTES]
 
 
-def _fake_instance_type_all(context):
-    def _type(mem, root, eph):
-        return {'root_gb': root,
+def _fake_instance_type_all(context, inactive=False):
+    def _type(id, mem, root, eph):
+        return {'id': id,
+                'root_gb': root,
                 'ephemeral_gb': eph,
                 'memory_mb': mem}
 
-    return [_type(*fake) for fake in FAKE_ITYPES]
+    return [_type(id, *fake) for id, fake in enumerate(FAKE_ITYPES)]
 
 
 class TestCellsStateManager(test.TestCase):
@@ -35,6 +35,7 @@ import mox
 from oslo.config import cfg
 
 import nova
+from nova.api.metadata import base as instance_metadata
 from nova import availability_zones
 from nova import block_device
 from nova import compute
@@ -2773,6 +2774,60 @@ class ComputeTestCase(BaseTestCase):
         self.assertEquals(len(fake_notifier.NOTIFICATIONS), 2)
         self.compute.terminate_instance(self.context, instance=instance)
 
+    def test_metadata_prerendered_until_terminate(self):
+        self.flags(metadata_prerender=True,
+                   memcached_servers=['localhost:11211'])
+        calls = []
+
+        def fake_cache_instance_metadata(cache, instance, network_info,
+                                         conductor_api=None):
+            calls.append(('cache', instance['uuid']))
+
+        def fake_uncache_instance_metadata(instance_uuid):
+            calls.append(('uncache', instance_uuid))
+
+        self.stubs.Set(instance_metadata, 'cache_instance_metadata',
+                       fake_cache_instance_metadata)
+        self.stubs.Set(compute_utils, 'uncache_instance_metadata',
+                       fake_uncache_instance_metadata)
+        instance = jsonutils.to_primitive(self._create_fake_instance())
+        self.compute.run_instance(self.context, instance=instance)
+        self.assertEqual([('cache', instance['uuid'])], calls)
+
+        self.compute.terminate_instance(self.context, instance=instance)
+        self.assertEqual(('uncache', instance['uuid']), calls[-1])
+
+    def test_metadata_not_prerendered_without_memcached(self):
+        self.flags(metadata_prerender=True, memcached_servers=None)
+
+        def fake_cache_instance_metadata(*args, **kwargs):
+            self.fail('metadata should not be pre-rendered')
+
+        self.stubs.Set(instance_metadata, 'cache_instance_metadata',
+                       fake_cache_instance_metadata)
+        self.mox.StubOutWithMock(nova.compute.manager.LOG, 'warn')
+        nova.compute.manager.LOG.warn(mox.IgnoreArg())
+        self.mox.ReplayAll()
+
+        instance = jsonutils.to_primitive(self._create_fake_instance())
+        self.compute.run_instance(self.context, instance=instance)
+        self.compute.terminate_instance(self.context, instance=instance)
+
+    def test_metadata_prerender_failure_does_not_fail_build(self):
+        self.flags(metadata_prerender=True,
+                   memcached_servers=['localhost:11211'])
+
+        def fake_cache_instance_metadata(*args, **kwargs):
+            raise test.TestingException()
+
+        self.stubs.Set(instance_metadata, 'cache_instance_metadata',
+                       fake_cache_instance_metadata)
+        instance = jsonutils.to_primitive(self._create_fake_instance())
+        self.compute.run_instance(self.context, instance=instance)
+        db_instance = db.instance_get_by_uuid(self.context, instance['uuid'])
+        self.assertEqual(vm_states.ACTIVE, db_instance['vm_state'])
+        self.compute.terminate_instance(self.context, instance=instance)
+
     def test_run_instance_usage_notification(self):
         # Ensure run instance generates appropriate usage notification.
         instance = jsonutils.to_primitive(self._create_fake_instance())
@@ -5038,6 +5093,39 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(call_info['get_by_uuid'], 3)
         self.assertEqual(call_info['get_nw_info'], 4)
 
+    def test_heal_instance_info_cache_batch(self):
+        self.flags(heal_instance_info_cache_interval=-1,
+                   heal_instance_info_cache_batch_size=2)
+        ctxt = context.get_admin_context()
+        uuids = [self._create_fake_instance({'host': self.compute.host})[
+                 'uuid'] for x in xrange(3)]
+        healed = []
+
+        def fake_get_instances_nw_info(context, instances):
+            for instance in instances:
+                self.assertIn('system_metadata', instance)
+                self.assertIn('info_cache', instance)
+            healed.append(sorted(inst['uuid'] for inst in instances))
+
+        self.stubs.Set(self.compute.network_api, 'get_instances_nw_info',
+                       fake_get_instances_nw_info)
+        self.mox.StubOutWithMock(instance_obj.InstanceList, 'get_by_host')
+        instance_obj.InstanceList.get_by_host(ctxt, self.compute.host,
+            expected_attrs=[]).AndReturn([{'uuid': uuid} for uuid in uuids])
+        instance_obj.InstanceList.get_by_host(ctxt, self.compute.host,
+            expected_attrs=[]).AndReturn([{'uuid': uuid} for uuid in uuids])
+        self.mox.ReplayAll()
+
+        self.compute._heal_instance_info_cache(ctxt)
+        # Gone or moved instances are skipped.
+        db.instance_update(ctxt, uuids[2], {'host': 'not-me'})
+        self.compute._heal_instance_info_cache(ctxt)
+        self.assertEqual([], self.compute._instance_uuids_to_heal)
+        # The host is queried again once every instance has been seen.
+        self.compute._heal_instance_info_cache(ctxt)
+        self.assertEqual([sorted(uuids[:2]), sorted(uuids[:2])], healed)
+        self.assertEqual([uuids[2]], self.compute._instance_uuids_to_heal)
+
     def test_poll_rescued_instances(self):
         timed_out_time = timeutils.utcnow() - datetime.timedelta(minutes=5)
         not_timed_out_time = timeutils.utcnow()
@@ -5598,9 +5686,9 @@ class ComputeTestCase(BaseTestCase):
                 params={'host': CONF.host,
                         'vm_state': vm_states.SOFT_DELETED,
                         'deleted_at': deleted_at})
-        instances = []
-        instances.append(instance1)
-        instances.append(instance2)
+        instances = instance_obj.InstanceList()
+        instances.objects = [instance1, instance2]
+        instances._context = ctxt
 
         self.mox.StubOutWithMock(instance_obj.InstanceList,
                                  'get_by_filters')
@@ -5610,19 +5698,17 @@ class ComputeTestCase(BaseTestCase):
         self.mox.StubOutWithMock(self.compute, '_delete_instance')
 
         instance_obj.InstanceList.get_by_filters(
-            ctxt, mox.IgnoreArg(),
-            expected_attrs=instance_obj.INSTANCE_DEFAULT_FIELDS
-            ).AndReturn(instances)
+            ctxt, mox.IgnoreArg(), expected_attrs=[]).AndReturn(instances)
+        self.compute._deleted_old_enough(instance1, 3600).AndReturn(True)
+        self.compute._deleted_old_enough(instance2, 3600).AndReturn(True)
 
         # The first instance delete fails.
-        self.compute._deleted_old_enough(instance1, 3600).AndReturn(True)
         self.compute.conductor_api.block_device_mapping_get_all_by_instance(
                 ctxt, instance1).AndReturn(None)
         self.compute._delete_instance(ctxt, instance1,
                                       None).AndRaise(test.TestingException)
 
         # The second instance delete that follows.
-        self.compute._deleted_old_enough(instance2, 3600).AndReturn(True)
         self.compute.conductor_api.block_device_mapping_get_all_by_instance(
                 ctxt, instance2).AndReturn(None)
         self.compute._delete_instance(ctxt, instance2,
@@ -5634,27 +5720,61 @@ class ComputeTestCase(BaseTestCase):
 
     def test_sync_power_states(self):
         ctxt = self.context.elevated()
-        self._create_fake_instance({'host': self.compute.host})
-        self._create_fake_instance({'host': self.compute.host})
-        self._create_fake_instance({'host': self.compute.host})
-        self.mox.StubOutWithMock(self.compute.driver, 'get_info')
+        instances = [self._create_fake_instance({'host': self.compute.host})
+                     for i in range(4)]
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
         self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
 
+        self.compute.driver.get_power_states(mox.IgnoreArg()).AndReturn(
+            {instances[0]['uuid']: power_state.NOSTATE,
+             instances[1]['uuid']: power_state.RUNNING,
+             instances[2]['uuid']: power_state.SHUTDOWN})
         # Check to make sure task continues on error.
-        self.compute.driver.get_info(mox.IgnoreArg()).AndRaise(
-            exception.InstanceNotFound(instance_id='fake-uuid'))
-        self.compute._sync_instance_power_state(ctxt, mox.IgnoreArg(),
-                                                power_state.NOSTATE).AndRaise(
+        self.compute._sync_instance_power_state(ctxt,
+            mox.ContainsKeyValue('uuid', instances[0]['uuid']),
+            power_state.NOSTATE, refresh=False).AndRaise(
             exception.InstanceNotFound(instance_id='fake-uuid'))
+        self.compute._sync_instance_power_state(ctxt,
+            mox.ContainsKeyValue('uuid', instances[1]['uuid']),
+            power_state.RUNNING, refresh=False).AndRaise(
+            test.TestingException())
+        self.compute._sync_instance_power_state(ctxt,
+            mox.ContainsKeyValue('uuid', instances[2]['uuid']),
+            power_state.SHUTDOWN, refresh=False)
+        # The driver could not tell the state of the last instance, so it
+        # is left alone.
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(ctxt)
+
+    def test_sync_power_states_driver_error(self):
+        ctxt = self.context.elevated()
+        self._create_fake_instance({'host': self.compute.host})
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
+        self.compute.driver.get_power_states(mox.IgnoreArg()).AndRaise(
+            test.TestingException())
+        self.mox.ReplayAll()
+        self.compute._sync_power_states(ctxt)
+
+    def test_sync_power_states_refresh_and_save_failures(self):
+        ctxt = self.context.elevated()
+        instances = [self._create_fake_instance({'host': self.compute.host})
+                     for i in range(3)]
+        self.mox.StubOutWithMock(self.compute.driver, 'get_power_states')
+        self.mox.StubOutWithMock(instance_obj.InstanceList, 'save_all')
+        self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
 
-        self.compute.driver.get_info(mox.IgnoreArg()).AndReturn(
-            {'state': power_state.RUNNING})
-        self.compute._sync_instance_power_state(ctxt, mox.IgnoreArg(),
-                                                power_state.RUNNING)
-        self.compute.driver.get_info(mox.IgnoreArg()).AndReturn(
-            {'state': power_state.SHUTDOWN})
-        self.compute._sync_instance_power_state(ctxt, mox.IgnoreArg(),
-                                                power_state.SHUTDOWN)
+        # The first instance is deleted while the driver is queried and
+        # saving the second one fails, so only the last one is synced.
+        self.compute.driver.get_power_states(mox.IgnoreArg()).WithSideEffects(
+            lambda *args: db.instance_destroy(ctxt, instances[0]['uuid'])
+            ).AndReturn(dict((instance['uuid'], power_state.SHUTDOWN)
+                             for instance in instances))
+        instance_obj.InstanceList.save_all().AndReturn(
+            {instances[1]['uuid']: test.TestingException()})
+        self.compute._sync_instance_power_state(ctxt,
+            mox.ContainsKeyValue('uuid', instances[2]['uuid']),
+            power_state.SHUTDOWN, refresh=False)
         self.mox.ReplayAll()
         self.compute._sync_power_states(ctxt)
 
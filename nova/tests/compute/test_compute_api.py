@@ -444,6 +444,7 @@ class _ComputeAPIUnitTestMixIn(object):
         self.mox.StubOutWithMock(db, 'instance_destroy')
         self.mox.StubOutWithMock(compute_utils,
                                  'notify_about_instance_usage')
+        self.mox.StubOutWithMock(compute_utils, 'uncache_instance_metadata')
         self.mox.StubOutWithMock(quota.QUOTAS, 'commit')
         self.mox.StubOutWithMock(self.compute_api.compute_rpcapi,
                                  'confirm_resize')
@@ -474,6 +475,7 @@ class _ComputeAPIUnitTestMixIn(object):
 
         if inst.host == 'down-host':
             inst.info_cache.delete()
+            compute_utils.uncache_instance_metadata(inst.uuid)
             compute_utils.notify_about_instance_usage(mox.IgnoreArg(),
                                                       self.context,
                                                       inst,
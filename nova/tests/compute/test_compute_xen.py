@@ -47,15 +47,19 @@ class ComputeXenTestCase(stubs.XenAPITestBase):
         self.mox.StubOutWithMock(instance_obj.InstanceList, 'get_by_host')
         self.mox.StubOutWithMock(self.compute.driver, 'get_num_instances')
         self.mox.StubOutWithMock(vm_utils, 'lookup')
+        self.mox.StubOutWithMock(instance_obj.InstanceList, 'refresh_all')
+        self.mox.StubOutWithMock(instance_obj.InstanceList, 'save_all')
         self.mox.StubOutWithMock(self.compute, '_sync_instance_power_state')
 
         instance_obj.InstanceList.get_by_host(ctxt,
-                self.compute.host).AndReturn(instance_list)
+                self.compute.host, use_slave=True).AndReturn(instance_list)
         self.compute.driver.get_num_instances().AndReturn(1)
         vm_utils.lookup(self.compute.driver._session, instance['name'],
                 False).AndReturn(None)
+        instance_list.refresh_all().AndReturn({})
+        instance_list.save_all().AndReturn({})
         self.compute._sync_instance_power_state(ctxt, instance,
-                power_state.NOSTATE)
+                power_state.NOSTATE, refresh=False)
 
         self.mox.ReplayAll()
 
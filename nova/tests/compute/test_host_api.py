@@ -268,7 +268,7 @@ class ComputeHostAPITestCase(test.TestCase):
 
         self.host_api.db.task_log_get_all(self.ctxt,
                 'fake-name', 'fake-begin', 'fake-end', host='fake-host',
-                state='fake-state').AndReturn('fake-response')
+                state='fake-state', use_slave=True).AndReturn('fake-response')
         self.mox.ReplayAll()
         result = self.host_api.task_log_get_all(self.ctxt, 'fake-name',
                 'fake-begin', 'fake-end', host='fake-host',
@@ -295,7 +295,7 @@ class _BaseTestCase(object):
         self.mox.StubOutWithMock(db, 'instance_get_active_by_window_joined')
         db.instance_get_active_by_window_joined(self.context, 'fake-begin',
                                                 'fake-end', 'fake-proj',
-                                                'fake-host')
+                                                'fake-host', use_slave=True)
         self.mox.ReplayAll()
         self.conductor.instance_get_active_by_window_joined(
             self.context, 'fake-begin', 'fake-end', 'fake-proj', 'fake-host')
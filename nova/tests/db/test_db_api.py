@@ -22,9 +22,11 @@
 import copy
 import datetime
 import iso8601
+import os
 import types
 import uuid as stdlib_uuid
 
+import fixtures
 import mox
 import netaddr
 from oslo.config import cfg
@@ -235,6 +237,15 @@ class NotDbApiTestCase(DbTestCase):
                           self.context, {'display_name': '%test%'},
                           marker=str(stdlib_uuid.uuid4()))
 
+    def test_instance_get_all_by_filters_marker_of_other_project(self):
+        ctxt = context.RequestContext('user1', 'project1')
+        other = db.instance_create(context.RequestContext('user2',
+                                                          'project2'),
+                                   {'display_name': 'test1'})
+        self.assertRaises(exception.MarkerNotFound,
+                          db.instance_get_all_by_filters,
+                          ctxt, {}, marker=other['uuid'])
+
 
 class AggregateDBApiTestCase(test.TestCase):
     def setUp(self):
@@ -397,6 +408,44 @@ class AggregateDBApiTestCase(test.TestCase):
                                                key='good')
         self.assertFalse('good' in r2)
 
+    def test_aggregate_metadata_get_all_by_host(self):
+        ctxt = context.get_admin_context()
+        values2 = {'name': 'fake_aggregate12'}
+        values3 = {'name': 'fake_aggregate23'}
+        a2_hosts = ['foo1.openstack.org', 'foo2.openstack.org']
+        a2_metadata = {'good': 'value12', 'bad': 'badvalue12'}
+        a3_hosts = ['foo2.openstack.org', 'foo3.openstack.org']
+        a3_metadata = {'good': 'value23'}
+        _create_aggregate_with_hosts(context=ctxt, values=values2,
+                hosts=a2_hosts, metadata=a2_metadata)
+        _create_aggregate_with_hosts(context=ctxt, values=values3,
+                hosts=a3_hosts, metadata=a3_metadata)
+        r1 = db.aggregate_metadata_get_all_by_host(ctxt)
+        self.assertEqual({'good': set(['value12']),
+                          'bad': set(['badvalue12'])},
+                         r1['foo1.openstack.org'])
+        self.assertEqual({'good': set(['value12', 'value23']),
+                          'bad': set(['badvalue12'])},
+                         r1['foo2.openstack.org'])
+        self.assertEqual({'good': set(['value23'])},
+                         r1['foo3.openstack.org'])
+        for host in r1:
+            self.assertEqual(db.aggregate_metadata_get_by_host(ctxt, host),
+                             r1[host])
+
+    def test_aggregate_metadata_get_all_by_host_with_key(self):
+        ctxt = context.get_admin_context()
+        values2 = {'name': 'fake_aggregate12'}
+        values3 = {'name': 'fake_aggregate23'}
+        _create_aggregate_with_hosts(context=ctxt, values=values2,
+                hosts=['foo1.openstack.org'],
+                metadata={'good': 'value12', 'bad': 'badvalue12'})
+        _create_aggregate_with_hosts(context=ctxt, values=values3,
+                hosts=['foo3.openstack.org'], metadata={'bad': 'badvalue23'})
+        r1 = db.aggregate_metadata_get_all_by_host(ctxt, key='good')
+        self.assertEqual({'foo1.openstack.org': {'good': set(['value12'])}},
+                         r1)
+
     def test_aggregate_host_get_by_metadata_key(self):
         ctxt = context.get_admin_context()
         values2 = {'name': 'fake_aggregate12'}
@@ -661,6 +710,147 @@ class SqlAlchemyDbApiTestCase(DbTestCase):
         self.assertEqual(types.UnicodeType, type(result[0]))
 
 
+class SlaveDbApiTestCase(test.TestCase):
+    """Tests reading from a slave database in a separate SQLite file."""
+
+    def setUp(self):
+        super(SlaveDbApiTestCase, self).setUp()
+        self.ctxt = context.get_admin_context()
+        tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.flags(slave_connection='sqlite:///%s' % os.path.join(
+            tmpdir, 'slave.sqlite'), group='database')
+        self.stubs.Set(db_session, '_SLAVE_ENGINE', None)
+        self.stubs.Set(db_session, '_SLAVE_MAKER', None)
+        self.stubs.Set(sqlalchemy_api, '_SLAVE_CONNECTED', False)
+        self.stubs.Set(sqlalchemy_api, '_SLAVE_FAILED_AT', None)
+        self.slave_engine = db_session.get_engine(slave_engine=True)
+        self.addCleanup(self.slave_engine.dispose)
+        # Give the slave the schema of the master
+        for sql, in get_session().execute(
+                "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL "
+                "AND name NOT LIKE 'sqlite_%'"):
+            self.slave_engine.execute(sql)
+
+    def _replicate(self, *tables):
+        """Copy the rows of the master tables to the slave."""
+        for name in tables:
+            table = models.BASE.metadata.tables[name]
+            rows = [dict(row) for row in
+                    get_session().execute(table.select()).fetchall()]
+            self.slave_engine.execute(table.delete())
+            if rows:
+                self.slave_engine.execute(table.insert(), rows)
+
+    def test_instance_get_all_by_filters(self):
+        instance = db.instance_create(self.ctxt, {})
+        self._replicate('instances')
+        db.instance_create(self.ctxt, {})
+
+        result = db.instance_get_all_by_filters(self.ctxt, {},
+                                                use_slave=True)
+        self.assertEqual([instance['uuid']], [i['uuid'] for i in result])
+        result = db.instance_get_all_by_filters(self.ctxt, {})
+        self.assertEqual(2, len(result))
+
+    def test_instance_get_all_by_filters_marker_not_replicated(self):
+        db.instance_create(self.ctxt, {})
+        self._replicate('instances')
+        marker = db.instance_create(self.ctxt, {})
+        db.instance_update(self.ctxt, marker['uuid'],
+                           {'created_at': datetime.datetime(2100, 1, 1)})
+
+        result = db.instance_get_all_by_filters(
+            self.ctxt, {}, marker=marker['uuid'], use_slave=True)
+        self.assertEqual(1, len(result))
+
+    def test_instance_get_all_by_filters_slave_unavailable(self):
+        db.instance_create(self.ctxt, {})
+        self.slave_engine.execute('DROP TABLE instances')
+
+        result = db.instance_get_all_by_filters(self.ctxt, {},
+                                                use_slave=True)
+        self.assertEqual(1, len(result))
+
+    def test_instance_get_all_by_host(self):
+        db.instance_create(self.ctxt, {'host': 'host1'})
+        self._replicate('instances')
+        db.instance_create(self.ctxt, {'host': 'host1'})
+
+        self.assertEqual(1, len(db.instance_get_all_by_host(
+            self.ctxt, 'host1', use_slave=True)))
+        self.assertEqual(2, len(db.instance_get_all_by_host(
+            self.ctxt, 'host1')))
+
+    def test_compute_node_get_all(self):
+        service = db.service_create(self.ctxt, {'host': 'host1',
+                                                'binary': 'nova-compute',
+                                                'topic': 'compute'})
+        db.compute_node_create(self.ctxt, {
+            'service_id': service['id'], 'vcpus': 2, 'memory_mb': 1024,
+            'local_gb': 10, 'vcpus_used': 0, 'memory_mb_used': 0,
+            'local_gb_used': 0, 'hypervisor_type': 'fake',
+            'hypervisor_version': 1, 'cpu_info': ''})
+
+        self.assertEqual([], db.compute_node_get_all(self.ctxt,
+                                                     use_slave=True))
+        self._replicate('services', 'compute_nodes')
+        self.assertEqual(1, len(db.compute_node_get_all(self.ctxt,
+                                                        use_slave=True)))
+
+    def test_no_slave_configured(self):
+        self.flags(slave_connection='', group='database')
+        db.instance_create(self.ctxt, {})
+
+        result = db.instance_get_all_by_filters(self.ctxt, {},
+                                                use_slave=True)
+        self.assertEqual(1, len(result))
+
+    def test_slave_unreachable(self):
+        slave_connection = 'sqlite:////nonexistent/slave.sqlite'
+        self.flags(slave_connection=slave_connection, group='database')
+        self.flags(max_retries=10, retry_interval=10, group='database')
+        self.stubs.Set(db_session, '_SLAVE_ENGINE', None)
+        self.stubs.Set(db_session, '_SLAVE_MAKER', None)
+        connects = []
+        create_engine = sqlalchemy_api.sqlalchemy.create_engine
+
+        def fake_create_engine(url, *args, **kwargs):
+            if url == slave_connection:
+                connects.append(url)
+            return create_engine(url, *args, **kwargs)
+
+        self.stubs.Set(sqlalchemy_api.sqlalchemy, 'create_engine',
+                       fake_create_engine)
+        db.instance_create(self.ctxt, {})
+
+        for i in range(2):
+            result = db.instance_get_all_by_filters(self.ctxt, {},
+                                                    use_slave=True)
+            self.assertEqual(1, len(result))
+        # The slave was tried once, without the connection retries of
+        # get_engine(), and not again until the retry interval is over
+        self.assertEqual(1, len(connects))
+        self.assertEqual(None, db_session._SLAVE_ENGINE)
+
+        self.stubs.Set(sqlalchemy_api, '_SLAVE_FAILED_AT',
+                       sqlalchemy_api._SLAVE_FAILED_AT - 60)
+        db.instance_get_all_by_filters(self.ctxt, {}, use_slave=True)
+        self.assertEqual(2, len(connects))
+
+    def test_master_errors_are_raised(self):
+        calls = []
+
+        @sqlalchemy_api._slave_fallback
+        def read(use_slave=False):
+            calls.append(use_slave)
+            raise exc.OperationalError('SELECT 1', {}, Exception())
+
+        self.assertRaises(exc.OperationalError, read)
+        self.assertRaises(exc.OperationalError, read, use_slave=False)
+        self.assertEqual([False, False], calls)
+        self.assertEqual(None, sqlalchemy_api._SLAVE_FAILED_AT)
+
+
 class MigrationTestCase(test.TestCase):
 
     def setUp(self):
@@ -842,6 +1032,13 @@ class InstanceSystemMetadataTestCase(test.TestCase):
                                                    self.instance['uuid'])
         self.assertEqual(metadata, {'key': 'value'})
 
+    def test_instance_system_metadata_get_by_instance_uuids(self):
+        instance = db.instance_create(self.ctxt, {})
+        metadata = db.instance_system_metadata_get_by_instance_uuids(
+            self.ctxt, [self.instance['uuid'], instance['uuid']])
+        self.assertEqual({self.instance['uuid']: {'key': 'value'},
+                          instance['uuid']: {}}, metadata)
+
     def test_instance_system_metadata_update_new_pair(self):
         db.instance_system_metadata_update(
                     self.ctxt, self.instance['uuid'],
@@ -1192,6 +1389,30 @@ class SecurityGroupTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self._assertEqualListsOfObjects(expected, real,
                                         ignored_keys=['instances'])
 
+    def test_security_group_get_by_instance_uuids(self):
+        instance1 = db.instance_create(self.ctxt, dict(host='foo'))
+        instance2 = db.instance_create(self.ctxt, dict(host='foo'))
+        instance3 = db.instance_create(self.ctxt, dict(host='foo'))
+        values = [
+            {'name': 'fake1', 'instances': [instance1, instance2]},
+            {'name': 'fake2', 'instances': [instance1]},
+            {'name': 'fake3', 'instances': []},
+        ]
+        security_groups = [self._create_security_group(vals)
+                           for vals in values]
+
+        real = db.security_group_get_by_instance_uuids(
+            self.ctxt, [instance1['uuid'], instance2['uuid'],
+                        instance3['uuid']])
+        self.assertEqual(3, len(real))
+        self._assertEqualListsOfObjects(security_groups[:2],
+                                        real[instance1['uuid']],
+                                        ignored_keys=['instances', 'rules'])
+        self._assertEqualListsOfObjects(security_groups[:1],
+                                        real[instance2['uuid']],
+                                        ignored_keys=['instances', 'rules'])
+        self.assertEqual([], real[instance3['uuid']])
+
     def test_security_group_get_all(self):
         values = [
             {'name': 'fake1', 'project_id': 'fake_proj1'},
@@ -1304,6 +1525,20 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         instance = self.create_instance_with_args()
         self.assertTrue(uuidutils.is_uuid_like(instance['uuid']))
 
+    def test_instance_info_cache_get_by_instance_uuids(self):
+        instance1 = self.create_instance_with_args()
+        instance2 = self.create_instance_with_args()
+        db.instance_info_cache_update(self.ctxt, instance1['uuid'],
+                                      {'network_info': '[]'})
+        db.instance_info_cache_delete(self.ctxt, instance2['uuid'])
+        uuids = [instance1['uuid'], instance2['uuid'], 'nonexistent']
+        info_caches = db.instance_info_cache_get_by_instance_uuids(self.ctxt,
+                                                                   uuids)
+        self.assertEqual(set(uuids), set(info_caches))
+        self.assertEqual('[]', info_caches[instance1['uuid']]['network_info'])
+        self.assertEqual(None, info_caches[instance2['uuid']])
+        self.assertEqual(None, info_caches['nonexistent'])
+
     def test_instance_create_with_object_values(self):
         values = {
             'access_ip_v4': netaddr.IPAddress('1.2.3.4'),
@@ -1425,6 +1660,31 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
         filtered_instances = db.instance_get_all_by_filters(self.ctxt, {})
         self._assertEqualListsOfInstances(instances, filtered_instances)
 
+    def test_instance_get_all_by_filters_iter(self):
+        for i in range(5):
+            self.create_instance_with_args()
+        self.create_instance_with_args(host='h2')
+        expected = [inst['uuid'] for inst in db.instance_get_all_by_filters(
+            self.ctxt, {'host': 'h1'})]
+        self.assertEqual(5, len(expected))
+        for chunk_size in (1, 2, 5, 6):
+            instances = db.instance_get_all_by_filters_iter(
+                self.ctxt, {'host': 'h1'}, chunk_size=chunk_size)
+            self.assertEqual(expected, [inst['uuid'] for inst in instances])
+
+    def test_instance_get_all_by_filters_iter_joins(self):
+        for i in range(3):
+            self.create_instance_with_args()
+        columns_to_join = ['metadata']
+        instances = list(db.instance_get_all_by_filters_iter(
+            self.ctxt, {}, chunk_size=1, columns_to_join=columns_to_join))
+        self.assertEqual(3, len(instances))
+        for instance in instances:
+            self.assertEqual({'mkey1': 'mval1', 'mkey2': 'mval2'},
+                             utils.metadata_to_dict(instance['metadata']))
+            self.assertEqual([], instance['system_metadata'])
+        self.assertEqual(['metadata'], columns_to_join)
+
     def test_instance_metadata_get_multi(self):
         uuids = [self.create_instance_with_args()['uuid'] for i in range(3)]
         meta = sqlalchemy_api._instance_metadata_get_multi(self.ctxt, uuids)
@@ -1456,6 +1716,76 @@ class InstanceTestCase(test.TestCase, ModelsObjectComparatorMixin):
                                                 {'display_name': 't.*st.'})
         self._assertEqualListsOfInstances(result, [i1, i2])
 
+    def test_instance_get_all_by_filters_regex_prefix(self):
+        i1 = self.create_instance_with_args(display_name='web1')
+        i2 = self.create_instance_with_args(display_name='web2')
+        i3 = self.create_instance_with_args(display_name='web.3')
+        self.create_instance_with_args(display_name='webby')
+        self.create_instance_with_args(display_name='aweb1')
+        self.create_instance_with_args(display_name='wc1')
+        result = db.instance_get_all_by_filters(self.ctxt,
+                                                {'display_name': '^web[0-9]'})
+        self._assertEqualListsOfInstances([i1, i2], result)
+        result = db.instance_get_all_by_filters(self.ctxt,
+                                                {'display_name': '^web1$'})
+        self._assertEqualListsOfInstances([i1], result)
+        result = db.instance_get_all_by_filters(self.ctxt,
+                                                {'display_name': '^web\\.'})
+        self._assertEqualListsOfInstances([i3], result)
+        result = db.instance_get_all_by_filters(
+            self.ctxt, {'display_name': '^wc*eb[0-9]'})
+        self._assertEqualListsOfInstances([i1, i2], result)
+
+    def test_instance_get_all_by_filters_regex_prefix_uses_index(self):
+        session = get_session()
+        query, manual_joins = (
+            sqlalchemy_api._instance_get_all_by_filters_query(
+                self.ctxt, {'display_name': '^web[0-9]', 'deleted': False},
+                'created_at', 'desc', None, None, [], session))
+        statement = query.statement.compile(dialect=session.bind.dialect)
+        plan = session.bind.execute(
+            'EXPLAIN QUERY PLAN %s' % statement,
+            *[statement.params[key] for key in statement.positiontup])
+        self.assertIn('instances_display_name_deleted_idx',
+                      ' '.join(str(row) for row in plan))
+
+    def test_regex_prefix(self):
+        for regex, prefix in (('^web', 'web'),
+                              ('^web01$', 'web01'),
+                              ('^web[0-9]+', 'web'),
+                              ('^web0*1', 'web'),
+                              ('^web0+1', 'web0'),
+                              ('^10\\.0\\.0\\.1$', '10.0.0.1'),
+                              ('^web\\d', 'web'),
+                              ('web', None),
+                              ('^.*web', None),
+                              ('^web|db', None),
+                              ('^web(?i)', None)):
+            self.assertEqual(prefix, sqlalchemy_api._regex_prefix(regex))
+
+    def test_instance_get_all_by_filters_launched_at(self):
+        now = timeutils.utcnow()
+        self.create_instance_with_args(
+            launched_at=now - datetime.timedelta(days=2))
+        i2 = self.create_instance_with_args(
+            launched_at=now - datetime.timedelta(days=1))
+        self.create_instance_with_args(launched_at=now)
+        self.create_instance_with_args()
+        result = db.instance_get_all_by_filters(self.ctxt, {
+            'launched-since': now - datetime.timedelta(days=1),
+            'launched-before': now})
+        self._assertEqualListsOfInstances([i2], result)
+
+    def test_instance_get_all_by_filters_node_regex(self):
+        i1 = self.create_instance_with_args(node='node1')
+        i2 = self.create_instance_with_args(node='node12')
+        result = db.instance_get_all_by_filters(self.ctxt,
+                                                {'node': 'node1'})
+        self._assertEqualListsOfInstances([i1, i2], result)
+        result = db.instance_get_all_by_filters(self.ctxt,
+                                                {'node': '^node1$'})
+        self._assertEqualListsOfInstances([i1], result)
+
     def test_instance_get_all_by_filters_exact_match(self):
         instance = self.create_instance_with_args(host='host1')
         self.create_instance_with_args(host='host12')
@@ -1849,6 +2179,21 @@ class InstanceMetadataTestCase(test.TestCase):
         self.assertEqual({'key': 'value'}, db.instance_metadata_get(
                                             self.ctxt, instance['uuid']))
 
+    def test_instance_metadata_get_by_instance_uuids(self):
+        instance1 = db.instance_create(self.ctxt, {'metadata':
+                                                     {'key': 'value',
+                                                      'key1': 'value1'}})
+        instance2 = db.instance_create(self.ctxt, {'metadata':
+                                                     {'key': 'value2'}})
+        instance3 = db.instance_create(self.ctxt, {})
+        db.instance_metadata_delete(self.ctxt, instance1['uuid'], 'key1')
+        metadata = db.instance_metadata_get_by_instance_uuids(
+            self.ctxt, [instance1['uuid'], instance2['uuid'],
+                        instance3['uuid']])
+        self.assertEqual({instance1['uuid']: {'key': 'value'},
+                          instance2['uuid']: {'key': 'value2'},
+                          instance3['uuid']: {}}, metadata)
+
     def test_instance_metadata_delete(self):
         instance = db.instance_create(self.ctxt,
                                       {'metadata': {'key': 'val',
@@ -2992,6 +3337,18 @@ class FixedIPTestCase(BaseInstanceTypeTestCase):
             [FIXED_IP_ADDRESS_1, FIXED_IP_ADDRESS_2],
             [ips_list[0].address, ips_list[1].address])
 
+    def test_fixed_ip_get_all_instance_uuids(self):
+        instance_uuid = self._create_instance()
+        db.fixed_ip_create(self.ctxt, dict(
+            instance_uuid=instance_uuid, address='192.168.1.5'))
+        db.fixed_ip_create(self.ctxt, dict(address='192.168.1.6'))
+        db.fixed_ip_create(self.ctxt, dict(
+            instance_uuid=instance_uuid, address='192.168.1.7', deleted=1))
+
+        result = db.fixed_ip_get_all_instance_uuids(self.ctxt)
+        self.assertEqual([('192.168.1.5', instance_uuid)],
+                         [tuple(row) for row in result])
+
     def test_fixed_ip_get_by_instance_inappropriate_ignored(self):
         instance_uuid = self._create_instance()
 
@@ -4314,6 +4671,26 @@ class BlockDeviceMappingTestCase(test.TestCase):
         bmd = db.block_device_mapping_get_all_by_instance(self.ctxt, uuid2)
         self.assertEqual(len(bmd), 2)
 
+    def test_block_device_mapping_get_all_by_instance_uuids(self):
+        uuid1 = self.instance['uuid']
+        uuid2 = db.instance_create(self.ctxt, {})['uuid']
+        uuid3 = db.instance_create(self.ctxt, {})['uuid']
+
+        for bdm in [{'instance_uuid': uuid1, 'device_name': 'first'},
+                    {'instance_uuid': uuid2, 'device_name': 'second'},
+                    {'instance_uuid': uuid2, 'device_name': 'third'}]:
+            self._create_bdm(bdm)
+
+        bdms = db.block_device_mapping_get_all_by_instance_uuids(
+            self.ctxt, [uuid1, uuid2, uuid3])
+        self.assertEqual(['first'],
+                         [bdm['device_name'] for bdm in bdms[uuid1]])
+        self.assertEqual(['second', 'third'],
+                         sorted(bdm['device_name'] for bdm in bdms[uuid2]))
+        self.assertEqual([], bdms[uuid3])
+        self.assertEqual({}, db.block_device_mapping_get_all_by_instance_uuids(
+            self.ctxt, []))
+
     def test_block_device_mapping_destroy(self):
         bdm = self._create_bdm({})
         db.block_device_mapping_destroy(self.ctxt, bdm['id'])
@@ -5174,6 +5551,13 @@ class S3ImageTestCase(test.TestCase):
             self.assertTrue(uuidutils.is_uuid_like(ref.uuid))
             self.assertEqual(uuid, ref.uuid)
 
+    def test_s3_image_get_by_uuids(self):
+        refs = db.s3_image_get_by_uuids(
+            self.ctxt, self.values[:2] + [uuidutils.generate_uuid()])
+        self.assertEqual(sorted(self.values[:2]),
+                         sorted(ref.uuid for ref in refs))
+        self.assertEqual([], db.s3_image_get_by_uuids(self.ctxt, []))
+
     def test_s3_image_get(self):
         self.assertEqual(sorted(self.values),
                          sorted([db.s3_image_get(self.ctxt, ref.id).uuid
@@ -5316,6 +5700,45 @@ class ComputeNodeTestCase(test.TestCase, ModelsObjectComparatorMixin):
         self._assertEqualListsOfObjects(expected, result,
                                         ignored_keys=['stats'])
 
+    def test_compute_node_get_all_changed_since(self):
+        service_data = self.service_dict.copy()
+        service_data['host'] = 'host2'
+        service = db.service_create(self.ctxt, service_data)
+        compute_node_data = self.compute_node_dict.copy()
+        compute_node_data['service_id'] = service['id']
+        compute_node_data['hypervisor_hostname'] = 'host2_node'
+        compute_node_data['stats'] = {}
+        timeutils.set_time_override(datetime.datetime(2013, 1, 1))
+        self.addCleanup(timeutils.clear_time_override)
+        node2, node3, node4 = [
+                db.compute_node_create(self.ctxt, compute_node_data.copy())
+                for i in xrange(3)]
+
+        changed_since = datetime.datetime(2013, 1, 2)
+        timeutils.set_time_override(changed_since)
+        db.compute_node_update(self.ctxt, node2['id'], {'vcpus_used': 1})
+        db.compute_node_delete(self.ctxt, node3['id'])
+
+        nodes = db.compute_node_get_all(self.ctxt,
+                                        changed_since=changed_since)
+        nodes = dict((node['id'], node) for node in nodes)
+        # self.item was created with the real clock, after changed_since
+        self.assertEqual(set([self.item['id'], node2['id'], node3['id']]),
+                         set(nodes.keys()))
+        self.assertFalse(node4['id'] in nodes)
+        self.assertEqual(0, nodes[node2['id']]['deleted'])
+        self.assertEqual(1, nodes[node2['id']]['vcpus_used'])
+        self.assertEqual(service['id'], nodes[node2['id']]['service']['id'])
+        self._stats_equal(self.stats,
+                          self._stats_as_dict(nodes[self.item['id']]['stats']))
+        self.assertNotEqual(0, nodes[node3['id']]['deleted'])
+        self.assertFalse(nodes[node3['id']].get('stats'))
+
+        nodes = db.compute_node_get_all(self.ctxt, no_date_fields=True,
+                                        changed_since=changed_since)
+        self.assertTrue(all('deleted' in node for node in nodes))
+        self.assertFalse(any('updated_at' in node for node in nodes))
+
     def test_compute_node_get(self):
         compute_node_id = self.item['id']
         node = db.compute_node_get(self.ctxt, compute_node_id)
@@ -6020,6 +6443,15 @@ class Ec2TestCase(test.TestCase):
         inst_id = db.get_ec2_instance_id_by_uuid(self.ctxt, 'fake-uuid')
         self.assertEqual(inst['id'], inst_id)
 
+    def test_get_ec2_instance_ids_by_uuids(self):
+        inst1 = db.ec2_instance_create(self.ctxt, 'fake-uuid1')
+        inst2 = db.ec2_instance_create(self.ctxt, 'fake-uuid2')
+        inst_ids = db.get_ec2_instance_ids_by_uuids(
+            self.ctxt, ['fake-uuid1', 'fake-uuid2', 'uuid-not-present'])
+        self.assertEqual({'fake-uuid1': inst1['id'],
+                          'fake-uuid2': inst2['id']}, inst_ids)
+        self.assertEqual({}, db.get_ec2_instance_ids_by_uuids(self.ctxt, []))
+
     def test_get_instance_uuid_by_ec2_id(self):
         inst = db.ec2_instance_create(self.ctxt, 'fake-uuid')
         inst_uuid = db.get_instance_uuid_by_ec2_id(self.ctxt, inst['id'])
@@ -6268,6 +6700,90 @@ class ArchiveTestCase(test.TestCase):
         num = db.archive_deleted_rows_for_table(self.context, "console_pools")
         self.assertEqual(num, 1)
 
+    def test_archive_deleted_rows_fk_order(self):
+        dialect = self.engine.url.get_dialect()
+        if dialect == sqlite.dialect:
+            import sqlite3
+            tup = sqlite3.sqlite_version_info
+            if tup[0] < 3 or (tup[0] == 3 and tup[1] < 7):
+                self.skipTest(
+                    'sqlite version too old for reliable SQLA foreign_keys')
+            self.conn.execute("PRAGMA foreign_keys = ON")
+        ins_stmt = self.console_pools.insert().values(deleted=1)
+        result = self.conn.execute(ins_stmt)
+        id1 = result.inserted_primary_key[0]
+        self.ids.append(id1)
+        ins_stmt = self.consoles.insert().values(deleted=1, pool_id=id1)
+        result = self.conn.execute(ins_stmt)
+        self.ids.append(result.inserted_primary_key[0])
+        # consoles is archived before console_pools in a single pass.
+        num = db.archive_deleted_rows(self.context)
+        self.assertEqual(num, 2)
+        rows = self.conn.execute(select([self.shadow_console_pools]).where(
+                self.shadow_console_pools.c.id == id1)).fetchall()
+        self.assertEqual(len(rows), 1)
+
+    def test_archive_deleted_rows_in_batches(self):
+        self.flags(archive_deleted_rows_batch_size=2)
+        for uuidstr in self.uuidstrs:
+            ins_stmt = self.instance_id_mappings.insert().values(uuid=uuidstr)
+            self.conn.execute(ins_stmt)
+        update_statement = self.instance_id_mappings.update().\
+                where(self.instance_id_mappings.c.uuid.in_(self.uuidstrs[:5]))\
+                .values(deleted=1)
+        self.conn.execute(update_statement)
+        num = db.archive_deleted_rows_for_table(self.context,
+                                                "instance_id_mappings")
+        self.assertEqual(num, 5)
+        qsiim = select([self.shadow_instance_id_mappings]).\
+                where(self.shadow_instance_id_mappings.c.uuid.in_(
+                                                            self.uuidstrs))
+        rows = self.conn.execute(qsiim).fetchall()
+        self.assertEqual(sorted(self.uuidstrs[:5]),
+                         sorted(row.uuid for row in rows))
+        qiim = select([self.instance_id_mappings]).where(
+                         self.instance_id_mappings.c.uuid.in_(self.uuidstrs))
+        rows = self.conn.execute(qiim).fetchall()
+        self.assertEqual([self.uuidstrs[5]], [row.uuid for row in rows])
+
+    def test_archive_deleted_rows_batch_deletes_copied_rows(self):
+        for uuidstr in self.uuidstrs:
+            ins_stmt = self.instance_id_mappings.insert().values(uuid=uuidstr)
+            self.conn.execute(ins_stmt)
+        iim = self.instance_id_mappings
+        self.conn.execute(iim.update().where(iim.c.uuid.in_(
+                [self.uuidstrs[0], self.uuidstrs[2]])).values(deleted=1))
+        late_delete = iim.update().where(
+                iim.c.uuid == self.uuidstrs[1]).values(deleted=1)
+        conn = self.conn
+
+        class Connection(object):
+            """Soft-deletes a row of the batch range after the copy."""
+
+            def begin(self):
+                return conn.begin()
+
+            def execute(self, statement):
+                result = conn.execute(statement)
+                if isinstance(statement, db_utils.InsertFromSelect):
+                    conn.execute(late_delete)
+                return result
+
+        num, watermark = sqlalchemy_api._archive_deleted_rows_batch(
+            Connection(), iim, self.shadow_instance_id_mappings, iim.c.id,
+            0, 2)
+        self.assertEqual(2, num)
+        qsiim = select([self.shadow_instance_id_mappings]).\
+                where(self.shadow_instance_id_mappings.c.uuid.in_(
+                                                            self.uuidstrs))
+        rows = self.conn.execute(qsiim).fetchall()
+        self.assertEqual(sorted([self.uuidstrs[0], self.uuidstrs[2]]),
+                         sorted(row.uuid for row in rows))
+        self.assertEqual(max(row.id for row in rows), watermark)
+        rows = self.conn.execute(select([iim]).where(
+                iim.c.uuid.in_(self.uuidstrs))).fetchall()
+        self.assertTrue(self.uuidstrs[1] in [row.uuid for row in rows])
+
     def test_archive_deleted_rows_2_tables(self):
         # Add 6 rows to each table
         for uuidstr in self.uuidstrs:
@@ -6821,6 +7337,21 @@ class PciDeviceDBApiTestCase(test.TestCase, ModelsObjectComparatorMixin):
             '00000000-0000-0000-0000-000000000010')
         self._assertEqualListsOfObjects(results, [v1, v2], self.ignored_keys)
 
+    def test_pci_device_get_by_instance_uuids(self):
+        v1, v2 = self._get_fake_pci_devs()
+        v1['status'] = 'allocated'
+        v2['status'] = 'claimed'
+        db.pci_device_update(self.admin_context, v1['compute_node_id'],
+                             v1['address'], v1)
+        db.pci_device_update(self.admin_context, v2['compute_node_id'],
+                             v2['address'], v2)
+        uuid = '00000000-0000-0000-0000-000000000010'
+        results = db.pci_device_get_by_instance_uuids(self.context,
+                                                      [uuid, 'nonexistent'])
+        self.assertEqual([], results['nonexistent'])
+        self._assertEqualListsOfObjects(results[uuid], [v1],
+                                        self.ignored_keys)
+
     def test_pci_device_get_by_instance_uuid_check_status(self):
         v1, v2 = self._get_fake_pci_devs()
         v1['status'] = 'allocated'
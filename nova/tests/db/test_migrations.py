@@ -3137,6 +3137,29 @@ class TestNovaMigrations(BaseMigrationTestCase, CommonTestsMixIn):
             self.assertEqual(1, len(rows))
             self.assertEqual(per_project[resource], rows[0]['in_use'])
 
+    def _get_instance_indexes(self, engine):
+        instances = db_utils.get_table(engine, 'instances')
+        return dict((index.name, index.columns.keys())
+                    for index in instances.indexes)
+
+    def _check_217(self, engine, data):
+        indexes = self._get_instance_indexes(engine)
+        for name, columns in (
+                ('instances_display_name_deleted_idx',
+                 ['display_name', 'deleted']),
+                ('instances_hostname_deleted_idx', ['hostname', 'deleted']),
+                ('instances_node_deleted_idx', ['node', 'deleted']),
+                ('instances_launched_at_deleted_idx',
+                 ['launched_at', 'deleted'])):
+            self.assertEqual(columns, indexes[name])
+
+    def _post_downgrade_217(self, engine):
+        indexes = self._get_instance_indexes(engine)
+        for name in ('instances_display_name_deleted_idx',
+                     'instances_hostname_deleted_idx',
+                     'instances_node_deleted_idx',
+                     'instances_launched_at_deleted_idx'):
+            self.assertNotIn(name, indexes)
 
 class TestBaremetalMigrations(BaseMigrationTestCase, CommonTestsMixIn):
     """Test sqlalchemy-migrate migrations."""
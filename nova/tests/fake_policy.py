@@ -345,6 +345,7 @@ policy_data = """
 
     "network:get_fixed_ip": "",
     "network:get_fixed_ip_by_address": "",
+    "network:get_fixed_ip_instance_uuids": "",
     "network:add_fixed_ip_to_instance": "",
     "network:remove_fixed_ip_from_instance": "",
     "network:add_network_to_project": "",
@@ -23,12 +23,15 @@ import random
 import mox
 
 from nova.compute import flavors
+from nova.compute import utils as compute_utils
 from nova import context
 from nova import exception
 from nova import network
 from nova.network import api
 from nova.network import floating_ips
+from nova.network import model as network_model
 from nova.network import rpcapi as network_rpcapi
+from nova.objects import instance_info_cache as info_cache_obj
 from nova import policy
 from nova import test
 from nova import utils
@@ -272,3 +275,34 @@ class ApiTestCase(test.TestCase):
         self.stubs.Set(self.network_api, 'get', fake_get)
 
         self.network_api.associate(self.context, FAKE_UUID, project=None)
+
+    def test_get_instances_nw_info(self):
+        self.mox.StubOutWithMock(self.network_api, 'get_instance_nw_info')
+        self.network_api.get_instance_nw_info(self.context,
+                                              {'uuid': 'a'}).AndReturn('nw-a')
+        self.network_api.get_instance_nw_info(self.context,
+                                              {'uuid': 'b'}).AndReturn('nw-b')
+        self.mox.ReplayAll()
+        result = self.network_api.get_instances_nw_info(
+            self.context, [{'uuid': 'a'}, {'uuid': 'b'}])
+        self.assertEqual(['nw-a', 'nw-b'], result)
+
+    def test_get_fixed_ip_instance_uuids(self):
+        self.mox.StubOutWithMock(self.network_api.db,
+                                 'fixed_ip_get_all_instance_uuids')
+        self.network_api.db.fixed_ip_get_all_instance_uuids(
+            self.context).AndReturn([('10.0.0.1', 'a'), ('10.0.0.2', 'b'),
+                                     ('10.0.0.2', 'c'), ('10.0.0.3', 'b')])
+        self.mox.ReplayAll()
+        self.assertEqual({'10.0.0.1': 'a', '10.0.0.3': 'b'},
+            self.network_api.get_fixed_ip_instance_uuids(self.context))
+
+    def test_update_instance_cache_uncaches_metadata(self):
+        self.mox.StubOutWithMock(info_cache_obj.InstanceInfoCache, 'save')
+        self.mox.StubOutWithMock(compute_utils, 'uncache_instance_metadata')
+        info_cache_obj.InstanceInfoCache.save(update_cells=True)
+        compute_utils.uncache_instance_metadata(FAKE_UUID)
+        self.mox.ReplayAll()
+        api.update_instance_cache_with_nw_info(
+            self.network_api, self.context, {'uuid': FAKE_UUID},
+            nw_info=network_model.NetworkInfo([network_model.VIF()]))
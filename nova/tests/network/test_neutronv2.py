@@ -15,12 +15,16 @@
 #
 # vim: tabstop=4 shiftwidth=4 softtabstop=4
 
+import datetime
 import uuid
 
+import eventlet
 import mox
 from neutronclient.common import exceptions
 from neutronclient.v2_0 import client
 from oslo.config import cfg
+import webob.dec
+import webob.exc
 
 from nova.compute import flavors
 from nova.conductor import api as conductor_api
@@ -31,8 +35,10 @@ from nova.network import neutronv2
 from nova.network.neutronv2 import api as neutronapi
 from nova.network.neutronv2 import constants
 from nova.openstack.common import jsonutils
+from nova.openstack.common import timeutils
 from nova import test
 from nova import utils
+from nova import wsgi
 
 CONF = cfg.CONF
 
@@ -91,6 +97,11 @@ class MyComparator(mox.Comparator):
 
 
 class TestNeutronClient(test.TestCase):
+    def setUp(self):
+        super(TestNeutronClient, self).setUp()
+        neutronv2.reset_clients()
+        self.addCleanup(neutronv2.reset_clients)
+
     def test_withtoken(self):
         self.flags(neutron_url='http://anyhost/')
         self.flags(neutron_url_timeout=30)
@@ -131,6 +142,117 @@ class TestNeutronClient(test.TestCase):
         neutronv2.get_client(my_context)
 
 
+class FakeNeutronServer(object):
+    """Keystone and Neutron stand-in counting the requests it serves."""
+
+    def __init__(self):
+        self.token_requests = 0
+        self.port_requests = 0
+        self.connections = set()
+        self.valid_tokens = set()
+        self.token_lifetime = 3600
+
+    @webob.dec.wsgify
+    def __call__(self, req):
+        self.connections.add(req.environ['REMOTE_PORT'])
+        if req.path_info == '/v2.0/tokens':
+            self.token_requests += 1
+            token = 'token%d' % self.token_requests
+            self.valid_tokens.add(token)
+            expires = timeutils.utcnow() + datetime.timedelta(
+                    seconds=self.token_lifetime)
+            body = {'access': {
+                        'token': {'id': token,
+                                  'expires': timeutils.isotime(expires)},
+                        'serviceCatalog': [{
+                            'type': 'network',
+                            'endpoints': [{'publicURL': req.host_url}]}]}}
+        elif req.path_info == '/v2.0/ports.json':
+            self.port_requests += 1
+            if req.headers.get('X-Auth-Token') not in self.valid_tokens:
+                raise webob.exc.HTTPUnauthorized()
+            body = {'ports': []}
+        else:
+            raise webob.exc.HTTPNotFound()
+        return webob.Response(body=jsonutils.dumps(body),
+                              content_type='application/json')
+
+
+class TestNeutronClientPool(test.NoDBTestCase):
+    def setUp(self):
+        super(TestNeutronClientPool, self).setUp()
+        self.neutron = FakeNeutronServer()
+        self.server = wsgi.Server('fake_neutron', self.neutron,
+                                  host='127.0.0.1', port=0)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        url = 'http://127.0.0.1:%d' % self.server.port
+        self.flags(neutron_url=url, neutron_admin_auth_url=url + '/v2.0',
+                   neutron_auth_strategy='keystone',
+                   neutron_admin_username='admin',
+                   neutron_admin_password='password',
+                   neutron_admin_tenant_name='admin')
+        neutronv2.reset_clients()
+        self.addCleanup(neutronv2.reset_clients)
+        self.addCleanup(timeutils.clear_time_override)
+        self.context = context.RequestContext('userid', 'my_tenantid')
+
+    def _list_ports(self, count=3):
+        for i in xrange(count):
+            neutronv2.get_client(self.context, admin=True).list_ports()
+
+    def test_admin_token_and_connection_reused(self):
+        self._list_ports()
+        self.assertEqual(1, self.neutron.token_requests)
+        self.assertEqual(3, self.neutron.port_requests)
+        # One connection to authenticate, one for the Neutron calls
+        self.assertEqual(2, len(self.neutron.connections))
+
+    def test_reauthenticates_on_unauthorized(self):
+        self._list_ports(count=1)
+        self.neutron.valid_tokens.clear()
+        self._list_ports()
+        self.assertEqual(2, self.neutron.token_requests)
+        # The first call after the revocation is turned down and retried
+        self.assertEqual(5, self.neutron.port_requests)
+        self.assertEqual('token2', neutronv2._get_auth_token())
+
+    def test_renews_token_close_to_expiry(self):
+        timeutils.set_time_override()
+        self._list_ports(count=1)
+        timeutils.advance_time_seconds(
+                self.neutron.token_lifetime - neutronv2.TOKEN_EXPIRY_WINDOW)
+        self._list_ports(count=1)
+        self.assertEqual(2, self.neutron.token_requests)
+        self.assertEqual(2, self.neutron.port_requests)
+
+    def test_older_client_token_not_shared(self):
+        timeutils.set_time_override()
+        self._list_ports(count=1)
+        self.neutron.valid_tokens.clear()
+        timeutils.advance_time_seconds(60)
+        # Another greenthread is turned down, authenticates again and
+        # shares its new token on its next call
+        eventlet.spawn(self._list_ports, count=2).wait()
+        self.assertEqual('token2', neutronv2._ADMIN_AUTH['token'])
+
+        # This greenthread's client still holds the older token
+        self._list_ports(count=1)
+        self.assertEqual('token2', neutronv2._ADMIN_AUTH['token'])
+        self.assertEqual(2, self.neutron.token_requests)
+        self.assertEqual(5, self.neutron.port_requests)
+
+    def test_user_clients_reused_per_token(self):
+        self.neutron.valid_tokens.add('user_token')
+        self.context.auth_token = 'user_token'
+        client1 = neutronv2.get_client(self.context)
+        client1.list_ports()
+        self.assertIs(client1, neutronv2.get_client(self.context))
+        self.assertIsNot(client1,
+                         neutronv2.get_client(self.context, admin=True))
+        self.assertEqual(1, self.neutron.token_requests)
+
+
 class TestNeutronv2Base(test.TestCase):
 
     def setUp(self):
@@ -422,23 +544,17 @@ class TestNeutronv2Base(test.TestCase):
             shared=False).AndReturn({'networks': nets})
         self.moxed_client.list_networks(
             shared=True).AndReturn({'networks': []})
-        for i in xrange(1, number + 1):
-            float_data = number == 1 and self.float_data1 or self.float_data2
-            for ip in port_data[i - 1]['fixed_ips']:
-                float_data = [x for x in float_data
-                              if x['fixed_ip_address'] == ip['ip_address']]
-                self.moxed_client.list_floatingips(
-                    fixed_ip_address=ip['ip_address'],
-                    port_id=port_data[i - 1]['id']).AndReturn(
-                        {'floatingips': float_data})
-            subnet_data = i == 1 and self.subnet_data1 or self.subnet_data2
-            self.moxed_client.list_subnets(
-                id=mox.SameElementsAs(['my_subid%s' % i])).AndReturn(
-                    {'subnets': subnet_data})
-            self.moxed_client.list_ports(
-                network_id=subnet_data[0]['network_id'],
-                device_owner='network:dhcp').AndReturn(
-                    {'ports': []})
+        float_data = number == 1 and self.float_data1 or self.float_data2
+        self.moxed_client.list_floatingips(
+            port_id=[port['id'] for port in port_data]).AndReturn(
+                {'floatingips': float_data})
+        subnet_data = self.subnet_data1 + self.subnet_data2[:number - 1]
+        self.moxed_client.list_subnets(
+            id=['my_subid%s' % i for i in xrange(1, number + 1)]).AndReturn(
+                {'subnets': subnet_data})
+        self.moxed_client.list_ports(
+            network_id=[subnet['network_id'] for subnet in subnet_data],
+            device_owner='network:dhcp').AndReturn({'ports': []})
         self.mox.ReplayAll()
         nw_inf = api.get_instance_nw_info(self.context, self.instance)
         for i in xrange(0, number):
@@ -470,6 +586,67 @@ class TestNeutronv2(TestNeutronv2Base):
             self.moxed_client)
         self._get_instance_nw_info(2)
 
+    def test_get_instances_nw_info(self):
+        # Test to get the ports of two instances with bulk requests.
+        api = neutronapi.API()
+        # The info_cache loaded with the first instance is used as is, the
+        # one of the second instance is looked up.
+        net_info_cache = [{'network': {'id': self.port_data2[0][
+                                           'network_id']}}]
+        instance2 = dict(self.instance2, info_cache={
+                'network_info': jsonutils.dumps(net_info_cache)})
+        instances = [instance2, self.instance]
+        project_id = self.instance['project_id']
+        ports = [dict(port, tenant_id=project_id)
+                 for port in self.port_data2]
+        # Ports of another tenant are left out
+        ports.append(dict(self.port_data2[1], id='his_portid',
+                          tenant_id='his_tenantid'))
+        neutronv2.get_client(mox.IgnoreArg(),
+                             admin=True).MultipleTimes().AndReturn(
+            self.moxed_client)
+        self.moxed_client.list_ports(
+            device_id=[self.instance2['uuid'],
+                       self.instance['uuid']]).AndReturn({'ports': ports})
+        self.moxed_client.list_networks(
+            tenant_id=project_id, shared=False).AndReturn(
+                {'networks': self.nets2})
+        self.moxed_client.list_networks(
+            shared=True).AndReturn({'networks': []})
+        self.mox.StubOutWithMock(conductor_api.API,
+                                 'instance_get_by_uuid')
+        net_info_cache = [{'network': {'id': self.port_data2[1][
+                                           'network_id']}}]
+        api.conductor_api.instance_get_by_uuid(
+            mox.IgnoreArg(), self.instance['uuid']).AndReturn(
+                {'info_cache': {'network_info':
+                                jsonutils.dumps(net_info_cache)}})
+        self.moxed_client.list_floatingips(
+            port_id=['my_portid1', 'my_portid2']).AndReturn(
+                {'floatingips': self.float_data2})
+        self.moxed_client.list_subnets(
+            id=['my_subid1', 'my_subid2']).AndReturn(
+                {'subnets': self.subnet_data1 + self.subnet_data2})
+        self.moxed_client.list_ports(
+            network_id=['my_netid1', 'my_netid2'],
+            device_owner='network:dhcp').AndReturn({'ports': []})
+        self.mox.StubOutWithMock(api.db, 'instance_info_cache_update')
+        for instance in instances:
+            api.db.instance_info_cache_update(
+                mox.IgnoreArg(), instance['uuid'], mox.IgnoreArg())
+        self.mox.ReplayAll()
+
+        nw_infos = api.get_instances_nw_info(self.context, instances)
+        self.assertEqual(2, len(nw_infos))
+        for index, nw_info in enumerate(nw_infos):
+            id_suffix = index + 1
+            self.assertEqual(1, len(nw_info))
+            self.assertEqual('my_portid%s' % id_suffix, nw_info[0]['id'])
+            self.assertEqual('10.0.%s.0/24' % id_suffix,
+                             nw_info[0]['network']['subnets'][0]['cidr'])
+            self.assertEqual(['172.0.%s.2' % id_suffix],
+                             nw_info.fixed_ips()[0].floating_ip_addresses())
+
     def test_get_instance_nw_info_with_nets(self):
         # Test get instance_nw_info with networks passed in.
         api = neutronapi.API()
@@ -481,17 +658,14 @@ class TestNeutronv2(TestNeutronv2Base):
             tenant_id=self.instance['project_id'],
             device_id=self.instance['uuid']).AndReturn(
                 {'ports': self.port_data1})
-        port_data = self.port_data1
-        for ip in port_data[0]['fixed_ips']:
-            self.moxed_client.list_floatingips(
-                fixed_ip_address=ip['ip_address'],
-                port_id=port_data[0]['id']).AndReturn(
-                    {'floatingips': self.float_data1})
+        self.moxed_client.list_floatingips(
+            port_id=['my_portid1']).AndReturn(
+                {'floatingips': self.float_data1})
         self.moxed_client.list_subnets(
-            id=mox.SameElementsAs(['my_subid1'])).AndReturn(
+            id=['my_subid1']).AndReturn(
                 {'subnets': self.subnet_data1})
         self.moxed_client.list_ports(
-            network_id='my_netid1',
+            network_id=['my_netid1'],
             device_owner='network:dhcp').AndReturn(
                 {'ports': self.dhcp_port_data1})
         neutronv2.get_client(mox.IgnoreArg(),
@@ -850,13 +1024,10 @@ class TestNeutronv2(TestNeutronv2Base):
         self.moxed_client.list_networks(shared=True).AndReturn(
             {'networks': []})
         float_data = number == 1 and self.float_data1 or self.float_data2
-        for data in port_data[1:]:
-            for ip in data['fixed_ips']:
-                self.moxed_client.list_floatingips(
-                    fixed_ip_address=ip['ip_address'],
-                    port_id=data['id']).AndReturn(
-                        {'floatingips': float_data[1:]})
-        for port in port_data[1:]:
+        if port_data[1:]:
+            self.moxed_client.list_floatingips(
+                port_id=[data['id'] for data in port_data[1:]]).AndReturn(
+                    {'floatingips': float_data[1:]})
             self.moxed_client.list_subnets(id=['my_subid2']).AndReturn({})
 
         self.mox.ReplayAll()
@@ -1063,6 +1234,35 @@ class TestNeutronv2(TestNeutronv2Base):
                           api.get_fixed_ip_by_address,
                           self.context, address)
 
+    def test_get_fixed_ip_instance_uuids(self):
+        dhcp_port = {'device_id': 'dhcp-agent', 'device_owner': 'network:dhcp',
+                     'fixed_ips': [{'ip_address': '10.0.1.9'}]}
+        self.moxed_client.list_ports(
+            fields=['device_id', 'device_owner', 'fixed_ips']).AndReturn(
+                {'ports': self.port_data2 + [dhcp_port]})
+        self.mox.ReplayAll()
+        api = neutronapi.API()
+        result = api.get_fixed_ip_instance_uuids(self.context)
+        self.assertEqual({self.port_address: self.instance2['uuid'],
+                          self.port_address2: self.instance['uuid']}, result)
+
+    def test_get_fixed_ip_instance_uuids_skips_shared_addresses(self):
+        ports = [{'device_id': 'instance-a', 'device_owner': 'compute:nova',
+                  'fixed_ips': [{'ip_address': '10.0.1.2'},
+                                {'ip_address': '10.0.2.2'}]},
+                 {'device_id': 'instance-b', 'device_owner': 'compute:nova',
+                  'fixed_ips': [{'ip_address': '10.0.1.2'}]},
+                 {'device_id': 'instance-b', 'device_owner': 'compute:nova',
+                  'fixed_ips': [{'ip_address': '10.0.3.2'}]}]
+        self.moxed_client.list_ports(
+            fields=['device_id', 'device_owner', 'fixed_ips']).AndReturn(
+                {'ports': ports})
+        self.mox.ReplayAll()
+        api = neutronapi.API()
+        result = api.get_fixed_ip_instance_uuids(self.context)
+        self.assertEqual({'10.0.2.2': 'instance-a',
+                          '10.0.3.2': 'instance-b'}, result)
+
     def _get_available_networks(self, prv_nets, pub_nets, req_ids=None):
         api = neutronapi.API()
         nets = prv_nets + pub_nets
@@ -1454,13 +1654,25 @@ class TestNeutronv2(TestNeutronv2Base):
         NeutronNotFound = exceptions.NeutronClientException(
             status_code=404)
         self.moxed_client.list_floatingips(
-            fixed_ip_address='1.1.1.1', port_id=1).AndRaise(NeutronNotFound)
+            port_id=[1]).AndRaise(NeutronNotFound)
         self.mox.ReplayAll()
         neutronv2.get_client('fake')
-        floatingips = api._get_floating_ips_by_fixed_and_port(
-            self.moxed_client, '1.1.1.1', 1)
+        floatingips = api._get_floating_ips_by_ports(self.moxed_client, [1])
         self.assertEqual(floatingips, [])
 
+    def test_list_floating_ips_by_ports_in_chunks(self):
+        self.stubs.Set(neutronapi, 'MAX_IDS_PER_REQUEST', 2)
+        api = neutronapi.API()
+        self.moxed_client.list_floatingips(port_id=[1, 2]).AndReturn(
+            {'floatingips': [{'id': 'fip1'}]})
+        self.moxed_client.list_floatingips(port_id=[3]).AndReturn(
+            {'floatingips': [{'id': 'fip3'}]})
+        self.mox.ReplayAll()
+        neutronv2.get_client('fake')
+        floatingips = api._get_floating_ips_by_ports(self.moxed_client,
+                                                     [1, 2, 3])
+        self.assertEqual(['fip1', 'fip3'], [fip['id'] for fip in floatingips])
+
     def test_nw_info_get_ips(self):
         fake_port = {
             'fixed_ips': [
@@ -1468,37 +1680,53 @@ class TestNeutronv2(TestNeutronv2Base):
             'id': 'port-id',
             }
         api = neutronapi.API()
-        self.mox.StubOutWithMock(api, '_get_floating_ips_by_fixed_and_port')
-        api._get_floating_ips_by_fixed_and_port(
-            self.moxed_client, '1.1.1.1', 'port-id').AndReturn(
-                [{'floating_ip_address': '10.0.0.1'}])
         self.mox.ReplayAll()
         neutronv2.get_client('fake')
-        result = api._nw_info_get_ips(self.moxed_client, fake_port)
+        result = api._nw_info_get_ips(
+                fake_port, {('port-id', '1.1.1.1'): ['10.0.0.1'],
+                            ('other-port-id', '1.1.1.1'): ['10.0.0.2']})
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0]['address'], '1.1.1.1')
+        self.assertEqual(len(result[0]['floating_ips']), 1)
         self.assertEqual(result[0]['floating_ips'][0]['address'], '10.0.0.1')
 
     def test_nw_info_get_subnets(self):
-        fake_port = {
-            'fixed_ips': [
-                {'ip_address': '1.1.1.1'},
-                {'ip_address': '2.2.2.2'}],
-            'id': 'port-id',
-            }
         fake_subnet = model.Subnet(cidr='1.0.0.0/8')
-        fake_ips = [model.IP(x['ip_address']) for x in fake_port['fixed_ips']]
+        fake_ips = [model.IP(x) for x in ['1.1.1.1', '2.2.2.2']]
         api = neutronapi.API()
-        self.mox.StubOutWithMock(api, '_get_subnets_from_port')
-        api._get_subnets_from_port(self.context, fake_port).AndReturn(
-            [fake_subnet])
         self.mox.ReplayAll()
         neutronv2.get_client('fake')
-        subnets = api._nw_info_get_subnets(self.context, fake_port, fake_ips)
+        subnets = api._nw_info_get_subnets([fake_subnet], fake_ips)
         self.assertEqual(len(subnets), 1)
         self.assertEqual(len(subnets[0]['ips']), 1)
         self.assertEqual(subnets[0]['ips'][0]['address'], '1.1.1.1')
 
+    def test_get_subnets_from_ports(self):
+        ports = self.port_data2 + [
+            {'id': 'my_portid4',
+             'fixed_ips': [{'ip_address': '10.0.1.3',
+                            'subnet_id': 'my_subid1'}]}]
+        self.moxed_client.list_subnets(
+            id=['my_subid1', 'my_subid2']).AndReturn(
+                {'subnets': self.subnet_data1 + self.subnet_data2})
+        self.moxed_client.list_ports(
+            network_id=mox.SameElementsAs(['my_netid1', 'my_netid2']),
+            device_owner='network:dhcp').AndReturn(
+                {'ports': self.dhcp_port_data1})
+        self.mox.ReplayAll()
+        api = neutronapi.API()
+        subnets = api._get_subnets_from_ports(self.context, ports)
+        self.assertEqual(set(['my_portid1', 'my_portid2', 'my_portid4']),
+                         set(subnets.keys()))
+        self.assertEqual('10.0.1.0/24', subnets['my_portid1'][0]['cidr'])
+        self.assertEqual('10.0.1.9',
+                         subnets['my_portid1'][0].get_meta('dhcp_server'))
+        self.assertEqual('10.0.2.0/24', subnets['my_portid2'][0]['cidr'])
+        self.assertEqual(None,
+                         subnets['my_portid2'][0].get_meta('dhcp_server'))
+        # Every port gets subnet objects of its own
+        self.assertIsNot(subnets['my_portid1'][0], subnets['my_portid4'][0])
+
     def _test_nw_info_build_network(self, vif_type):
         fake_port = {
             'fixed_ips': [{'ip_address': '1.1.1.1'}],
@@ -1566,13 +1794,14 @@ class TestNeutronv2(TestNeutronv2Base):
         self.moxed_client.list_ports(
             tenant_id='fake', device_id='uuid').AndReturn(
                 {'ports': fake_ports})
-        self.mox.StubOutWithMock(api, '_get_floating_ips_by_fixed_and_port')
-        api._get_floating_ips_by_fixed_and_port(
-            self.moxed_client, '1.1.1.1', 'port0').AndReturn(
-                [{'floating_ip_address': '10.0.0.1'}])
-        self.mox.StubOutWithMock(api, '_get_subnets_from_port')
-        api._get_subnets_from_port(self.context, fake_ports[0]).AndReturn(
-            fake_subnets)
+        self.mox.StubOutWithMock(api, '_get_floating_ips_by_ports')
+        api._get_floating_ips_by_ports(
+            self.moxed_client, ['port0']).AndReturn(
+                [{'port_id': 'port0', 'fixed_ip_address': '1.1.1.1',
+                  'floating_ip_address': '10.0.0.1'}])
+        self.mox.StubOutWithMock(api, '_get_subnets_from_ports')
+        api._get_subnets_from_ports(self.context, [fake_ports[0]]).AndReturn(
+            {'port0': fake_subnets})
         self.mox.ReplayAll()
         neutronv2.get_client('fake')
         nw_info = api._build_network_info_model(self.context, fake_inst,
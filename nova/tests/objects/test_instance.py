@@ -153,11 +153,10 @@ class _TestInstanceObject(object):
                                 columns_to_join=['info_cache',
                                                  'security_groups']
                                 ).AndReturn(self.fake_instance)
-        fake_inst2 = dict(self.fake_instance,
-                          system_metadata=[{'key': 'foo', 'value': 'bar'}])
-        db.instance_get_by_uuid(self.context, fake_uuid,
-                                columns_to_join=['system_metadata']
-                                ).AndReturn(fake_inst2)
+        self.mox.StubOutWithMock(
+            db, 'instance_system_metadata_get_by_instance_uuids')
+        db.instance_system_metadata_get_by_instance_uuids(
+            self.context, [fake_uuid]).AndReturn({fake_uuid: {'foo': 'bar'}})
         self.mox.ReplayAll()
         inst = instance.Instance.get_by_uuid(self.context, fake_uuid)
         self.assertFalse(hasattr(inst, '_system_metadata'))
@@ -169,6 +168,39 @@ class _TestInstanceObject(object):
         self.assertEqual(sys_meta2, {'foo': 'bar'})
         self.assertRemotes()
 
+    def test_load_empty(self):
+        fake_instance = self.fake_instance
+        fake_instance['metadata'] = []
+        self.mox.StubOutWithMock(db, 'instance_metadata_get_by_instance_uuids')
+        self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
+        db.instance_metadata_get_by_instance_uuids(
+            self.context, ['fake-uuid']).AndReturn({'fake-uuid': {}})
+        db.instance_get_by_uuid(self.context, 'fake-uuid',
+                                columns_to_join=['metadata']
+                                ).AndReturn(fake_instance)
+        self.mox.ReplayAll()
+        inst = instance.Instance()
+        inst.uuid = 'fake-uuid'
+        inst._context = self.context
+        self.assertEqual({}, inst.metadata)
+        self.assertRemotes()
+
+    def test_load_deleted(self):
+        self.mox.StubOutWithMock(db, 'instance_metadata_get_by_instance_uuids')
+        self.mox.StubOutWithMock(db, 'instance_get_by_uuid')
+        db.instance_metadata_get_by_instance_uuids(
+            self.context, ['fake-uuid']).AndReturn({'fake-uuid': {}})
+        db.instance_get_by_uuid(self.context, 'fake-uuid',
+                                columns_to_join=['metadata']
+                                ).AndRaise(exception.InstanceNotFound(
+                                    instance_id='fake-uuid'))
+        self.mox.ReplayAll()
+        inst = instance.Instance()
+        inst.uuid = 'fake-uuid'
+        inst._context = self.context
+        self.assertRaises(exception.InstanceNotFound,
+                          inst.obj_load_attr, 'metadata')
+
     def test_load_invalid(self):
         inst = instance.Instance()
         inst.uuid = 'fake-uuid'
@@ -760,6 +792,18 @@ class _TestInstanceListObject(object):
         self.assertEqual(inst_list.obj_what_changed(), set())
         self.assertRemotes()
 
+    def test_get_by_host_use_slave(self):
+        fakes = [self.fake_instance(1)]
+        self.mox.StubOutWithMock(db, 'instance_get_all_by_host')
+        db.instance_get_all_by_host(self.context, 'foo',
+                                    columns_to_join=None,
+                                    use_slave=True).AndReturn(fakes)
+        self.mox.ReplayAll()
+        inst_list = instance.InstanceList.get_by_host(self.context, 'foo',
+                                                      use_slave=True)
+        self.assertEqual(inst_list.objects[0].uuid, fakes[0]['uuid'])
+        self.assertRemotes()
+
     def test_get_by_host_and_node(self):
         fakes = [self.fake_instance(1),
                  self.fake_instance(2)]
@@ -867,6 +911,115 @@ class _TestInstanceListObject(object):
         for inst in inst_list:
             self.assertEqual(inst.obj_what_changed(), set())
 
+    def test_get_attrs_by_uuids(self):
+        self.mox.StubOutWithMock(db, 'instance_metadata_get_by_instance_uuids')
+        self.mox.StubOutWithMock(db,
+                                 'instance_info_cache_get_by_instance_uuids')
+        db.instance_metadata_get_by_instance_uuids(
+            self.context, ['uuid1', 'uuid2']).AndReturn(
+                {'uuid1': {'foo': 'bar'}, 'uuid2': {}})
+        db.instance_info_cache_get_by_instance_uuids(
+            self.context, ['uuid1', 'uuid2']).AndReturn(
+                {'uuid1': {'instance_uuid': 'uuid1', 'network_info': '[]'},
+                 'uuid2': None})
+        self.mox.ReplayAll()
+        inst_list = instance.InstanceList.get_attrs_by_uuids(
+            self.context, ['uuid1', 'uuid2'], ['metadata', 'info_cache'])
+        self.assertEqual(['uuid1', 'uuid2'], [inst.uuid for inst in inst_list])
+        self.assertEqual({'foo': 'bar'}, inst_list[0].metadata)
+        self.assertEqual({}, inst_list[1].metadata)
+        self.assertEqual('uuid1', inst_list[0].info_cache.instance_uuid)
+        self.assertEqual(None, inst_list[1].info_cache)
+        for inst in inst_list:
+            self.assertFalse(inst.obj_attr_is_set('host'))
+        self.assertRemotes()
+
+    def test_fill(self):
+        self.mox.StubOutWithMock(
+            db, 'instance_system_metadata_get_by_instance_uuids')
+        inst1 = instance.Instance()
+        inst1.uuid = 'uuid1'
+        inst1.system_metadata = {'foo': 'bar'}
+        inst2 = instance.Instance()
+        inst2.uuid = 'uuid2'
+        insts = [inst1, inst2]
+        for inst in insts:
+            inst.obj_reset_changes()
+        db.instance_system_metadata_get_by_instance_uuids(
+            self.context, ['uuid2']).AndReturn({'uuid2': {'baz': 'qux'}})
+        self.mox.ReplayAll()
+        inst_list = instance.InstanceList()
+        inst_list._context = self.context
+        inst_list.objects = insts
+        inst_list.fill(['system_metadata'])
+        self.assertEqual({'foo': 'bar'}, inst_list[0].system_metadata)
+        self.assertEqual({'baz': 'qux'}, inst_list[1].system_metadata)
+        for inst in inst_list:
+            self.assertEqual(inst.obj_what_changed(), set())
+        # Everything is loaded now, so this does not query again
+        inst_list.fill(['system_metadata'])
+
+    def _create_instances(self, num_instances):
+        for i in range(num_instances):
+            db.instance_create(self.context, {
+                'host': 'fake-host',
+                'user_id': self.context.user_id,
+                'project_id': self.context.project_id})
+        return instance.InstanceList.get_by_filters(self.context,
+                                                    {'host': 'fake-host'})
+
+    def test_fill_deleted(self):
+        inst_list = self._create_instances(2)
+        for inst in inst_list:
+            db.instance_metadata_update(self.context, inst.uuid,
+                                        {'foo': inst.uuid}, False)
+        db.instance_destroy(self.context, inst_list[1].uuid)
+        inst_list.fill(['metadata'])
+        # The metadata of the deleted instance was deleted along with it
+        self.assertEqual([{'foo': inst_list[0].uuid}, {}],
+                         [inst.metadata for inst in inst_list])
+        self.assertEqual('no', self.context.read_deleted)
+
+    def test_refresh_all(self):
+        inst_list = self._create_instances(3)
+        db.instance_update(self.context, inst_list[0].uuid,
+                           {'display_name': 'foo'})
+        db.instance_destroy(self.context, inst_list[1].uuid)
+        inst_list[2].display_name = 'bar'
+        failures = inst_list.refresh_all()
+        self.assertEqual([inst_list[1].uuid], failures.keys())
+        self.assertTrue(isinstance(failures[inst_list[1].uuid],
+                                   exception.InstanceNotFound))
+        self.assertEqual('foo', inst_list[0].display_name)
+        self.assertEqual(None, inst_list[2].display_name)
+        self.assertEqual(set(), inst_list[2].obj_what_changed())
+        self.assertRemotes()
+
+    def test_save_all(self):
+        inst_list = self._create_instances(3)
+        db.instance_update(self.context, inst_list[1].uuid,
+                           {'task_state': 'rebooting'})
+        for inst in inst_list:
+            inst.display_name = 'foo'
+        failures = inst_list.save_all(expected_task_state=[None])
+        self.assertEqual([inst_list[1].uuid], failures.keys())
+        self.assertTrue(isinstance(failures[inst_list[1].uuid],
+                                   exception.UnexpectedTaskStateError))
+        self.assertEqual(set(['display_name']),
+                         inst_list[1].obj_what_changed())
+        for inst in (inst_list[0], inst_list[2]):
+            self.assertEqual(set(), inst.obj_what_changed())
+            self.assertEqual('foo', db.instance_get_by_uuid(
+                self.context, inst.uuid)['display_name'])
+        self.assertRemotes()
+
+    def test_fill_invalid(self):
+        inst_list = instance.InstanceList()
+        inst_list._context = self.context
+        inst_list.objects = []
+        self.assertRaises(exception.ObjectActionError,
+                          inst_list.fill, ['host'])
+
 
 class TestInstanceListObject(test_objects._LocalTest,
                              _TestInstanceListObject):
@@ -63,6 +63,14 @@ class MyObj(base.NovaPersistentObject, base.NovaObject):
         else:
             self.bar = 'updated'
 
+    @base.remotable
+    def update_unless(self, context, foo):
+        if self.foo == foo:
+            raise exception.ObjectActionError(action='update_unless',
+                                              reason='foo is %s' % foo)
+        self.bar = 'updated'
+        return self.foo
+
     @base.remotable
     def save(self, context):
         self.obj_reset_changes()
@@ -536,6 +544,25 @@ class _TestObject(object):
         self.assertEqual(obj.bar, 'updated')
         self.assertRemotes()
 
+    def test_batch_action(self):
+        objs = [MyObj.query(self.context) for i in range(3)]
+        objs[1].foo = 2
+        results = base.obj_batch_action(self.context, objs, 'update_unless',
+                                        2)
+        self.assertEqual(1, results[0])
+        self.assertTrue(isinstance(results[1],
+                                   exception.ObjectActionError))
+        self.assertEqual(1, results[2])
+        self.assertEqual(['updated', 'bar', 'updated'],
+                         [obj.bar for obj in objs])
+        self.assertEqual(set(['bar']), objs[0].obj_what_changed())
+        self.assertEqual(set(['foo']), objs[1].obj_what_changed())
+        self.assertRemotes()
+
+    def test_batch_action_no_objects(self):
+        self.assertEqual([], base.obj_batch_action(self.context, [],
+                                                   'marco'))
+
     def test_base_attributes(self):
         dt = datetime.datetime(1955, 11, 5)
         obj = MyObj()
@@ -645,6 +672,40 @@ class TestRemoteObject(_RemoteTest, _TestObject):
         self.assertEqual(obj.bar, 'bar')
         self.assertRemotes()
 
+    def test_batch_action_below_version_cap(self):
+        self.flags(conductor='1.59', group='upgrade_levels')
+        base.NovaObject.indirection_api = conductor_rpcapi.ConductorAPI()
+        self.mox.StubOutWithMock(self.conductor_service.manager,
+                                 'object_action_batch')
+        self.mox.ReplayAll()
+        objs = [MyObj.query(self.context) for i in range(2)]
+        objs[1].foo = 2
+        results = base.obj_batch_action(self.context, objs, 'update_unless',
+                                        2)
+        self.assertEqual(1, results[0])
+        self.assertTrue(isinstance(results[1],
+                                   exception.ObjectActionError))
+        self.assertEqual(['updated', 'bar'], [obj.bar for obj in objs])
+        self.assertEqual(['update_unless', 'update_unless'],
+                         [call[1] for call in self.remote_object_calls[2:]])
+
+
+class TestCompactRemoteObject(_RemoteTest, _TestObject):
+    def _testable_conductor(self):
+        self.flags(compact_objects=True, group='conductor')
+        super(TestCompactRemoteObject, self)._testable_conductor()
+
+    def test_compact_format_is_used(self):
+        serializer = base.NovaObject.indirection_api.serializer
+        self.assertTrue(serializer.compact)
+
+    def test_not_used_below_version_cap(self):
+        self.flags(conductor='1.58', group='upgrade_levels')
+        self.assertFalse(conductor_rpcapi.ConductorAPI().compact_objects)
+        obj = MyObj.query(self.context)
+        obj.update_test(self.context)
+        self.assertEqual(obj.bar, 'updated')
+
 
 class TestObjectListBase(test.TestCase):
     def test_list_like_operations(self):
@@ -716,3 +777,90 @@ class TestObjectSerializer(_BaseTestCase):
             self.assertEqual(1, len(thing2))
             for item in thing2:
                 self.assertTrue(isinstance(item, MyObj))
+
+    def test_compact_object_serialization(self):
+        ser = base.NovaObjectSerializer(compact=True)
+        obj = MyObj()
+        obj.foo = 1
+        obj.bar = 'bar'
+        obj.obj_reset_changes()
+        obj.created_at = datetime.datetime(1955, 11, 5, 12, 30, 10)
+        obj.deleted_at = None
+        primitive = ser.serialize_entity(self.context, obj)
+        self.assertTrue(base.is_compact_primitive(primitive))
+        objname, objver, data, changes = primitive['nova_object.compact']
+        self.assertEqual(('MyObj', '1.5'), (objname, objver))
+        self.assertTrue(-446729390 in data)
+        obj2 = ser.deserialize_entity(self.context, primitive)
+        self.assertTrue(isinstance(obj2, MyObj))
+        self.assertEqual(self.context, obj2._context)
+        self.assertEqual(1, obj2.foo)
+        self.assertEqual('bar', obj2.bar)
+        self.assertEqual(obj.created_at, obj2.created_at)
+        self.assertEqual(None, obj2.deleted_at)
+        self.assertFalse(obj2.obj_attr_is_set('missing'))
+        self.assertEqual(set(['created_at', 'deleted_at']),
+                         obj2.obj_what_changed())
+
+    def test_compact_serialization_from_older_version(self):
+        class OldMyObj(base.NovaPersistentObject, base.NovaObject):
+            version = '1.4'
+            fields = {'foo': int,
+                      'bar': str,
+                      }
+
+            @classmethod
+            def obj_name(cls):
+                return 'MyObj'
+
+        # Only the newer version is known on the receiving side
+        base.NovaObject._obj_classes['MyObj'].remove(OldMyObj)
+        obj = OldMyObj()
+        obj.foo = 1
+        obj.bar = 'bar'
+        obj.obj_reset_changes()
+        obj.updated_at = datetime.datetime(1955, 11, 5, 12, 30, 10)
+        obj2 = base.NovaObject.obj_from_compact_primitive(
+            obj.obj_to_compact_primitive())
+        self.assertTrue(isinstance(obj2, MyObj))
+        self.assertEqual(1, obj2.foo)
+        self.assertEqual('bar', obj2.bar)
+        self.assertEqual(obj.updated_at, obj2.updated_at)
+        self.assertFalse(obj2.obj_attr_is_set('missing'))
+        self.assertEqual(set(['updated_at']), obj2.obj_what_changed())
+
+    def test_compact_serialization_of_selected_fields(self):
+        obj = MyObj()
+        obj.foo = 1
+        obj.obj_reset_changes()
+        obj.bar = 'bar'
+        obj2 = base.NovaObject.obj_from_compact_primitive(
+            obj.obj_to_compact_primitive(fields=['bar']))
+        self.assertFalse(obj2.obj_attr_is_set('foo'))
+        self.assertEqual('bar', obj2.bar)
+        self.assertEqual(set(['bar']), obj2.obj_what_changed())
+
+    def test_compact_serialization_of_nested_objects(self):
+        class Foo(base.ObjectListBase, base.NovaObject):
+            pass
+
+        class Bar(base.NovaObject):
+            fields = {'foo': str}
+
+        obj = Foo()
+        obj.objects = []
+        for i in 'abc':
+            bar = Bar()
+            bar.foo = i
+            obj.objects.append(bar)
+        obj2 = base.NovaObject.obj_from_compact_primitive(
+            obj.obj_to_compact_primitive())
+        self.assertEqual(['a', 'b', 'c'], [x.foo for x in obj2])
+
+    def test_compact_unknown_fields_are_ignored(self):
+        primitive = MyObj().obj_to_compact_primitive()
+        primitive['nova_object.compact'][2].extend(('newer', 'value'))
+        primitive['nova_object.compact'][3].append('newer')
+        obj = base.NovaObject.obj_from_compact_primitive(primitive)
+        self.assertFalse(hasattr(obj, 'newer'))
+        self.assertEqual(set(), obj.obj_what_changed())
@@ -28,6 +28,7 @@ from nova.pci import pci_stats
 from nova.scheduler import filters
 from nova.scheduler.filters import extra_specs_ops
 from nova.scheduler.filters import trusted_filter
+from nova.scheduler import host_manager
 from nova import servicegroup
 from nova import test
 from nova.tests.scheduler import fakes
@@ -399,6 +400,55 @@ class HostFiltersTestCase(test.NoDBTestCase):
 
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_affinity_filters_look_up_instance_hosts_once(self):
+        same_filter = self.class_map['SameHostFilter']()
+        different_filter = self.class_map['DifferentHostFilter']()
+        instance1 = fakes.FakeInstance(context=self.context,
+                                       params={'host': 'host1'})
+        instance2 = fakes.FakeInstance(context=self.context,
+                                       params={'host': 'host2'})
+        hosts = [fakes.FakeHostState('host%d' % i, 'node%d' % i, {})
+                 for i in xrange(1, 4)]
+        filter_properties = {'context': self.context.elevated(),
+                             'scheduler_hints': {
+                                 'same_host': [instance1.uuid],
+                                 'different_host': [instance2.uuid]}}
+
+        get_all = same_filter.compute_api.get_all
+        calls = []
+
+        def fake_get_all(context, search_opts):
+            calls.append(search_opts)
+            return get_all(context, search_opts)
+
+        self.stubs.Set(same_filter.compute_api, 'get_all', fake_get_all)
+        self.stubs.Set(different_filter.compute_api, 'get_all', fake_get_all)
+
+        self.assertEqual([hosts[0]],
+                         list(same_filter.filter_all(hosts,
+                                                     filter_properties)))
+        self.assertEqual([hosts[0], hosts[2]],
+                         list(different_filter.filter_all(hosts,
+                                                          filter_properties)))
+        self.assertEqual([{'uuid': [instance1.uuid], 'deleted': False},
+                          {'uuid': [instance2.uuid], 'deleted': False}],
+                         calls)
+        self.assertEqual({instance1.uuid: 'host1', instance2.uuid: 'host2'},
+                         filter_properties['affinity_instance_hosts'])
+
+    def test_affinity_filters_skip_hosts_without_hint(self):
+        hosts = [fakes.FakeHostState('host1', 'node1', {})]
+        filter_properties = {'context': self.context.elevated(),
+                             'scheduler_hints': {}}
+        for name in ('SameHostFilter', 'DifferentHostFilter'):
+            filt_cls = self.class_map[name]()
+            self.mox.StubOutWithMock(filt_cls, 'host_passes')
+            self.mox.StubOutWithMock(filt_cls.compute_api, 'get_all')
+            self.mox.ReplayAll()
+            self.assertEqual(hosts,
+                             filt_cls.filter_all(hosts, filter_properties))
+            self.mox.UnsetStubs()
+
     def test_affinity_simple_cidr_filter_passes(self):
         filt_cls = self.class_map['SimpleCIDRAffinityFilter']()
         host = fakes.FakeHostState('host1', 'node1', {})
@@ -528,6 +578,19 @@ class HostFiltersTestCase(test.NoDBTestCase):
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
         self.assertEqual(2048 * 2.0, host.limits['memory_mb'])
 
+    def test_ram_filter_filter_all(self):
+        filt_cls = self.class_map['RamFilter']()
+        self.flags(ram_allocation_ratio=2.0)
+        filter_properties = {'instance_type': {'memory_mb': 1024}}
+        host1 = fakes.FakeHostState('host1', 'node1',
+                {'free_ram_mb': -1024, 'total_usable_ram_mb': 2048})
+        host2 = fakes.FakeHostState('host2', 'node2',
+                {'free_ram_mb': -1025, 'total_usable_ram_mb': 2048})
+        self.assertEqual([host1], list(filt_cls.filter_all([host1, host2],
+                                                           filter_properties)))
+        self.assertEqual(2048 * 2.0, host1.limits['memory_mb'])
+        self.assertNotIn('memory_mb', host2.limits)
+
     def test_aggregate_ram_filter_value_error(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['AggregateRamFilter']()
@@ -634,6 +697,19 @@ class HostFiltersTestCase(test.NoDBTestCase):
                  'service': service})
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_disk_filter_filter_all(self):
+        filt_cls = self.class_map['DiskFilter']()
+        self.flags(disk_allocation_ratio=10.0)
+        filter_properties = {'instance_type': {'root_gb': 100,
+                                               'ephemeral_gb': 19}}
+        host1 = fakes.FakeHostState('host1', 'node1',
+                {'free_disk_mb': 11 * 1024, 'total_usable_disk_gb': 12})
+        host2 = fakes.FakeHostState('host2', 'node2',
+                {'free_disk_mb': 10 * 1024, 'total_usable_disk_gb': 12})
+        self.assertEqual([host1], list(filt_cls.filter_all([host1, host2],
+                                                           filter_properties)))
+        self.assertEqual(12 * 10.0, host1.limits['disk_gb'])
+
     def test_compute_filter_fails_on_service_disabled(self):
         self._stub_service_is_up(True)
         filt_cls = self.class_map['ComputeFilter']()
@@ -829,6 +905,45 @@ class HostFiltersTestCase(test.NoDBTestCase):
         db.aggregate_host_delete(self.context.elevated(), agg2['id'], 'host1')
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_aggregate_filters_share_aggregate_metadata_index(self):
+        self._stub_service_is_up(True)
+        ctxt = self.context.elevated()
+        self._create_aggregate_with_host(metadata={'opt1': '1',
+                                                   'filter_tenant_id': 'fake'})
+        self._create_aggregate_with_host(name='fake2', hosts=['host2'],
+                                         metadata={'opt1': '2'})
+        metadata_by_host = db.aggregate_metadata_get_all_by_host(ctxt)
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_by_host')
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_all_by_host')
+        db.aggregate_metadata_get_all_by_host(ctxt).AndReturn(
+                metadata_by_host)
+        self.mox.ReplayAll()
+
+        index = host_manager.AggregateMetadataIndex(ctxt)
+        host1 = fakes.FakeHostState('host1', 'node1',
+                {'aggregate_metadata_index': index})
+        host2 = fakes.FakeHostState('host2', 'node2',
+                {'aggregate_metadata_index': index})
+        filter_properties = {'context': self.context,
+                'instance_type': {'memory_mb': 1024,
+                                  'extra_specs': {'opt1': '1'}},
+                'request_spec': {'instance_properties': {
+                    'availability_zone': 'fake_avail_zone',
+                    'project_id': 'fake'}}}
+        extra_specs_filter = self.class_map[
+                'AggregateInstanceExtraSpecsFilter']()
+        az_filter = self.class_map['AvailabilityZoneFilter']()
+        tenant_filter = self.class_map['AggregateMultiTenancyIsolation']()
+
+        self.assertTrue(extra_specs_filter.host_passes(host1,
+                                                       filter_properties))
+        self.assertFalse(extra_specs_filter.host_passes(host2,
+                                                        filter_properties))
+        self.assertTrue(az_filter.host_passes(host1, filter_properties))
+        self.assertTrue(az_filter.host_passes(host2, filter_properties))
+        self.assertTrue(tenant_filter.host_passes(host1, filter_properties))
+        self.assertTrue(tenant_filter.host_passes(host2, filter_properties))
+
     def test_aggregate_filter_passes_extra_specs_simple(self):
         especs = {
             # Un-scoped extra spec
@@ -1341,6 +1456,21 @@ class HostFiltersTestCase(test.NoDBTestCase):
                 {'vcpus_total': 4, 'vcpus_used': 8})
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_core_filter_filter_all(self):
+        filt_cls = self.class_map['CoreFilter']()
+        filter_properties = {'instance_type': {'vcpus': 1}}
+        self.flags(cpu_allocation_ratio=2)
+        host1 = fakes.FakeHostState('host1', 'node1',
+                {'vcpus_total': 4, 'vcpus_used': 7})
+        host2 = fakes.FakeHostState('host2', 'node2',
+                {'vcpus_total': 4, 'vcpus_used': 8})
+        host3 = fakes.FakeHostState('host3', 'node3', {})
+        hosts = [host1, host2, host3]
+        self.assertEqual([host1, host3],
+                         list(filt_cls.filter_all(hosts, filter_properties)))
+        self.assertEqual(8, host1.limits['vcpu'])
+        self.assertEqual(hosts, list(filt_cls.filter_all(hosts, {})))
+
     def test_aggregate_core_filter_value_error(self):
         filt_cls = self.class_map['AggregateCoreFilter']()
         filter_properties = {'context': self.context,
@@ -1474,6 +1604,16 @@ class HostFiltersTestCase(test.NoDBTestCase):
         filter_properties = {}
         self.assertFalse(filt_cls.host_passes(host, filter_properties))
 
+    def test_filter_num_instances_filter_all(self):
+        self.flags(max_instances_per_host=5)
+        filt_cls = self.class_map['NumInstancesFilter']()
+        host1 = fakes.FakeHostState('host1', 'node1',
+                                    {'num_instances': 4})
+        host2 = fakes.FakeHostState('host2', 'node2',
+                                    {'num_instances': 5})
+        self.assertEqual([host1], list(filt_cls.filter_all([host1, host2],
+                                                           {})))
+
     def test_group_anti_affinity_filter_passes(self):
         filt_cls = self.class_map['GroupAntiAffinityFilter']()
         host = fakes.FakeHostState('host1', 'node1', {})
@@ -15,6 +15,8 @@
 """
 Tests For HostManager
 """
+import datetime
+
 from nova.compute import task_states
 from nova.compute import vm_states
 from nova import db
@@ -357,6 +359,30 @@ class HostManagerTestCase(test.NoDBTestCase):
         self.assertEqual(host_states_map[('host4', 'node4')].free_disk_mb,
                          8388608)
 
+    def test_get_all_host_states_share_aggregate_metadata_index(self):
+        context = 'fake_context'
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'aggregate_metadata_get_all_by_host')
+        db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
+        db.aggregate_metadata_get_all_by_host(context).AndReturn(
+                {'host1': {'foo': set(['bar']), 'baz': set(['qux'])}})
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(context)
+        host_states_map = self.host_manager.host_state_map
+        host1 = host_states_map[('host1', 'node1')]
+        host2 = host_states_map[('host2', 'node2')]
+        self.assertTrue(host1.aggregate_metadata_index is
+                        host2.aggregate_metadata_index)
+
+        index = host1.aggregate_metadata_index
+        self.assertEqual({'foo': set(['bar']), 'baz': set(['qux'])},
+                         index.get('host1'))
+        self.assertEqual({'foo': set(['bar'])}, index.get('host1', key='foo'))
+        self.assertEqual({}, index.get('host1', key='missing'))
+        self.assertEqual({}, index.get('host2'))
+
 
 class HostManagerChangedNodesTestCase(test.NoDBTestCase):
     """Test case for HostManager class."""
@@ -416,6 +442,104 @@ class HostManagerChangedNodesTestCase(test.NoDBTestCase):
         self.assertEqual(len(host_states_map), 0)
 
 
+class HostManagerIncrementalRefreshTestCase(test.NoDBTestCase):
+    """Test case for the incremental host state refresh."""
+
+    def setUp(self):
+        super(HostManagerIncrementalRefreshTestCase, self).setUp()
+        self.flags(scheduler_incremental_host_refresh=True)
+        self.host_manager = host_manager.HostManager()
+        self.context = 'fake_context'
+        self.addCleanup(timeutils.clear_time_override)
+        timeutils.set_time_override()
+        self.t0 = timeutils.utcnow()
+        self.services = [dict(id=i, host='host%d' % i, disabled=False,
+                              binary='nova-compute')
+                         for i in xrange(1, 4)]
+        self.nodes = [self._node(i, self.t0) for i in xrange(1, 4)]
+
+    def _node(self, i, updated_at, free_ram_mb=512, deleted=0):
+        return dict(id=i, local_gb=1024, memory_mb=1024, vcpus=1,
+                    disk_available_least=512, free_ram_mb=free_ram_mb,
+                    vcpus_used=1, local_gb_used=0, host_ip='127.0.0.1',
+                    created_at=self.t0, updated_at=updated_at,
+                    deleted_at=None, deleted=deleted,
+                    hypervisor_hostname='node%d' % i,
+                    service=self.services[i - 1])
+
+    def test_get_all_host_states_only_fetches_changed_nodes(self):
+        t1 = self.t0 + datetime.timedelta(seconds=30)
+        changed_nodes = [self._node(1, t1, free_ram_mb=256),
+                         self._node(3, self.t0, deleted=3)]
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        db.compute_node_get_all(self.context).AndReturn(self.nodes)
+        db.compute_node_get_all(self.context, changed_since=self.t0).AndReturn(
+                changed_nodes)
+        db.service_get_all(self.context).AndReturn(
+                [dict(self.services[0], disabled=True), self.services[1],
+                 dict(id=4, host='host4', binary='nova-network')])
+        db.compute_node_get_all(self.context, changed_since=t1).AndReturn([])
+        db.service_get_all(self.context).AndReturn(self.services[:2])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(self.context)
+        host2 = self.host_manager.host_state_map[('host2', 'node2')]
+        self.host_manager.get_all_host_states(self.context)
+        host_states_map = self.host_manager.host_state_map
+
+        self.assertEqual(set([('host1', 'node1'), ('host2', 'node2')]),
+                         set(host_states_map.keys()))
+        host1 = host_states_map[('host1', 'node1')]
+        self.assertEqual(256, host1.free_ram_mb)
+        self.assertTrue(host1.service['disabled'])
+        self.assertTrue(host2 is host_states_map[('host2', 'node2')])
+        self.assertTrue(host1.aggregate_metadata_index is
+                        host2.aggregate_metadata_index)
+
+        self.host_manager.get_all_host_states(self.context)
+        self.assertEqual(2, len(self.host_manager.host_state_map))
+
+    def test_get_all_host_states_drops_nodes_of_deleted_services(self):
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        db.compute_node_get_all(self.context).AndReturn(self.nodes)
+        db.compute_node_get_all(self.context, changed_since=self.t0).AndReturn(
+                [])
+        db.service_get_all(self.context).AndReturn(self.services[1:])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(self.context)
+        self.host_manager.get_all_host_states(self.context)
+        self.assertEqual(set([('host2', 'node2'), ('host3', 'node3')]),
+                         set(self.host_manager.host_state_map.keys()))
+
+    def test_get_all_host_states_full_refresh_after_interval(self):
+        self.flags(scheduler_full_host_refresh_interval=60)
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(self.context).AndReturn(self.nodes)
+        db.compute_node_get_all(self.context).AndReturn(self.nodes[:1])
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(self.context)
+        timeutils.advance_time_seconds(61)
+        self.host_manager.get_all_host_states(self.context)
+        self.assertEqual([('host1', 'node1')],
+                         self.host_manager.host_state_map.keys())
+
+    def test_get_all_host_states_disabled(self):
+        self.flags(scheduler_incremental_host_refresh=False)
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        db.compute_node_get_all(self.context).AndReturn(self.nodes)
+        db.compute_node_get_all(self.context).AndReturn(self.nodes)
+        self.mox.ReplayAll()
+
+        self.host_manager.get_all_host_states(self.context)
+        self.host_manager.get_all_host_states(self.context)
+        self.assertEqual(3, len(self.host_manager.host_state_map))
+
+
 class HostStateTestCase(test.NoDBTestCase):
     """Test case for HostState class."""
 
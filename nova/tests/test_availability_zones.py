@@ -137,6 +137,17 @@ class AvailabilityZoneTestCases(test.TestCase):
         self.assertEquals(self.availability_zone,
                         az.get_host_availability_zone(self.context, self.host))
 
+    def test_get_host_availability_zones(self):
+        """Test get right availability zones of given hosts."""
+        service = self._create_service_with_topic('compute', self.host)
+        self._add_to_aggregate(service, self.agg)
+
+        self.assertEquals({self.host: self.availability_zone,
+                           'other': self.default_az,
+                           None: self.default_az},
+                          az.get_host_availability_zones(
+                              self.context, [self.host, 'other', None]))
+
     def test_update_host_availability_zone(self):
         """Test availability zone could be update by given host."""
         service = self._create_service_with_topic('compute', self.host)
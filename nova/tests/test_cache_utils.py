@@ -0,0 +1,104 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nova import cache_utils
+from nova.openstack.common import memorycache
+from nova.openstack.common import timeutils
+from nova import test
+
+
+class CacheClientTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(CacheClientTestCase, self).setUp()
+        self.flags(memorycache_max_entries=3)
+        self.client = cache_utils.Client()
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+
+    def _stats(self):
+        return self.client.get_stats()[0][1]
+
+    def test_set_get_delete(self):
+        self.assertTrue(self.client.set('a', 'foo'))
+        self.assertEqual('foo', self.client.get('a'))
+        self.client.set('a', 'bar')
+        self.assertEqual('bar', self.client.get('a'))
+        self.client.delete('a')
+        self.assertEqual(None, self.client.get('a'))
+        self.client.delete('a')
+
+    def test_expiry(self):
+        self.client.set('a', 'foo', time=10)
+        self.client.set('b', 'bar')
+        timeutils.advance_time_seconds(9)
+        self.assertEqual('foo', self.client.get('a'))
+        timeutils.advance_time_seconds(1)
+        self.assertEqual(None, self.client.get('a'))
+        self.assertEqual('bar', self.client.get('b'))
+        self.assertEqual(1, self._stats()['curr_items'])
+
+    def test_evicts_least_recently_used(self):
+        for key in ('a', 'b', 'c'):
+            self.client.set(key, key)
+        self.client.get('a')
+        self.client.set('d', 'd')
+        self.assertEqual(None, self.client.get('b'))
+        for key in ('a', 'c', 'd'):
+            self.assertEqual(key, self.client.get(key))
+        stats = self._stats()
+        self.assertEqual(4, stats['get_hits'])
+        self.assertEqual(1, stats['get_misses'])
+        self.assertEqual(1, stats['evictions'])
+        self.assertEqual(3, stats['curr_items'])
+
+    def test_expired_keys_are_not_counted_as_evictions(self):
+        self.client.set('a', 'a', time=1)
+        self.client.set('b', 'b')
+        self.client.set('c', 'c')
+        timeutils.advance_time_seconds(1)
+        self.client.set('d', 'd')
+        self.assertEqual(0, self._stats()['evictions'])
+
+    def test_unbounded(self):
+        self.flags(memorycache_max_entries=0)
+        client = cache_utils.Client()
+        for i in xrange(10):
+            client.set(i, i)
+        self.assertEqual(0, client.get(0))
+
+    def test_expired_keys_are_swept(self):
+        self.flags(memorycache_max_entries=0)
+        client = cache_utils.Client()
+        client.set('a', 'a', time=1)
+        client.set('b', 'b')
+        timeutils.advance_time_seconds(cache_utils.SWEEP_INTERVAL)
+        client.get('b')
+        self.assertEqual(['b'], client.cache.keys())
+
+    def test_add_and_incr(self):
+        self.assertTrue(self.client.add('a', '1'))
+        self.assertFalse(self.client.add('a', '2'))
+        self.assertEqual(3, self.client.incr('a', delta=2))
+        self.assertEqual('3', self.client.get('a'))
+        self.assertEqual(None, self.client.incr('b'))
+
+    def test_get_client(self):
+        self.assertTrue(isinstance(cache_utils.get_client(),
+                                   cache_utils.Client))
+        self.stubs.Set(memorycache, 'get_client',
+                       lambda memcached_servers=None: 'memcache')
+        self.assertEqual('memcache', cache_utils.get_client())
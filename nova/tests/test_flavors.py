@@ -23,6 +23,7 @@ from nova import db
 from nova.db.sqlalchemy import models
 from nova import exception
 from nova.openstack.common.db.sqlalchemy import session as sql_session
+from nova.openstack.common import timeutils
 from nova import test
 
 
@@ -537,3 +538,122 @@ class CreateInstanceTypeTest(test.TestCase):
         self.assertRaises(exception.InstanceTypeIdExists,
                           flavors.create,
                           'flavor2', 64, 1, 120, flavorid='flavorid')
+
+
+class FlavorCacheTest(test.TestCase):
+    def setUp(self):
+        super(FlavorCacheTest, self).setUp()
+        self.flags(flavor_cache_seconds=60)
+        self.stubs.Set(flavors, 'MC', None)
+        flavors.invalidate_cache()
+        self.addCleanup(flavors.invalidate_cache)
+        self.addCleanup(timeutils.clear_time_override)
+        self.flavor = flavors.create('cached', 256, 1, 10, flavorid='c1')
+        self.lookups = 0
+        orig_flavor_get_by_flavor_id = db.flavor_get_by_flavor_id
+
+        def fake_flavor_get_by_flavor_id(*args):
+            self.lookups += 1
+            return orig_flavor_get_by_flavor_id(*args)
+
+        self.stubs.Set(db, 'flavor_get_by_flavor_id',
+                       fake_flavor_get_by_flavor_id)
+
+    def test_lookups_are_cached(self):
+        flavor = flavors.get_flavor_by_flavor_id('c1')
+        self.assertEqual(self.flavor['id'], flavor['id'])
+        flavor['extra_specs']['changed'] = 'by the caller'
+        flavor = flavors.get_flavor_by_flavor_id('c1')
+        self.assertEqual({}, flavor['extra_specs'])
+        self.assertEqual(1, self.lookups)
+
+    def test_cache_disabled(self):
+        self.flags(flavor_cache_seconds=0)
+        flavors.get_flavor_by_flavor_id('c1')
+        flavors.get_flavor_by_flavor_id('c1')
+        self.assertEqual(2, self.lookups)
+
+    def test_entries_expire(self):
+        timeutils.set_time_override()
+        flavors.get_flavor_by_flavor_id('c1')
+        timeutils.advance_time_seconds(59)
+        flavors.get_flavor_by_flavor_id('c1')
+        self.assertEqual(1, self.lookups)
+        timeutils.advance_time_seconds(1)
+        flavors.get_flavor_by_flavor_id('c1')
+        self.assertEqual(2, self.lookups)
+
+    def test_changes_invalidate_cache(self):
+        self.assertFalse('new' in [flavor['name'] for flavor in
+                                   flavors.get_all_flavors().values()])
+        flavors.create('new', 256, 1, 10, flavorid='n1')
+        self.assertTrue('new' in [flavor['name'] for flavor in
+                                  flavors.get_all_flavors().values()])
+
+        flavors.destroy('new')
+        self.assertRaises(exception.InstanceTypeNotFoundByName,
+                          flavors.get_flavor_by_name, 'new')
+
+    def test_other_processes_invalidate_cache(self):
+        flavors.get_flavor_by_flavor_id('c1')
+        # As done by invalidate_cache in another process sharing memcache
+        flavors.MC.set(flavors._GENERATION_KEY, 'other')
+        flavors.get_flavor_by_flavor_id('c1')
+        flavors.get_flavor_by_flavor_id('c1')
+        self.assertEqual(2, self.lookups)
+
+    def test_not_cached_without_memcache(self):
+        self.stubs.Set(flavors._get_cache(), 'get', lambda key: None)
+        self.stubs.Set(flavors._get_cache(), 'add', lambda key, value: False)
+        flavors.get_flavor_by_flavor_id('c1')
+        flavors.get_flavor_by_flavor_id('c1')
+        self.assertEqual(2, self.lookups)
+
+    def test_access_lists_are_not_cached(self):
+        self.assertEqual([], flavors.get_flavor_access_by_flavor_id('c1'))
+        db.flavor_access_add(context.get_admin_context(), 'c1', 'fake')
+        self.assertEqual(['fake'],
+                         [access['project_id'] for access in
+                          flavors.get_flavor_access_by_flavor_id('c1')])
+
+    def test_invalidated_lookup_is_not_used(self):
+        orig_flavor_get = db.flavor_get
+        calls = []
+
+        def fake_flavor_get(*args):
+            flavor = orig_flavor_get(*args)
+            if not calls:
+                flavors.invalidate_cache()
+            calls.append(args)
+            return flavor
+
+        self.stubs.Set(db, 'flavor_get', fake_flavor_get)
+        flavors.get_flavor(self.flavor['id'])
+        flavors.get_flavor(self.flavor['id'])
+        flavors.get_flavor(self.flavor['id'])
+        self.assertEqual(2, len(calls))
+
+    def test_lookups_read_generation_once(self):
+        cache = flavors._get_cache()
+        orig_get = cache.get
+        keys = []
+
+        def fake_get(key):
+            keys.append(key)
+            return orig_get(key)
+
+        self.stubs.Set(cache, 'get', fake_get)
+        flavors.get_flavor_by_flavor_id('c1')
+        flavors.get_flavor_by_flavor_id('c1')
+        self.assertEqual([flavors._GENERATION_KEY] * 2, keys)
+
+    def test_projects_are_cached_apart(self):
+        flavor = flavors.create('private', 256, 1, 10, flavorid='p1',
+                                is_public=False)
+        flavors.add_flavor_access('p1', 'project1')
+        ctxt1 = context.RequestContext('user', 'project1')
+        ctxt2 = context.RequestContext('user', 'project2')
+        self.assertEqual(flavor['id'],
+                         flavors.get_flavor_by_flavor_id('p1', ctxt1)['id'])
+        self.assertRaises(exception.FlavorNotFound,
+                          flavors.get_flavor_by_flavor_id, 'p1', ctxt2)
@@ -17,7 +17,11 @@
 #    under the License.
 """Unit Tests for network code."""
 
+import eventlet
+
 from nova.network import linux_net
+from nova.openstack.common import processutils
+from nova.openstack.common import timeutils
 from nova import test
 
 
@@ -101,6 +105,23 @@ class IptablesManagerTestCase(test.NoDBTestCase):
         self.assertEqual(len(table.rules), num_rules)
         self.assertFalse(table.dirty)
 
+    def test_removed_rules_keep_order(self):
+        table = linux_net.IptablesTable()
+        table.add_chain('test')
+        for i in range(4):
+            table.add_rule('test', '-s 10.0.0.%d -j DROP' % i)
+        table.remove_rule('test', '-s 10.0.0.0 -j DROP')
+        table.remove_rule('test', '-s 10.0.0.2 -j DROP')
+        table.remove_rule('test', '-s 10.0.0.3 -j DROP')
+        table.add_rule('test', '-s 10.0.0.0 -j DROP')
+        table.add_rule('test', '-s 10.0.0.4 -j DROP')
+        self.assertEqual(['-s 10.0.0.1 -j DROP', '-s 10.0.0.0 -j DROP',
+                          '-s 10.0.0.4 -j DROP'],
+                         [rule.rule for rule in table.rules])
+        table.remove_rule('test', '-s 10.0.0.0 -j DROP')
+        self.assertEqual(['-s 10.0.0.1 -j DROP', '-s 10.0.0.4 -j DROP'],
+                         [rule.rule for rule in table.rules])
+
     def test_clean_tables_no_apply(self):
         for table in self.manager.ipv4.itervalues():
             table.dirty = False
@@ -278,3 +299,175 @@ class IptablesManagerTestCase(test.NoDBTestCase):
                                                self.manager.ipv4['filter'],
                                                'filter')
         self.assertEqual(current_lines, new_lines)
+
+
+class IptablesIncrementalApplyTestCase(test.NoDBTestCase):
+
+    binary_name = linux_net.get_binary_name()
+
+    def setUp(self):
+        super(IptablesIncrementalApplyTestCase, self).setUp()
+        self.flags(iptables_incremental_apply=True, use_ipv6=False)
+        self.calls = []
+        self.fail_incremental = False
+        self.manager = linux_net.IptablesManager(self._fake_execute)
+        self.manager.apply()
+        self.calls = []
+
+    def _fake_execute(self, *cmd, **kwargs):
+        self.calls.append((cmd, kwargs.get('process_input')))
+        if self.fail_incremental and '-n' in cmd:
+            raise processutils.ProcessExecutionError()
+        return '', ''
+
+    def _commands(self):
+        return [cmd for cmd, process_input in self.calls]
+
+    def test_only_changed_chains_are_sent(self):
+        table = self.manager.ipv4['filter']
+        table.add_chain('sg-1')
+        table.add_rule('sg-1', '-s 10.0.0.1 -j ACCEPT')
+        table.add_rule('INPUT', '-j $sg-1')
+        self.manager.apply()
+        self.assertEqual([('iptables-restore', '-c', '-n')],
+                         self._commands())
+        # The new chain is declared before the jump to it
+        self.assertEqual('*filter\n'
+                         ':%(bn)s-sg-1 - [0:0]\n'
+                         '[0:0] -A %(bn)s-INPUT -j %(bn)s-sg-1\n'
+                         '[0:0] -A %(bn)s-sg-1 -s 10.0.0.1 -j ACCEPT\n'
+                         'COMMIT\n' % {'bn': self.binary_name},
+                         self.calls[0][1])
+        self.assertFalse(self.manager.dirty())
+
+        self.calls = []
+        table.remove_rule('INPUT', '-j $sg-1')
+        table.remove_chain('sg-1')
+        self.manager.apply()
+        self.assertEqual('*filter\n'
+                         ':%(bn)s-INPUT - [0:0]\n'
+                         ':%(bn)s-sg-1 - [0:0]\n'
+                         '-X %(bn)s-sg-1\n'
+                         'COMMIT\n' % {'bn': self.binary_name},
+                         self.calls[0][1])
+
+    def test_unwrapped_change_falls_back_to_full_apply(self):
+        self.manager.ipv4['filter'].add_rule('nova-filter-top',
+                                             '-s 10.0.0.1 -j DROP',
+                                             wrap=False)
+        self.manager.apply()
+        self.assertEqual([('iptables-save', '-c'), ('iptables-restore', '-c')],
+                         self._commands())
+
+    def test_failure_falls_back_to_full_apply(self):
+        self.fail_incremental = True
+        self.manager.ipv4['filter'].add_rule('INPUT', '-s 10.0.0.1 -j DROP')
+        self.manager.apply()
+        self.assertEqual([('iptables-restore', '-c', '-n'),
+                          ('iptables-save', '-c'), ('iptables-restore', '-c')],
+                         self._commands())
+
+    def test_periodic_full_resync(self):
+        self.flags(iptables_full_resync_interval=60)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        # The last full sync has to be timed with the overridden clock
+        self.manager = linux_net.IptablesManager(self._fake_execute)
+        self.manager.apply()
+        self.manager.ipv4['filter'].add_rule('INPUT', '-s 10.0.0.1 -j DROP')
+        self.manager.apply()
+        timeutils.advance_time_seconds(61)
+        self.manager.ipv4['filter'].add_rule('INPUT', '-s 10.0.0.2 -j DROP')
+        self.manager.apply()
+        self.assertEqual(('iptables-save', '-c'), self._commands()[-2])
+
+
+class IpsetManagerTestCase(test.NoDBTestCase):
+
+    def setUp(self):
+        super(IpsetManagerTestCase, self).setUp()
+        self.calls = []
+        self.manager = linux_net.IpsetManager(self._fake_execute)
+
+    def _fake_execute(self, *cmd, **kwargs):
+        self.calls.append((cmd, kwargs.get('process_input')))
+        return '', ''
+
+    def test_set_members_creates_and_updates_incrementally(self):
+        self.manager.set_members('nova-sg-1-v4', 'inet',
+                                 ['10.0.0.1', '10.0.0.2'])
+        self.manager.set_members('nova-sg-1-v4', 'inet',
+                                 ['10.0.0.2', '10.0.0.3'])
+        self.manager.set_members('nova-sg-1-v4', 'inet',
+                                 ['10.0.0.3', '10.0.0.2'])
+        self.assertEqual(
+            [(('ipset', 'restore', '-exist'),
+              'create nova-sg-1-v4 hash:ip family inet\n'
+              'create nova-sg-1-v4-new hash:ip family inet\n'
+              'flush nova-sg-1-v4-new\n'
+              'add nova-sg-1-v4-new 10.0.0.1\n'
+              'add nova-sg-1-v4-new 10.0.0.2\n'
+              'swap nova-sg-1-v4-new nova-sg-1-v4\n'
+              'destroy nova-sg-1-v4-new\n'),
+             (('ipset', 'restore', '-exist'),
+              'del nova-sg-1-v4 10.0.0.1\n'
+              'add nova-sg-1-v4 10.0.0.3\n')],
+            self.calls)
+
+    def test_set_members_serialized(self):
+        def fake_execute(*cmd, **kwargs):
+            self.calls.append((cmd, kwargs.get('process_input')))
+            # Let the other greenthread run while ipset is running
+            eventlet.sleep(0)
+            return '', ''
+
+        self.manager.set_members('nova-sg-1-v4', 'inet', ['10.0.0.1'])
+        self.manager.execute = fake_execute
+        del self.calls[:]
+        threads = [eventlet.spawn(self.manager.set_members, 'nova-sg-1-v4',
+                                  'inet', [address])
+                   for address in ('10.0.0.2', '10.0.0.3')]
+        for thread in threads:
+            thread.wait()
+        self.assertEqual(['del nova-sg-1-v4 10.0.0.1\n'
+                          'add nova-sg-1-v4 10.0.0.2\n',
+                          'del nova-sg-1-v4 10.0.0.2\n'
+                          'add nova-sg-1-v4 10.0.0.3\n'],
+                         [process_input for cmd, process_input in self.calls])
+
+    def test_destroy_unused_sets(self):
+        def fake_execute(*cmd, **kwargs):
+            self.calls.append((cmd, kwargs.get('process_input')))
+            if cmd[:2] == ('ipset', 'list'):
+                return ('nova-sg-1-v4\nnova-sg-2-v4\nnova-sg-3-v4\n'
+                        'other\n', '')
+            return '', ''
+
+        self.manager.execute = fake_execute
+        self.manager.set_members('nova-sg-1-v4', 'inet', [])
+        self.manager.set_members('nova-sg-4-v4', 'inet', [])
+        self.manager.destroy_unused_sets('nova-sg-', ['nova-sg-1-v4',
+                                                      'nova-sg-3-v4'])
+        # Sets left over by a previous run are destroyed as well
+        self.assertEqual([('ipset', 'destroy', 'nova-sg-2-v4'),
+                          ('ipset', 'destroy', 'nova-sg-4-v4')],
+                         [cmd for cmd, process_input in self.calls
+                          if cmd[1] == 'destroy'])
+        self.assertEqual(['nova-sg-1-v4'], self.manager.sets.keys())
+        self.assertEqual(set(['nova-sg-3-v4']), self.manager.leftover_sets)
+
+    def test_destroy_set(self):
+        self.manager.set_members('nova-sg-1-v4', 'inet', [])
+        self.assertTrue(self.manager.destroy_set('nova-sg-1-v4'))
+        self.assertEqual(('ipset', 'destroy', 'nova-sg-1-v4'),
+                         self.calls[-1][0])
+        self.assertEqual({}, self.manager.sets)
+
+    def test_destroy_set_in_use(self):
+        def fake_execute(*cmd, **kwargs):
+            raise processutils.ProcessExecutionError()
+
+        self.manager.set_members('nova-sg-1-v4', 'inet', [])
+        self.manager.execute = fake_execute
+        self.assertFalse(self.manager.destroy_set('nova-sg-1-v4'))
+        self.assertIn('nova-sg-1-v4', self.manager.sets)
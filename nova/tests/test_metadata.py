@@ -39,11 +39,15 @@ from nova.api.metadata import handler
 from nova.api.metadata import password
 from nova import block_device
 from nova.compute import flavors
+from nova.compute import utils as compute_utils
 from nova.conductor import api as conductor_api
+from nova import context
 from nova import db
 from nova.db.sqlalchemy import api
 from nova import exception
 from nova.network import api as network_api
+from nova.openstack.common import memorycache
+from nova.openstack.common import timeutils
 from nova import test
 from nova.tests import fake_network
 from nova import utils
@@ -308,6 +312,120 @@ class MetadataTestCase(test.TestCase):
 
         base.InstanceMetadata(INSTANCES[0])
 
+    def test_cache_instance_metadata(self):
+        cache = memorycache.Client()
+        network_info = fake_network.fake_get_instance_nw_info(self.stubs, 1, 2)
+        addresses = [ip['address'] for ip in network_info.fixed_ips()]
+        inst = copy.copy(self.instance)
+        inst['info_cache'] = {'network_info': network_info}
+        self.mox.StubOutWithMock(network_api.API, 'get_instance_nw_info')
+        self.mox.ReplayAll()
+
+        md = base.cache_instance_metadata(cache, inst, network_info)
+        self.assertTrue(md is cache.get('metadata-%s' % inst['uuid']))
+        for address in addresses:
+            self.assertEqual(None, cache.get('metadata-%s' % address))
+
+    def test_prerendered_metadata_only_serves_its_addresses(self):
+        cache = memorycache.Client()
+        network_info = fake_network.fake_get_instance_nw_info(self.stubs, 1, 1)
+        address = network_info.fixed_ips()[0]['address']
+        inst = copy.copy(self.instance)
+        inst['info_cache'] = {'network_info': network_info}
+        md = base.cache_instance_metadata(cache, inst, network_info)
+
+        def fake_get_fixed_ip_by_address(self, context, address):
+            return {'instance_uuid': inst['uuid']}
+
+        self.stubs.Set(network_api.API, 'get_fixed_ip_by_address',
+                       fake_get_fixed_ip_by_address)
+        conductor = conductor_api.LocalAPI()
+        self.mox.StubOutWithMock(conductor, 'instance_get_by_uuid')
+        self.mox.ReplayAll()
+
+        address_md = base.get_metadata_by_address(conductor, address,
+                                                  cache=cache)
+        self.assertEqual(address, address_md.address)
+        self.assertEqual(inst['uuid'], address_md.uuid)
+        self.assertFalse(address_md is md)
+        self.assertEqual(None, base._get_prerendered_metadata(
+            cache, inst['uuid'], '10.9.9.9'))
+
+    def test_uncache_instance_metadata(self):
+        cache = memorycache.Client()
+        self.stubs.Set(compute_utils, 'MC', cache)
+        cache.set('metadata-%s' % self.instance['uuid'], 'md')
+        compute_utils.uncache_instance_metadata(self.instance['uuid'])
+        self.assertEqual(None,
+                         cache.get('metadata-%s' % self.instance['uuid']))
+
+
+class FixedIpIndexTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(FixedIpIndexTestCase, self).setUp()
+        self.flags(metadata_fixed_ip_index_interval=60)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        self.uuids = {'10.0.0.1': 'uuid1', '10.0.0.2': 'uuid2'}
+        self.calls = 0
+
+        def fake_get_fixed_ip_instance_uuids(context):
+            self.calls += 1
+            return dict(self.uuids)
+
+        self.network_api = network_api.API()
+        self.stubs.Set(self.network_api, 'get_fixed_ip_instance_uuids',
+                       fake_get_fixed_ip_instance_uuids)
+        self.index = base.FixedIpIndex(self.network_api)
+        self.ctxt = context.get_admin_context()
+
+    def test_lookups_share_one_refresh(self):
+        self.assertEqual('uuid1',
+                         self.index.get_instance_uuid(self.ctxt, '10.0.0.1'))
+        self.assertEqual('uuid2',
+                         self.index.get_instance_uuid(self.ctxt, '10.0.0.2'))
+        self.assertEqual(1, self.calls)
+        timeutils.advance_time_seconds(61)
+        self.index.get_instance_uuid(self.ctxt, '10.0.0.1')
+        self.assertEqual(2, self.calls)
+
+    def test_miss_refreshes_at_most_every_few_seconds(self):
+        self.index.get_instance_uuid(self.ctxt, '10.0.0.1')
+        self.uuids['10.0.0.3'] = 'uuid3'
+        self.assertEqual(None,
+                         self.index.get_instance_uuid(self.ctxt, '10.0.0.3'))
+        self.assertEqual(1, self.calls)
+        timeutils.advance_time_seconds(
+            base.FixedIpIndex.MISS_REFRESH_INTERVAL + 1)
+        self.assertEqual('uuid3',
+                         self.index.get_instance_uuid(self.ctxt, '10.0.0.3'))
+        self.assertEqual(None,
+                         self.index.get_instance_uuid(self.ctxt, '10.0.0.4'))
+        self.assertEqual(2, self.calls)
+
+    def test_stale_entry_is_discarded(self):
+        instance = {'uuid': 'uuid1'}
+        network_info = fake_network.fake_get_instance_nw_info(self.stubs, 1, 1)
+        address = network_info.fixed_ips()[0]['address']
+        self.uuids = {address: 'uuid1', '10.9.9.9': 'uuid1'}
+        conductor = conductor_api.LocalAPI()
+        self.mox.StubOutWithMock(conductor, 'instance_get_by_uuid')
+        self.mox.StubOutWithMock(compute_utils, 'get_nw_info_for_instance')
+        self.stubs.Set(network_api.API, 'get_fixed_ip_by_address',
+                       return_non_existing_address)
+        conductor.instance_get_by_uuid(mox.IgnoreArg(),
+                                       'uuid1').MultipleTimes().AndReturn(
+                                           instance)
+        compute_utils.get_nw_info_for_instance(
+            instance).MultipleTimes().AndReturn(network_info)
+        self.mox.ReplayAll()
+
+        self.assertEqual(instance, base._get_instance_with_address(
+            conductor, self.ctxt, 'uuid1', address))
+        self.assertRaises(exception.NotFound, base.get_metadata_by_address,
+                          conductor, '10.9.9.9', self.index)
+        self.assertFalse('10.9.9.9' in self.index._uuids)
+
 
 class OpenStackMetadataTestCase(test.TestCase):
     def setUp(self):
@@ -544,6 +662,23 @@ class MetadataHandlerTestCase(test.TestCase):
                                 relpath="/2009-04-04/user-data", address=None)
         self.assertEqual(response.status_int, 500)
 
+    def test_prerendered_metadata_is_served_from_cache(self):
+        def fake_get_fixed_ip_by_address(self, context, address):
+            return {'instance_uuid': 'uuid1'}
+
+        self.stubs.Set(network_api.API, 'get_fixed_ip_by_address',
+                       fake_get_fixed_ip_by_address)
+        self.stubs.Set(base, 'InstanceMetadata',
+                       lambda *args: self.fail('metadata was not cached'))
+        self.mdinst.ip_info['fixed_ips'] = ['192.168.1.1']
+        app = handler.MetadataRequestHandler()
+        app._cache.set('metadata-uuid1', self.mdinst)
+        request = webob.Request.blank('/2009-04-04/user-data')
+        request.remote_addr = '192.168.1.1'
+        response = request.get_response(app)
+        self.assertEqual(response.body,
+                         base64.b64decode(self.instance['user_data']))
+
     def test_invalid_path_is_404(self):
         response = fake_request(self.stubs, self.mdinst,
                                 relpath="/2009-04-04/user-data-invalid")
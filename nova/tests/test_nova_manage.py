@@ -20,6 +20,7 @@ import StringIO
 import sys
 
 from nova.cmd import manage
+from nova.compute import flavors
 from nova import context
 from nova import db
 from nova import exception
@@ -384,6 +385,34 @@ class ProjectCommandsTestCase(test.TestCase):
         self.assertEqual(2, self.commands.quota('admin', 'volumes1', '10'))
 
 
+class VmCommandsTestCase(test.TestCase):
+    def setUp(self):
+        super(VmCommandsTestCase, self).setUp()
+        self.commands = manage.VmCommands()
+        self.ctxt = context.get_admin_context()
+        sys_meta = flavors.save_flavor_info({}, flavors.get_default_flavor())
+        for name, host in (('vm1', 'host1'), ('vm2', 'host2'),
+                           ('vm3', 'host1')):
+            instance = db.instance_create(self.ctxt, {
+                'display_name': name, 'host': host, 'launch_index': 0,
+                'system_metadata': sys_meta})
+        db.instance_destroy(self.ctxt, instance['uuid'])
+
+    def test_list(self):
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+        self.commands.list()
+        lines = sys.stdout.getvalue().splitlines()[1:]
+        self.assertEqual(['vm2', 'vm1'], [line.split()[0] for line in lines])
+
+    def test_list_just_one_host(self):
+        self.useFixture(fixtures.MonkeyPatch('sys.stdout',
+                                             StringIO.StringIO()))
+        self.commands.list('host1')
+        lines = sys.stdout.getvalue().splitlines()[1:]
+        self.assertEqual(['vm1'], [line.split()[0] for line in lines])
+
+
 class DBCommandsTestCase(test.TestCase):
     def setUp(self):
         super(DBCommandsTestCase, self).setUp()
@@ -21,9 +21,12 @@ import os.path
 import StringIO
 import urllib2
 
+import fixtures
+
 from nova import context
 from nova import exception
 from nova.openstack.common import policy as common_policy
+from nova.openstack.common import timeutils
 from nova import policy
 from nova import test
 from nova import utils
@@ -58,6 +61,31 @@ class PolicyFileTestCase(test.NoDBTestCase):
             self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
                               self.context, action, self.target)
 
+    def test_modified_policy_checked_on_interval(self):
+        self.useFixture(fixtures.MonkeyPatch(
+            'nova.openstack.common.timeutils.utcnow.override_time', None))
+        with utils.tempdir() as tmpdir:
+            tmpfilename = os.path.join(tmpdir, 'policy')
+            self.flags(policy_file=tmpfilename,
+                       policy_file_check_interval=10)
+            policy.reset()
+
+            action = "example:test"
+            with open(tmpfilename, "w") as policyfile:
+                policyfile.write('{"example:test": ""}')
+            os.utime(tmpfilename, (1000, 1000))
+            timeutils.set_time_override()
+            policy.enforce(self.context, action, self.target)
+
+            with open(tmpfilename, "w") as policyfile:
+                policyfile.write('{"example:test": "!"}')
+            os.utime(tmpfilename, (2000, 2000))
+            timeutils.advance_time_seconds(9)
+            policy.enforce(self.context, action, self.target)
+            timeutils.advance_time_seconds(1)
+            self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                              self.context, action, self.target)
+
 
 class PolicyTestCase(test.NoDBTestCase):
     def setUp(self):
@@ -180,6 +208,82 @@ class DefaultPolicyTestCase(test.NoDBTestCase):
                 self.context, "example:noexist", {})
 
 
+class CompiledPolicyTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(CompiledPolicyTestCase, self).setUp()
+        rules = {
+            "admin": "role:admin or is_admin:True",
+            "example:allowed": "@",
+            "example:early_and_fail": "! and rule:admin",
+            "example:late_or_success": "role:admin or @",
+            "example:owner": "rule:admin or project_id:%(project_id)s",
+            "example:get_http": "http://www.example.com",
+        }
+        self.policy.set_rules(rules)
+        self.context = context.RequestContext('fake', 'fake', roles=['member'])
+
+    def test_constant_rules_folded(self):
+        self.assertEqual(policy._get_compiled('example:allowed').func, True)
+        self.assertEqual(
+            policy._get_compiled('example:early_and_fail').func, False)
+        self.assertEqual(policy._get_compiled('example:noexist').func, False)
+
+    def test_keys_used_recorded(self):
+        compiled = policy._get_compiled('example:owner')
+        self.assertTrue(compiled.memoizable)
+        self.assertEqual(compiled.cred_keys,
+                         ('is_admin', 'project_id', 'roles'))
+        self.assertEqual(compiled.target_keys, ('project_id',))
+
+    def test_late_or_keeps_earlier_checks(self):
+        # roles is missing, so the role check fails the rule as it would
+        # have done before the rule was compiled
+        credentials = {'is_admin': False}
+        self.assertEqual(common_policy.check('example:late_or_success', {},
+                                             credentials), False)
+        self.assertEqual(policy._get_compiled('example:late_or_success')(
+            {}, credentials), False)
+
+    def test_decisions_memoized(self):
+        self.mox.StubOutWithMock(self.context, 'to_dict')
+        self.context.to_dict().AndReturn({'project_id': 'fake',
+                                          'is_admin': False,
+                                          'roles': ['member']})
+        self.mox.ReplayAll()
+
+        target = {'project_id': 'fake', 'user_id': 'fake'}
+        policy.enforce(self.context, 'example:owner', target)
+        target = {'project_id': 'fake', 'user_id': 'other'}
+        policy.enforce(self.context, 'example:owner', target)
+        self.assertEqual(len(self.context.policy_decisions), 1)
+
+    def test_decisions_depend_on_target(self):
+        policy.enforce(self.context, 'example:owner', {'project_id': 'fake'})
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, 'example:owner',
+                          {'project_id': 'other'})
+        policy.enforce(self.context.elevated(), 'example:owner',
+                       {'project_id': 'other'})
+
+    def test_decisions_dropped_with_rules(self):
+        policy.enforce(self.context, 'example:owner', {'project_id': 'fake'})
+        self.policy.set_rules({"example:owner": "!"})
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, 'example:owner',
+                          {'project_id': 'fake'})
+
+    def test_http_not_memoized(self):
+        responses = ["True", "False"]
+
+        def fakeurlopen(url, post_data):
+            return StringIO.StringIO(responses.pop(0))
+        self.stubs.Set(urllib2, 'urlopen', fakeurlopen)
+        policy.enforce(self.context, 'example:get_http', {})
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, 'example:get_http', {})
+        self.assertEqual(self.context.policy_decisions, {})
+
+
 class IsAdminCheckTestCase(test.NoDBTestCase):
     def test_init_true(self):
         check = policy.IsAdminCheck('is_admin', 'True')
@@ -1497,6 +1497,61 @@ class LibvirtConnTestCase(test.TestCase):
         # Only one should be listed, since domain with ID 0 must be skipped
         self.assertEquals(len(instances), 1)
 
+    def _fake_domain(self, domain_id, name, state):
+        domain = self.mox.CreateMockAnything()
+        domain.ID = lambda: domain_id
+        domain.name = lambda: name
+        if state is None:
+            def info():
+                raise libvirt.libvirtError("we deleted an instance!")
+            domain.info = info
+        else:
+            domain.info = lambda: [state, 2048, 2048, 1, 0]
+        return domain
+
+    def test_get_power_states_skips_failing_domains(self):
+        domains = [self._fake_domain(0, 'Domain-0', power_state.RUNNING),
+                   self._fake_domain(1, 'instance-1', power_state.RUNNING),
+                   self._fake_domain(2, 'instance-2', None),
+                   self._fake_domain(-1, 'instance-3', power_state.SHUTDOWN)]
+        self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
+        libvirt_driver.LibvirtDriver._conn.listAllDomains = (
+                lambda flags: domains)
+
+        self.mox.ReplayAll()
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        instances = [{'uuid': 'uuid%d' % i, 'name': 'instance-%d' % i}
+                     for i in xrange(1, 5)]
+        self.assertEqual({'uuid1': power_state.RUNNING,
+                          'uuid2': power_state.NOSTATE,
+                          'uuid3': power_state.SHUTDOWN,
+                          'uuid4': power_state.NOSTATE},
+                         conn.get_power_states(instances))
+
+    def test_get_power_states_without_list_all_domains(self):
+        domains = {1: self._fake_domain(1, 'instance-1', power_state.RUNNING),
+                   2: self._fake_domain(2, 'instance-2', None)}
+
+        def fake_list_all_domains(flags):
+            raise libvirt.libvirtError("not supported",
+                                       error_code=libvirt.VIR_ERR_NO_SUPPORT)
+
+        self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
+        libvirt_driver.LibvirtDriver._conn.listAllDomains = (
+                fake_list_all_domains)
+        libvirt_driver.LibvirtDriver._conn.numOfDomains = lambda: 3
+        libvirt_driver.LibvirtDriver._conn.listDomainsID = lambda: [0, 1, 2]
+        libvirt_driver.LibvirtDriver._conn.lookupByID = domains.get
+        libvirt_driver.LibvirtDriver._conn.listDefinedDomains = lambda: []
+
+        self.mox.ReplayAll()
+        conn = libvirt_driver.LibvirtDriver(fake.FakeVirtAPI(), False)
+        instances = [{'uuid': 'uuid%d' % i, 'name': 'instance-%d' % i}
+                     for i in xrange(1, 3)]
+        self.assertEqual({'uuid1': power_state.RUNNING,
+                          'uuid2': power_state.NOSTATE},
+                         conn.get_power_states(instances))
+
     def test_list_instance_uuids(self):
         self.mox.StubOutWithMock(libvirt_driver.LibvirtDriver, '_conn')
         libvirt_driver.LibvirtDriver._conn.lookupByID = self.fake_lookup
@@ -5648,6 +5703,207 @@ class IptablesFirewallTestCase(test.TestCase):
                         "TCP port 80/81 acceptance rule wasn't added")
         db.instance_destroy(admin_ctxt, instance_ref['uuid'])
 
+    def _setup_ipset_firewall(self):
+        self.flags(firewall_use_ipset=True)
+        self.fw = firewall.IptablesFirewallDriver(
+                      fake.FakeVirtAPI(),
+                      get_connection=lambda: self.fake_libvirt_connection)
+        self.ipset_calls = []
+
+        def fake_ipset_execute(*cmd, **kwargs):
+            self.ipset_calls.append((cmd, kwargs.get('process_input')))
+            return '', ''
+
+        from nova.network import linux_net
+        self.fw.ipset = linux_net.IpsetManager(fake_ipset_execute)
+
+        admin_ctxt = context.get_admin_context()
+        instance_ref = self._create_instance_ref()
+        src_instance_ref = self._create_instance_ref()
+        secgroup = db.security_group_create(admin_ctxt,
+                                            {'user_id': 'fake',
+                                             'project_id': 'fake',
+                                             'name': 'testgroup',
+                                             'description': 'test group'})
+        src_secgroup = db.security_group_create(admin_ctxt,
+                                                {'user_id': 'fake',
+                                                 'project_id': 'fake',
+                                                 'name': 'testsourcegroup',
+                                                 'description': 'src group'})
+        db.security_group_rule_create(admin_ctxt,
+                                      {'parent_group_id': secgroup['id'],
+                                       'protocol': 'tcp',
+                                       'from_port': 22,
+                                       'to_port': 22,
+                                       'group_id': src_secgroup['id']})
+        db.instance_add_security_group(admin_ctxt, instance_ref['uuid'],
+                                       secgroup['id'])
+        db.instance_add_security_group(admin_ctxt, src_instance_ref['uuid'],
+                                       src_secgroup['id'])
+        instance_ref = db.instance_get(admin_ctxt, instance_ref['id'])
+
+        self.member_network_infos = [_fake_network_info(self.stubs, 1)]
+
+        def fake_get_nw_info_for_instance(instance):
+            return self.member_network_infos.pop(0)
+
+        from nova.compute import utils as compute_utils
+        self.stubs.Set(compute_utils, 'get_nw_info_for_instance',
+                       fake_get_nw_info_for_instance)
+        return instance_ref, src_secgroup
+
+    def test_instance_rules_with_ipset(self):
+        instance_ref, src_secgroup = self._setup_ipset_firewall()
+        member_ips = [ip['address'] for ip in
+                      self.member_network_infos[0].fixed_ips()
+                      if ip['version'] == 4]
+        network_info = _fake_network_info(self.stubs, 1)
+        ipv4_rules, ipv6_rules = self.fw.instance_rules(instance_ref,
+                                                        network_info)
+
+        set_name = 'nova-sg-%s-v4' % src_secgroup['id']
+        self.assertIn('-j ACCEPT -p tcp --dport 22 -m set --match-set %s src'
+                      % set_name, ipv4_rules)
+        for ip in member_ips:
+            self.assertFalse([rule for rule in ipv4_rules if ip in rule])
+        self.assertEqual(set(member_ips), self.fw.ipset.sets[set_name])
+        self.assertEqual(set([set_name]),
+                         self.fw.instance_ipsets[instance_ref['id']])
+
+    def test_refresh_security_group_members_with_ipset(self):
+        instance_ref, src_secgroup = self._setup_ipset_firewall()
+        network_info = _fake_network_info(self.stubs, 1)
+        self.fw.prepare_instance_filter(instance_ref, network_info)
+        self.stubs.Set(self.fw.iptables, 'apply',
+                       lambda: self.fail('iptables should not be applied'))
+        old_ips = self.fw.ipset.sets['nova-sg-%s-v4' % src_secgroup['id']]
+
+        # The member got a new address; only the set changes.
+        self.member_network_infos = [_fake_network_info(self.stubs, 2)]
+        new_ips = set(ip['address'] for ip in
+                      self.member_network_infos[0].fixed_ips()
+                      if ip['version'] == 4)
+        del self.ipset_calls[:]
+        self.fw.refresh_security_group_members(src_secgroup['id'])
+        self.assertEqual(new_ips,
+                         self.fw.ipset.sets['nova-sg-%s-v4' %
+                                            src_secgroup['id']])
+        self.assertEqual(1, len(self.ipset_calls))
+        self.assertEqual(len(new_ips - old_ips),
+                         self.ipset_calls[0][1].count('add '))
+
+    def test_unfilter_instance_destroys_unused_ipsets(self):
+        instance_ref, src_secgroup = self._setup_ipset_firewall()
+        network_info = _fake_network_info(self.stubs, 1)
+        self.stubs.Set(self.fw.nwfilter, 'unfilter_instance',
+                       lambda *args: None)
+        self.stubs.Set(self.fw.iptables, 'apply', lambda: None)
+        self.fw.prepare_instance_filter(instance_ref, network_info)
+        self.fw.unfilter_instance(instance_ref, network_info)
+        self.assertEqual({}, self.fw.ipset.sets)
+        self.assertEqual(('ipset', 'destroy',
+                          'nova-sg-%s-v4' % src_secgroup['id']),
+                         self.ipset_calls[-1][0])
+
+    def test_security_group_chains(self):
+        self.flags(firewall_security_group_chains=True)
+        self.fw = firewall.IptablesFirewallDriver(
+                      fake.FakeVirtAPI(),
+                      get_connection=lambda: self.fake_libvirt_connection)
+        self.stubs.Set(self.fw.nwfilter, 'unfilter_instance',
+                       lambda *args: None)
+        self.stubs.Set(self.fw.iptables, 'apply', lambda: None)
+        admin_ctxt = context.get_admin_context()
+        secgroup = db.security_group_create(admin_ctxt,
+                                            {'user_id': 'fake',
+                                             'project_id': 'fake',
+                                             'name': 'testgroup',
+                                             'description': 'test group'})
+        db.security_group_rule_create(admin_ctxt,
+                                      {'parent_group_id': secgroup['id'],
+                                       'protocol': 'tcp',
+                                       'from_port': 22,
+                                       'to_port': 22,
+                                       'cidr': '192.168.10.0/24'})
+        instance_refs = []
+        for i in range(2):
+            instance_ref = self._create_instance_ref()
+            db.instance_add_security_group(admin_ctxt, instance_ref['uuid'],
+                                           secgroup['id'])
+            instance_refs.append(db.instance_get(admin_ctxt,
+                                                 instance_ref['id']))
+        network_info = _fake_network_info(self.stubs, 1)
+        for instance_ref in instance_refs:
+            self.fw.prepare_instance_filter(instance_ref, network_info)
+
+        from nova.network import linux_net
+        table = self.fw.iptables.ipv4['filter']
+        chain_name = 'nova-sg-%s' % secgroup['id']
+
+        def chain_rules(chain):
+            return [rule.rule for rule in table.rules if rule.chain == chain]
+
+        self.assertEqual(['-j ACCEPT -p tcp --dport 22 -s 192.168.10.0/24'],
+                         chain_rules(chain_name))
+        jump = '-j %s-%s' % (linux_net.get_binary_name(), chain_name)
+        for instance_ref in instance_refs:
+            self.assertIn(jump, chain_rules('inst-%s' % instance_ref['id']))
+
+        # A new rule only changes the shared chain, which is rendered
+        # with one lookup for both instances.
+        db.security_group_rule_create(admin_ctxt,
+                                      {'parent_group_id': secgroup['id'],
+                                       'protocol': 'udp',
+                                       'from_port': 53,
+                                       'to_port': 53,
+                                       'cidr': '192.168.10.0/24'})
+        self.mox.StubOutWithMock(self.fw, 'instance_rules')
+        self.mox.ReplayAll()
+        self.fw.refresh_security_group_rules(secgroup['id'])
+        self.assertEqual(['-j ACCEPT -p tcp --dport 22 -s 192.168.10.0/24',
+                          '-j ACCEPT -p udp --dport 53 -s 192.168.10.0/24'],
+                         chain_rules(chain_name))
+
+        for instance_ref in instance_refs:
+            self.fw.unfilter_instance(instance_ref, network_info)
+        self.assertNotIn(chain_name, table.chains)
+        self.assertEqual({}, self.fw.security_group_chains)
+
+    def test_refreshes_are_coalesced(self):
+        passes = []
+
+        def fake_do_coalesced_refreshes(refreshes):
+            passes.append(refreshes)
+            if len(passes) == 1:
+                # Requests arriving while the first pass is running
+                self.fw.refresh_security_group_rules(2)
+                self.fw.refresh_security_group_members(3)
+                self.assertEqual(1, len(passes))
+
+        self.stubs.Set(self.fw, '_do_coalesced_refreshes',
+                       fake_do_coalesced_refreshes)
+        self.fw.refresh_security_group_rules(1)
+        self.assertEqual([[('rules', 1)], [('rules', 2), ('members', 3)]],
+                         passes)
+        self.assertFalse(self.fw._refreshing)
+
+    def test_refreshes_queued_during_failed_pass_are_processed(self):
+        passes = []
+
+        def fake_do_coalesced_refreshes(refreshes):
+            passes.append(refreshes)
+            if len(passes) == 1:
+                self.fw.refresh_security_group_rules(2)
+                raise test.TestingException()
+
+        self.stubs.Set(self.fw, '_do_coalesced_refreshes',
+                       fake_do_coalesced_refreshes)
+        self.assertRaises(test.TestingException,
+                          self.fw.refresh_security_group_rules, 1)
+        self.assertEqual([[('rules', 1)], [('rules', 2)]], passes)
+        self.assertEqual([], self.fw._pending_refreshes)
+        self.assertFalse(self.fw._refreshing)
+
     def test_filters_for_instance_with_ip_v6(self):
         self.flags(use_ipv6=True)
         network_info = _fake_network_info(self.stubs, 1)
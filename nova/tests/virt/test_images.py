@@ -12,6 +12,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+
+import fixtures
+import mox
 
 from nova import test
 from nova.virt import images
@@ -22,3 +26,110 @@ class QemuTestCase(test.NoDBTestCase):
         image_info = images.qemu_img_info("/path/that/does/not/exist")
         self.assertTrue(image_info)
         self.assertTrue(str(image_info))
+
+
+class ImageInfoTestCase(test.NoDBTestCase):
+    def setUp(self):
+        super(ImageInfoTestCase, self).setUp()
+        self.stubs.Set(images, '_image_info_cache', {})
+        self.tmpdir = self.useFixture(fixtures.TempDir()).path
+        self.mox.StubOutWithMock(images, 'qemu_img_info')
+
+    def _write_image(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _qcow2_header(self, virtual_size, backing_file='', cluster_bits=16,
+                      backing_file_size=None):
+        if backing_file_size is None:
+            backing_file_size = len(backing_file)
+        header = images.QCOW2_HEADER.pack(images.QCOW2_MAGIC, 2,
+                                          512 if backing_file else 0,
+                                          backing_file_size, cluster_bits,
+                                          virtual_size)
+        return header.ljust(512, '\0') + backing_file
+
+    def test_qcow2(self):
+        path = self._write_image('disk', self._qcow2_header(
+            20 * 1024 ** 3, backing_file='/base/abcd'))
+        self.mox.ReplayAll()
+        image_info = images.image_info(path)
+        self.assertEqual('qcow2', image_info.file_format)
+        self.assertEqual(20 * 1024 ** 3, image_info.virtual_size)
+        self.assertEqual(65536, image_info.cluster_size)
+        self.assertEqual('/base/abcd', image_info.backing_file)
+
+    def test_qcow2_relative_backing_file(self):
+        path = self._write_image('disk', self._qcow2_header(
+            1024, backing_file='base'))
+        self.mox.ReplayAll()
+        self.assertEqual(os.path.join(self.tmpdir, 'base'),
+                         images.image_info(path).backing_file)
+
+    def test_qcow2_without_backing_file(self):
+        path = self._write_image('disk', self._qcow2_header(1024))
+        self.mox.ReplayAll()
+        self.assertEqual(None, images.image_info(path).backing_file)
+
+    def _test_qcow2_uses_qemu_img(self, data):
+        path = self._write_image('disk', data)
+        image_info = images.QemuImgInfo()
+        images.qemu_img_info(path).AndReturn(image_info)
+        self.mox.ReplayAll()
+        self.assertEqual(image_info, images.image_info(path))
+
+    def test_qcow2_long_backing_file_uses_qemu_img(self):
+        self._test_qcow2_uses_qemu_img(self._qcow2_header(
+            1024, backing_file='/base/' + 'a' * 1018))
+
+    def test_qcow2_truncated_backing_file_uses_qemu_img(self):
+        self._test_qcow2_uses_qemu_img(self._qcow2_header(
+            1024, backing_file='/base/abcd', backing_file_size=20))
+
+    def test_qcow2_small_clusters_use_qemu_img(self):
+        self._test_qcow2_uses_qemu_img(self._qcow2_header(
+            1024, cluster_bits=8))
+
+    def test_qcow2_large_clusters_use_qemu_img(self):
+        self._test_qcow2_uses_qemu_img(self._qcow2_header(
+            1024, cluster_bits=22))
+
+    def test_raw(self):
+        path = self._write_image('disk', 'x' * 4096)
+        self.mox.ReplayAll()
+        image_info = images.image_info(path)
+        self.assertEqual('raw', image_info.file_format)
+        self.assertEqual(4096, image_info.virtual_size)
+        self.assertEqual(None, image_info.backing_file)
+
+    def test_other_format_uses_qemu_img(self):
+        path = self._write_image('disk', 'KDMV'.ljust(4096, '\0'))
+        image_info = images.QemuImgInfo()
+        images.qemu_img_info(path).AndReturn(image_info)
+        self.mox.ReplayAll()
+        self.assertEqual(image_info, images.image_info(path))
+
+    def test_missing_uses_qemu_img(self):
+        path = os.path.join(self.tmpdir, 'disk')
+        image_info = images.QemuImgInfo()
+        images.qemu_img_info(path).AndReturn(image_info)
+        self.mox.ReplayAll()
+        self.assertEqual(image_info, images.image_info(path))
+
+    def test_cache(self):
+        path = self._write_image('disk', self._qcow2_header(1024))
+        self.mox.StubOutWithMock(images, '_read_image_header')
+        images._read_image_header(path, mox.IgnoreArg()).AndReturn(
+            images.QemuImgInfo())
+        self.mox.ReplayAll()
+        image_info = images.image_info(path)
+        self.assertEqual(image_info, images.image_info(path))
+
+    def test_cache_reads_changed_file(self):
+        path = self._write_image('disk', self._qcow2_header(1024))
+        self.mox.ReplayAll()
+        self.assertEqual(1024, images.image_info(path).virtual_size)
+        self._write_image('disk', self._qcow2_header(2048, 'base'))
+        self.assertEqual(2048, images.image_info(path).virtual_size)
@@ -21,6 +21,7 @@ import sys
 import traceback
 
 from nova.compute import manager
+from nova.compute import power_state
 from nova import exception
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
@@ -488,6 +489,16 @@ class _VirtDriverTestCase(_FakeDriverBackendTestCase):
                           self.connection.get_info,
                           {'name': 'I just made this name up'})
 
+    @catch_notimplementederror
+    def test_get_power_states(self):
+        instance_ref, network_info = self._get_running_instance()
+        unknown = {'name': 'I just made this name up', 'uuid': 'fake-uuid'}
+        power_states = self.connection.get_power_states([instance_ref,
+                                                         unknown])
+        self.assertEqual(power_state.RUNNING,
+                         power_states[instance_ref['uuid']])
+        self.assertEqual(power_state.NOSTATE, power_states['fake-uuid'])
+
     @catch_notimplementederror
     def test_get_diagnostics(self):
         instance_ref, network_info = self._get_running_instance()
@@ -26,6 +26,8 @@ import sys
 
 from oslo.config import cfg
 
+from nova.compute import power_state
+from nova import exception
 from nova.openstack.common.gettextutils import _
 from nova.openstack.common import importutils
 from nova.openstack.common import log as logging
@@ -155,6 +157,34 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def get_power_states(self, instances):
+        """Return the power state of several instances at once.
+
+        :param instances: list of instances to look up
+        :returns: dict mapping the uuid of each instance to one of the
+                  power_state codes; instances unknown to the hypervisor
+                  map to power_state.NOSTATE and instances whose state
+                  could not be determined are left out.
+
+        .. note::
+
+            This implementation works for all drivers, but it is
+            not particularly efficient. Maintainers of the virt drivers are
+            encouraged to override this method with something more
+            efficient.
+        """
+        power_states = {}
+        for instance in instances:
+            try:
+                power_states[instance['uuid']] = self.get_info(
+                        instance)['state']
+            except exception.InstanceNotFound:
+                power_states[instance['uuid']] = power_state.NOSTATE
+            except Exception:
+                LOG.exception(_("Unable to get the power state of the "
+                                "instance."), instance=instance)
+        return power_states
+
     def get_num_instances(self):
         """Return the total number of virtual machines.
 
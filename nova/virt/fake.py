@@ -266,6 +266,16 @@ class FakeDriver(driver.ComputeDriver):
                 'num_cpu': 2,
                 'cpu_time': 0}
 
+    def get_power_states(self, instances):
+        power_states = {}
+        for instance in instances:
+            if instance['name'] in self.instances:
+                state = self.instances[instance['name']].state
+            else:
+                state = power_state.NOSTATE
+            power_states[instance['uuid']] = state
+        return power_states
+
     def get_diagnostics(self, instance_name):
         return {'cpu0_time': 17300000000,
                 'memory': 524288,
@@ -17,6 +17,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import sys
+
+from eventlet import greenthread
 from oslo.config import cfg
 
 from nova.compute import utils as compute_utils
@@ -37,6 +40,23 @@ firewall_opts = [
     cfg.BoolOpt('allow_same_net_traffic',
                 default=True,
                 help='Whether to allow network traffic from same network'),
+    cfg.BoolOpt('firewall_use_ipset',
+                default=False,
+                help='Whether the iptables firewall drivers match traffic '
+                     'from the members of a security group against an '
+                     'ipset rather than one rule per member address'),
+    cfg.BoolOpt('firewall_security_group_chains',
+                default=False,
+                help='Whether the iptables firewall drivers render the rules '
+                     'of each security group once into a chain shared by '
+                     'the instances in the group rather than into the chain '
+                     'of every instance'),
+    cfg.IntOpt('firewall_refresh_delay',
+               default=0,
+               help='Number of seconds a security group refresh waits for '
+                    'further refreshes to coalesce with before recomputing '
+                    'the rules. Refreshes arriving while one is in progress '
+                    'are always coalesced with it.'),
 ]
 
 CONF = cfg.CONF
@@ -141,8 +161,25 @@ class IptablesFirewallDriver(FirewallDriver):
     def __init__(self, virtapi, **kwargs):
         super(IptablesFirewallDriver, self).__init__(virtapi)
         self.iptables = linux_net.iptables_manager
+        self.ipset = linux_net.ipset_manager
+        self.use_ipset = CONF.firewall_use_ipset
         self.instances = {}
         self.network_infos = {}
+        # Names of the ipsets the rules of each instance match against
+        self.instance_ipsets = {}
+        self.use_security_group_chains = CONF.firewall_security_group_chains
+        # State of the shared security group chains, keyed by group id
+        self.security_groups = {}
+        self.security_group_chains = {}
+        self.security_group_grantees = {}
+        self.security_group_ipsets = {}
+        # Ids of the security groups whose chain each instance jumps to
+        self.instance_security_groups = {}
+        # Rendered security group rules, only kept during a refresh pass
+        # so that every group is looked up once for all instances
+        self._security_group_rules_cache = None
+        self._pending_refreshes = []
+        self._refreshing = False
         self.basically_filtered = False
 
         # Flags for DHCP request rule
@@ -171,8 +208,12 @@ class IptablesFirewallDriver(FirewallDriver):
         if self.instances.pop(instance['id'], None):
             # NOTE(vish): use the passed info instead of the stored info
             self.network_infos.pop(instance['id'])
+            self.instance_ipsets.pop(instance['id'], None)
+            self.instance_security_groups.pop(instance['id'], None)
             self.remove_filters_for_instance(instance)
+            self._purge_unused_security_group_chains()
             self.iptables.apply()
+            self._purge_unused_ipsets()
         else:
             LOG.info(_('Attempted to unfilter instance which is not '
                      'filtered'), instance=instance)
@@ -264,6 +305,46 @@ class IptablesFirewallDriver(FirewallDriver):
     def _instance_chain_name(self, instance):
         return 'inst-%s' % (instance['id'],)
 
+    @staticmethod
+    def _security_group_ipset_name(security_group_id, version):
+        return 'nova-sg-%s-v%s' % (security_group_id, version)
+
+    def _security_group_member_ips(self, security_group, version):
+        ips = []
+        for instance in security_group['instances']:
+            if instance['info_cache']['deleted']:
+                LOG.debug('ignoring deleted cache')
+                continue
+            nw_info = compute_utils.get_nw_info_for_instance(instance)
+            instance_ips = [ip['address'] for ip in nw_info.fixed_ips()
+                            if ip['version'] == version]
+            LOG.debug('ips: %r', instance_ips, instance=instance)
+            ips += instance_ips
+        return ips
+
+    def _update_security_group_ipset(self, security_group, version):
+        """Bring the ipset of the members of security_group up to date.
+
+        :returns: the name of the ipset
+        """
+        name = self._security_group_ipset_name(security_group['id'], version)
+        family = 'inet6' if version == 6 else 'inet'
+        self.ipset.set_members(
+            name, family,
+            self._security_group_member_ips(security_group, version))
+        return name
+
+    def _purge_unused_ipsets(self):
+        """Destroy the ipsets no instance rule matches against anymore."""
+        used = set()
+        for ipsets in self.instance_ipsets.values():
+            used.update(ipsets)
+        for ipsets in self.security_group_ipsets.values():
+            used.update(ipsets)
+        # A set which is still referenced because the new rules have not
+        # been applied yet is retried on the next purge.
+        self.ipset.destroy_unused_sets('nova-sg-', used)
+
     def _do_basic_rules(self, ipv4_rules, ipv6_rules, network_info):
         # Always drop invalid packets
         ipv4_rules += ['-m state --state ' 'INVALID -j DROP']
@@ -358,85 +439,270 @@ class IptablesFirewallDriver(FirewallDriver):
 
         security_groups = self._virtapi.security_group_get_by_instance(
             ctxt, instance)
+        ipsets = set()
+        security_group_ids = set()
 
         # then, security group chains and rules
         for security_group in security_groups:
-            rules = self._virtapi.security_group_rule_get_by_security_group(
-                ctxt, security_group)
+            sg_ipv4_rules, sg_ipv6_rules, sg_ipsets, grantees = (
+                self._security_group_rules(ctxt, security_group))
+            ipsets.update(sg_ipsets)
+            if self.use_security_group_chains:
+                self._update_security_group_chain(security_group,
+                                                  sg_ipv4_rules,
+                                                  sg_ipv6_rules, sg_ipsets,
+                                                  grantees)
+                chain_name = self._security_group_chain_name(
+                    security_group['id'])
+                ipv4_rules += ['-j $%s' % chain_name]
+                ipv6_rules += ['-j $%s' % chain_name]
+                security_group_ids.add(security_group['id'])
+            else:
+                ipv4_rules += sg_ipv4_rules
+                ipv6_rules += sg_ipv6_rules
 
-            for rule in rules:
-                LOG.debug(_('Adding security group rule: %r'), rule,
-                          instance=instance)
+            LOG.debug('Using fw_rules: %r', (ipv4_rules, ipv6_rules),
+                      instance=instance)
 
-                if not rule['cidr']:
-                    version = 4
-                else:
-                    version = netutils.get_ip_version(rule['cidr'])
+        ipv4_rules += ['-j $sg-fallback']
+        ipv6_rules += ['-j $sg-fallback']
 
-                if version == 4:
-                    fw_rules = ipv4_rules
-                else:
-                    fw_rules = ipv6_rules
+        self.instance_ipsets[instance['id']] = ipsets
+        if self.use_security_group_chains:
+            self.instance_security_groups[instance['id']] = security_group_ids
+        return ipv4_rules, ipv6_rules
 
-                protocol = rule['protocol']
+    def _security_group_rules(self, ctxt, security_group):
+        """Render the iptables rules of security_group.
 
-                if protocol:
-                    protocol = rule['protocol'].lower()
+        :returns: a tuple of the ipv4 rules, the ipv6 rules, the names of
+                  the ipsets they match against and the ids of the groups
+                  they grant access to
+        """
+        cache = self._security_group_rules_cache
+        if cache is not None and security_group['id'] in cache:
+            return cache[security_group['id']]
 
-                if version == 6 and protocol == 'icmp':
-                    protocol = 'icmpv6'
+        ipv4_rules = []
+        ipv6_rules = []
+        ipsets = set()
+        grantees = set()
+        rules = self._virtapi.security_group_rule_get_by_security_group(
+            ctxt, security_group)
 
-                args = ['-j ACCEPT']
-                if protocol:
-                    args += ['-p', protocol]
+        for rule in rules:
+            LOG.debug(_('Adding security group rule: %r'), rule)
 
-                if protocol in ['udp', 'tcp']:
-                    args += self._build_tcp_udp_rule(rule, version)
-                elif protocol == 'icmp':
-                    args += self._build_icmp_rule(rule, version)
-                if rule['cidr']:
-                    LOG.debug('Using cidr %r', rule['cidr'], instance=instance)
-                    args += ['-s', rule['cidr']]
-                    fw_rules += [' '.join(args)]
-                else:
-                    if rule['grantee_group']:
-                        for instance in rule['grantee_group']['instances']:
-                            if instance['info_cache']['deleted']:
-                                LOG.debug('ignoring deleted cache')
-                                continue
-                            nw_info = compute_utils.get_nw_info_for_instance(
-                                    instance)
+            if not rule['cidr']:
+                version = 4
+            else:
+                version = netutils.get_ip_version(rule['cidr'])
 
-                            ips = [ip['address']
-                                for ip in nw_info.fixed_ips()
-                                    if ip['version'] == version]
+            if version == 4:
+                fw_rules = ipv4_rules
+            else:
+                fw_rules = ipv6_rules
 
-                            LOG.debug('ips: %r', ips, instance=instance)
-                            for ip in ips:
-                                subrule = args + ['-s %s' % ip]
-                                fw_rules += [' '.join(subrule)]
+            protocol = rule['protocol']
 
-                LOG.debug('Using fw_rules: %r', fw_rules, instance=instance)
+            if protocol:
+                protocol = rule['protocol'].lower()
 
-        ipv4_rules += ['-j $sg-fallback']
-        ipv6_rules += ['-j $sg-fallback']
+            if version == 6 and protocol == 'icmp':
+                protocol = 'icmpv6'
 
-        return ipv4_rules, ipv6_rules
+            args = ['-j ACCEPT']
+            if protocol:
+                args += ['-p', protocol]
+
+            if protocol in ['udp', 'tcp']:
+                args += self._build_tcp_udp_rule(rule, version)
+            elif protocol == 'icmp':
+                args += self._build_icmp_rule(rule, version)
+            if rule['cidr']:
+                LOG.debug('Using cidr %r', rule['cidr'])
+                args += ['-s', rule['cidr']]
+                fw_rules += [' '.join(args)]
+            elif rule['grantee_group'] and self.use_ipset:
+                grantees.add(rule['grantee_group']['id'])
+                name = self._update_security_group_ipset(
+                        rule['grantee_group'], version)
+                ipsets.add(name)
+                subrule = args + ['-m set --match-set %s src' % name]
+                fw_rules += [' '.join(subrule)]
+            elif rule['grantee_group']:
+                grantees.add(rule['grantee_group']['id'])
+                ips = self._security_group_member_ips(
+                        rule['grantee_group'], version)
+                for ip in ips:
+                    subrule = args + ['-s %s' % ip]
+                    fw_rules += [' '.join(subrule)]
+
+        result = (ipv4_rules, ipv6_rules, ipsets, grantees)
+        if cache is not None:
+            cache[security_group['id']] = result
+        return result
+
+    @utils.synchronized('iptables', external=True)
+    def _update_security_group_chain(self, security_group, ipv4_rules,
+                                     ipv6_rules, ipsets, grantees):
+        """Bring the shared chain of security_group up to date."""
+        security_group_id = security_group['id']
+        self.security_groups[security_group_id] = security_group
+        self.security_group_grantees[security_group_id] = grantees
+        self.security_group_ipsets[security_group_id] = ipsets
+        if (self.security_group_chains.get(security_group_id) ==
+                (ipv4_rules, ipv6_rules)):
+            return
+        chain_name = self._security_group_chain_name(security_group_id)
+        self.iptables.ipv4['filter'].add_chain(chain_name)
+        self.iptables.ipv4['filter'].empty_chain(chain_name)
+        if CONF.use_ipv6:
+            self.iptables.ipv6['filter'].add_chain(chain_name)
+            self.iptables.ipv6['filter'].empty_chain(chain_name)
+        self._add_filters(chain_name, ipv4_rules, ipv6_rules)
+        self.security_group_chains[security_group_id] = (ipv4_rules,
+                                                         ipv6_rules)
+
+    def _purge_unused_security_group_chains(self):
+        """Remove the shared chains no instance jumps to anymore."""
+        used = set()
+        for security_group_ids in self.instance_security_groups.values():
+            used.update(security_group_ids)
+        for security_group_id in self.security_group_chains.keys():
+            if security_group_id in used:
+                continue
+            chain_name = self._security_group_chain_name(security_group_id)
+            self.iptables.ipv4['filter'].remove_chain(chain_name)
+            if CONF.use_ipv6:
+                self.iptables.ipv6['filter'].remove_chain(chain_name)
+            del self.security_group_chains[security_group_id]
+            self.security_groups.pop(security_group_id, None)
+            self.security_group_grantees.pop(security_group_id, None)
+            self.security_group_ipsets.pop(security_group_id, None)
 
     def instance_filter_exists(self, instance, network_info):
         pass
 
     def refresh_security_group_members(self, security_group):
-        self.do_refresh_security_group_rules(security_group)
-        self.iptables.apply()
+        if self.use_ipset:
+            # The rules only refer to the ipset of the group, so only
+            # the content of that set has to change.
+            self._refresh_security_group_ipsets(security_group)
+            return
+        self._coalesce_refresh('members', security_group)
 
     def refresh_security_group_rules(self, security_group):
-        self.do_refresh_security_group_rules(security_group)
-        self.iptables.apply()
+        self._coalesce_refresh('rules', security_group)
 
     def refresh_instance_security_rules(self, instance):
         self.do_refresh_instance_rules(instance)
+        self._purge_unused_security_group_chains()
+        self.iptables.apply()
+        self._purge_unused_ipsets()
+
+    def _coalesce_refresh(self, kind, security_group):
+        """Queue a security group refresh and process the queue.
+
+        Refreshes queued while the rules are being recomputed or applied
+        by another greenthread are handled by that greenthread in a single
+        further pass instead of one pass each. A failed pass is logged and
+        does not keep the refreshes queued after it from being processed;
+        its error is raised once the queue is empty.
+        """
+        self._pending_refreshes.append((kind, security_group))
+        if self._refreshing:
+            return
+        self._refreshing = True
+        exc_info = None
+        try:
+            while self._pending_refreshes:
+                if CONF.firewall_refresh_delay > 0:
+                    greenthread.sleep(CONF.firewall_refresh_delay)
+                refreshes = self._pending_refreshes
+                self._pending_refreshes = []
+                LOG.debug(_('Refreshing security group rules for %d '
+                            'coalesced requests'), len(refreshes))
+                try:
+                    self._do_coalesced_refreshes(refreshes)
+                except Exception:
+                    LOG.exception(_('Failed to refresh security group rules '
+                                    'for %d coalesced requests'),
+                                  len(refreshes))
+                    if exc_info is None:
+                        exc_info = sys.exc_info()
+        finally:
+            self._refreshing = False
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def _do_coalesced_refreshes(self, refreshes):
+        self._security_group_rules_cache = {}
+        try:
+            if self.use_security_group_chains:
+                self._refresh_security_group_chains(refreshes)
+            else:
+                self.do_refresh_security_group_rules(refreshes[-1][1])
+        finally:
+            self._security_group_rules_cache = None
         self.iptables.apply()
+        self._purge_unused_ipsets()
+
+    def _refresh_security_group_chains(self, refreshes):
+        """Re-render the shared chains affected by refreshes.
+
+        The rules of a group only change its own chain, and its members
+        only change the chains of the groups granting it access.
+        """
+        security_group_ids = set()
+        for kind, security_group_id in refreshes:
+            if kind == 'rules':
+                security_group_ids.add(security_group_id)
+            else:
+                security_group_ids.update(
+                    group_id for group_id, grantees
+                    in self.security_group_grantees.items()
+                    if security_group_id in grantees)
+
+        ctxt = context.get_admin_context()
+        for security_group_id in security_group_ids:
+            security_group = self.security_groups.get(security_group_id)
+            if security_group is None:
+                # No instance on this host is in the group.
+                continue
+            sg_ipv4_rules, sg_ipv6_rules, sg_ipsets, grantees = (
+                self._security_group_rules(ctxt, security_group))
+            self._update_security_group_chain(security_group, sg_ipv4_rules,
+                                              sg_ipv6_rules, sg_ipsets,
+                                              grantees)
+
+    def _refresh_security_group_ipsets(self, security_group_id):
+        names = set(self._security_group_ipset_name(security_group_id, v)
+                    for v in (4, 6))
+        for instance_id, ipsets in self.instance_ipsets.items():
+            if names & ipsets:
+                break
+        else:
+            # No rule of the instances on this host matches the group.
+            return
+
+        # Look the group up through the rules of an instance using it.
+        ctxt = context.get_admin_context()
+        instance = self.instances[instance_id]
+        for security_group in self._virtapi.security_group_get_by_instance(
+                ctxt, instance):
+            rules = self._virtapi.security_group_rule_get_by_security_group(
+                ctxt, security_group)
+            for rule in rules:
+                grantee_group = rule['grantee_group']
+                if grantee_group and grantee_group['id'] == security_group_id:
+                    for version in (4, 6):
+                        name = self._security_group_ipset_name(
+                            security_group_id, version)
+                        if name in ipsets:
+                            self._update_security_group_ipset(grantee_group,
+                                                              version)
+                    return
 
     @utils.synchronized('iptables', external=True)
     def _inner_do_refresh_rules(self, instance, ipv4_rules,
@@ -445,11 +711,19 @@ class IptablesFirewallDriver(FirewallDriver):
         self.add_filters_for_instance(instance, ipv4_rules, ipv6_rules)
 
     def do_refresh_security_group_rules(self, security_group):
-        for instance in self.instances.values():
-            network_info = self.network_infos[instance['id']]
-            ipv4_rules, ipv6_rules = self.instance_rules(instance,
-                                                         network_info)
-            self._inner_do_refresh_rules(instance, ipv4_rules, ipv6_rules)
+        own_cache = self._security_group_rules_cache is None
+        if own_cache:
+            self._security_group_rules_cache = {}
+        try:
+            for instance in self.instances.values():
+                network_info = self.network_infos[instance['id']]
+                ipv4_rules, ipv6_rules = self.instance_rules(instance,
+                                                             network_info)
+                self._inner_do_refresh_rules(instance, ipv4_rules,
+                                             ipv6_rules)
+        finally:
+            if own_cache:
+                self._security_group_rules_cache = None
 
     def do_refresh_instance_rules(self, instance):
         network_info = self.network_infos[instance['id']]
@@ -23,6 +23,8 @@ Handling of VM disk images.
 
 import os
 import re
+import stat
+import struct
 
 from oslo.config import cfg
 
@@ -173,6 +175,124 @@ def qemu_img_info(path):
     return QemuImgInfo(out)
 
 
+# The start of the qcow2 header: magic, version, backing file offset and
+# size, cluster bits and virtual size, see docs/specs/qcow2.txt in qemu.
+QCOW2_HEADER = struct.Struct('>4sIQIIQ')
+QCOW2_MAGIC = 'QFI\xfb'
+# Limits qemu enforces when opening a qcow2 image. Headers outside of them
+# are left to qemu-img to report on.
+QCOW2_MAX_BACKING_FILE_SIZE = 1023
+QCOW2_MIN_CLUSTER_BITS = 9
+QCOW2_MAX_CLUSTER_BITS = 21
+
+# Offsets and magic strings of the other image formats qemu-img probes
+# from the image contents. Images which start with none of these and with
+# no qcow2 header are raw.
+OTHER_IMAGE_MAGICS = [
+    (0, 'QED\x00'),  # qed
+    (0, 'KDMV'),  # vmdk
+    (0, 'COWD'),  # vmdk3
+    (0, '# Disk DescriptorFile'),  # vmdk descriptor
+    (0, 'conectix'),  # vpc
+    (0, 'vhdxfile'),  # vhdx
+    (0, 'LUKS\xba\xbe'),  # luks
+    (0, 'OOOM'),  # cow
+    (0, 'WithoutFreeSpace'),  # parallels
+    (0, 'WithouFreSpacExt'),  # parallels
+    (0, 'Bochs Virtual HD Image'),  # bochs
+    (0, '#!/bin/sh\n#V2.0 Format\n'),  # cloop
+    (64, '\x7f\x10\xda\xbe'),  # vdi
+]
+IMAGE_PROBE_SIZE = 512
+
+# Maps image paths to the (inode, mtime, size) of the file when it was
+# read and the QemuImgInfo read from it.
+_image_info_cache = {}
+IMAGE_INFO_CACHE_SIZE = 4096
+
+
+def _read_image_header(path, st):
+    """Read the format, virtual size and backing file of a qcow2 or raw
+    image from its header.
+
+    Returns None for images of other formats.
+    """
+    with open(path, 'rb') as f:
+        header = f.read(IMAGE_PROBE_SIZE)
+        info = QemuImgInfo()
+        info.image = path
+        info.disk_size = st.st_blocks * 512
+        if header.startswith(QCOW2_MAGIC):
+            if len(header) < QCOW2_HEADER.size:
+                return None
+            (magic, version, backing_file_offset, backing_file_size,
+             cluster_bits, virtual_size) = QCOW2_HEADER.unpack_from(header)
+            if (version not in (2, 3) or
+                    backing_file_size > QCOW2_MAX_BACKING_FILE_SIZE or
+                    not (QCOW2_MIN_CLUSTER_BITS <= cluster_bits <=
+                         QCOW2_MAX_CLUSTER_BITS)):
+                return None
+            info.file_format = 'qcow2'
+            info.virtual_size = virtual_size
+            info.cluster_size = 1 << cluster_bits
+            if backing_file_offset:
+                f.seek(backing_file_offset)
+                backing_file = f.read(backing_file_size)
+                if len(backing_file) != backing_file_size:
+                    # Truncated image
+                    return None
+                if ':' in backing_file:
+                    # Possibly a protocol, which qemu-img resolves
+                    return None
+                info.backing_file = os.path.join(os.path.dirname(path),
+                                                 backing_file)
+            return info
+
+    for offset, magic in OTHER_IMAGE_MAGICS:
+        if header[offset:offset + len(magic)] == magic:
+            return None
+    info.file_format = 'raw'
+    info.virtual_size = st.st_size
+    return info
+
+
+def image_info(path):
+    """Return an object with the format, virtual size and backing file of
+    a disk image.
+
+    qcow2 and raw images are read directly instead of running qemu-img
+    info, and what is read is cached until the file changes, so that this
+    is cheap enough to call for every disk of a host on each audit.
+    Images of other formats and anything that isn't a regular file are
+    left to qemu_img_info.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return qemu_img_info(path)
+    if not stat.S_ISREG(st.st_mode):
+        return qemu_img_info(path)
+
+    key = (st.st_ino, st.st_mtime, st.st_size)
+    cached = _image_info_cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    try:
+        info = _read_image_header(path, st)
+    except IOError as e:
+        LOG.debug(_('Could not read the header of %(path)s: %(error)s'),
+                  {'path': path, 'error': e})
+        info = None
+    if info is None:
+        info = qemu_img_info(path)
+
+    if len(_image_info_cache) >= IMAGE_INFO_CACHE_SIZE:
+        _image_info_cache.clear()
+    _image_info_cache[path] = (key, info)
+    return info
+
+
 def convert_image(source, dest, out_format, run_as_root=False):
     """Convert image to other format."""
     cmd = ('qemu-img', 'convert', '-O', out_format, source, dest)
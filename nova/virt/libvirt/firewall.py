@@ -320,8 +320,12 @@ class IptablesFirewallDriver(base_firewall.IptablesFirewallDriver):
         if self.instances.pop(instance['id'], None):
             # NOTE(vish): use the passed info instead of the stored info
             self.network_infos.pop(instance['id'])
+            self.instance_ipsets.pop(instance['id'], None)
+            self.instance_security_groups.pop(instance['id'], None)
             self.remove_filters_for_instance(instance)
+            self._purge_unused_security_group_chains()
             self.iptables.apply()
+            self._purge_unused_ipsets()
             self.nwfilter.unfilter_instance(instance, network_info)
         else:
             LOG.info(_('Attempted to unfilter instance which is not '
@@ -49,6 +49,9 @@ class Dom0IptablesFirewallDriver(firewall.IptablesFirewallDriver):
         self._session = xenapi_session
         # Create IpTablesManager with executor through plugin
         self.iptables = linux_net.IptablesManager(self._plugin_execute)
+        # NOTE: the xenhost plugin only runs iptables, so there is no
+        # ipset in dom0 to match security group members against.
+        self.use_ipset = False
         self.iptables.ipv4['filter'].add_chain('sg-fallback')
         self.iptables.ipv4['filter'].add_rule('sg-fallback', '-j DROP')
         self.iptables.ipv6['filter'].add_chain('sg-fallback')
@@ -48,8 +48,9 @@ class BaseWeigher(object):
         """Weigh multiple objects.  Override in a subclass if you need
         need access to all objects in order to manipulate weights.
         """
+        weight_multiplier = self._weight_multiplier()
         for obj in weighed_obj_list:
-            obj.weight += (self._weight_multiplier() *
+            obj.weight += (weight_multiplier *
                            self._weigh_object(obj.obj, weight_properties))
 
 
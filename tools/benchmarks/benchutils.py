@@ -0,0 +1,78 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Helpers shared by the benchmark scripts in this directory."""
+
+import os
+import sys
+import time
+
+TOPDIR = os.path.normpath(os.path.join(os.path.dirname(__file__),
+                                       os.pardir, os.pardir))
+if TOPDIR not in sys.path:
+    sys.path.insert(0, TOPDIR)
+
+from oslo.config import cfg
+from sqlalchemy import event
+
+CONF = cfg.CONF
+
+
+def setup_database():
+    """Point nova at a private in-memory sqlite DB and create the schema."""
+    from nova.db import migration
+    from nova.openstack.common.db.sqlalchemy import session
+
+    CONF([], project='nova')
+    CONF.set_override('connection', 'sqlite://', group='database')
+    migration.db_sync()
+    return session.get_engine()
+
+
+class QueryCounter(object):
+    """Count the SQL statements executed on an engine."""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args, **kwargs):
+        self.count += 1
+
+    def reset(self):
+        self.count = 0
+
+
+def timed(func, repeat=5):
+    """Run func repeat times; return (best time in ms, last result)."""
+    best = None
+    result = None
+    for i in xrange(repeat):
+        start = time.time()
+        result = func()
+        elapsed = (time.time() - start) * 1000.0
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(x)) for x in col) for col in zip(headers, *rows)]
+    fmt = '  '.join('%%%ds' % w for w in widths)
+    print fmt % tuple(headers)
+    for row in rows:
+        print fmt % tuple(row)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the EC2 DescribeInstances call against the instance count.
+
+Creates growing numbers of instances spread over a few hosts in
+availability zones and describes them all through the EC2 cloud
+controller, once with the ec2 id mappings not yet memoized, once with
+them memoized as on a long running API server and once page by page with
+MaxResults. It reports the time spent and the database queries issued.
+
+Usage: python tools/benchmarks/ec2_describe_instances.py [instances ...]
+"""
+
+import os
+import sys
+
+import benchutils
+
+from nova.api.ec2 import cloud
+from nova.api.ec2 import ec2utils
+from nova.compute import flavors
+from nova import context
+from nova import db
+from nova.network import model as network_model
+
+HOSTS = 4
+PAGE_SIZE = 100
+
+
+def make_network_info(address):
+    ip = network_model.FixedIP(address=address)
+    subnet = network_model.Subnet(cidr='10.0.0.0/8', ips=[ip])
+    network = network_model.Network(subnets=[subnet])
+    return network_model.NetworkInfo([network_model.VIF(network=network)])
+
+
+def create_zones(ctxt):
+    for i in xrange(HOSTS):
+        aggregate = db.aggregate_create(ctxt, {'name': 'agg%d' % i},
+                                        {'availability_zone': 'zone%d' % i})
+        db.aggregate_host_add(ctxt, aggregate['id'], 'compute%d' % i)
+
+
+def create_instances(ctxt, start, stop):
+    sys_meta = flavors.save_flavor_info({}, flavors.get_default_flavor())
+    for i in xrange(start, stop):
+        instance = db.instance_create(ctxt, {
+            'host': 'compute%d' % (i % HOSTS),
+            'hostname': 'vm%d' % i,
+            'reservation_id': 'r-%d' % (i / 10),
+            'user_id': 'fake-user',
+            'project_id': 'fake-project',
+            'image_ref': 'cedef40a-ed67-4d10-800e-17455edce175',
+            'kernel_id': '155d900f-4e14-4e4c-a73d-069cbf4541e6',
+            'ramdisk_id': 'a2459075-d96c-40d5-893e-577ff92e721c',
+            'vm_state': 'active',
+            'system_metadata': sys_meta,
+            'metadata': {'role': 'web'}})
+        db.instance_info_cache_update(ctxt, instance['uuid'], {
+            'network_info': make_network_info(
+                '10.1.%d.%d' % divmod(i, 250)).json()})
+
+
+def count_instances(result):
+    return sum(len(reservation['instancesSet'])
+               for reservation in result['reservationSet'])
+
+
+def describe_all(controller, ctxt):
+    return count_instances(controller.describe_instances(ctxt))
+
+
+def describe_pages(controller, ctxt):
+    num_instances = 0
+    next_token = None
+    while True:
+        result = controller.describe_instances(ctxt, max_results=PAGE_SIZE,
+                                               next_token=next_token)
+        num_instances += count_instances(result)
+        next_token = result.get('nextToken')
+        if not next_token:
+            return num_instances
+
+
+def main(argv):
+    counts = [int(arg) for arg in argv[1:]] or [100, 400, 1600]
+    engine = benchutils.setup_database()
+    benchutils.CONF.set_override('policy_file', os.path.join(
+        benchutils.TOPDIR, 'etc', 'nova', 'policy.json'))
+    queries = benchutils.QueryCounter(engine)
+    ctxt = context.get_admin_context()
+    controller = cloud.CloudController()
+    create_zones(ctxt)
+
+    rows = []
+    created = 0
+    for num_instances in sorted(counts):
+        create_instances(ctxt, created, num_instances)
+        created = num_instances
+        for name, describe in (('cold', describe_all),
+                               ('memoized', describe_all),
+                               ('pages', describe_pages)):
+            if name == 'cold':
+                ec2utils.reset_cache()
+            queries.reset()
+            msecs, described = benchutils.timed(
+                lambda: describe(controller, ctxt), repeat=1)
+            assert described == num_instances
+            rows.append((num_instances, name, '%.1f' % msecs,
+                         '%.3f' % (msecs / num_instances), queries.count))
+
+    print 'hosts: %d, page size: %d' % (HOSTS, PAGE_SIZE)
+    benchutils.print_table(['instances', 'mode', 'describe ms',
+                            'ms/instance', 'queries'], rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark security group member rules of the iptables firewall driver.
+
+Filters a number of local instances which all allow traffic from the
+members of one source security group, once with one iptables rule per
+member address, once with firewall_security_group_chains so that those
+rules are shared by the instances, and once with firewall_use_ipset. It
+reports the number of iptables rules, the time it takes to filter the
+instances and to handle a membership change, and the number of lines fed
+to iptables-restore and ipset restore for that change.
+
+Usage: python tools/benchmarks/firewall_ipset.py [instances [members]]
+"""
+
+import sys
+import tempfile
+
+import benchutils
+
+from nova.compute import utils as compute_utils
+from nova.network import linux_net
+from nova.network import model as network_model
+from nova.virt import firewall
+
+
+def make_network_info(address):
+    ip = network_model.FixedIP(address=address)
+    subnet = network_model.Subnet(cidr='10.0.0.0/8', ips=[ip])
+    network = network_model.Network(subnets=[subnet])
+    return network_model.NetworkInfo([network_model.VIF(network=network)])
+
+
+def make_members(num_members, offset=0):
+    return [{'uuid': 'member-%d' % (i + offset),
+             'info_cache': {'deleted': False},
+             'nw_info': make_network_info('10.1.%d.%d' % divmod(
+                 i + offset, 250))}
+            for i in xrange(num_members)]
+
+
+class FakeVirtAPI(object):
+    def __init__(self, members):
+        self.source_group = {'id': 2, 'instances': members}
+
+    def security_group_get_by_instance(self, context, instance):
+        return [{'id': 1}]
+
+    def security_group_rule_get_by_security_group(self, context,
+                                                  security_group):
+        return [{'cidr': None, 'protocol': 'tcp', 'from_port': 22,
+                 'to_port': 22, 'grantee_group': self.source_group}]
+
+    def provider_fw_rule_get_all(self, context):
+        return []
+
+
+class FakeExecute(object):
+    def __init__(self):
+        self.restore_lines = 0
+
+    def __call__(self, *cmd, **kwargs):
+        if cmd[0].endswith('-restore') or cmd[:2] == ('ipset', 'restore'):
+            self.restore_lines += kwargs['process_input'].count('\n')
+        return '', ''
+
+
+def run(use_ipset, use_chains, num_instances, num_members):
+    benchutils.CONF.set_override('firewall_use_ipset', use_ipset)
+    benchutils.CONF.set_override('firewall_security_group_chains',
+                                 use_chains)
+    execute = FakeExecute()
+    linux_net.iptables_manager = linux_net.IptablesManager(execute)
+    linux_net.ipset_manager = linux_net.IpsetManager(execute)
+    virtapi = FakeVirtAPI(make_members(num_members))
+    driver = firewall.IptablesFirewallDriver(virtapi)
+
+    instances = [{'id': i, 'uuid': 'instance-%d' % i}
+                 for i in xrange(num_instances)]
+    msecs, unused = benchutils.timed(lambda: filter_instances(driver,
+                                                              instances),
+                                     repeat=1)
+    num_rules = len(driver.iptables.ipv4['filter'].rules)
+
+    # One member leaves the group and another one joins it.
+    virtapi.source_group['instances'] = (
+        virtapi.source_group['instances'][1:] + make_members(1, num_members))
+    execute.restore_lines = 0
+    refresh_msecs, unused = benchutils.timed(
+        lambda: driver.refresh_security_group_members(2), repeat=1)
+    return num_rules, msecs, refresh_msecs, execute.restore_lines
+
+
+def filter_instances(driver, instances):
+    driver.filter_defer_apply_on()
+    for instance in instances:
+        network_info = make_network_info('10.2.%d.%d' % divmod(
+            instance['id'], 250))
+        driver.prepare_instance_filter(instance, network_info)
+    driver.filter_defer_apply_off()
+
+
+def main(argv):
+    num_instances = int(argv[1]) if len(argv) > 1 else 100
+    num_members = int(argv[2]) if len(argv) > 2 else 500
+    benchutils.CONF([], project='nova')
+    benchutils.CONF.set_override('lock_path', tempfile.mkdtemp())
+    compute_utils.get_nw_info_for_instance = lambda instance: (
+        instance['nw_info'])
+
+    rows = []
+    for name, use_ipset, use_chains in (('per-member', False, False),
+                                        ('shared chains', False, True),
+                                        ('ipset', True, False)):
+        num_rules, msecs, refresh_msecs, restore_lines = run(
+            use_ipset, use_chains, num_instances, num_members)
+        rows.append((name, num_rules, '%.1f' % msecs,
+                     '%.1f' % refresh_msecs, restore_lines))
+
+    print 'instances: %d, source group members: %d' % (num_instances,
+                                                       num_members)
+    benchutils.print_table(['mode', 'rules', 'filter ms', 'refresh ms',
+                            'restore lines on refresh'], rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
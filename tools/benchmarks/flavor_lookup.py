@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark flavor lookups with and without the flavor cache.
+
+Looks flavors up the way server creates and resizes do, by flavor id, and
+lists all of them the way the cells capacity update does, once with
+flavor_cache_seconds set to 0 and once with the cache enabled. It reports
+the time spent and the database queries issued.
+
+Usage: python tools/benchmarks/flavor_lookup.py [lookups]
+"""
+
+import sys
+
+import benchutils
+
+from nova.compute import flavors
+from nova import context
+from nova import db
+
+EXTRA_SPECS = {'hw:cpu_policy': 'shared', 'quota:disk_read_bytes_sec': '1000'}
+
+
+def add_extra_specs(ctxt):
+    for flavor in flavors.get_all_flavors(ctxt).values():
+        db.flavor_extra_specs_update_or_create(ctxt, flavor['flavorid'],
+                                               EXTRA_SPECS)
+    flavors.invalidate_cache()
+
+
+def lookup_by_flavor_id(ctxt, flavorids, num_lookups):
+    for i in xrange(num_lookups):
+        flavors.get_flavor_by_flavor_id(flavorids[i % len(flavorids)],
+                                        ctxt=ctxt)
+
+
+def list_all(ctxt, flavorids, num_lookups):
+    for i in xrange(num_lookups):
+        flavors.get_all_flavors(ctxt)
+
+
+def main(argv):
+    num_lookups = int(argv[1]) if len(argv) > 1 else 1000
+    engine = benchutils.setup_database()
+    queries = benchutils.QueryCounter(engine)
+    ctxt = context.get_admin_context()
+    add_extra_specs(ctxt)
+    flavorids = [flavor['flavorid']
+                 for flavor in flavors.get_all_flavors(ctxt).values()]
+
+    rows = []
+    for name, lookup in (('by flavor id', lookup_by_flavor_id),
+                         ('all flavors', list_all)):
+        for cache_seconds in (0, 60):
+            benchutils.CONF.set_override('flavor_cache_seconds',
+                                         cache_seconds)
+            flavors.invalidate_cache()
+            queries.reset()
+            msecs, unused = benchutils.timed(
+                lambda: lookup(ctxt, flavorids, num_lookups), repeat=1)
+            rows.append((name, 'on' if cache_seconds else 'off',
+                         '%.1f' % msecs, '%.3f' % (msecs / num_lookups),
+                         queries.count))
+
+    print 'lookups: %d, flavors: %d' % (num_lookups, len(flavorids))
+    benchutils.print_table(['lookup', 'cache', 'total ms', 'ms/lookup',
+                            'queries'], rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
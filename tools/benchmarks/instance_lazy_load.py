@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark loading optional attributes of a list of instances.
+
+Lists instances without their optional attributes and then loads the
+attributes the compute periodic tasks use, once by lazy-loading them one
+instance at a time and once for the whole list with InstanceList.fill. It
+reports the time spent and the database queries issued.
+
+Usage: python tools/benchmarks/instance_lazy_load.py [instances]
+"""
+
+import sys
+
+import benchutils
+
+from nova.compute import flavors
+from nova import context
+from nova import db
+from nova.objects import instance as instance_obj
+
+ATTRS = ['metadata', 'system_metadata', 'info_cache', 'security_groups']
+
+
+def create_instances(num_instances):
+    # The default security group of the project is added to the instances
+    ctxt = context.RequestContext('fake-user', 'fake-project',
+                                  is_admin=False)
+    sys_meta = flavors.save_flavor_info({}, flavors.get_default_flavor())
+    for i in xrange(num_instances):
+        db.instance_create(ctxt, {
+            'host': 'compute1',
+            'hostname': 'vm%d' % i,
+            'user_id': 'fake-user',
+            'project_id': 'fake-project',
+            'system_metadata': sys_meta,
+            'metadata': {'role': 'web'},
+            'security_groups': ['default']})
+
+
+def lazy_load(instances):
+    for instance in instances:
+        for attr in ATTRS:
+            getattr(instance, attr)
+
+
+def run(ctxt, fill, queries):
+    instances = instance_obj.InstanceList.get_by_host(ctxt, 'compute1',
+                                                      expected_attrs=[])
+    queries.reset()
+    if fill:
+        msecs, unused = benchutils.timed(lambda: instances.fill(ATTRS),
+                                         repeat=1)
+    else:
+        msecs, unused = benchutils.timed(lambda: lazy_load(instances),
+                                         repeat=1)
+    return msecs, queries.count
+
+
+def main(argv):
+    num_instances = int(argv[1]) if len(argv) > 1 else 200
+    engine = benchutils.setup_database()
+    queries = benchutils.QueryCounter(engine)
+    ctxt = context.get_admin_context()
+    create_instances(num_instances)
+
+    rows = []
+    for name, fill in (('lazy-load', False), ('fill', True)):
+        msecs, num_queries = run(ctxt, fill, queries)
+        rows.append((name, '%.1f' % msecs, num_queries))
+
+    print 'instances: %d, attributes: %s' % (num_instances, ', '.join(ATTRS))
+    benchutils.print_table(['mode', 'load ms', 'queries'], rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark listing all instances page by page.
+
+Walks through all instances the way API clients page through servers,
+with the optional attributes of the detail view and with none as the
+index view now does, and once with instance_get_all_by_filters_iter,
+which continues each chunk from the last instance of the previous one
+instead of looking the marker up. It reports the time spent and the
+database queries issued.
+
+Usage: python tools/benchmarks/instance_list.py [instances [page size]]
+"""
+
+import sys
+
+import benchutils
+
+from nova.compute import flavors
+from nova import context
+from nova import db
+
+DETAIL_ATTRS = ['metadata', 'system_metadata', 'info_cache',
+                'security_groups']
+
+
+def create_instances(ctxt, num_instances):
+    sys_meta = flavors.save_flavor_info({}, flavors.get_default_flavor())
+    for i in xrange(num_instances):
+        db.instance_create(ctxt, {
+            'hostname': 'vm%d' % i,
+            'display_name': 'vm%d' % i,
+            'user_id': 'fake-user',
+            'project_id': 'fake-project',
+            'system_metadata': sys_meta,
+            'metadata': {'role': 'web'}})
+
+
+def list_pages(ctxt, page_size, columns_to_join):
+    uuids = []
+    marker = None
+    while True:
+        page = db.instance_get_all_by_filters(
+            ctxt, {}, limit=page_size, marker=marker,
+            columns_to_join=columns_to_join)
+        uuids.extend(instance['uuid'] for instance in page)
+        if len(page) < page_size:
+            return uuids
+        marker = page[-1]['uuid']
+
+
+def list_iter(ctxt, page_size, columns_to_join):
+    return [instance['uuid'] for instance in
+            db.instance_get_all_by_filters_iter(
+                ctxt, {}, chunk_size=page_size,
+                columns_to_join=columns_to_join)]
+
+
+def main(argv):
+    num_instances = int(argv[1]) if len(argv) > 1 else 2000
+    page_size = int(argv[2]) if len(argv) > 2 else 100
+    engine = benchutils.setup_database()
+    queries = benchutils.QueryCounter(engine)
+    ctxt = context.get_admin_context()
+    create_instances(ctxt, num_instances)
+
+    rows = []
+    expected = None
+    for name, list_func, columns_to_join in (
+            ('detail pages', list_pages, DETAIL_ATTRS),
+            ('index pages', list_pages, []),
+            ('detail iter', list_iter, DETAIL_ATTRS)):
+        queries.reset()
+        msecs, uuids = benchutils.timed(
+            lambda: list_func(ctxt, page_size, columns_to_join), repeat=1)
+        expected = expected or uuids
+        assert uuids == expected and len(uuids) == num_instances
+        rows.append((name, '%.1f' % msecs, queries.count))
+
+    print 'instances: %d, page size: %d' % (num_instances, page_size)
+    benchutils.print_table(['mode', 'list ms', 'queries'], rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the metadata API under a cloud-init storm.
+
+Creates a number of instances and lets each of them fetch the metadata
+paths cloud-init reads at boot, once with the metadata built on demand by
+the metadata handler, once with the requesters resolved through the fixed
+IP index of metadata_fixed_ip_index_interval and once pre-rendered into
+the shared cache the way compute hosts do with metadata_prerender. It
+reports the time spent serving the requests and the database queries and
+network API calls the requests caused.
+
+Usage: python tools/benchmarks/metadata_load.py [instances]
+"""
+
+import os
+import sys
+
+import benchutils
+import webob
+
+from nova.api.metadata import base
+from nova.api.metadata import handler
+from nova import cache_utils
+from nova.compute import flavors
+from nova.compute import utils as compute_utils
+from nova import context
+from nova import db
+from nova.network import api as network_api
+from nova.network import model as network_model
+
+PATHS = ['/2009-04-04/meta-data/',
+         '/2009-04-04/meta-data/instance-id',
+         '/2009-04-04/meta-data/local-ipv4',
+         '/2009-04-04/meta-data/public-keys/',
+         '/2009-04-04/meta-data/public-keys/0/openssh-key',
+         '/2009-04-04/meta-data/placement/availability-zone',
+         '/2009-04-04/user-data',
+         '/openstack/latest/meta_data.json',
+         '/openstack/latest/user_data']
+
+
+class NetworkCallCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def wrap(self, func):
+        def counted(*args, **kwargs):
+            self.count += 1
+            return func(*args, **kwargs)
+        return counted
+
+
+def make_network_info(address):
+    ip = network_model.FixedIP(address=address)
+    subnet = network_model.Subnet(cidr='10.0.0.0/8', ips=[ip])
+    network = network_model.Network(subnets=[subnet])
+    return network_model.NetworkInfo([network_model.VIF(network=network)])
+
+
+def create_instances(ctxt, num_instances):
+    sys_meta = flavors.save_flavor_info({}, flavors.get_default_flavor())
+    instances = []
+    for i in xrange(num_instances):
+        address = '10.1.%d.%d' % divmod(i, 250)
+        instance = db.instance_create(ctxt, {
+            'host': 'compute1',
+            'hostname': 'vm%d' % i,
+            'image_ref': 'cedef40a-ed67-4d10-800e-17455edce175',
+            'kernel_id': '155d900f-4e14-4e4c-a73d-069cbf4541e6',
+            'ramdisk_id': 'a2459075-d96c-40d5-893e-577ff92e721c',
+            'key_name': 'mykey',
+            'key_data': 'ssh-rsa AAAAB3Nzai....N3NtHw== someuser@somehost',
+            'launch_index': 0,
+            'root_device_name': '/dev/vda',
+            'user_data': 'IyEvYmluL3NoCmVjaG8gaGVsbG8K',
+            'system_metadata': sys_meta,
+            'metadata': {'role': 'web'}})
+        db.instance_info_cache_update(ctxt, instance['uuid'], {
+            'network_info': make_network_info(address).json()})
+        db.fixed_ip_create(ctxt, {'address': address,
+                                  'instance_uuid': instance['uuid']})
+        instances.append((address, db.instance_get_by_uuid(
+            ctxt, instance['uuid'])))
+    return instances
+
+
+def serve(app, instances):
+    for address, instance in instances:
+        for path in PATHS:
+            request = webob.Request.blank(path)
+            request.remote_addr = address
+            response = request.get_response(app)
+            assert response.status_int == 200, (path, response.status)
+
+
+def run(instances, indexed, prerender, queries, network_calls):
+    app = handler.MetadataRequestHandler()
+    app._cache = cache_utils.Client()
+    app._fixed_ip_index = base.FixedIpIndex() if indexed else None
+    prerender_msecs = 0.0
+    if prerender:
+        prerender_msecs, unused = benchutils.timed(
+            lambda: [base.cache_instance_metadata(
+                         app._cache, instance,
+                         compute_utils.get_nw_info_for_instance(instance),
+                         conductor_api=app.conductor_api)
+                     for address, instance in instances],
+            repeat=1)
+
+    queries.reset()
+    network_calls.count = 0
+    msecs, unused = benchutils.timed(lambda: serve(app, instances), repeat=1)
+    return prerender_msecs, msecs, queries.count, network_calls.count
+
+
+def main(argv):
+    num_instances = int(argv[1]) if len(argv) > 1 else 200
+    engine = benchutils.setup_database()
+    benchutils.CONF.set_override('use_local', True, group='conductor')
+    benchutils.CONF.set_override('policy_file', os.path.join(
+        benchutils.TOPDIR, 'etc', 'nova', 'policy.json'))
+    benchutils.CONF.set_override('metadata_fixed_ip_index_interval', 60)
+    queries = benchutils.QueryCounter(engine)
+
+    network_calls = NetworkCallCounter()
+    network_api.API.get_fixed_ip_by_address = network_calls.wrap(
+        network_api.API.get_fixed_ip_by_address.im_func)
+    network_api.API.get_fixed_ip_instance_uuids = network_calls.wrap(
+        network_api.API.get_fixed_ip_instance_uuids.im_func)
+    network_api.API.get_instance_nw_info = network_calls.wrap(
+        lambda self, context, instance, **kwargs:
+            compute_utils.get_nw_info_for_instance(instance))
+
+    ctxt = context.get_admin_context()
+    instances = create_instances(ctxt, num_instances)
+
+    rows = []
+    for name, indexed, prerender in (('on demand', False, False),
+                                     ('indexed', True, False),
+                                     ('prerendered', False, True)):
+        prerender_msecs, msecs, num_queries, num_network_calls = run(
+            instances, indexed, prerender, queries, network_calls)
+        num_requests = len(instances) * len(PATHS)
+        rows.append((name, num_requests, '%.1f' % prerender_msecs,
+                     '%.1f' % msecs, '%.3f' % (msecs / num_requests),
+                     num_queries, num_network_calls))
+
+    print 'instances: %d, paths per instance: %d' % (num_instances,
+                                                     len(PATHS))
+    benchutils.print_table(['mode', 'requests', 'prerender ms', 'serve ms',
+                            'ms/request', 'queries', 'network calls'], rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
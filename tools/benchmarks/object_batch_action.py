@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark refreshing and saving many instances through the conductor.
+
+Refreshes a list of instances and saves a power state change for each of
+them the way _sync_power_states does, with object methods remoted to a
+conductor manager through a loopback indirection API which serializes the
+calls and replies like RPC does. This is done once with one conductor call
+per instance and method, and once with InstanceList.refresh_all and
+save_all. It reports the time spent and the number of conductor calls.
+
+Usage: python tools/benchmarks/object_batch_action.py [instances]
+"""
+
+import sys
+
+import benchutils
+
+from nova.compute import power_state
+from nova.conductor import manager
+from nova import context
+from nova import db
+from nova.objects import base
+from nova.objects import instance as instance_obj
+from nova.openstack.common import jsonutils
+
+
+class LoopbackIndirectionAPI(object):
+    """Remote object methods to a conductor manager in this process."""
+
+    def __init__(self):
+        self.manager = manager.ConductorManager()
+        self.serializer = base.NovaObjectSerializer()
+        self.calls = 0
+
+    def _transfer(self, ctxt, entity):
+        message = jsonutils.dumps(self.serializer.serialize_entity(ctxt,
+                                                                   entity))
+        return self.serializer.deserialize_entity(ctxt,
+                                                  jsonutils.loads(message))
+
+    def _call(self, ctxt, method, **kwargs):
+        self.calls += 1
+        kwargs = dict((key, self._transfer(ctxt, value))
+                      for key, value in kwargs.iteritems())
+        base.NovaObject.indirection_api = None
+        try:
+            result = getattr(self.manager, method)(ctxt, **kwargs)
+        finally:
+            base.NovaObject.indirection_api = self
+        return self._transfer(ctxt, result)
+
+    def object_class_action(self, ctxt, objname, objmethod, objver, args,
+                            kwargs):
+        return self._call(ctxt, 'object_class_action', objname=objname,
+                          objmethod=objmethod, objver=objver, args=args,
+                          kwargs=kwargs)
+
+    def object_action(self, ctxt, objinst, objmethod, args, kwargs):
+        return self._call(ctxt, 'object_action', objinst=objinst,
+                          objmethod=objmethod, args=args, kwargs=kwargs)
+
+    def object_action_batch(self, ctxt, objinsts, objmethod, args, kwargs):
+        return self._call(ctxt, 'object_action_batch', objinsts=objinsts,
+                          objmethod=objmethod, args=args, kwargs=kwargs)
+
+
+def create_instances(ctxt, num_instances):
+    for i in xrange(num_instances):
+        db.instance_create(ctxt, {
+            'host': 'compute1',
+            'hostname': 'vm%d' % i,
+            'user_id': 'fake-user',
+            'project_id': 'fake-project',
+            'power_state': power_state.RUNNING})
+
+
+def sync_each(instances, state):
+    for instance in instances:
+        instance.refresh()
+        instance.power_state = state
+        instance.save()
+
+
+def sync_batched(instances, state):
+    instances.refresh_all()
+    for instance in instances:
+        instance.power_state = state
+    instances.save_all()
+
+
+def main(argv):
+    num_instances = int(argv[1]) if len(argv) > 1 else 200
+    benchutils.setup_database()
+    ctxt = context.get_admin_context()
+    create_instances(ctxt, num_instances)
+    indirection_api = LoopbackIndirectionAPI()
+    base.NovaObject.indirection_api = indirection_api
+
+    rows = []
+    for name, sync, state in (('per instance', sync_each,
+                               power_state.SHUTDOWN),
+                              ('batched', sync_batched,
+                               power_state.RUNNING)):
+        instances = instance_obj.InstanceList.get_by_host(ctxt, 'compute1')
+        indirection_api.calls = 0
+        msecs, unused = benchutils.timed(lambda: sync(instances, state),
+                                         repeat=1)
+        assert all(instance['power_state'] == state for instance in
+                   db.instance_get_all_by_host(ctxt, 'compute1'))
+        rows.append((name, '%.1f' % msecs, indirection_api.calls))
+
+    print 'instances: %d' % num_instances
+    benchutils.print_table(['mode', 'sync ms', 'conductor calls'], rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the RPC serialization of objects.
+
+Serializes an Instance, an InstanceList and a ComputeNode the way RPC
+messages carrying them are built and parsed, with the NovaObjectSerializer
+followed by JSON encoding, once in the regular object format and once in
+the compact one used with the conductor compact_objects option. It
+reports the time spent serializing, the time of a full round trip and the
+size of the message.
+
+Usage: python tools/benchmarks/object_serialization.py [instances]
+"""
+
+import sys
+
+import benchutils
+
+from nova.compute import flavors
+from nova import context
+from nova import db
+from nova.network import model as network_model
+from nova.objects import base
+from nova.objects import compute_node
+from nova.objects import instance as instance_obj
+from nova.openstack.common import jsonutils
+from nova.openstack.common import timeutils
+
+REPEAT = 20
+
+
+def make_network_info(address):
+    ip = network_model.FixedIP(address=address)
+    subnet = network_model.Subnet(cidr='10.0.0.0/8', ips=[ip])
+    network = network_model.Network(id='net1', label='private',
+                                    subnets=[subnet])
+    return network_model.NetworkInfo([network_model.VIF(
+        id='vif-%s' % address, address='fa:16:3e:00:00:01',
+        network=network)])
+
+
+def create_instances(ctxt, num_instances):
+    sys_meta = flavors.save_flavor_info({}, flavors.get_default_flavor())
+    for i in xrange(num_instances):
+        instance = db.instance_create(ctxt, {
+            'host': 'compute1',
+            'node': 'node1',
+            'hostname': 'vm%d' % i,
+            'display_name': 'vm%d' % i,
+            'user_id': 'fake-user',
+            'project_id': 'fake-project',
+            'image_ref': 'cedef40a-ed67-4d10-800e-17455edce175',
+            'vm_state': 'active',
+            'power_state': 1,
+            'memory_mb': 512,
+            'vcpus': 1,
+            'root_gb': 1,
+            'launched_at': timeutils.utcnow(),
+            'scheduled_at': timeutils.utcnow(),
+            'system_metadata': sys_meta,
+            'metadata': {'role': 'web'}})
+        db.instance_info_cache_update(ctxt, instance['uuid'], {
+            'network_info': make_network_info(
+                '10.1.%d.%d' % divmod(i, 250)).json()})
+    return instance_obj.InstanceList.get_by_host(
+        ctxt, 'compute1', expected_attrs=instance_obj.INSTANCE_DEFAULT_FIELDS)
+
+
+def make_compute_node(ctxt):
+    return compute_node.ComputeNode._from_db_object(
+        ctxt, compute_node.ComputeNode(),
+        {'id': 1, 'service_id': 1, 'vcpus': 16, 'memory_mb': 65536,
+         'local_gb': 1024, 'vcpus_used': 4, 'memory_mb_used': 8192,
+         'local_gb_used': 40, 'hypervisor_type': 'QEMU',
+         'hypervisor_version': 1005003, 'hypervisor_hostname': 'node1',
+         'free_ram_mb': 57344, 'free_disk_gb': 984, 'current_workload': 0,
+         'running_vms': 4, 'cpu_info': '{"arch": "x86_64"}',
+         'disk_available_least': 900, 'created_at': timeutils.utcnow(),
+         'updated_at': timeutils.utcnow(), 'deleted_at': None,
+         'deleted': False})
+
+
+def round_trip(ctxt, serializer, entity):
+    message = jsonutils.dumps(serializer.serialize_entity(ctxt, entity))
+    serializer.deserialize_entity(ctxt, jsonutils.loads(message))
+    return message
+
+
+def bench(ctxt, name, entity, rows):
+    for fmt, compact in (('regular', False), ('compact', True)):
+        serializer = base.NovaObjectSerializer(compact=compact)
+        msecs, message = benchutils.timed(
+            lambda: round_trip(ctxt, serializer, entity), REPEAT)
+        to_msecs, unused = benchutils.timed(
+            lambda: jsonutils.dumps(serializer.serialize_entity(ctxt,
+                                                                entity)),
+            REPEAT)
+        rows.append((name, fmt, '%.3f' % to_msecs, '%.3f' % msecs,
+                     len(message)))
+
+
+def check_round_trips(ctxt, obj):
+    results = []
+    for compact in (False, True):
+        serializer = base.NovaObjectSerializer(compact=compact)
+        message = jsonutils.dumps(serializer.serialize_entity(ctxt, obj))
+        results.append(base.obj_to_primitive(
+            serializer.deserialize_entity(ctxt, jsonutils.loads(message))))
+    assert results[0] == results[1], (
+        'compact round trip of %s differs' % obj.obj_name())
+
+
+def main(argv):
+    num_instances = int(argv[1]) if len(argv) > 1 else 100
+    benchutils.setup_database()
+    ctxt = context.get_admin_context()
+    instances = create_instances(ctxt, num_instances)
+    node = make_compute_node(ctxt)
+    for obj in (instances[0], instances, node):
+        check_round_trips(ctxt, obj)
+
+    rows = []
+    bench(ctxt, 'Instance', instances[0], rows)
+    bench(ctxt, 'InstanceList', instances, rows)
+    bench(ctxt, 'ComputeNode', node, rows)
+
+    print 'instances in InstanceList: %d' % num_instances
+    benchutils.print_table(['object', 'format', 'serialize ms',
+                            'round trip ms', 'bytes'], rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark policy checks against the shipped policy file.
+
+Checks every rule of etc/nova/policy.json for a member and an admin
+context against instance targets, the way API requests do. This is done
+once by walking the parsed rules with the policy file stat'ed and the
+credentials built on every check as nova.policy.enforce used to, once
+with the compiled rules and once with the decisions memoized on the
+request context as well. It reports the time spent per check.
+
+Usage: python tools/benchmarks/policy_enforce.py [checks]
+"""
+
+import os
+import sys
+
+import benchutils
+
+from nova import context
+from nova.openstack.common import policy as common_policy
+from nova import policy
+from nova import utils
+
+TARGETS = [{'project_id': 'fake-project', 'user_id': 'fake-user'},
+           {'project_id': 'other-project', 'user_id': 'other-user'}]
+
+
+def enforce_tree(ctxt, action, target):
+    utils.read_cached_file(policy._POLICY_PATH, policy._POLICY_CACHE,
+                           reload_func=policy._set_rules)
+    return common_policy.check(action, target, ctxt.to_dict())
+
+
+def enforce_compiled(ctxt, action, target):
+    return policy.enforce(ctxt, action, target, do_raise=False)
+
+
+def run(enforce, contexts, actions, num_checks):
+    allowed = 0
+    for i in xrange(num_checks):
+        if enforce(contexts[i % len(contexts)], actions[i % len(actions)],
+                   TARGETS[i % len(TARGETS)]):
+            allowed += 1
+    return allowed
+
+
+def main(argv):
+    num_checks = int(argv[1]) if len(argv) > 1 else 100000
+    benchutils.CONF([], project='nova')
+    benchutils.CONF.set_override('policy_file', os.path.join(
+        benchutils.TOPDIR, 'etc', 'nova', 'policy.json'))
+    policy.init()
+    actions = sorted(common_policy._rules)
+
+    rows = []
+    expected = None
+    for name, enforce, memoize in (('tree', enforce_tree, False),
+                                   ('compiled', enforce_compiled, False),
+                                   ('memoized', enforce_compiled, True)):
+        contexts = [context.RequestContext('fake-user', 'fake-project',
+                                           roles=['member']),
+                    context.RequestContext('admin', 'admin-project',
+                                           roles=['admin'])]
+        if not memoize:
+            for ctxt in contexts:
+                ctxt.policy_decisions = None
+        msecs, allowed = benchutils.timed(
+            lambda: run(enforce, contexts, actions, num_checks), repeat=3)
+        expected = expected or allowed
+        assert allowed == expected
+        rows.append((name, '%.1f' % msecs,
+                     '%.2f' % (msecs * 1000.0 / num_checks)))
+
+    print 'checks: %d, rules: %d, allowed: %d' % (num_checks, len(actions),
+                                                  expected)
+    benchutils.print_table(['mode', 'total ms', 'us/check'], rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
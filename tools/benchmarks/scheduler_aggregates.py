@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the aggregate-aware scheduler filters.
+
+Runs AvailabilityZoneFilter, AggregateInstanceExtraSpecsFilter and
+AggregateMultiTenancyIsolation over a growing number of hosts, once with
+per-host DB lookups and once with the per-request aggregate metadata index
+the HostManager hands out, and reports query count and latency for both.
+
+Usage: python tools/benchmarks/scheduler_aggregates.py [host counts ...]
+"""
+
+import sys
+
+import benchutils
+
+from nova import context
+from nova import db
+from nova.scheduler import filters
+from nova.scheduler import host_manager
+
+FILTERS = ['AvailabilityZoneFilter',
+           'AggregateInstanceExtraSpecsFilter',
+           'AggregateMultiTenancyIsolation']
+HOSTS_PER_AGGREGATE = 50
+
+
+def create_aggregates(ctxt, num_hosts):
+    hosts = ['host%05d' % i for i in xrange(num_hosts)]
+    for start in xrange(0, num_hosts, HOSTS_PER_AGGREGATE):
+        agg_num = start / HOSTS_PER_AGGREGATE
+        metadata = {'availability_zone': 'az%d' % (agg_num % 2),
+                    'ssd': str(agg_num % 3 == 0)}
+        if agg_num % 4 == 0:
+            metadata['filter_tenant_id'] = 'tenant1'
+        agg = db.aggregate_create(ctxt, {'name': 'agg%d' % agg_num},
+                                  metadata)
+        for host in hosts[start:start + HOSTS_PER_AGGREGATE]:
+            db.aggregate_host_add(ctxt, agg['id'], host)
+    return hosts
+
+
+def run_filters(ctxt, filter_classes, hostnames, use_index):
+    index = None
+    if use_index:
+        index = host_manager.AggregateMetadataIndex(ctxt)
+    hosts = []
+    for hostname in hostnames:
+        host_state = host_manager.HostState(hostname, hostname)
+        host_state.aggregate_metadata_index = index
+        hosts.append(host_state)
+    filter_properties = {
+        'context': ctxt,
+        'instance_type': {'extra_specs': {'ssd': 'True'}},
+        'request_spec': {'instance_properties': {
+            'availability_zone': 'az0', 'project_id': 'tenant1'}}}
+    handler = filters.HostFilterHandler()
+    return handler.get_filtered_objects(filter_classes, hosts,
+                                        filter_properties)
+
+
+def main(argv):
+    host_counts = [int(x) for x in argv[1:]] or [100, 500, 1000, 2000]
+    engine = benchutils.setup_database()
+    counter = benchutils.QueryCounter(engine)
+    ctxt = context.get_admin_context()
+    handler = filters.HostFilterHandler()
+    filter_classes = [cls for cls in handler.get_matching_classes(
+                          ['nova.scheduler.filters.all_filters'])
+                      if cls.__name__ in FILTERS]
+
+    rows = []
+    for num_hosts in host_counts:
+        for agg in db.aggregate_get_all(ctxt):
+            for host in agg['hosts']:
+                db.aggregate_host_delete(ctxt, agg['id'], host)
+            db.aggregate_delete(ctxt, agg['id'])
+        hostnames = create_aggregates(ctxt, num_hosts)
+        result = {}
+        for use_index in (False, True):
+            counter.reset()
+            msecs, passed = benchutils.timed(
+                    lambda: run_filters(ctxt, filter_classes, hostnames,
+                                        use_index),
+                    repeat=3)
+            result[use_index] = (counter.count / 3, msecs, len(passed))
+        assert result[False][2] == result[True][2]
+        rows.append((num_hosts, result[True][2],
+                     result[False][0], '%.1f' % result[False][1],
+                     result[True][0], '%.1f' % result[True][1]))
+
+    benchutils.print_table(['hosts', 'passed',
+                            'per-host queries', 'per-host ms',
+                            'index queries', 'index ms'], rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
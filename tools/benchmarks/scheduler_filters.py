@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Benchmark the resource filters and weighers of the scheduler.
+
+Runs RamFilter, CoreFilter, DiskFilter and NumInstancesFilter followed by
+the RAMWeigher over a growing number of hosts, once by calling host_passes
+for every host and once through the filter_all overrides the filter
+handler uses, and reports the latency of both.
+
+Usage: python tools/benchmarks/scheduler_filters.py [host counts ...]
+"""
+
+import sys
+
+import benchutils
+
+from nova import filters as base_filters
+from nova.scheduler import filters
+from nova.scheduler import host_manager
+from nova.scheduler import weights
+
+FILTERS = ['RamFilter', 'CoreFilter', 'DiskFilter', 'NumInstancesFilter']
+
+
+def filter_per_host(filter_classes, hosts, filter_properties):
+    """Filter hosts through host_passes, ignoring filter_all overrides."""
+    for filter_cls in filter_classes:
+        hosts = list(base_filters.BaseFilter.filter_all(
+                filter_cls(), hosts, filter_properties))
+    return hosts
+
+
+def create_hosts(num_hosts):
+    hosts = []
+    for i in xrange(num_hosts):
+        host_state = host_manager.HostState('host%05d' % i, 'node%05d' % i)
+        host_state.total_usable_ram_mb = 65536
+        host_state.free_ram_mb = (i * 397) % 65536
+        host_state.vcpus_total = 16
+        host_state.vcpus_used = (i * 7) % 300
+        host_state.total_usable_disk_gb = 1024
+        host_state.free_disk_mb = (i * 1031) % (1024 * 1024)
+        host_state.num_instances = i % 60
+        hosts.append(host_state)
+    return hosts
+
+
+def run(filter_hosts, filter_classes, weigher_classes, hosts):
+    filter_properties = {
+        'instance_type': {'memory_mb': 2048, 'vcpus': 2, 'root_gb': 20,
+                          'ephemeral_gb': 0}}
+    passed = filter_hosts(filter_classes, hosts, filter_properties)
+    weigher_handler = weights.HostWeightHandler()
+    return weigher_handler.get_weighed_objects(weigher_classes, passed, {})
+
+
+def main(argv):
+    host_counts = [int(x) for x in argv[1:]] or [1000, 5000, 10000]
+    benchutils.CONF([], project='nova')
+    handler = filters.HostFilterHandler()
+    filter_classes = [cls for cls in handler.get_matching_classes(
+                          ['nova.scheduler.filters.all_filters'])
+                      if cls.__name__ in FILTERS]
+    weigher_classes = weights.HostWeightHandler().get_matching_classes(
+            ['nova.scheduler.weights.all_weighers'])
+
+    rows = []
+    for num_hosts in host_counts:
+        hosts = create_hosts(num_hosts)
+        result = {}
+        for name, filter_hosts in (('per-host', filter_per_host),
+                                   ('batched', handler.get_filtered_objects)):
+            msecs, weighed = benchutils.timed(
+                    lambda: run(filter_hosts, filter_classes,
+                                weigher_classes, hosts))
+            result[name] = (msecs, [w.obj for w in weighed])
+        assert result['per-host'][1] == result['batched'][1]
+        rows.append((num_hosts, len(result['batched'][1]),
+                     '%.1f' % result['per-host'][0],
+                     '%.1f' % result['batched'][0]))
+
+    benchutils.print_table(['hosts', 'passed', 'per-host ms', 'batched ms'],
+                           rows)
+
+
+if __name__ == '__main__':
+    main(sys.argv)